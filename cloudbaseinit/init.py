@@ -14,14 +14,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
 import sys
 
 from cloudbaseinit.metadata import factory as metadata_factory
+from cloudbaseinit.metadata import prefetch as metadata_prefetch
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins import base as plugins_base
 from cloudbaseinit.plugins import factory as plugins_factory
+from cloudbaseinit.plugins import scheduler as plugins_scheduler
+from cloudbaseinit.plugins import status as plugins_status
+from cloudbaseinit.utils import timeline
 
 opts = [
     cfg.BoolOpt('allow_reboot', default=True, help='Allows OS reboots '
@@ -29,6 +34,15 @@ opts = [
     cfg.BoolOpt('stop_service_on_exit', default=True, help='In case of '
                 'execution as a service, specifies if the service '
                 'must be gracefully stopped before exiting'),
+    cfg.IntOpt('plugins_max_workers', default=4, help='Maximum number of '
+               'plugins executed in parallel. Plugins are started as soon '
+               'as the plugins they depend on are completed'),
+    cfg.IntOpt('plugins_status_batch_size', default=1, help='Number of '
+               'plugin execution status updates buffered before being '
+               'written. Pending updates are always written before '
+               'executing a plugin which may require a reboot and when the '
+               'plugins execution ends. If 0, updates are written only in '
+               'those cases'),
 ]
 
 CONF = cfg.CONF
@@ -39,34 +53,84 @@ LOG = logging.getLogger(__name__)
 
 class InitManager(object):
     _PLUGINS_CONFIG_SECTION = 'Plugins'
+    _BOOT_TIMELINE_CONFIG_NAME = 'BootTimelineSummary'
+    _PLUGIN_STATUS_NAMES = {
+        plugins_base.PLUGIN_EXECUTION_DONE: 'done',
+        plugins_base.PLUGIN_EXECUTE_ON_NEXT_BOOT: 'execute_on_next_boot',
+    }
+
+    def __init__(self):
+        self._plugin_status_store = None
+
+    def _get_plugin_status_store(self, osutils):
+        if not self._plugin_status_store:
+            self._plugin_status_store = plugins_status.PluginStatusStore(
+                osutils, self._PLUGINS_CONFIG_SECTION,
+                CONF.plugins_status_batch_size)
+        return self._plugin_status_store
 
     def _get_plugin_status(self, osutils, plugin_name):
-        return osutils.get_config_value(plugin_name,
-                                        self._PLUGINS_CONFIG_SECTION)
+        return self._get_plugin_status_store(osutils).get(plugin_name)
 
     def _set_plugin_status(self, osutils, plugin_name, status):
-        osutils.set_config_value(plugin_name, status,
-                                 self._PLUGINS_CONFIG_SECTION)
+        try:
+            self._get_plugin_status_store(osutils).set(plugin_name, status)
+        except Exception, ex:
+            # The status is kept pending and written by the next flush
+            LOG.error('Failed to write the plugins execution status: %s' %
+                      ex)
+            LOG.exception(ex)
+
+    def _flush_plugin_status(self, osutils):
+        try:
+            self._get_plugin_status_store(osutils).flush()
+        except Exception, ex:
+            LOG.error('Failed to write the plugins execution status: %s' %
+                      ex)
+            LOG.exception(ex)
 
     def _exec_plugin(self, osutils, service, plugin, shared_data):
         plugin_name = plugin.get_name()
 
-        status = self._get_plugin_status(osutils, plugin_name)
-        if status == plugins_base.PLUGIN_EXECUTION_DONE:
-            LOG.debug('Plugin \'%(plugin_name)s\' execution already done, '
-                      'skipping' % locals())
-        else:
-            LOG.info('Executing plugin \'%(plugin_name)s\'' %
-                     locals())
+        with timeline.get_boot_timeline().span(timeline.SPAN_PLUGIN,
+                                               plugin_name) as span:
+            status = self._get_plugin_status(osutils, plugin_name)
+            if status == plugins_base.PLUGIN_EXECUTION_DONE:
+                LOG.debug('Plugin \'%(plugin_name)s\' execution already '
+                          'done, skipping' % locals())
+                span.status = 'skipped'
+            else:
+                if plugin.may_require_reboot():
+                    # The plugin can reboot the host before returning, e.g.
+                    # from a user data script
+                    self._flush_plugin_status(osutils)
+
+                LOG.info('Executing plugin \'%(plugin_name)s\'' %
+                         locals())
+                try:
+                    (status, reboot_required) = plugin.execute(service,
+                                                               shared_data)
+                    span.status = self._PLUGIN_STATUS_NAMES.get(status,
+                                                                status)
+                    self._set_plugin_status(osutils, plugin_name, status)
+                    return reboot_required
+                except Exception, ex:
+                    span.status = 'error'
+                    LOG.error('plugin \'%(plugin_name)s\' failed '
+                              'with error \'%(ex)s\'' % locals())
+                    LOG.exception(ex)
+
+    def _end_boot_timeline(self, osutils):
+        summary = timeline.get_boot_timeline().end()
+        LOG.debug('Boot completed in %.3f seconds' % summary['total_time'])
+        if CONF.boot_timeline_summary:
             try:
-                (status, reboot_required) = plugin.execute(service,
-                                                           shared_data)
-                self._set_plugin_status(osutils, plugin_name, status)
-                return reboot_required
+                osutils.set_config_value(self._BOOT_TIMELINE_CONFIG_NAME,
+                                         json.dumps(summary),
+                                         self._PLUGINS_CONFIG_SECTION)
             except Exception, ex:
-                LOG.error('plugin \'%(plugin_name)s\' failed '
-                          'with error \'%(ex)s\'' % locals())
-                LOG.exception(ex)
+                LOG.error('Failed to write the boot timeline summary: %s' %
+                          ex)
 
     def _check_plugin_os_requirements(self, osutils, plugin):
         supported = False
@@ -90,29 +154,40 @@ class InitManager(object):
 
     def configure_host(self):
         osutils = osutils_factory.OSUtilsFactory().get_os_utils()
-        osutils.wait_for_boot_completion()
 
         mdsf = metadata_factory.MetadataServiceFactory()
-        service = mdsf.get_metadata_service()
+        if CONF.metadata_prefetch:
+            prefetcher = metadata_prefetch.MetadataPrefetcher(mdsf)
+            prefetcher.start()
+            osutils.wait_for_boot_completion()
+            service = prefetcher.get_service()
+        else:
+            osutils.wait_for_boot_completion()
+            service = mdsf.get_metadata_service()
         LOG.info('Metadata service loaded: \'%s\'' %
                  service.get_name())
 
-        plugins = plugins_factory.PluginFactory().load_plugins()
+        plugins = [plugin for plugin in
+                   plugins_factory.PluginFactory().load_plugins()
+                   if self._check_plugin_os_requirements(osutils, plugin)]
 
         plugins_shared_data = {}
 
-        reboot_required = False
+        def _exec_plugin(plugin):
+            return self._exec_plugin(osutils, service, plugin,
+                                     plugins_shared_data)
+
+        scheduler = plugins_scheduler.PluginScheduler(
+            plugins, CONF.plugins_max_workers)
         try:
-            for plugin in plugins:
-                if self._check_plugin_os_requirements(osutils, plugin):
-                    if self._exec_plugin(osutils, service, plugin,
-                                         plugins_shared_data):
-                        reboot_required = True
-                        if CONF.allow_reboot:
-                            break
+            reboot_required = scheduler.run(_exec_plugin,
+                                            stop_on_reboot=CONF.allow_reboot)
         finally:
+            self._flush_plugin_status(osutils)
             service.cleanup()
 
+        self._end_boot_timeline(osutils)
+
         if reboot_required and CONF.allow_reboot:
             try:
                 osutils.reboot()
@@ -14,9 +14,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+import Queue
+import threading
+import time
+
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.utils import classloader
+from cloudbaseinit.utils import timeline
 
 opts = [
     cfg.ListOpt('metadata_services',
@@ -29,7 +35,14 @@ opts = [
                 help='List of enabled metadata service classes, '
                 'to be tested fro availability in the provided order. '
                 'The first available service will be used to retrieve '
-                'metadata')
+                'metadata'),
+    cfg.BoolOpt('metadata_services_parallel_discovery', default=False,
+                help='Probe all the enabled metadata services concurrently '
+                'instead of one at a time. The first service in the '
+                'provided order that loads is used, as soon as all the '
+                'services preceding it failed to load. Once a service '
+                'loaded, the preceding ones still probing complete their '
+                'current request but do not retry it anymore'),
 ]
 
 CONF = cfg.CONF
@@ -37,16 +50,141 @@ CONF.register_opts(opts)
 LOG = logging.getLogger(__name__)
 
 
+def _load_service(class_path, service):
+    with timeline.get_boot_timeline().span(timeline.SPAN_METADATA_PROBE,
+                                           class_path) as span:
+        try:
+            loaded = service.load()
+            span.status = 'loaded' if loaded else 'not_available'
+            return loaded
+        except Exception, ex:
+            span.status = 'error'
+            LOG.error('Failed to load metadata service \'%s\'' % class_path)
+            LOG.exception(ex)
+
+
+class _MetadataServiceProbe(object):
+    def __init__(self, index, class_path, service, completed):
+        self.index = index
+        self.class_path = class_path
+        self.service = service
+        self.loaded = False
+        self.start_time = None
+        self.end_time = None
+        self._done = False
+        self._discarded = False
+        self._completed = completed
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self.start_time = time.time()
+        self._thread.start()
+
+    def _run(self):
+        if os.name == 'nt':
+            # WMI / COM objects are used by some services during load
+            import pythoncom
+            pythoncom.CoInitialize()
+        try:
+            self.loaded = _load_service(self.class_path, self.service)
+        finally:
+            self.end_time = time.time()
+            LOG.debug('Metadata service \'%(class_path)s\' probe completed '
+                      'in %(elapsed).3f seconds, loaded: %(loaded)s' %
+                      {'class_path': self.class_path,
+                       'elapsed': self.end_time - self.start_time,
+                       'loaded': bool(self.loaded)})
+            if os.name == 'nt':
+                pythoncom.CoUninitialize()
+
+        with self._lock:
+            self._done = True
+            discarded = self._discarded
+        if discarded:
+            self._cleanup()
+        self._completed.put(self)
+
+    def is_done(self):
+        with self._lock:
+            return self._done
+
+    def stop_retrying(self):
+        self.service.stop_retrying()
+
+    def discard(self):
+        # Losers still running are cleaned up as soon as they complete
+        self.stop_retrying()
+        with self._lock:
+            self._discarded = True
+            done = self._done
+        if done:
+            self._cleanup()
+
+    def _cleanup(self):
+        try:
+            self.service.cleanup()
+        except Exception, ex:
+            LOG.error('Failed to cleanup metadata service \'%s\'' %
+                      self.class_path)
+            LOG.exception(ex)
+
+
 class MetadataServiceFactory(object):
     def get_metadata_service(self):
+        if CONF.metadata_services_parallel_discovery:
+            return self._get_metadata_service_parallel()
+
         # Return the first service that loads correctly
         cl = classloader.ClassLoader()
         for class_path in CONF.metadata_services:
             service = cl.load_class(class_path)()
-            try:
-                if service.load():
-                    return service
-            except Exception, ex:
-                LOG.error('Failed to load metadata service \'%(class_path)s\'')
-                LOG.exception(ex)
+            if _load_service(class_path, service):
+                return service
         raise Exception("No available service found")
+
+    def _get_metadata_service_parallel(self):
+        cl = classloader.ClassLoader()
+        completed = Queue.Queue()
+        probes = []
+        for class_path in CONF.metadata_services:
+            service = cl.load_class(class_path)()
+            probes.append(_MetadataServiceProbe(len(probes), class_path,
+                                                service, completed))
+
+        discovery_start = time.time()
+        for probe in probes:
+            probe.start()
+
+        # A service is selected only once all the ones preceding it in the
+        # provided order failed, even if it loaded before them
+        selected = None
+        for probe in probes:
+            while not probe.is_done():
+                completed_probe = completed.get()
+                if completed_probe.loaded:
+                    # Don't wait for the retries of the preceding services,
+                    # e.g. an unreachable HTTP metadata endpoint
+                    for preceding_probe in probes[:completed_probe.index]:
+                        preceding_probe.stop_retrying()
+            if probe.loaded:
+                selected = probe
+                break
+
+        for probe in probes:
+            if probe is not selected:
+                probe.discard()
+
+        if not selected:
+            raise Exception("No available service found")
+
+        # The selected service could have loaded after being told to stop
+        # retrying, its next requests are retried as usual
+        selected.service.resume_retrying()
+
+        LOG.debug('Metadata service \'%(class_path)s\' selected after '
+                  '%(elapsed).3f seconds' %
+                  {'class_path': selected.class_path,
+                   'elapsed': selected.end_time - discovery_start})
+        return selected.service
@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import sys
+import threading
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import timeline
+
+opts = [
+    cfg.BoolOpt('metadata_prefetch', default=True,
+                help='Load the metadata service and fetch the metadata '
+                'commonly used by plugins in the background, while waiting '
+                'for the OS boot completion'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+PREFETCH_DATA_TYPE = 'openstack'
+
+
+def _prefetch(description, action):
+    try:
+        return action()
+    except Exception, ex:
+        # Plugins will request it again and handle the error
+        LOG.debug('Prefetch of %(description)s failed: %(ex)s' % locals())
+
+
+def prefetch_metadata(service):
+    '''
+    Loads in the service cache the metadata, user data and network
+    configuration content.
+    '''
+    data_type = PREFETCH_DATA_TYPE
+    with timeline.get_boot_timeline().span(timeline.SPAN_METADATA_PREFETCH,
+                                           data_type) as span:
+        meta_data = _prefetch('meta data',
+                              lambda: service.get_meta_data(data_type))
+        _prefetch('user data', lambda: service.get_user_data(data_type))
+
+        network_config = (meta_data or {}).get('network_config') or {}
+        content_path = network_config.get('content_path')
+        if content_path:
+            content_name = content_path.rsplit('/', 1)[-1]
+            _prefetch('network config content',
+                      lambda: service.get_content(data_type, content_name))
+        span.status = 'done'
+
+
+class MetadataPrefetcher(object):
+    '''
+    Loads the metadata service and prefetches its metadata in a background
+    thread. get_service waits for both to complete, so that the service is
+    never accessed by more than one thread at a time.
+    '''
+
+    def __init__(self, service_factory):
+        self._service_factory = service_factory
+        self._service = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        if os.name == 'nt':
+            # WMI / COM objects are used by some services during load
+            import pythoncom
+            pythoncom.CoInitialize()
+        try:
+            try:
+                self._service = self._service_factory.get_metadata_service()
+            except Exception:
+                self._exc_info = sys.exc_info()
+                return
+            prefetch_metadata(self._service)
+        finally:
+            if os.name == 'nt':
+                pythoncom.CoUninitialize()
+
+    def get_service(self):
+        self._thread.join()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._service
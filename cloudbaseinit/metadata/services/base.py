@@ -15,20 +15,33 @@
 #    under the License.
 
 import abc
+import copy
 import json
 import posixpath
-import time
+import threading
 
+from cloudbaseinit.metadata.services import cache
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import retry
+from cloudbaseinit.utils import timeline
 
 opts = [
     cfg.IntOpt('retry_count', default=5,
                help='Max. number of attempts for fetching metadata in '
                'case of transient errors'),
     cfg.FloatOpt('retry_count_interval', default=4,
-                 help='Interval between attempts in case of transient errors, '
-                 'expressed in seconds'),
+                 help='Average interval between attempts in case of '
+                 'transient errors, expressed in seconds. Intervals grow '
+                 'exponentially from half of it with random jitter, up to '
+                 'retry_max_interval, while the total time waited is at most '
+                 'retry_count * retry_count_interval'),
+    cfg.FloatOpt('retry_max_interval', default=30,
+                 help='Max. interval between attempts in case of transient '
+                 'errors, expressed in seconds'),
+    cfg.FloatOpt('retry_deadline', default=0,
+                 help='Max. time spent retrying a metadata request, '
+                 'expressed in seconds. 0 means no limit'),
 ]
 
 CONF = cfg.CONF
@@ -41,16 +54,66 @@ class NotExistingMetadataException(Exception):
     pass
 
 
+class ReadOnlyDict(dict):
+    '''
+    Dictionary that cannot be modified, used to share parsed metadata
+    between plugins.
+    '''
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Metadata is read-only')
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+
+    # Copies are regular, modifiable dictionaries
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self, memo)
+
+
+def _freeze(obj):
+    if isinstance(obj, dict):
+        return ReadOnlyDict((k, _freeze(v)) for (k, v) in obj.iteritems())
+    elif isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    else:
+        return obj
+
+
+def _thaw(obj, memo):
+    # Deep copies the frozen metadata with dicts and lists, as parsed
+    if isinstance(obj, dict):
+        return dict((copy.deepcopy(k, memo), _thaw(v, memo))
+                    for (k, v) in obj.iteritems())
+    elif isinstance(obj, tuple):
+        return [_thaw(v, memo) for v in obj]
+    else:
+        return copy.deepcopy(obj, memo)
+
+
 class BaseMetadataService(object):
     def __init__(self):
         self._cache = {}
+        self._meta_data_cache = {}
         self._enable_retry = False
+        self._retry_stop_event = threading.Event()
+        self._enable_persistent_cache = False
+        self._persistent_cache = None
 
     def get_name(self):
         return self.__class__.__name__
 
     def load(self):
         self._cache = {}
+        self._meta_data_cache = {}
 
     @property
     def can_post_password(self):
@@ -60,26 +123,69 @@ class BaseMetadataService(object):
     def _get_data(self, path):
         pass
 
+    def _is_retryable_error(self, ex):
+        return (self._enable_retry and
+                not isinstance(ex, NotExistingMetadataException) and
+                retry.is_transient_error(ex))
+
     def _exec_with_retry(self, action):
-        i = 0
-        while True:
+        policy = retry.RetryPolicy(
+            '%s request' % self.get_name(),
+            max_attempts=CONF.retry_count + 1,
+            base_delay=CONF.retry_count_interval / 2.0,
+            max_delay=CONF.retry_max_interval,
+            deadline=CONF.retry_deadline or None,
+            max_total_delay=CONF.retry_count * CONF.retry_count_interval,
+            is_retryable=self._is_retryable_error,
+            stop_event=self._retry_stop_event)
+        return policy.execute(action)
+
+    def stop_retrying(self):
+        '''
+        Makes the requests in progress fail at their next transient error
+        instead of being retried, e.g. when another service is used anyway.
+        '''
+        self._retry_stop_event.set()
+
+    def resume_retrying(self):
+        self._retry_stop_event.clear()
+
+    def _get_persistent_cache(self):
+        if (self._enable_persistent_cache and CONF.metadata_cache_path and
+                not self._persistent_cache):
+            self._persistent_cache = cache.PersistentMetadataCache(
+                CONF.metadata_cache_path, CONF.metadata_cache_ttl,
+                CONF.metadata_cache_validate_instance_id)
+        return self._persistent_cache
+
+    def _get_persistent_cache_data(self, path):
+        persistent_cache = self._get_persistent_cache()
+        if persistent_cache:
+            try:
+                return persistent_cache.get(self.get_name(), path)
+            except Exception, ex:
+                LOG.debug('Failed to read persisted metadata: %s' % ex)
+
+    def _set_persistent_cache_data(self, path, data):
+        persistent_cache = self._get_persistent_cache()
+        if persistent_cache:
             try:
-                return action()
-            except NotExistingMetadataException:
-                raise
-            except:
-                if self._enable_retry and i < CONF.retry_count:
-                    i += 1
-                    time.sleep(CONF.retry_count_interval)
-                else:
-                    raise
+                persistent_cache.set(self.get_name(), path, data)
+            except Exception, ex:
+                LOG.debug('Failed to persist metadata: %s' % ex)
 
     def _get_cache_data(self, path):
         if path in self._cache:
             LOG.debug("Using cached copy of metadata: '%s'" % path)
             return self._cache[path]
         else:
-            data = self._exec_with_retry(lambda: self._get_data(path))
+            data = self._get_persistent_cache_data(path)
+            if data is not None:
+                LOG.debug("Using persisted copy of metadata: '%s'" % path)
+            else:
+                timeline.get_boot_timeline().record_metadata_fetch()
+                data = self._exec_with_retry(lambda: self._get_data(path))
+                self._set_persistent_cache_data(path, data)
             self._cache[path] = data
             return data
 
@@ -94,13 +200,21 @@ class BaseMetadataService(object):
         return self._get_cache_data(path)
 
     def get_meta_data(self, data_type, version='latest'):
-        path = posixpath.normpath(
-            posixpath.join(data_type, version, 'meta_data.json'))
-        data = self._get_cache_data(path)
-        if type(data) is str:
-            return json.loads(self._get_cache_data(path))
-        else:
-            return data
+        '''
+        Returns the parsed meta_data.json document as a read-only view,
+        parsed only once per data type and version.
+        '''
+        key = (data_type, version)
+        meta_data = self._meta_data_cache.get(key)
+        if meta_data is None:
+            path = posixpath.normpath(
+                posixpath.join(data_type, version, 'meta_data.json'))
+            data = self._get_cache_data(path)
+            if isinstance(data, basestring):
+                data = json.loads(data)
+            meta_data = _freeze(data)
+            self._meta_data_cache[key] = meta_data
+        return meta_data
 
     def _post_data(self, path, data):
         raise NotExistingMetadataException()
@@ -0,0 +1,198 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import time
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.osutils import factory as osutils_factory
+
+opts = [
+    cfg.StrOpt('metadata_cache_path', default=None,
+               help='Local file where the metadata retrieved from remote '
+               'services is persisted across reboots. The file is readable '
+               'only by its owner and passwords are not persisted, but it '
+               'still contains sensitive data, e.g. the user data. '
+               'Disabled if not set'),
+    cfg.IntOpt('metadata_cache_ttl', default=86400,
+               help='Max. age of the persisted metadata, expressed in '
+               'seconds'),
+    cfg.BoolOpt('metadata_cache_validate_instance_id', default=True,
+                help='Discard the persisted metadata if the instance ID, as '
+                'reported by the system UUID, changed since it was stored'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+DATA_TYPE_STR = 'str'
+DATA_TYPE_JSON = 'json'
+
+# Metadata items, or paths, which are never persisted
+SECRET_KEYS = ['admin_pass']
+
+
+def _remove_secrets(obj):
+    if isinstance(obj, dict):
+        return dict((k, _remove_secrets(v)) for (k, v) in obj.iteritems()
+                    if k not in SECRET_KEYS)
+    elif isinstance(obj, list):
+        return [_remove_secrets(v) for v in obj]
+    else:
+        return obj
+
+
+class PersistentMetadataCache(object):
+    # Shared among all the instances, as services can be loaded concurrently
+    _lock = threading.Lock()
+
+    def __init__(self, path, ttl, validate_instance_id=True):
+        self._path = path
+        self._ttl = ttl
+        self._validate_instance_id = validate_instance_id
+        self._instance_id = None
+
+    def _get_osutils(self):
+        return osutils_factory.OSUtilsFactory().get_os_utils()
+
+    def _get_instance_id(self):
+        if not self._instance_id:
+            osutils = self._get_osutils()
+            system_uuid = osutils.get_system_uuid()
+            if system_uuid:
+                self._instance_id = system_uuid.lower()
+        return self._instance_id
+
+    def _get_empty_cache(self):
+        return {'version': CACHE_FORMAT_VERSION, 'entries': {}}
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return self._get_empty_cache()
+
+        try:
+            with open(self._path, 'rb') as f:
+                cache = json.load(f)
+        except Exception, ex:
+            LOG.debug('Discarding unreadable metadata cache \'%(path)s\': '
+                      '%(ex)s' % {'path': self._path, 'ex': ex})
+            return self._get_empty_cache()
+
+        if cache.get('version') != CACHE_FORMAT_VERSION:
+            LOG.debug('Discarding metadata cache with unsupported version: '
+                      '%s' % cache.get('version'))
+            return self._get_empty_cache()
+
+        if self._validate_instance_id:
+            instance_id = self._get_instance_id()
+            if not instance_id or cache.get('instance_id') != instance_id:
+                LOG.debug('Discarding metadata cache not matching the '
+                          'current instance ID')
+                return self._get_empty_cache()
+
+        return cache
+
+    def _save(self, cache):
+        if self._validate_instance_id:
+            cache['instance_id'] = self._get_instance_id()
+
+        cache_dir = os.path.dirname(self._path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, 0700)
+
+        tmp_path = self._path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        # Restrict the access to the file before writing the metadata in it
+        os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0600))
+        self._get_osutils().set_owner_only_permissions(tmp_path)
+        with open(tmp_path, 'wb') as f:
+            json.dump(cache, f)
+        if os.path.exists(self._path):
+            # os.rename does not replace existing files on Windows
+            os.remove(self._path)
+        os.rename(tmp_path, self._path)
+
+    def _get_checksum(self, value):
+        return hashlib.sha256(value).hexdigest()
+
+    def get(self, service_name, path):
+        with self._lock:
+            cache = self._load()
+
+        entry = cache['entries'].get(service_name, {}).get(path)
+        if not entry:
+            return None
+
+        if time.time() - entry['timestamp'] > self._ttl:
+            LOG.debug('Persisted metadata expired: \'%s\'' % path)
+            return None
+
+        value = entry['value']
+        if self._get_checksum(value) != entry['checksum']:
+            LOG.debug('Persisted metadata checksum mismatch: \'%s\'' % path)
+            return None
+
+        if entry['type'] == DATA_TYPE_STR:
+            return base64.b64decode(value)
+        else:
+            return json.loads(value)
+
+    def _remove_secrets(self, data):
+        if isinstance(data, str):
+            try:
+                parsed = json.loads(data)
+            except ValueError:
+                return data
+            stripped = _remove_secrets(parsed)
+            if stripped != parsed:
+                return json.dumps(stripped)
+            return data
+        return _remove_secrets(data)
+
+    def set(self, service_name, path, data):
+        if posixpath.basename(path) in SECRET_KEYS:
+            LOG.debug('Not persisting secret metadata: \'%s\'' % path)
+            return
+
+        data = self._remove_secrets(data)
+        if isinstance(data, str):
+            data_type = DATA_TYPE_STR
+            value = base64.b64encode(data)
+        else:
+            data_type = DATA_TYPE_JSON
+            value = json.dumps(data)
+
+        entry = {'type': data_type,
+                 'timestamp': time.time(),
+                 'checksum': self._get_checksum(value),
+                 'value': value}
+
+        with self._lock:
+            cache = self._load()
+            cache['entries'].setdefault(service_name, {})[path] = entry
+            self._save(cache)
@@ -0,0 +1,88 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+class BasePhysicalDisk(object):
+    '''
+    Bulk read support for raw disks.
+
+    Reads are aligned to the disk sector size and performed in chunks of
+    up to buffer_size bytes, reusing the same preallocated buffer.
+    '''
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        self._buffer_size = buffer_size
+        self.read_count = 0
+
+    @abc.abstractmethod
+    def get_sector_size(self):
+        pass
+
+    @abc.abstractmethod
+    def seek(self, offset):
+        pass
+
+    @abc.abstractmethod
+    def _read_into_buffer(self, bytes_to_read):
+        '''
+        Reads at most bytes_to_read bytes from the current position into the
+        reusable buffer. Returns a buffer object containing the data read.
+        '''
+        pass
+
+    def _get_aligned_buffer_size(self):
+        sector_size = self.get_sector_size()
+        return max(self._buffer_size / sector_size, 1) * sector_size
+
+    def iter_read(self, offset, size):
+        '''
+        Yields the disk content between offset and offset + size as buffer
+        objects, valid only until the next read.
+        '''
+        sector_size = self.get_sector_size()
+        aligned_offset = offset - offset % sector_size
+        skip = offset - aligned_offset
+        remaining = size
+        chunk_size = self._get_aligned_buffer_size()
+
+        self.seek(aligned_offset)
+        while remaining > 0:
+            bytes_to_read = skip + remaining
+            if bytes_to_read % sector_size:
+                bytes_to_read += sector_size - bytes_to_read % sector_size
+            buf = self._read_into_buffer(min(bytes_to_read, chunk_size))
+            self.read_count += 1
+            if len(buf) <= skip:
+                break
+
+            chunk_len = min(len(buf) - skip, remaining)
+            yield buffer(buf, skip, chunk_len)
+            remaining -= chunk_len
+            skip = 0
+
+    def read_at(self, offset, size):
+        return ''.join(str(chunk) for chunk in self.iter_read(offset, size))
+
+    def copy_to(self, f, size, offset=0):
+        copied = 0
+        for chunk in self.iter_read(offset, size):
+            f.write(chunk)
+            copied += len(chunk)
+        return copied
@@ -29,6 +29,9 @@ opts = [
                 help='Look for an ISO config drive in raw HDDs'),
     cfg.BoolOpt('config_drive_cdrom', default=True,
                 help='Look for a config drive in the attached cdrom drives'),
+    cfg.BoolOpt('config_drive_read_in_place', default=True,
+                help='Read the metadata directly from the config drive, '
+                'instead of copying its content to a temporary folder'),
 ]
 
 CONF = cfg.CONF
@@ -41,10 +44,15 @@ class ConfigDriveService(base.BaseMetadataService):
     def __init__(self):
         super(ConfigDriveService, self).__init__()
         self._metadata_path = None
+        self._delete_metadata_path = False
+        self._iso_reader = None
 
     def load(self):
         super(ConfigDriveService, self).load()
 
+        if CONF.config_drive_read_in_place:
+            return self._load_in_place()
+
         target_path = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
 
         mgr = manager.ConfigDriveManager()
@@ -53,20 +61,52 @@ class ConfigDriveService(base.BaseMetadataService):
                                            CONF.config_drive_cdrom)
         if found:
             self._metadata_path = target_path
+            self._delete_metadata_path = True
             LOG.debug('Metadata copied to folder: \'%s\'' %
                       self._metadata_path)
         return found
 
+    def _load_in_place(self):
+        mgr = manager.ConfigDriveManager()
+
+        if CONF.config_drive_raw_hhd:
+            LOG.debug('Looking for Config Drive in raw HDDs')
+            self._iso_reader = mgr.get_raw_hdd_config_drive_reader()
+            if self._iso_reader:
+                return True
+
+        if CONF.config_drive_cdrom:
+            LOG.debug('Looking for Config Drive in cdrom drives')
+            cdrom_mount_point = mgr.get_config_drive_cdrom_mount_point()
+            if cdrom_mount_point:
+                self._metadata_path = cdrom_mount_point
+                LOG.debug('Reading metadata from: \'%s\'' %
+                          self._metadata_path)
+                return True
+
+        return False
+
     def _get_data(self, path):
-        norm_path = os.path.normpath(os.path.join(self._metadata_path, path))
         try:
+            if self._iso_reader:
+                return self._iso_reader.read_file(path)
+
+            norm_path = os.path.normpath(os.path.join(self._metadata_path,
+                                                      path))
             with open(norm_path, 'rb') as f:
                 return f.read()
         except IOError:
             raise base.NotExistingMetadataException()
 
     def cleanup(self):
+        if self._iso_reader:
+            self._iso_reader.close()
+            self._iso_reader = None
+
         if self._metadata_path:
-            LOG.debug('Deleting metadata folder: \'%s\'' % self._metadata_path)
-            shutil.rmtree(self._metadata_path, True)
+            if self._delete_metadata_path:
+                LOG.debug('Deleting metadata folder: \'%s\'' %
+                          self._metadata_path)
+                shutil.rmtree(self._metadata_path, True)
             self._metadata_path = None
+            self._delete_metadata_path = False
@@ -0,0 +1,236 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import posixpath
+import struct
+import threading
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+ISO_ID = 'CD001'
+LOGICAL_SECTOR_SIZE = 2048
+VOLUME_DESCRIPTORS_SECTOR = 16
+
+VD_TYPE_PRIMARY = 1
+VD_TYPE_SUPPLEMENTARY = 2
+VD_TYPE_TERMINATOR = 255
+
+JOLIET_ESCAPE_SEQUENCES = ['%/@', '%/C', '%/E']
+
+FILE_FLAG_DIRECTORY = 2
+
+# Rock Ridge alternate name entry
+RR_NM_SIGNATURE = 'NM'
+RR_NM_FLAG_CONTINUE = 1
+
+
+class ISO9660Error(Exception):
+    pass
+
+
+class DirectoryRecord(object):
+    def __init__(self, name, extent, size, is_dir):
+        self.name = name
+        self.extent = extent
+        self.size = size
+        self.is_dir = is_dir
+
+
+class ISO9660Reader(object):
+    '''
+    Reads files from an ISO 9660 image, including the Joliet and Rock Ridge
+    extensions used for long and lowercase names, e.g. by config drives.
+
+    The image is accessed through a seekable file-like object, reading only
+    the volume descriptors, the directories and the requested file extents.
+    Reads are always performed on logical sector boundaries.
+    '''
+
+    def __init__(self, f):
+        self._f = f
+        self._block_size = LOGICAL_SECTOR_SIZE
+        self._root = None
+        self._joliet = False
+        self._dir_cache = {}
+        self._lock = threading.Lock()
+        self.volume_label = None
+        self._read_volume_descriptors()
+
+    def _read(self, offset, size):
+        # Round the read to full logical sectors
+        start = offset - offset % LOGICAL_SECTOR_SIZE
+        end = offset + size
+        if end % LOGICAL_SECTOR_SIZE:
+            end += LOGICAL_SECTOR_SIZE - end % LOGICAL_SECTOR_SIZE
+
+        with self._lock:
+            self._f.seek(start)
+            data = self._f.read(end - start)
+        if len(data) < offset - start + size:
+            raise ISO9660Error('Unexpected end of the ISO image')
+        return data[offset - start:offset - start + size]
+
+    def _read_extent(self, extent, size):
+        return self._read(extent * self._block_size, size)
+
+    def _read_volume_descriptors(self):
+        primary_root = None
+        joliet_root = None
+
+        sector = VOLUME_DESCRIPTORS_SECTOR
+        while True:
+            vd = self._read(sector * LOGICAL_SECTOR_SIZE, LOGICAL_SECTOR_SIZE)
+            if vd[1:6] != ISO_ID:
+                raise ISO9660Error('Invalid ISO 9660 volume descriptor')
+
+            vd_type = ord(vd[0])
+            if vd_type == VD_TYPE_TERMINATOR:
+                break
+            elif vd_type == VD_TYPE_PRIMARY:
+                self._block_size = struct.unpack('<H', vd[128:130])[0]
+                self.volume_label = vd[40:72].rstrip(' \x00')
+                primary_root = vd[156:190]
+            elif (vd_type == VD_TYPE_SUPPLEMENTARY and
+                    vd[88:91] in JOLIET_ESCAPE_SEQUENCES):
+                joliet_root = vd[156:190]
+            sector += 1
+
+        if joliet_root:
+            self._joliet = True
+            self._root = self._parse_dir_record(joliet_root)
+        elif primary_root:
+            self._root = self._parse_dir_record(primary_root)
+        else:
+            raise ISO9660Error('Primary volume descriptor not found')
+        LOG.debug('ISO 9660 volume \'%(label)s\' found, Joliet: %(joliet)s' %
+                  {'label': self.volume_label, 'joliet': self._joliet})
+
+    def _get_rock_ridge_name(self, system_use):
+        name = None
+        offset = 0
+        while offset + 4 <= len(system_use):
+            signature = system_use[offset:offset + 2]
+            length = ord(system_use[offset + 2])
+            if length < 4:
+                break
+            if signature == RR_NM_SIGNATURE:
+                flags = ord(system_use[offset + 4])
+                name = (name or '') + system_use[offset + 5:offset + length]
+                if not flags & RR_NM_FLAG_CONTINUE:
+                    break
+            offset += length
+        return name
+
+    def _decode_name(self, name, system_use):
+        if self._joliet:
+            name = name.decode('utf-16-be')
+        else:
+            rr_name = self._get_rock_ridge_name(system_use)
+            if rr_name:
+                return rr_name
+
+        # Remove the file version and the trailing dot of files without
+        # extension
+        name = name.split(';')[0]
+        if name.endswith('.'):
+            name = name[:-1]
+        return name
+
+    def _parse_dir_record(self, record):
+        extent = struct.unpack('<I', record[2:6])[0]
+        size = struct.unpack('<I', record[10:14])[0]
+        is_dir = bool(ord(record[25]) & FILE_FLAG_DIRECTORY)
+        name_len = ord(record[32])
+        name = record[33:33 + name_len]
+
+        if name in ['\x00', '\x01']:
+            # "." and ".." entries
+            name = None
+        else:
+            system_use_offset = 33 + name_len + (1 - name_len % 2)
+            name = self._decode_name(name, record[system_use_offset:])
+
+        return DirectoryRecord(name, extent, size, is_dir)
+
+    def _list_dir_records(self, dir_record):
+        if dir_record.extent in self._dir_cache:
+            return self._dir_cache[dir_record.extent]
+
+        data = self._read_extent(dir_record.extent, dir_record.size)
+        records = []
+        offset = 0
+        while offset < len(data):
+            length = ord(data[offset])
+            if not length:
+                # Records do not span across sectors, move to the next one
+                offset += self._block_size - offset % self._block_size
+                continue
+            record = self._parse_dir_record(data[offset:offset + length])
+            if record.name:
+                records.append(record)
+            offset += length
+
+        self._dir_cache[dir_record.extent] = records
+        return records
+
+    def _find_child_record(self, dir_record, name):
+        records = self._list_dir_records(dir_record)
+        for record in records:
+            if record.name == name:
+                return record
+        # Names can be upper cased, e.g. without Joliet and Rock Ridge
+        for record in records:
+            if record.name.lower() == name.lower():
+                return record
+
+    def _get_record(self, path):
+        record = self._root
+        for name in posixpath.normpath('/' + path).split('/'):
+            if not name:
+                continue
+            if not record.is_dir:
+                record = None
+            else:
+                record = self._find_child_record(record, name)
+            if not record:
+                raise IOError(errno.ENOENT, 'File not found in ISO image',
+                              path)
+        return record
+
+    def exists(self, path):
+        try:
+            self._get_record(path)
+            return True
+        except IOError:
+            return False
+
+    def list_dir(self, path):
+        record = self._get_record(path)
+        if not record.is_dir:
+            raise IOError(errno.ENOTDIR, 'Not a directory', path)
+        return [r.name for r in self._list_dir_records(record)]
+
+    def read_file(self, path):
+        record = self._get_record(path)
+        if record.is_dir:
+            raise IOError(errno.EISDIR, 'Is a directory', path)
+        return self._read_extent(record.extent, record.size)
+
+    def close(self):
+        self._f.close()
@@ -20,31 +20,61 @@ import shutil
 import sys
 import tempfile
 import uuid
-import wmi
 
 from ctypes import wintypes
 
 from cloudbaseinit.openstack.common import log as logging
 
+from cloudbaseinit.metadata.services.configdrive import iso9660
 from cloudbaseinit.metadata.services.configdrive.windows.disk \
     import physical_disk
 from cloudbaseinit.metadata.services.configdrive.windows.disk \
     import virtual_disk
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import wmiquery
 
 LOG = logging.getLogger(__name__)
 
 
+class _PhysicalDiskFile(object):
+    '''
+    Read only file-like access to the first size bytes of a physical disk.
+    '''
+
+    def __init__(self, phys_disk, size):
+        self._phys_disk = phys_disk
+        self._size = size
+        self._offset = 0
+
+    def seek(self, offset):
+        self._offset = offset
+
+    def tell(self):
+        return self._offset
+
+    def read(self, size):
+        size = max(min(size, self._size - self._offset), 0)
+        if not size:
+            return ''
+
+        data = self._phys_disk.read_at(self._offset, size)
+        self._offset += len(data)
+        return data
+
+    def close(self):
+        self._phys_disk.close()
+
+
 class ConfigDriveManager(object):
     def _get_physical_disks_path(self):
         l = []
-        conn = wmi.WMI(moniker='//./root/cimv2')
-        q = conn.query('SELECT DeviceID FROM Win32_DiskDrive')
+        q = wmiquery.get_wmi_connection().query_records('Win32_DiskDrive',
+                                                        ['DeviceID'])
         for r in q:
             l.append(r.DeviceID)
         return l
 
-    def _get_config_drive_cdrom_mount_point(self):
+    def get_config_drive_cdrom_mount_point(self):
         osutils = osutils_factory.OSUtilsFactory().get_os_utils()
 
         for drive in osutils.get_cdrom_drives():
@@ -101,20 +131,7 @@ class ConfigDriveManager(object):
 
     def _write_iso_file(self, phys_disk, path, iso_file_size):
         with open(path, 'wb') as f:
-            geom = phys_disk.get_geometry()
-            disk_size = geom.Cylinders * geom.TracksPerCylinder * \
-                geom.SectorsPerTrack * geom.BytesPerSector
-
-            offset = 0
-            # Get a multiple of the sector byte size
-            bytes_to_read = 4096 / geom.BytesPerSector * geom.BytesPerSector
-
-            while offset < iso_file_size:
-                phys_disk.seek(offset)
-                bytes_to_read = min(bytes_to_read, iso_file_size - offset)
-                (buf, bytes_read) = phys_disk.read(bytes_to_read)
-                f.write(buf)
-                offset += bytes_read
+            phys_disk.copy_to(f, iso_file_size)
 
     def _copy_iso_files(self, iso_file_path, target_path):
         virt_disk = virtual_disk.VirtualDisk(iso_file_path)
@@ -173,7 +190,7 @@ class ConfigDriveManager(object):
         return config_drive_found
 
     def _get_conf_drive_from_cdrom_drive(self, target_path):
-        cdrom_mount_point = self._get_config_drive_cdrom_mount_point()
+        cdrom_mount_point = self.get_config_drive_cdrom_mount_point()
         if cdrom_mount_point:
             shutil.copytree(cdrom_mount_point, target_path)
             return True
@@ -191,3 +208,19 @@ class ConfigDriveManager(object):
             if os.path.exists(iso_file_path):
                 os.remove(iso_file_path)
         return config_drive_found
+
+    def get_raw_hdd_config_drive_reader(self):
+        for path in self._get_physical_disks_path():
+            phys_disk = physical_disk.PhysicalDisk(path)
+            try:
+                phys_disk.open()
+                iso_file_size = self._get_iso_disk_size(phys_disk)
+                if iso_file_size:
+                    LOG.debug('ISO config drive found on: \'%s\'' % path)
+                    iso_file = _PhysicalDiskFile(phys_disk, iso_file_size)
+                    return iso9660.ISO9660Reader(iso_file)
+            except:
+                # Ignore exception
+                pass
+            phys_disk.close()
+        return None
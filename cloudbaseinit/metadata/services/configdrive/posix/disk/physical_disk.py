@@ -0,0 +1,97 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import fcntl
+import io
+import mmap
+import os
+import stat
+import struct
+
+from cloudbaseinit.metadata.services.configdrive import base_disk
+
+BLKSSZGET = 0x1268
+DEFAULT_SECTOR_SIZE = 512
+
+
+class PhysicalDisk(base_disk.BasePhysicalDisk):
+    '''
+    Raw access to block devices and disk image files, e.g. loop files.
+
+    If use_mmap is set, the device is mapped in memory and the data is
+    returned without being copied into an intermediate buffer.
+    '''
+
+    def __init__(self, path, buffer_size=base_disk.DEFAULT_BUFFER_SIZE,
+                 use_mmap=False):
+        super(PhysicalDisk, self).__init__(buffer_size)
+        self._path = path
+        self._use_mmap = use_mmap
+        self._file = None
+        self._mmap = None
+        self._buffer = None
+        self._offset = 0
+        self._sector_size = None
+
+    def open(self):
+        if self._file:
+            self.close()
+
+        self._file = io.FileIO(self._path, 'r')
+        self._offset = 0
+        if self._use_mmap:
+            size = self.get_size()
+            if size:
+                self._mmap = mmap.mmap(self._file.fileno(), size,
+                                       access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._sector_size = None
+
+    def get_size(self):
+        return os.lseek(self._file.fileno(), 0, os.SEEK_END)
+
+    def get_sector_size(self):
+        if not self._sector_size:
+            fd = self._file.fileno()
+            if stat.S_ISBLK(os.fstat(fd).st_mode):
+                buf = fcntl.ioctl(fd, BLKSSZGET, struct.pack('i', 0))
+                self._sector_size = struct.unpack('i', buf)[0]
+            else:
+                self._sector_size = DEFAULT_SECTOR_SIZE
+        return self._sector_size
+
+    def seek(self, offset):
+        if not self._mmap:
+            self._file.seek(offset)
+        self._offset = offset
+
+    def _read_into_buffer(self, bytes_to_read):
+        if self._mmap:
+            buf = buffer(self._mmap, self._offset, bytes_to_read)
+        else:
+            if not self._buffer or len(self._buffer) < bytes_to_read:
+                self._buffer = bytearray(bytes_to_read)
+            view = memoryview(self._buffer)[:bytes_to_read]
+            buf = buffer(self._buffer, 0, self._file.readinto(view))
+        self._offset += len(buf)
+        return buf
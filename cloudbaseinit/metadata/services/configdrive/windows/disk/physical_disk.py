@@ -19,6 +19,8 @@ import ctypes
 from ctypes import windll
 from ctypes import wintypes
 
+from cloudbaseinit.metadata.services.configdrive import base_disk
+
 kernel32 = windll.kernel32
 
 
@@ -34,7 +36,7 @@ class Win32_DiskGeometry(ctypes.Structure):
     ]
 
 
-class PhysicalDisk(object):
+class PhysicalDisk(base_disk.BasePhysicalDisk):
     GENERIC_READ = 0x80000000
     FILE_SHARE_READ = 1
     OPEN_EXISTING = 3
@@ -44,10 +46,12 @@ class PhysicalDisk(object):
     FILE_BEGIN = 0
     INVALID_SET_FILE_POINTER = 0xFFFFFFFFL
 
-    def __init__(self, path):
+    def __init__(self, path, buffer_size=base_disk.DEFAULT_BUFFER_SIZE):
+        super(PhysicalDisk, self).__init__(buffer_size)
         self._path = path
         self._handle = 0
         self._geom = None
+        self._buffer = None
 
     def open(self):
         if self._handle:
@@ -88,6 +92,9 @@ class PhysicalDisk(object):
             self._geom = geom
         return self._geom
 
+    def get_sector_size(self):
+        return self.get_geometry().BytesPerSector
+
     def seek(self, offset):
         high = wintypes.DWORD(offset >> 32)
         low = wintypes.DWORD(offset & 0xFFFFFFFFL)
@@ -106,3 +113,13 @@ class PhysicalDisk(object):
         if not ret_val:
             raise Exception("Read exception")
         return (buf, bytes_read.value)
+
+    def _read_into_buffer(self, bytes_to_read):
+        if not self._buffer or ctypes.sizeof(self._buffer) < bytes_to_read:
+            self._buffer = ctypes.create_string_buffer(bytes_to_read)
+        bytes_read = wintypes.DWORD()
+        ret_val = kernel32.ReadFile(self._handle, self._buffer, bytes_to_read,
+                                    ctypes.byref(bytes_read), 0)
+        if not ret_val:
+            raise Exception("Read exception")
+        return buffer(self._buffer, 0, bytes_read.value)
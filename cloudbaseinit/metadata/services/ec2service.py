@@ -15,18 +15,25 @@
 #    under the License.
 
 import posixpath
-import urllib2
 import traceback
 import os
 
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import concurrency
+from cloudbaseinit.utils import httpclient
 
 opts = [
     cfg.StrOpt('ec2_metadata_base_url',
                default='http://169.254.169.254/2009-04-04/',
                help='The base URL where the service looks for metadata'),
+    cfg.IntOpt('ec2_metadata_fetch_concurrency', default=4,
+               help='Max. number of EC2 metadata values retrieved '
+               'concurrently'),
+    cfg.FloatOpt('ec2_metadata_request_timeout', default=30,
+                 help='Timeout for each EC2 metadata HTTP request, '
+                 'expressed in seconds'),
 ]
 
 ec2nodes = [
@@ -48,6 +55,11 @@ class EC2Service(base.BaseMetadataService):
     def __init__(self):
         super(EC2Service, self).__init__()
         self._enable_retry = True
+        self._enable_persistent_cache = True
+        self._ec2_available = False
+        self._pool = httpclient.HTTPConnectionPool(
+            maxsize=CONF.ec2_metadata_fetch_concurrency,
+            timeout=CONF.ec2_metadata_request_timeout)
         self.error_count = 0
 
     def load(self):
@@ -70,12 +82,12 @@ class EC2Service(base.BaseMetadataService):
 
         LOG.debug('Getting data for the path: %s' % path)
         if path.endswith('meta_data.json'):
-            for key in ec2nodes:
-                LOG.debug('Getting metadata from: %s' % key)
-                try:
-                    data[key] = self._get_EC2_value(key)
-                except:
+            values = self._get_EC2_values(ec2nodes)
+            for (key, (value, ex)) in zip(ec2nodes, values):
+                if ex:
                     LOG.info("EC2 value %s is not available. Skip it." % key)
+                else:
+                    data[key] = value
             # Saving keys to the local folder
             self._load_public_keys(data)
 
@@ -83,27 +95,38 @@ class EC2Service(base.BaseMetadataService):
             norm_path = posixpath.join(CONF.ec2_metadata_base_url, 'user-data')
             LOG.debug('Getting metadata from: %(norm_path)s' % locals())
             try:
-                req = urllib2.Request(norm_path)
-                response = urllib2.urlopen(req)
-                data = response.read()
+                data = self._get_response(norm_path).data
                 LOG.debug("Got data: %s" % data)
             except:
                 LOG.error("EC2 user-data is not available.")
         return data
 
     def _check_EC2(self):
-        try:
-            data = self._get_EC2_value('')
-            return True
-        except:
-            return False
+        # Once available, the interface is not probed anymore
+        if not self._ec2_available:
+            try:
+                self._get_EC2_value('')
+                self._ec2_available = True
+            except:
+                pass
+        return self._ec2_available
+
+    def _get_response(self, url):
+        response = self._pool.request('GET', url)
+        if response.status >= 400:
+            raise httpclient.HTTPError(url, response.status, response.reason,
+                                       response.headers)
+        return response
 
     def _get_EC2_value(self, key):
         meta_path = posixpath.join(
             CONF.ec2_metadata_base_url, 'meta-data', key)
-        req = urllib2.Request(meta_path)
-        response = urllib2.urlopen(req)
-        return response.read()
+        LOG.debug('Getting metadata from: %s' % meta_path)
+        return self._get_response(meta_path).data
+
+    def _get_EC2_values(self, keys):
+        return concurrency.map_concurrently(
+            self._get_EC2_value, keys, CONF.ec2_metadata_fetch_concurrency)
 
     def _load_public_keys(self, data):
         try:
@@ -111,13 +134,26 @@ class EC2Service(base.BaseMetadataService):
             LOG.debug("Got a list of keys %s" % key_list)
             data['public_keys'] = {}
 
-            for key_name in key_list.split('\n'):
-                key_index = key_name.split('=')[0]
-                LOG.debug('Loading key %s' % key_index)
-                key = self._get_EC2_value(
-                    'public-keys/%s/openssh-key' % key_index)
-                data['public_keys'].update({key_index: key})
+            key_indexes = [key_name.split('=')[0] for key_name
+                           in key_list.split('\n') if key_name]
+            key_paths = ['public-keys/%s/openssh-key' % key_index
+                         for key_index in key_indexes]
+            values = self._get_EC2_values(key_paths)
+
+            for (key_index, (key, ex)) in zip(key_indexes, values):
+                if ex:
+                    LOG.debug("Can't load public key %(key_index)s: %(ex)s" %
+                              locals())
+                else:
+                    data['public_keys'].update({key_index: key})
 
         except Exception, ex:
             LOG.debug("Can't save public key %s" % ex)
             LOG.debug(traceback.format_exc())
+
+    def cleanup(self):
+        LOG.debug('EC2 metadata HTTP connections opened: %(opened)d, '
+                  'requests served: %(served)d' %
+                  {'opened': self._pool.connections_opened,
+                   'served': self._pool.requests_served})
+        self._pool.close()
@@ -15,17 +15,30 @@
 #    under the License.
 
 import posixpath
-import urllib2
+import Queue
+import sys
+import threading
 import urlparse
 
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import httpclient
 
 opts = [
     cfg.StrOpt('metadata_base_url', default='http://169.254.169.254/',
                help='The base URL where the service looks for metadata'),
+    cfg.ListOpt('metadata_fallback_urls', default=[],
+                help='Additional base URLs where the service looks for '
+                'metadata, in order of preference after metadata_base_url'),
+    cfg.FloatOpt('metadata_hedge_delay', default=1,
+                 help='Time to wait for a metadata GET response before '
+                 'sending the same request to the next base URL, expressed '
+                 'in seconds'),
+    cfg.FloatOpt('metadata_request_timeout', default=30,
+                 help='Timeout for each metadata HTTP request, expressed in '
+                 'seconds'),
 ]
 
 CONF = cfg.CONF
@@ -38,35 +51,56 @@ class HttpService(base.BaseMetadataService):
     def __init__(self):
         super(HttpService, self).__init__()
         self._enable_retry = True
+        self._enable_persistent_cache = True
+        self._pool = httpclient.HTTPConnectionPool(
+            timeout=CONF.metadata_request_timeout)
+        self._base_url = None
+        self._base_url_lock = threading.Lock()
+        self._post_maybe_delivered = False
+
+    def _get_base_urls(self):
+        base_urls = [CONF.metadata_base_url]
+        for base_url in CONF.metadata_fallback_urls:
+            if base_url not in base_urls:
+                base_urls.append(base_url)
+        return base_urls
 
     def _check_metadata_ip_route(self):
         '''
         Workaround for: https://bugs.launchpad.net/quantum/+bug/1174657
         '''
+        if sys.platform != 'win32':
+            return
+
         osutils = osutils_factory.OSUtilsFactory().get_os_utils()
 
         if osutils.check_os_version(6, 0):
             # 169.254.x.x addresses are not getting routed starting from
             # Windows Vista / 2008
-            metadata_netloc = urlparse.urlparse(CONF.metadata_base_url).netloc
-            metadata_host = metadata_netloc.split(':')[0]
-
-            if metadata_host.startswith("169.254."):
-                if not osutils.check_static_route_exists(metadata_host):
-                    (interface_index, gateway) = osutils.get_default_gateway()
-                    if gateway:
-                        try:
-                            osutils.add_static_route(metadata_host,
-                                                     "255.255.255.255",
-                                                     gateway,
-                                                     interface_index,
-                                                     10)
-                        except Exception, ex:
-                            # Ignore it
-                            LOG.exception(ex)
+            for base_url in self._get_base_urls():
+                metadata_netloc = urlparse.urlparse(base_url).netloc
+                metadata_host = metadata_netloc.split(':')[0]
+
+                if metadata_host.startswith("169.254."):
+                    self._add_metadata_ip_route(osutils, metadata_host)
+
+    def _add_metadata_ip_route(self, osutils, metadata_host):
+        if not osutils.check_static_route_exists(metadata_host):
+            (interface_index, gateway) = osutils.get_default_gateway()
+            if gateway:
+                try:
+                    osutils.add_static_route(metadata_host,
+                                             "255.255.255.255",
+                                             gateway,
+                                             interface_index,
+                                             10)
+                except Exception, ex:
+                    # Ignore it
+                    LOG.exception(ex)
 
     def load(self):
         super(HttpService, self).load()
+        self._base_url = None
 
         self._check_metadata_ip_route()
 
@@ -74,44 +108,132 @@ class HttpService(base.BaseMetadataService):
             self.get_meta_data('openstack')
             return True
         except:
-            LOG.debug('Metadata not found at URL \'%s\'' %
-                      CONF.metadata_base_url)
+            LOG.debug('Metadata not found at URLs: %s' %
+                      ', '.join(self._get_base_urls()))
             return False
 
     @property
     def can_post_password(self):
         return True
 
-    def _get_response(self, req):
-        try:
-            return urllib2.urlopen(req)
-        except urllib2.HTTPError as ex:
-            if ex.code == 404:
-                raise base.NotExistingMetadataException()
-            else:
-                raise
+    def _get_response(self, method, url, data=None):
+        headers = {}
+        if data is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        response = self._pool.request(method, url, data, headers)
+        if response.status == 404:
+            raise base.NotExistingMetadataException()
+        elif response.status >= 400:
+            raise httpclient.HTTPError(url, response.status, response.reason,
+                                       response.headers)
+        return response
+
+    def _set_base_url(self, base_url):
+        with self._base_url_lock:
+            if not self._base_url:
+                LOG.debug('Using metadata base URL: %s' % base_url)
+                self._base_url = base_url
+
+    def _get_url_data(self, base_url, path):
+        norm_path = posixpath.join(base_url, path)
+        LOG.debug('Getting metadata from: %(norm_path)s' % locals())
+        response = self._get_response('GET', norm_path)
+        return response.data
+
+    def _get_hedged_data(self, base_urls, path):
+        '''
+        Sends the GET request to the base URLs in order, moving to the next
+        one after metadata_hedge_delay seconds without a response or as soon
+        as a request fails. The first URL that answers is used for the rest
+        of the boot.
+        '''
+        results = Queue.Queue()
+
+        def _get(base_url):
+            try:
+                results.put((base_url, self._get_url_data(base_url, path),
+                             None))
+            except Exception, ex:
+                results.put((base_url, None, ex))
+
+        next_index = 0
+        pending = 0
+        while True:
+            if next_index < len(base_urls):
+                thread = threading.Thread(target=_get,
+                                          args=(base_urls[next_index],))
+                thread.daemon = True
+                thread.start()
+                next_index += 1
+                pending += 1
+
+            try:
+                if next_index < len(base_urls):
+                    result = results.get(timeout=CONF.metadata_hedge_delay)
+                else:
+                    result = results.get()
+            except Queue.Empty:
+                continue
+
+            pending -= 1
+            (base_url, data, ex) = result
+            if ex is None or isinstance(ex,
+                                        base.NotExistingMetadataException):
+                self._set_base_url(base_url)
+                if ex:
+                    raise ex
+                return data
+
+            LOG.debug('Metadata request to %(base_url)s failed: %(ex)s' %
+                      locals())
+            if not pending and next_index == len(base_urls):
+                raise ex
 
     def _get_data(self, path):
-        norm_path = posixpath.join(CONF.metadata_base_url, path)
-        LOG.debug('Getting metadata from: %(norm_path)s' % locals())
-        req = urllib2.Request(norm_path)
-        response = self._get_response(req)
-        return response.read()
+        base_urls = self._get_base_urls()
+        if self._base_url:
+            return self._get_url_data(self._base_url, path)
+        elif len(base_urls) == 1:
+            return self._get_url_data(base_urls[0], path)
+        else:
+            return self._get_hedged_data(base_urls, path)
 
     def _post_data(self, path, data):
-        norm_path = posixpath.join(CONF.metadata_base_url, path)
+        # POST requests are never hedged
+        base_url = self._base_url or self._get_base_urls()[0]
+        norm_path = posixpath.join(base_url, path)
         LOG.debug('Posting metadata to: %(norm_path)s' % locals())
-        req = urllib2.Request(norm_path, data=data)
-        self._get_response(req)
+        try:
+            self._get_response('POST', norm_path, data)
+        except (httpclient.HTTPError, base.NotExistingMetadataException):
+            raise
+        except Exception:
+            # The request might have been processed before failing
+            self._post_maybe_delivered = True
+            raise
         return True
 
     def post_password(self, enc_password_b64, version='latest'):
+        self._post_maybe_delivered = False
         try:
             return super(HttpService, self).post_password(enc_password_b64,
                                                           version)
-        except urllib2.HTTPError as ex:
+        except httpclient.HTTPError as ex:
             if ex.code == 409:
+                if self._post_maybe_delivered:
+                    # Conflict caused by a previous attempt that set the
+                    # password without returning a response
+                    LOG.debug('Password set by a previous attempt')
+                    return True
                 # Password already set
                 return False
             else:
                 raise
+
+    def cleanup(self):
+        LOG.debug('Metadata HTTP connections opened: %(opened)d, requests '
+                  'served: %(served)d' %
+                  {'opened': self._pool.connections_opened,
+                   'served': self._pool.requests_served})
+        self._pool.close()
@@ -17,6 +17,11 @@
 import base64
 import os
 import subprocess
+import time
+
+from cloudbaseinit.osutils import userprovisioning
+from cloudbaseinit.utils import processrunner
+from cloudbaseinit.utils import timeline
 
 
 class BaseOSUtils(object):
@@ -36,13 +41,21 @@ class BaseOSUtils(object):
         return b64_password.replace('/', '').replace('+', '')[:length]
 
     def execute_process(self, args, shell=True):
+        start_time = time.time()
         p = subprocess.Popen(args,
                              stdout=subprocess.PIPE,
                              stderr=subprocess.PIPE,
                              shell=shell)
         (out, err) = p.communicate()
+        timeline.get_boot_timeline().record_subprocess(
+            time.time() - start_time)
         return (out, err, p.returncode)
 
+    def run_process(self, args, shell=False, timeout=None, deadline=None,
+                    name=None):
+        return processrunner.run_process(args, shell, timeout, deadline,
+                                         name)
+
     def sanitize_shell_input(self, value):
         raise NotImplementedError()
 
@@ -55,6 +68,13 @@ class BaseOSUtils(object):
     def add_user_to_local_group(self, username, groupname):
         raise NotImplementedError()
 
+    def _get_user_backend(self):
+        return userprovisioning.OSUtilsUserBackend(self)
+
+    def provision_user(self, user_spec):
+        return userprovisioning.provision_user(self._get_user_backend(),
+                                               user_spec)
+
     def set_host_name(self, new_host_name):
         raise NotImplementedError()
 
@@ -72,9 +92,16 @@ class BaseOSUtils(object):
     def set_config_value(self, name, value, section=None):
         raise NotImplementedError()
 
+    def set_config_values(self, values, section=None):
+        for (name, value) in values.items():
+            self.set_config_value(name, value, section)
+
     def get_config_value(self, name, section=None):
         raise NotImplementedError()
 
+    def get_config_values(self, section=None):
+        raise NotImplementedError()
+
     def wait_for_boot_completion(self):
         pass
 
@@ -97,6 +124,12 @@ class BaseOSUtils(object):
     def get_volume_label(self, drive):
         raise NotImplementedError()
 
+    def get_system_uuid(self):
+        raise NotImplementedError()
+
+    def set_owner_only_permissions(self, path):
+        raise NotImplementedError()
+
     def firewall_create_rule(self, name, port, protocol, allow=True):
         raise NotImplementedError()
 
@@ -23,7 +23,7 @@ class OSUtilsFactory(object):
     def get_os_utils(self):
         osutils_class_paths = {
             'nt': 'cloudbaseinit.osutils.windows.WindowsUtils',
-            'posix': 'cloudbaseinit.osutils.posix.PosixUtils'
+            'posix': 'cloudbaseinit.osutils.posix.PosixUtil'
         }
 
         cl = classloader.ClassLoader()
@@ -14,11 +14,328 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import errno
+import json
 import os
+import pipes
+import pwd
+import re
+import subprocess
+import threading
+import time
 
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import base
+from cloudbaseinit.utils import routing
+from cloudbaseinit.utils import timeline
+
+opts = [
+    cfg.StrOpt('config_file_path',
+               default='/var/lib/cloudbase-init/config.json',
+               help='File where the configuration values, e.g. the plugins '
+               'execution status, are stored'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+ARPHRD_ETHER = 1
+# SCSI peripheral device type of CD-ROM drives
+SCSI_TYPE_ROM = 5
+# Route flags in /proc/net/route
+RTF_UP = 0x1
 
 
 class PosixUtil(base.BaseOSUtils):
+    _config_lock = threading.Lock()
+    _routing_table_cache = None
+
+    # Roots of the kernel and system files, replaced in the tests
+    _sys_path = '/sys'
+    _proc_path = '/proc'
+    _etc_path = '/etc'
+    _dev_path = '/dev'
+
     def reboot(self):
         os.system('reboot')
+
+    def _execute(self, args, input_data=None):
+        start_time = time.time()
+        p = subprocess.Popen(args,
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        (out, err) = p.communicate(input_data)
+        timeline.get_boot_timeline().record_subprocess(
+            time.time() - start_time)
+        if p.returncode:
+            raise Exception('Command "%(cmd)s" failed with exit code '
+                            '%(ret_val)d: %(err)s' %
+                            {'cmd': ' '.join(args), 'ret_val': p.returncode,
+                             'err': err.strip()})
+        return out
+
+    def _read_file(self, path, default=None):
+        try:
+            with open(path, 'rb') as f:
+                return f.read().strip()
+        except IOError:
+            return default
+
+    def _write_file(self, path, data):
+        # Replaces the file atomically, keeping its permissions
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.rename(tmp_path, path)
+
+    def user_exists(self, username):
+        try:
+            pwd.getpwnam(username)
+            return True
+        except KeyError:
+            return False
+
+    def sanitize_shell_input(self, value):
+        return pipes.quote(value)
+
+    def _set_user_password(self, username, password, password_expires):
+        # The password is passed on stdin, not to be visible in the process
+        # list
+        self._execute(['chpasswd'], '%s:%s\n' % (username, password))
+        if not password_expires:
+            self._execute(['chage', '-M', '-1', username])
+
+    def create_user(self, username, password, password_expires=False):
+        self._execute(['useradd', '-m', username])
+        self._set_user_password(username, password, password_expires)
+
+    def set_user_password(self, username, password, password_expires=False):
+        self._set_user_password(username, password, password_expires)
+
+    def add_user_to_local_group(self, username, groupname):
+        self._execute(['usermod', '-a', '-G', groupname, username])
+
+    def get_user_home(self, username):
+        try:
+            return pwd.getpwnam(username).pw_dir
+        except KeyError:
+            LOG.debug('Home directory not found for user \'%s\'' % username)
+            return None
+
+    def set_host_name(self, new_host_name):
+        self._write_file(os.path.join(self._etc_path, 'hostname'),
+                         new_host_name + '\n')
+        self._execute(['hostname', new_host_name])
+        # The new host name is applied immediately
+        return False
+
+    def _get_net_path(self, *paths):
+        return os.path.join(self._sys_path, 'class', 'net', *paths)
+
+    def _get_interface_index(self, interface_name):
+        index = self._read_file(self._get_net_path(interface_name, 'ifindex'))
+        if index:
+            return int(index)
+
+    def _get_interface_name(self, interface_index):
+        for name in self._list_dir(self._get_net_path()):
+            if self._get_interface_index(name) == interface_index:
+                return name
+
+    def _list_dir(self, path):
+        try:
+            return sorted(os.listdir(path))
+        except OSError, ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            return []
+
+    def get_network_adapters(self):
+        # Physical Ethernet adapters only, virtual ones have no device
+        l = []
+        for name in self._list_dir(self._get_net_path()):
+            if (self._read_file(self._get_net_path(name, 'type')) ==
+                    str(ARPHRD_ETHER) and
+                    os.path.exists(self._get_net_path(name, 'device'))):
+                l.append(name)
+        return l
+
+    def _get_prefix_length(self, netmask):
+        return bin(routing.ipv4_to_dword(netmask)).count('1')
+
+    def set_static_network_config(self, adapter_name, address, netmask,
+                                  broadcast, gateway, dnsnameservers):
+        if adapter_name not in self.get_network_adapters():
+            raise Exception("Network adapter not found")
+
+        LOG.debug("Setting static IP address")
+        self._execute(['ip', 'addr', 'flush', 'dev', adapter_name])
+        self._execute(['ip', 'addr', 'add', '%s/%d' %
+                       (address, self._get_prefix_length(netmask)),
+                       'broadcast', broadcast, 'dev', adapter_name])
+        self._execute(['ip', 'link', 'set', adapter_name, 'up'])
+
+        LOG.debug("Setting static gateways")
+        try:
+            self._execute(['ip', 'route', 'replace', 'default', 'via',
+                           gateway, 'dev', adapter_name])
+        finally:
+            self._invalidate_routing_table()
+
+        LOG.debug("Setting static DNS servers")
+        resolv_conf = ''.join('nameserver %s\n' % dns
+                              for dns in dnsnameservers)
+        self._write_file(os.path.join(self._etc_path, 'resolv.conf'),
+                         resolv_conf)
+        return False
+
+    def _load_config(self):
+        try:
+            with open(CONF.config_file_path, 'rb') as f:
+                return json.load(f)
+        except IOError:
+            return {}
+
+    def _save_config(self, config):
+        # Values are written to a temporary file replacing the config file,
+        # so that either all or none of them are persisted
+        path = CONF.config_file_path
+        config_dir = os.path.dirname(path)
+        if config_dir and not os.path.isdir(config_dir):
+            os.makedirs(config_dir)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            json.dump(config, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+
+    def set_config_value(self, name, value, section=None):
+        self.set_config_values({name: value}, section)
+
+    def set_config_values(self, values, section=None):
+        with self._config_lock:
+            config = self._load_config()
+            config.setdefault(section or '', {}).update(values)
+            self._save_config(config)
+
+    def get_config_value(self, name, section=None):
+        return self.get_config_values(section).get(name)
+
+    def get_config_values(self, section=None):
+        with self._config_lock:
+            return self._load_config().get(section or '', {})
+
+    def _get_routing_table(self):
+        if not self._routing_table_cache:
+            self._routing_table_cache = routing.RoutingTableCache(
+                self._get_ipv4_routing_table)
+        return self._routing_table_cache.get_table()
+
+    def _invalidate_routing_table(self):
+        if self._routing_table_cache:
+            self._routing_table_cache.invalidate()
+
+    def _get_ipv4_routing_table(self):
+        routing_table = []
+        with open(os.path.join(self._proc_path, 'net', 'route'), 'rb') as f:
+            # Skip the header
+            f.readline()
+            for line in f:
+                fields = line.split()
+                if len(fields) < 8 or not int(fields[3], 16) & RTF_UP:
+                    continue
+                # Addresses are DWORDs in network byte order, as the IP
+                # Helper ones on Windows
+                routing_table.append((
+                    routing.dword_to_ipv4(int(fields[1], 16)),
+                    routing.dword_to_ipv4(int(fields[7], 16)),
+                    routing.dword_to_ipv4(int(fields[2], 16)),
+                    self._get_interface_index(fields[0]),
+                    int(fields[6])))
+        return routing_table
+
+    def get_default_gateway(self):
+        default_route = self._get_routing_table().get_default_route()
+        if default_route:
+            return (default_route.interface_index, default_route.next_hop)
+        else:
+            return (None, None)
+
+    def check_static_route_exists(self, destination):
+        return self._get_routing_table().has_route(destination)
+
+    def add_static_route(self, destination, mask, next_hop, interface_index,
+                         metric):
+        args = ['ip', 'route', 'add', '%s/%d' %
+                (destination, self._get_prefix_length(mask)),
+                'via', next_hop, 'metric', str(metric)]
+        interface_name = self._get_interface_name(interface_index)
+        if interface_name:
+            args += ['dev', interface_name]
+        try:
+            self._execute(args)
+        except Exception, ex:
+            if 'File exists' not in str(ex):
+                raise
+            LOG.debug('Route to %s already exists' % destination)
+        finally:
+            self._invalidate_routing_table()
+
+    def check_os_version(self, major, minor, build=0):
+        # The requirements are expressed as Windows versions, which have no
+        # equivalent here
+        return False
+
+    def _get_block_devices(self):
+        return self._list_dir(os.path.join(self._sys_path, 'block'))
+
+    def get_cdrom_drives(self):
+        drives = []
+        for name in self._get_block_devices():
+            device_type = self._read_file(os.path.join(
+                self._sys_path, 'block', name, 'device', 'type'))
+            if device_type == str(SCSI_TYPE_ROM):
+                drives.append(os.path.join(self._dev_path, name))
+        return drives
+
+    def _decode_label(self, label):
+        # udev escapes characters like spaces, e.g. "config\x20drive"
+        return re.sub(r'\\x([0-9a-fA-F]{2})',
+                      lambda m: chr(int(m.group(1), 16)), label)
+
+    def get_volume_label(self, drive):
+        labels_path = os.path.join(self._dev_path, 'disk', 'by-label')
+        drive_path = os.path.realpath(drive)
+        for label in self._list_dir(labels_path):
+            if os.path.realpath(os.path.join(labels_path,
+                                             label)) == drive_path:
+                return self._decode_label(label)
+
+    def get_system_uuid(self):
+        return self._read_file(os.path.join(self._sys_path, 'class', 'dmi',
+                                            'id', 'product_uuid'))
+
+    def set_owner_only_permissions(self, path):
+        os.chmod(path, 0600)
+
+    def _get_iptables_rule(self, name, port, protocol, allow):
+        return ['INPUT', '-p', protocol.lower(), '--dport', str(port),
+                '-m', 'comment', '--comment', name,
+                '-j', 'ACCEPT' if allow else 'DROP']
+
+    def firewall_create_rule(self, name, port, protocol, allow=True):
+        self._execute(['iptables', '-I'] +
+                      self._get_iptables_rule(name, port, protocol, allow))
+
+    def firewall_remove_rule(self, name, port, protocol, allow=True):
+        self._execute(['iptables', '-D'] +
+                      self._get_iptables_rule(name, port, protocol, allow))
@@ -0,0 +1,134 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class UserSpec(object):
+    '''
+    Desired state of a local user account.
+
+    If create is False, an existing user is updated but a missing one is
+    not created. The profile is created only along with the user.
+    '''
+
+    def __init__(self, username, password, password_expires=False,
+                 groups=None, create_profile=False, create=True):
+        self.username = username
+        self.password = password
+        self.password_expires = password_expires
+        self.groups = groups or []
+        self.create_profile = create_profile
+        self.create = create
+
+
+class UserInfo(object):
+    def __init__(self, username, password_expires=None, flags=None):
+        self.username = username
+        # None if not known by the backend
+        self.password_expires = password_expires
+        self.flags = flags
+
+
+class ProvisioningResult(object):
+    def __init__(self, exists, created, failed_groups):
+        self.exists = exists
+        self.created = created
+        self.failed_groups = failed_groups
+
+
+class BaseUserBackend(object):
+    def get_user(self, username):
+        '''
+        Returns a UserInfo, or None if the user does not exist.
+        '''
+        raise NotImplementedError()
+
+    def add_user(self, username, password, password_expires):
+        raise NotImplementedError()
+
+    def update_user(self, user, password, password_expires):
+        raise NotImplementedError()
+
+    def add_user_to_local_group(self, username, groupname):
+        raise NotImplementedError()
+
+    def create_user_profile(self, username, password):
+        raise NotImplementedError()
+
+
+class OSUtilsUserBackend(BaseUserBackend):
+    '''
+    Backend based on the single user operations of an OS utils object.
+    '''
+
+    def __init__(self, osutils):
+        self._osutils = osutils
+
+    def get_user(self, username):
+        if self._osutils.user_exists(username):
+            return UserInfo(username)
+
+    def add_user(self, username, password, password_expires):
+        self._osutils.create_user(username, password, password_expires)
+
+    def update_user(self, user, password, password_expires):
+        self._osutils.set_user_password(user.username, password,
+                                        password_expires)
+
+    def add_user_to_local_group(self, username, groupname):
+        self._osutils.add_user_to_local_group(username, groupname)
+
+    def create_user_profile(self, username, password):
+        token = self._osutils.create_user_logon_session(username, password,
+                                                        load_profile=True)
+        self._osutils.close_user_logon_session(token)
+
+
+def provision_user(backend, spec):
+    '''
+    Applies the given UserSpec looking up the user only once. Failures to
+    add the user to a group are logged and reported in the result.
+    '''
+    user = backend.get_user(spec.username)
+    created = False
+    if user:
+        LOG.info('Setting password for existing user "%s"' % spec.username)
+        backend.update_user(user, spec.password, spec.password_expires)
+    elif spec.create:
+        LOG.info('Creating user "%s" and setting password' % spec.username)
+        backend.add_user(spec.username, spec.password, spec.password_expires)
+        created = True
+        if spec.create_profile:
+            # Create a user profile in order for other plugins
+            # to access the user home, etc
+            backend.create_user_profile(spec.username, spec.password)
+    else:
+        LOG.debug('User "%s" not found' % spec.username)
+        return ProvisioningResult(False, False, [])
+
+    failed_groups = []
+    for group_name in spec.groups:
+        try:
+            backend.add_user_to_local_group(spec.username, group_name)
+        except Exception, ex:
+            LOG.exception(ex)
+            LOG.error('Cannot add user to group "%s"' % group_name)
+            failed_groups.append(group_name)
+
+    return ProvisioningResult(True, created, failed_groups)
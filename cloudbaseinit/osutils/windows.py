@@ -16,11 +16,11 @@
 
 import _winreg
 import ctypes
+import ntsecuritycon
 import re
 import time
 import win32process
 import win32security
-import wmi
 
 from ctypes import windll
 from ctypes import wintypes
@@ -28,6 +28,9 @@ from win32com import client
 
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import base
+from cloudbaseinit.osutils import userprovisioning
+from cloudbaseinit.utils import routing
+from cloudbaseinit.utils import wmiquery
 
 LOG = logging.getLogger(__name__)
 
@@ -36,7 +39,6 @@ kernel32 = windll.kernel32
 netapi32 = windll.netapi32
 userenv = windll.userenv
 iphlpapi = windll.iphlpapi
-Ws2_32 = windll.Ws2_32
 
 
 class Win32_PROFILEINFO(ctypes.Structure):
@@ -58,6 +60,31 @@ class Win32_LOCALGROUP_MEMBERS_INFO_3(ctypes.Structure):
     ]
 
 
+class Win32_USER_INFO_1(ctypes.Structure):
+    _fields_ = [
+        ('usri1_name', wintypes.LPWSTR),
+        ('usri1_password', wintypes.LPWSTR),
+        ('usri1_password_age', wintypes.DWORD),
+        ('usri1_priv', wintypes.DWORD),
+        ('usri1_home_dir', wintypes.LPWSTR),
+        ('usri1_comment', wintypes.LPWSTR),
+        ('usri1_flags', wintypes.DWORD),
+        ('usri1_script_path', wintypes.LPWSTR)
+    ]
+
+
+class Win32_USER_INFO_1003(ctypes.Structure):
+    _fields_ = [
+        ('usri1003_password', wintypes.LPWSTR)
+    ]
+
+
+class Win32_USER_INFO_1008(ctypes.Structure):
+    _fields_ = [
+        ('usri1008_flags', wintypes.DWORD)
+    ]
+
+
 class Win32_MIB_IPFORWARDROW(ctypes.Structure):
     _fields_ = [
         ('dwForwardDest', wintypes.DWORD),
@@ -84,6 +111,46 @@ class Win32_MIB_IPFORWARDTABLE(ctypes.Structure):
     ]
 
 
+class Win32_MIB_IPINTERFACE_ROW(ctypes.Structure):
+    _fields_ = [
+        ('Family', wintypes.USHORT),
+        ('InterfaceLuid', ctypes.c_ulonglong),
+        ('InterfaceIndex', wintypes.ULONG),
+        ('MaxReassemblySize', wintypes.ULONG),
+        ('InterfaceIdentifier', ctypes.c_ulonglong),
+        ('MinRouterAdvertisementInterval', wintypes.ULONG),
+        ('MaxRouterAdvertisementInterval', wintypes.ULONG),
+        ('AdvertisingEnabled', wintypes.BOOLEAN),
+        ('ForwardingEnabled', wintypes.BOOLEAN),
+        ('WeakHostSend', wintypes.BOOLEAN),
+        ('WeakHostReceive', wintypes.BOOLEAN),
+        ('UseAutomaticMetric', wintypes.BOOLEAN),
+        ('UseNeighborUnreachabilityDetection', wintypes.BOOLEAN),
+        ('ManagedAddressConfigurationSupported', wintypes.BOOLEAN),
+        ('OtherStatefulConfigurationSupported', wintypes.BOOLEAN),
+        ('AdvertiseDefaultRoute', wintypes.BOOLEAN),
+        ('RouterDiscoveryBehavior', ctypes.c_int),
+        ('DadTransmits', wintypes.ULONG),
+        ('BaseReachableTime', wintypes.ULONG),
+        ('RetransmitTime', wintypes.ULONG),
+        ('PathMtuDiscoveryTimeout', wintypes.ULONG),
+        ('LinkLocalAddressBehavior', ctypes.c_int),
+        ('LinkLocalAddressTimeout', wintypes.ULONG),
+        ('ZoneIndices', wintypes.ULONG * 16),
+        ('SitePrefixLength', wintypes.ULONG),
+        ('Metric', wintypes.ULONG),
+        ('NlMtu', wintypes.ULONG),
+        ('Connected', wintypes.BOOLEAN),
+        ('SupportsWakeUpPatterns', wintypes.BOOLEAN),
+        ('SupportsNeighborDiscovery', wintypes.BOOLEAN),
+        ('SupportsRouterDiscovery', wintypes.BOOLEAN),
+        ('ReachableTime', wintypes.ULONG),
+        ('TransmitOffload', wintypes.BYTE),
+        ('ReceiveOffload', wintypes.BYTE),
+        ('DisableDefaultRoutes', wintypes.BOOLEAN)
+    ]
+
+
 class Win32_OSVERSIONINFOEX_W(ctypes.Structure):
     _fields_ = [
         ('dwOSVersionInfoSize', wintypes.DWORD),
@@ -137,7 +204,35 @@ iphlpapi.GetIpForwardTable.argtypes = [
     wintypes.BOOL]
 iphlpapi.GetIpForwardTable.restype = wintypes.DWORD
 
-Ws2_32.inet_ntoa.restype = ctypes.c_char_p
+iphlpapi.CreateIpForwardEntry.argtypes = [
+    ctypes.POINTER(Win32_MIB_IPFORWARDROW)]
+iphlpapi.CreateIpForwardEntry.restype = wintypes.DWORD
+
+iphlpapi.InitializeIpInterfaceEntry.argtypes = [
+    ctypes.POINTER(Win32_MIB_IPINTERFACE_ROW)]
+iphlpapi.InitializeIpInterfaceEntry.restype = None
+
+iphlpapi.GetIpInterfaceEntry.argtypes = [
+    ctypes.POINTER(Win32_MIB_IPINTERFACE_ROW)]
+iphlpapi.GetIpInterfaceEntry.restype = wintypes.DWORD
+
+netapi32.NetUserAdd.argtypes = [wintypes.LPCWSTR, wintypes.DWORD,
+                                ctypes.c_void_p,
+                                ctypes.POINTER(wintypes.DWORD)]
+netapi32.NetUserAdd.restype = wintypes.DWORD
+
+netapi32.NetUserGetInfo.argtypes = [wintypes.LPCWSTR, wintypes.LPCWSTR,
+                                    wintypes.DWORD,
+                                    ctypes.POINTER(ctypes.c_void_p)]
+netapi32.NetUserGetInfo.restype = wintypes.DWORD
+
+netapi32.NetUserSetInfo.argtypes = [wintypes.LPCWSTR, wintypes.LPCWSTR,
+                                    wintypes.DWORD, ctypes.c_void_p,
+                                    ctypes.POINTER(wintypes.DWORD)]
+netapi32.NetUserSetInfo.restype = wintypes.DWORD
+
+netapi32.NetApiBufferFree.argtypes = [ctypes.c_void_p]
+netapi32.NetApiBufferFree.restype = wintypes.DWORD
 
 VER_MAJORVERSION = 1
 VER_MINORVERSION = 2
@@ -146,6 +241,70 @@ VER_BUILDNUMBER = 4
 VER_GREATER_EQUAL = 3
 
 
+class NetUserBackend(userprovisioning.OSUtilsUserBackend):
+    '''
+    Manages users with the Net API, without spawning NET USER or querying
+    WMI.
+    '''
+
+    NERR_UserNotFound = 2221
+    USER_PRIV_USER = 1
+    UF_SCRIPT = 0x1
+    UF_NORMAL_ACCOUNT = 0x200
+    UF_DONT_EXPIRE_PASSWD = 0x10000
+
+    def _get_flags(self, flags, password_expires):
+        if password_expires:
+            return flags & ~self.UF_DONT_EXPIRE_PASSWD
+        return flags | self.UF_DONT_EXPIRE_PASSWD
+
+    def get_user(self, username):
+        buf = ctypes.c_void_p()
+        ret_val = netapi32.NetUserGetInfo(None, unicode(username), 1,
+                                          ctypes.byref(buf))
+        if ret_val == self.NERR_UserNotFound:
+            return None
+        elif ret_val:
+            raise Exception('Cannot get user info. Error: %s' % ret_val)
+
+        try:
+            flags = ctypes.cast(
+                buf, ctypes.POINTER(Win32_USER_INFO_1)).contents.usri1_flags
+        finally:
+            netapi32.NetApiBufferFree(buf)
+        return userprovisioning.UserInfo(
+            username, not flags & self.UF_DONT_EXPIRE_PASSWD, flags)
+
+    def add_user(self, username, password, password_expires):
+        ui = Win32_USER_INFO_1()
+        ui.usri1_name = unicode(username)
+        ui.usri1_password = unicode(password)
+        ui.usri1_priv = self.USER_PRIV_USER
+        ui.usri1_flags = self._get_flags(
+            self.UF_SCRIPT | self.UF_NORMAL_ACCOUNT, password_expires)
+
+        ret_val = netapi32.NetUserAdd(None, 1, ctypes.byref(ui), None)
+        wmiquery.get_wmi_connection().invalidate('Win32_Account')
+        if ret_val:
+            raise Exception('Create user failed. Error: %s' % ret_val)
+
+    def _set_user_info(self, username, level, ui):
+        ret_val = netapi32.NetUserSetInfo(None, unicode(username), level,
+                                          ctypes.byref(ui), None)
+        if ret_val:
+            raise Exception('Set user info failed. Error: %s' % ret_val)
+
+    def update_user(self, user, password, password_expires):
+        ui = Win32_USER_INFO_1003()
+        ui.usri1003_password = unicode(password)
+        self._set_user_info(user.username, 1003, ui)
+
+        if user.password_expires != password_expires:
+            ui = Win32_USER_INFO_1008()
+            ui.usri1008_flags = self._get_flags(user.flags, password_expires)
+            self._set_user_info(user.username, 1008, ui)
+
+
 class WindowsUtils(base.BaseOSUtils):
     NERR_GroupNotFound = 2220
     ERROR_ACCESS_DENIED = 5
@@ -155,6 +314,13 @@ class WindowsUtils(base.BaseOSUtils):
     ERROR_MEMBER_IN_ALIAS = 1378
     ERROR_INVALID_MEMBER = 1388
     ERROR_OLD_WIN_VERSION = 1150
+    ERROR_OBJECT_ALREADY_EXISTS = 5010
+
+    MIB_IPROUTE_TYPE_INDIRECT = 4
+    MIB_IPPROTO_NETMGMT = 3
+    MIB_IPROUTE_METRIC_UNUSED = 0xffffffff
+
+    AF_INET = 2
 
     DRIVE_CDROM = 5
 
@@ -181,6 +347,8 @@ class WindowsUtils(base.BaseOSUtils):
     _FW_SCOPE_ALL = 0
     _FW_SCOPE_LOCAL_SUBNET = 1
 
+    _routing_table_cache = None
+
     def _enable_shutdown_privilege(self):
         process = win32process.GetCurrentProcess()
         token = win32security.OpenProcessToken(
@@ -201,16 +369,27 @@ class WindowsUtils(base.BaseOSUtils):
             raise Exception("Reboot failed")
 
     def _get_user_wmi_object(self, username):
-        conn = wmi.WMI(moniker='//./root/cimv2')
         username_san = self._sanitize_wmi_input(username)
-        q = conn.query('SELECT * FROM Win32_Account where name = '
-                       '\'%(username_san)s\'' % locals())
+        q = wmiquery.get_wmi_connection().query(
+            'Win32_Account', where='Name = \'%(username_san)s\'' % locals())
+        if len(q) > 0:
+            return q[0]
+        return None
+
+    def _get_user_record(self, username):
+        username_san = self._sanitize_wmi_input(username)
+        q = wmiquery.get_wmi_connection().query_records(
+            'Win32_Account', ['Name', 'SID'],
+            'Name = \'%(username_san)s\'' % locals(), cache=True)
         if len(q) > 0:
             return q[0]
         return None
 
     def user_exists(self, username):
-        return self._get_user_wmi_object(username) is not None
+        return self._get_user_record(username) is not None
+
+    def _get_user_backend(self):
+        return NetUserBackend(self)
 
     def _create_or_change_user(self, username, password, create,
                                password_expires):
@@ -222,6 +401,8 @@ class WindowsUtils(base.BaseOSUtils):
             args.append('/ADD')
 
         (out, err, ret_val) = self.execute_process(args)
+        if create:
+            wmiquery.get_wmi_connection().invalidate('Win32_Account')
         if not ret_val:
             self._set_user_password_expiration(username, password_expires)
         else:
@@ -289,7 +470,7 @@ class WindowsUtils(base.BaseOSUtils):
             raise Exception('Unknown error')
 
     def get_user_sid(self, username):
-        r = self._get_user_wmi_object(username)
+        r = self._get_user_record(username)
         if not r:
             return None
         return r.SID
@@ -339,23 +520,22 @@ class WindowsUtils(base.BaseOSUtils):
 
     def get_network_adapters(self):
         l = []
-        conn = wmi.WMI(moniker='//./root/cimv2')
         # Get Ethernet adapters only
-        q = conn.query('SELECT * FROM Win32_NetworkAdapter WHERE '
-                       'AdapterTypeId = 0 AND PhysicalAdapter = True AND '
-                       'MACAddress IS NOT NULL')
+        q = wmiquery.get_wmi_connection().query_records(
+            'Win32_NetworkAdapter', ['Name'],
+            'AdapterTypeId = 0 AND PhysicalAdapter = True AND '
+            'MACAddress IS NOT NULL')
         for r in q:
             l.append(r.Name)
         return l
 
     def set_static_network_config(self, adapter_name, address, netmask,
                                   broadcast, gateway, dnsnameservers):
-        conn = wmi.WMI(moniker='//./root/cimv2')
-
         adapter_name_san = self._sanitize_wmi_input(adapter_name)
-        q = conn.query('SELECT * FROM Win32_NetworkAdapter WHERE '
-                       'MACAddress IS NOT NULL AND '
-                       'Name = \'%(adapter_name_san)s\'' % locals())
+        q = wmiquery.get_wmi_connection().query(
+            'Win32_NetworkAdapter',
+            where='MACAddress IS NOT NULL AND '
+            'Name = \'%(adapter_name_san)s\'' % locals())
         if not len(q):
             raise Exception("Network adapter not found")
 
@@ -370,6 +550,7 @@ class WindowsUtils(base.BaseOSUtils):
 
         LOG.debug("Setting static gateways")
         (ret_val,) = adapter_config.SetGateways([gateway], [1])
+        self._invalidate_routing_table()
         if ret_val > 1:
             raise Exception("Cannot set gateway on network adapter")
         reboot_required = reboot_required or ret_val == 1
@@ -388,16 +569,27 @@ class WindowsUtils(base.BaseOSUtils):
             key_name += section + '\\'
         return key_name
 
+    def _set_config_key_value(self, key, name, value):
+        if type(value) == int:
+            regtype = _winreg.REG_DWORD
+        else:
+            regtype = _winreg.REG_SZ
+        _winreg.SetValueEx(key, name, 0, regtype, value)
+
     def set_config_value(self, name, value, section=None):
         key_name = self._get_config_key_name(section)
 
         with _winreg.CreateKey(_winreg.HKEY_LOCAL_MACHINE,
                                key_name) as key:
-            if type(value) == int:
-                regtype = _winreg.REG_DWORD
-            else:
-                regtype = _winreg.REG_SZ
-            _winreg.SetValueEx(key, name, 0, regtype, value)
+            self._set_config_key_value(key, name, value)
+
+    def set_config_values(self, values, section=None):
+        key_name = self._get_config_key_name(section)
+
+        with _winreg.CreateKey(_winreg.HKEY_LOCAL_MACHINE,
+                               key_name) as key:
+            for (name, value) in values.items():
+                self._set_config_key_value(key, name, value)
 
     def get_config_value(self, name, section=None):
         key_name = self._get_config_key_name(section)
@@ -410,6 +602,26 @@ class WindowsUtils(base.BaseOSUtils):
         except WindowsError:
             return None
 
+    def get_config_values(self, section=None):
+        key_name = self._get_config_key_name(section)
+
+        values = {}
+        try:
+            with _winreg.OpenKey(_winreg.HKEY_LOCAL_MACHINE,
+                                 key_name) as key:
+                i = 0
+                while True:
+                    try:
+                        (name, value, regtype) = _winreg.EnumValue(key, i)
+                    except WindowsError:
+                        # No more values
+                        break
+                    values[name] = value
+                    i += 1
+        except WindowsError:
+            pass
+        return values
+
     def wait_for_boot_completion(self):
         try:
             with _winreg.OpenKey(_winreg.HKEY_LOCAL_MACHINE,
@@ -431,26 +643,41 @@ class WindowsUtils(base.BaseOSUtils):
                 raise ex
 
     def _get_service(self, service_name):
-        conn = wmi.WMI(moniker='//./root/cimv2')
-        service_list = conn.Win32_Service(Name=service_name)
+        service_name_san = self._sanitize_wmi_input(service_name)
+        service_list = wmiquery.get_wmi_connection().query(
+            'Win32_Service', where='Name = \'%(service_name_san)s\'' %
+            locals())
+        if len(service_list):
+            return service_list[0]
+
+    def _get_service_record(self, service_name, fields, cache):
+        service_name_san = self._sanitize_wmi_input(service_name)
+        service_list = wmiquery.get_wmi_connection().query_records(
+            'Win32_Service', fields,
+            'Name = \'%(service_name_san)s\'' % locals(), cache=cache)
         if len(service_list):
             return service_list[0]
 
     def check_service_exists(self, service_name):
-        return self._get_service(service_name) is not None
+        return self._get_service_record(service_name, ['Name', 'StartMode'],
+                                        cache=True) is not None
 
     def get_service_status(self, service_name):
-        service = self._get_service(service_name)
+        # The state changes asynchronously, it is never cached
+        service = self._get_service_record(service_name, ['State'],
+                                           cache=False)
         return service.State
 
     def get_service_start_mode(self, service_name):
-        service = self._get_service(service_name)
+        service = self._get_service_record(service_name,
+                                           ['Name', 'StartMode'], cache=True)
         return service.StartMode
 
     def set_service_start_mode(self, service_name, start_mode):
         #TODO(alexpilotti): Handle the "Delayed Start" case
         service = self._get_service(service_name)
         (ret_val,) = service.ChangeStartMode(start_mode)
+        wmiquery.get_wmi_connection().invalidate('Win32_Service')
         if ret_val != 0:
             raise Exception('Setting service %(service_name)s start mode '
                             'failed with return value: %(ret_val)d' % locals())
@@ -477,11 +704,20 @@ class WindowsUtils(base.BaseOSUtils):
         time.sleep(3)
         self.stop_service(self._service_name)
 
+    def _get_routing_table(self):
+        if not self._routing_table_cache:
+            self._routing_table_cache = routing.RoutingTableCache(
+                self._get_ipv4_routing_table)
+        return self._routing_table_cache.get_table()
+
+    def _invalidate_routing_table(self):
+        if self._routing_table_cache:
+            self._routing_table_cache.invalidate()
+
     def get_default_gateway(self):
-        default_routes = [r for r in self._get_ipv4_routing_table()
-                          if r[0] == '0.0.0.0']
-        if default_routes:
-            return (default_routes[0][3], default_routes[0][2])
+        default_route = self._get_routing_table().get_default_route()
+        if default_route:
+            return (default_route.interface_index, default_route.next_hop)
         else:
             return (None, None)
 
@@ -510,8 +746,8 @@ class WindowsUtils(base.BaseOSUtils):
                 p_forward_table = ctypes.cast(
                     p, ctypes.POINTER(Win32_MIB_IPFORWARDTABLE))
 
-            err = iphlpapi.GetIpForwardTable(p_forward_table,
-                                             ctypes.byref(size), 0)
+                err = iphlpapi.GetIpForwardTable(p_forward_table,
+                                                 ctypes.byref(size), 0)
             if err != self.ERROR_NO_DATA:
                 if err:
                     raise Exception('Unable to get IP forward table. '
@@ -527,9 +763,9 @@ class WindowsUtils(base.BaseOSUtils):
                 while i < forward_table.dwNumEntries:
                     row = table[i]
                     routing_table.append((
-                        Ws2_32.inet_ntoa(row.dwForwardDest),
-                        Ws2_32.inet_ntoa(row.dwForwardMask),
-                        Ws2_32.inet_ntoa(row.dwForwardNextHop),
+                        routing.dword_to_ipv4(row.dwForwardDest),
+                        routing.dword_to_ipv4(row.dwForwardMask),
+                        routing.dword_to_ipv4(row.dwForwardNextHop),
                         row.dwForwardIfIndex,
                         row.dwForwardMetric1))
                     i += 1
@@ -539,16 +775,52 @@ class WindowsUtils(base.BaseOSUtils):
             kernel32.HeapFree(heap, 0, p_forward_table)
 
     def check_static_route_exists(self, destination):
-        return len([r for r in self._get_ipv4_routing_table()
-                    if r[0] == destination]) > 0
+        return self._get_routing_table().has_route(destination)
+
+    def _get_ipv4_interface_metric(self, interface_index):
+        row = Win32_MIB_IPINTERFACE_ROW()
+        iphlpapi.InitializeIpInterfaceEntry(ctypes.byref(row))
+        row.Family = self.AF_INET
+        row.InterfaceIndex = interface_index
+
+        err = iphlpapi.GetIpInterfaceEntry(ctypes.byref(row))
+        if err:
+            raise Exception('Unable to get the metric of interface '
+                            '%(interface_index)s. Error: %(err)s' % locals())
+        return row.Metric
 
     def add_static_route(self, destination, mask, next_hop, interface_index,
                          metric):
-        args = ['ROUTE', 'ADD', destination, 'MASK', mask, next_hop]
-        (out, err, ret_val) = self.execute_process(args)
-        # Cannot use the return value to determine the outcome
-        if err:
-            raise Exception('Unable to add route: %(err)s' % locals())
+        # The route metric includes the interface metric, lower values are
+        # rejected with ERROR_INVALID_PARAMETER
+        try:
+            metric += self._get_ipv4_interface_metric(interface_index)
+        except Exception, ex:
+            LOG.warning('Using the route metric %(metric)s as is: %(ex)s' %
+                        locals())
+
+        row = Win32_MIB_IPFORWARDROW()
+        row.dwForwardDest = routing.ipv4_to_dword(destination)
+        row.dwForwardMask = routing.ipv4_to_dword(mask)
+        row.dwForwardNextHop = routing.ipv4_to_dword(next_hop)
+        row.dwForwardIfIndex = interface_index
+        row.dwForwardType = self.MIB_IPROUTE_TYPE_INDIRECT
+        row.dwForwardProto = self.MIB_IPPROTO_NETMGMT
+        row.dwForwardMetric1 = metric
+        row.dwForwardMetric2 = self.MIB_IPROUTE_METRIC_UNUSED
+        row.dwForwardMetric3 = self.MIB_IPROUTE_METRIC_UNUSED
+        row.dwForwardMetric4 = self.MIB_IPROUTE_METRIC_UNUSED
+        row.dwForwardMetric5 = self.MIB_IPROUTE_METRIC_UNUSED
+
+        try:
+            err = iphlpapi.CreateIpForwardEntry(ctypes.byref(row))
+        finally:
+            self._invalidate_routing_table()
+        if err == self.ERROR_OBJECT_ALREADY_EXISTS:
+            LOG.debug('Route to %s already exists' % destination)
+        elif err:
+            raise Exception('Unable to add route to %(destination)s. '
+                            'Error: %(err)s' % locals())
 
     def check_os_version(self, major, minor, build=0):
         vi = Win32_OSVERSIONINFOEX_W()
@@ -584,6 +856,29 @@ class WindowsUtils(base.BaseOSUtils):
         if ret_val:
             return label.value
 
+    def get_system_uuid(self):
+        q = wmiquery.get_wmi_connection().query_records(
+            'Win32_ComputerSystemProduct', ['UUID'], cache=True)
+        if len(q) > 0:
+            return q[0].UUID
+
+    def set_owner_only_permissions(self, path):
+        # Full control for the user running the process, e.g. LocalSystem,
+        # without the entries inherited from the parent directory
+        process = win32process.GetCurrentProcess()
+        token = win32security.OpenProcessToken(process,
+                                               win32security.TOKEN_QUERY)
+        user_sid = win32security.GetTokenInformation(
+            token, win32security.TokenUser)[0]
+        dacl = win32security.ACL()
+        dacl.AddAccessAllowedAce(win32security.ACL_REVISION,
+                                 ntsecuritycon.FILE_ALL_ACCESS, user_sid)
+        win32security.SetNamedSecurityInfo(
+            path, win32security.SE_FILE_OBJECT,
+            win32security.DACL_SECURITY_INFORMATION |
+            win32security.PROTECTED_DACL_SECURITY_INFORMATION,
+            None, None, dacl, None)
+
     def generate_random_password(self, length):
         while True:
             pwd = super(WindowsUtils, self).generate_random_password(length)
@@ -25,5 +25,27 @@ class BasePlugin(object):
     def get_os_requirements(self):
         return (None, None)
 
+    def get_provided_shared_data(self):
+        '''
+        Returns the shared_data keys set by the plugin.
+        '''
+        return []
+
+    def get_required_shared_data(self):
+        '''
+        Returns the shared_data keys used by the plugin.
+        '''
+        return []
+
+    def get_exclusive_resources(self):
+        '''
+        Returns the names of the resources, e.g. a service configuration,
+        that cannot be modified by other plugins at the same time.
+        '''
+        return []
+
+    def may_require_reboot(self):
+        return False
+
     def execute(self, service, shared_data):
         pass
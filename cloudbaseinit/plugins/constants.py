@@ -16,3 +16,5 @@
 
 SHARED_DATA_USERNAME = "admin_user"
 SHARED_DATA_PASSWORD = "admin_password"
+
+EXCLUSIVE_RESOURCE_WINRM = "winrm"
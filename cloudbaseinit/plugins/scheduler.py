@@ -0,0 +1,145 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import threading
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def get_plugin_dependencies(plugins):
+    '''
+    Returns for each plugin the set of indexes of the preceding plugins
+    that need to be completed before the plugin can be executed.
+
+    A plugin depends on a preceding one if they share any shared_data key
+    provided by one of them or any exclusive resource. Plugins which may
+    require a reboot depend on all the preceding plugins and all the
+    following plugins depend on them, so that the plugins executed before a
+    reboot are the same as in a sequential execution.
+    '''
+    dependencies = []
+    for (j, plugin) in enumerate(plugins):
+        provided = set(plugin.get_provided_shared_data())
+        used = provided | set(plugin.get_required_shared_data())
+        resources = set(plugin.get_exclusive_resources())
+        reboot = plugin.may_require_reboot()
+
+        deps = set()
+        for (i, prev_plugin) in enumerate(plugins[:j]):
+            prev_provided = set(prev_plugin.get_provided_shared_data())
+            prev_used = prev_provided | set(
+                prev_plugin.get_required_shared_data())
+            prev_resources = set(prev_plugin.get_exclusive_resources())
+            if (reboot or prev_plugin.may_require_reboot() or
+                    provided & prev_used or used & prev_provided or
+                    resources & prev_resources):
+                deps.add(i)
+        dependencies.append(deps)
+    return dependencies
+
+
+class PluginScheduler(object):
+    '''
+    Executes plugins as soon as the plugins they depend on are completed,
+    running at most max_workers plugins at the same time. Plugins become
+    ready in the configured order.
+    '''
+
+    def __init__(self, plugins, max_workers):
+        self._plugins = plugins
+        self._max_workers = max(max_workers, 1)
+        self._dependencies = get_plugin_dependencies(plugins)
+
+        self._cond = threading.Condition()
+        self._ready = []
+        self._running = 0
+        self._stopped = False
+        self._reboot_required = False
+        self._exec_plugin = None
+        self._stop_on_reboot = True
+
+    def _start(self, index):
+        self._running += 1
+        if self._max_workers == 1:
+            # Sequential execution in the calling thread
+            self._run(index)
+        else:
+            thread = threading.Thread(target=self._run_in_thread,
+                                      args=(index,))
+            thread.daemon = True
+            thread.start()
+
+    def _run_in_thread(self, index):
+        self._run(index, init_com=(os.name == 'nt'))
+
+    def _run(self, index, init_com=False):
+        plugin = self._plugins[index]
+        reboot_required = False
+        try:
+            if init_com:
+                # Plugins use WMI / COM objects
+                import pythoncom
+                pythoncom.CoInitialize()
+            try:
+                reboot_required = self._exec_plugin(plugin)
+            finally:
+                if init_com:
+                    pythoncom.CoUninitialize()
+        except Exception, ex:
+            LOG.error('Plugin \'%s\' execution failed' % plugin.get_name())
+            LOG.exception(ex)
+
+        with self._cond:
+            self._running -= 1
+            if reboot_required:
+                self._reboot_required = True
+                if self._stop_on_reboot:
+                    LOG.debug('Reboot required by plugin \'%s\', no other '
+                              'plugins will be started' % plugin.get_name())
+                    self._stopped = True
+            for (j, deps) in enumerate(self._dependencies):
+                if index in deps:
+                    deps.remove(index)
+                    if not deps:
+                        self._ready.append(j)
+            self._cond.notify()
+
+    def run(self, exec_plugin, stop_on_reboot=True):
+        '''
+        Calls exec_plugin for each plugin, which returns True if a reboot
+        is required. If stop_on_reboot is set, no other plugins are
+        started once a reboot is required. Returns True if any plugin
+        required a reboot.
+        '''
+        self._exec_plugin = exec_plugin
+        self._stop_on_reboot = stop_on_reboot
+
+        with self._cond:
+            self._ready = [i for (i, deps) in enumerate(self._dependencies)
+                           if not deps]
+            while True:
+                while (self._ready and not self._stopped and
+                       self._running < self._max_workers):
+                    self._ready.sort()
+                    self._start(self._ready.pop(0))
+                if not self._running:
+                    break
+                self._cond.wait()
+
+        return self._reboot_required
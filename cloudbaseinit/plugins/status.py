@@ -0,0 +1,79 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class PluginStatusStore(object):
+    '''
+    Plugin execution status cache backed by the osutils config values.
+
+    All the statuses are loaded at once and updates are buffered until
+    flush is called or batch_size updates are pending, writing them with a
+    single set_config_values call.
+    '''
+
+    def __init__(self, osutils, section, batch_size=0):
+        self._osutils = osutils
+        self._section = section
+        self._batch_size = batch_size
+        self._statuses = None
+        self._loaded_all = False
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._statuses is None:
+            self._statuses = {}
+            try:
+                self._statuses.update(self._osutils.get_config_values(
+                    self._section))
+                self._loaded_all = True
+            except NotImplementedError:
+                # Statuses are retrieved one at a time
+                pass
+
+    def get(self, plugin_name):
+        with self._lock:
+            if plugin_name in self._pending:
+                return self._pending[plugin_name]
+            self._load()
+            if not self._loaded_all and plugin_name not in self._statuses:
+                self._statuses[plugin_name] = self._osutils.get_config_value(
+                    plugin_name, self._section)
+            return self._statuses.get(plugin_name)
+
+    def set(self, plugin_name, status):
+        with self._lock:
+            self._pending[plugin_name] = status
+            flush = (self._batch_size and
+                     len(self._pending) >= self._batch_size)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            LOG.debug('Writing %d plugin statuses' % len(self._pending))
+            self._osutils.set_config_values(self._pending, self._section)
+            if self._statuses is not None:
+                self._statuses.update(self._pending)
+            self._pending = {}
@@ -17,6 +17,7 @@
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.osutils import userprovisioning
 from cloudbaseinit.plugins import base
 from cloudbaseinit.plugins import constants
 
@@ -40,6 +41,10 @@ class CreateUserPlugin(base.BasePlugin):
         # by SetUserPasswordPlugin (starting from Grizzly)
         return osutils.generate_random_password(14)
 
+    def get_provided_shared_data(self):
+        return [constants.SHARED_DATA_USERNAME,
+                constants.SHARED_DATA_PASSWORD]
+
     def execute(self, service, shared_data):
         user_name = CONF.username
         shared_data[constants.SHARED_DATA_USERNAME] = user_name
@@ -47,27 +52,10 @@ class CreateUserPlugin(base.BasePlugin):
         osutils = osutils_factory.OSUtilsFactory().get_os_utils()
         password = self._get_password(osutils)
 
-        if osutils.user_exists(user_name):
-            LOG.info('Setting password for existing user "%s"' % user_name)
-            osutils.set_user_password(user_name, password)
-        else:
-            LOG.info('Creating user "%s" and setting password' % user_name)
-            osutils.create_user(user_name, password)
-            # Create a user profile in order for other plugins
-            # to access the user home, etc
-            token = osutils.create_user_logon_session(user_name,
-                                                      password,
-                                                      True)
-            osutils.close_user_logon_session(token)
-
+        result = osutils.provision_user(userprovisioning.UserSpec(
+            user_name, password, groups=CONF.groups, create_profile=True))
+        if result.created:
             # TODO(alexpilotti): encrypt with DPAPI
             shared_data[constants.SHARED_DATA_PASSWORD] = password
 
-        for group_name in CONF.groups:
-            try:
-                osutils.add_user_to_local_group(user_name, group_name)
-            except Exception as ex:
-                LOG.exception(ex)
-                LOG.error('Cannot add user to group "%s"' % group_name)
-
         return (base.PLUGIN_EXECUTION_DONE, False)
@@ -34,6 +34,9 @@ CONF.register_opts(opts)
 
 
 class NetworkConfigPlugin(base.BasePlugin):
+    def may_require_reboot(self):
+        return True
+
     def execute(self, service, shared_data):
         meta_data = service.get_meta_data('openstack')
         if 'network_config' not in meta_data:
@@ -22,6 +22,9 @@ LOG = logging.getLogger(__name__)
 
 
 class SetHostNamePlugin(base.BasePlugin):
+    def may_require_reboot(self):
+        return True
+
     def execute(self, service, shared_data):
         meta_data = service.get_meta_data('openstack')
         if 'hostname' not in meta_data:
@@ -20,6 +20,7 @@ from cloudbaseinit.metadata.services import base as services_base
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.osutils import userprovisioning
 from cloudbaseinit.plugins import base
 from cloudbaseinit.plugins import constants
 from cloudbaseinit.utils import crypt
@@ -41,8 +42,7 @@ class SetUserPasswordPlugin(base.BasePlugin):
 
     def _encrypt_password(self, ssh_pub_key, password):
         cm = crypt.CryptManager()
-        with cm.load_ssh_rsa_public_key(ssh_pub_key) as rsa:
-            enc_password = rsa.public_encrypt(password)
+        enc_password = cm.public_encrypt(ssh_pub_key, password)
         return base64.b64encode(enc_password)
 
     def _get_ssh_public_key(self, service):
@@ -104,9 +104,17 @@ class SetUserPasswordPlugin(base.BasePlugin):
 
     def _set_password(self, service, osutils, user_name):
         password = self._get_password(service, osutils)
-        LOG.info('Setting the user\'s password')
-        osutils.set_user_password(user_name, password)
-        return password
+        # The password is set only if the user exists
+        result = osutils.provision_user(userprovisioning.UserSpec(
+            user_name, password, create=False))
+        if result.exists:
+            return password
+
+    def get_provided_shared_data(self):
+        return [constants.SHARED_DATA_PASSWORD]
+
+    def get_required_shared_data(self):
+        return [constants.SHARED_DATA_USERNAME]
 
     def execute(self, service, shared_data):
         # TODO(alexpilotti): The username selection logic must be set in the
@@ -119,8 +127,8 @@ class SetUserPasswordPlugin(base.BasePlugin):
             LOG.debug('User\'s password already set in the instance metadata')
         else:
             osutils = osutils_factory.OSUtilsFactory().get_os_utils()
-            if osutils.user_exists(user_name):
-                password = self._set_password(service, osutils, user_name)
+            password = self._set_password(service, osutils, user_name)
+            if password:
                 # TODO(alexpilotti): encrypt with DPAPI
                 shared_data[constants.SHARED_DATA_PASSWORD] = password
 
@@ -20,12 +20,17 @@ from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins import base
+from cloudbaseinit.plugins import constants
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 
 class SetUserSSHPublicKeysPlugin(base.BasePlugin):
+    def get_required_shared_data(self):
+        # The user profile needs to be created first
+        return [constants.SHARED_DATA_USERNAME]
+
     def execute(self, service, shared_data):
         meta_data = service.get_meta_data('openstack')
         if not 'public_keys' in meta_data:
@@ -14,19 +14,39 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import email
+import StringIO
 
 from cloudbaseinit.metadata.services import base as metadata_services_base
+from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.plugins import base
 from cloudbaseinit.plugins.windows import userdatautils
 from cloudbaseinit.plugins.windows.userdataplugins import factory
+from cloudbaseinit.utils import compression
+from cloudbaseinit.utils import concurrency
+from cloudbaseinit.utils import mimestream
+
+opts = [
+    cfg.IntOpt('user_data_spool_threshold', default=1024 * 1024,
+               help='Multipart user data parts larger than this size in '
+               'bytes are spooled to a temporary file while processed'),
+    cfg.IntOpt('user_data_parallel_workers', default=4,
+               help='Maximum number of multipart user data parts of the '
+               'same parallel group executed concurrently'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
 
 LOG = logging.getLogger(__name__)
 
 
 class UserDataPlugin(base.BasePlugin):
     _part_handler_content_type = "text/part-handler"
+    _parallel_group_header = "X-Cloudbase-Parallel-Group"
+
+    def may_require_reboot(self):
+        return True
 
     def execute(self, service, shared_data):
         try:
@@ -39,25 +59,42 @@ class UserDataPlugin(base.BasePlugin):
 
         return self._process_user_data(user_data)
 
-    def _parse_mime(self, user_data):
-        return email.message_from_string(user_data).walk()
+    def _parse_mime(self, user_data_stream):
+        return mimestream.iter_parts(user_data_stream,
+                                     CONF.user_data_spool_threshold,
+                                     decompress=True)
 
     def _process_user_data(self, user_data):
         plugin_status = base.PLUGIN_EXECUTION_DONE
         reboot = False
 
-        LOG.debug('User data content:\n%s' % user_data)
-        if user_data.startswith('Content-Type: multipart'):
+        LOG.debug('User data size: %d bytes' % len(user_data))
+        user_data_stream = compression.get_decompressed_stream(
+            StringIO.StringIO(user_data))
+
+        multipart_header = 'Content-Type: multipart'
+        if user_data_stream.peek(len(multipart_header)) == multipart_header:
             user_data_plugins_factory = factory.UserDataPluginsFactory()
             user_data_plugins = user_data_plugins_factory.load_plugins()
             user_handlers = {}
 
-            for part in self._parse_mime(user_data):
-                (plugin_status, reboot) = self._process_part(part,
-                                                             user_data_plugins,
-                                                             user_handlers)
-                if reboot:
-                    break
+            parts_groups = self._group_parts(
+                self._parse_mime(user_data_stream), user_handlers)
+            try:
+                for parts in parts_groups:
+                    try:
+                        (plugin_status,
+                         reboot) = self._process_parts(parts,
+                                                       user_data_plugins,
+                                                       user_handlers)
+                    finally:
+                        for part in parts:
+                            part.close()
+                    if reboot:
+                        break
+            finally:
+                # Closes the part already parsed ahead of its group, if any
+                parts_groups.close()
 
             if not reboot:
                 for handler_func in list(set(user_handlers.values())):
@@ -65,7 +102,71 @@ class UserDataPlugin(base.BasePlugin):
 
             return (plugin_status, reboot)
         else:
-            return self._process_non_multi_part(user_data)
+            return self._process_non_multi_part(user_data_stream.read())
+
+    def _get_parallel_group(self, part, user_handlers):
+        content_type = part.get_content_type()
+        # Part handlers change the handlers used by the following parts,
+        # while the user provided handlers are not meant to be thread safe
+        if (content_type == self._part_handler_content_type or
+                content_type in user_handlers):
+            return None
+        return part.get(self._parallel_group_header)
+
+    def _group_parts(self, parts, user_handlers):
+        '''
+        Yields lists of consecutive parts belonging to the same parallel
+        group, or single parts not belonging to any group.
+        '''
+        group = []
+        group_name = None
+        part = None
+        try:
+            for part in parts:
+                part_group_name = self._get_parallel_group(part,
+                                                           user_handlers)
+                if group and (not part_group_name or
+                              part_group_name != group_name):
+                    yield group
+                    group = []
+                group.append(part)
+                part = None
+                group_name = part_group_name
+                if not group_name:
+                    yield group
+                    group = []
+            if group:
+                yield group
+        finally:
+            # The part read ahead is not closed by the caller if the
+            # iteration stops before it is yielded
+            if part is not None:
+                part.close()
+
+    def _process_parts(self, parts, user_data_plugins, user_handlers):
+        if len(parts) == 1:
+            return self._process_part(parts[0], user_data_plugins,
+                                      user_handlers)
+
+        LOG.debug('Executing %(count)d user data parts of parallel group '
+                  '"%(group)s"' % {'count': len(parts),
+                                   'group': parts[0].get(
+                                       self._parallel_group_header)})
+        results = concurrency.map_concurrently(
+            lambda part: self._process_part(part, user_data_plugins,
+                                            user_handlers),
+            parts, CONF.user_data_parallel_workers)
+
+        # Merge the results in the parts order, as in sequential execution
+        plugin_status = base.PLUGIN_EXECUTION_DONE
+        reboot = False
+        for (result, ex) in results:
+            if ex:
+                raise ex
+            (plugin_status, reboot) = result
+            if reboot:
+                break
+        return (plugin_status, reboot)
 
     def _process_part(self, part, user_data_plugins, user_handlers):
         ret_val = None
@@ -78,6 +179,10 @@ class UserDataPlugin(base.BasePlugin):
                           content_type)
                 handler_func(None, content_type, part.get_filename(),
                              part.get_payload())
+            elif content_type in compression.COMPRESSED_CONTENT_TYPES:
+                # Decompressed content which is not a MIME message
+                ret_val = userdatautils.execute_user_data_script(
+                    part.get_payload())
             else:
                 user_data_plugin = user_data_plugins.get(content_type)
                 if not user_data_plugin:
@@ -32,7 +32,7 @@ class PartHandlerPlugin(base.BaseUserDataPlugin):
         part_handler_path = os.path.join(temp_dir, part.get_filename())
 
         with open(part_handler_path, "wb") as f:
-            f.write(part.get_payload())
+            part.copy_payload(f)
 
         part_handler = classloader.ClassLoader().load_module(part_handler_path)
 
@@ -13,11 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import tempfile
 import os
+import shutil
+import tempfile
 
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.plugins.windows import userdatautils
 from cloudbaseinit.plugins.windows.userdataplugins import base
 
 LOG = logging.getLogger(__name__)
@@ -31,39 +33,37 @@ class ShellScriptPlugin(base.BaseUserDataPlugin):
         osutils = osutils_factory.OSUtilsFactory().get_os_utils()
 
         file_name = part.get_filename()
-        target_path = os.path.join(tempfile.gettempdir(), file_name)
 
         if file_name.endswith(".cmd"):
-            args = [target_path]
+            interpreter_args = []
             shell = True
         elif file_name.endswith(".sh"):
-            args = ['bash.exe', target_path]
+            interpreter_args = ['bash.exe']
             shell = False
         elif file_name.endswith(".py"):
-            args = ['python.exe', target_path]
+            interpreter_args = ['python.exe']
             shell = False
         elif file_name.endswith(".ps1"):
-            args = ['powershell.exe', '-ExecutionPolicy', 'RemoteSigned',
-                    '-NonInteractive', target_path]
+            interpreter_args = ['powershell.exe', '-ExecutionPolicy',
+                                'RemoteSigned', '-NonInteractive']
             shell = False
         else:
             # Unsupported
             LOG.warning('Unsupported script type')
             return 0
 
+        # Parts can be executed concurrently, each one needs its own
+        # directory to avoid clashes between identical file names
+        target_dir = tempfile.mkdtemp()
+        target_path = os.path.join(target_dir, file_name)
+        args = interpreter_args + [target_path]
+
         try:
             with open(target_path, 'wb') as f:
-                f.write(part.get_payload())
-            (out, err, ret_val) = osutils.execute_process(args, shell)
-
-            LOG.info('User_data script ended with return code: %d' % ret_val)
-            LOG.debug('User_data stdout:\n%s' % out)
-            LOG.debug('User_data stderr:\n%s' % err)
-
-            return ret_val
+                part.copy_payload(f)
+            return userdatautils.execute_script(osutils, args, shell)
         except Exception, ex:
             LOG.warning('An error occurred during user_data execution: \'%s\''
                         % ex)
         finally:
-            if os.path.exists(target_path):
-                os.remove(target_path)
+            shutil.rmtree(target_dir, ignore_errors=True)
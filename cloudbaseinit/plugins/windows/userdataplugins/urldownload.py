@@ -14,23 +14,37 @@
 #    under the License.
 
 import os
+import shutil
 import tempfile
-import uuid
-import email
+import urlparse
 
+from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
-from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.windows.userdataplugins import base
+from cloudbaseinit.utils import artifactcache
+from cloudbaseinit.utils import concurrency
+from cloudbaseinit.utils import download
 from cloudbaseinit.utils import file as util
+from cloudbaseinit.utils import httpclient
+
+opts = [
+    cfg.IntOpt('url_download_max_workers', default=4,
+               help='Maximum number of concurrent user data URL downloads'),
+    cfg.IntOpt('url_download_retries', default=3,
+               help='Number of times an interrupted user data URL download '
+               'is resumed before failing'),
+    cfg.FloatOpt('url_download_timeout', default=60,
+                 help='Socket timeout in seconds of user data URL '
+                 'downloads'),
+    cfg.FloatOpt('url_download_max_retry_delay', default=30,
+                 help='Maximum total time in seconds spent waiting between '
+                 'the retries of a user data URL download'),
+]
 
+CONF = cfg.CONF
+CONF.register_opts(opts)
 
-
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.nonmultipart import MIMENonMultipart
-from email.mime.text import MIMEText
-
-from urlparse import urlparse, urlunparse, urljoin, urlsplit, urldefrag
+LOG = logging.getLogger(__name__)
 
 DECOMP_TYPES = [
     'application/zip',
@@ -42,66 +56,192 @@ DECOMP_TYPES = [
     'application/x-gunzip',
     'application/x-gzip',
     'application/x-gzip-compressed',
+    'application/x-tar',
 ]
 
-# Saves typing errors
-CONTENT_TYPE = 'Content-Type'
-NOT_MULTIPART_TYPE = "text/x-not-multipart"
+ARCHIVE_EXTENSIONS = ['.zip', '.tar', '.tgz', '.tar.gz', '.tar.bz2']
 
 DOWNLOAD_DIR = "openstack"
 
 
-LOG = logging.getLogger(__name__)
-
-
 class URLDownloadPlugin(base.BaseUserDataPlugin):
     def __init__(self):
         super(URLDownloadPlugin, self).__init__("text/x-download-url")
-        self.ssl_details = None #need to be changed ??? lem0na
 
     def process(self, part):
-        content = part.get_payload()
-        self._do_include(content)
+        self._do_include(part.get_payload())
 
-    def _do_include(self, content):
+    def _get_urls(self, content):
         # Include a list of urls, one per line
         # lines starting with # are treated as comments
         # empty lines are skipped
+        urls = []
         for line in content.splitlines():
             if line.startswith("#"):
                 continue
             download_url = line.strip()
-            if not download_url:
-                continue
-
-            LOG.debug("Downloading '%s'." % download_url)
-            resp = util.read_file_or_url(download_url, ssl_details=self.ssl_details)
-            if resp is not None:
-
-                local_filename = None
-                url_path = urlsplit(download_url)[2]
-                dest_dir = os.path.join(tempfile.gettempdir(), DOWNLOAD_DIR)
-                if url_path != "":
-                    file_name = os.path.basename(url_path)
-                    local_filename = os.path.join(dest_dir, file_name)
-                    LOG.debug("Saving '%s' to '%s'." % (file_name, dest_dir))
-                    try:
-                        util.write_file(local_filename, str(resp), mode=0600)
-                    except Exception as ex:
-                        LOG.warning('An error occurred during saving file: \'%s\'' % ex)
-                        raise
-
-                content_type = resp.headers.get("content-type")
-                if local_filename is not None and content_type in DECOMP_TYPES:
-                    LOG.debug("Uncompressing '%s' to '%s'." % (local_filename, dest_dir))
-                    try:
-                        util.unzip_archive(local_filename, dest_dir)
-                        os.remove(local_filename)
-                    except Exception as ex:
-                        LOG.warning('An error occurred during uncompressing file: \'%s\'' % ex)
-                        raise
-                    finally:
-                        if os.path.exists(local_filename):
-                            os.remove(local_filename)
-            pass
+            if download_url:
+                urls.append(download_url)
+        return urls
 
+    def _do_include(self, content):
+        urls = self._get_urls(content)
+        if not urls:
+            return
+
+        dest_dir = os.path.join(tempfile.gettempdir(), DOWNLOAD_DIR)
+        util.ensure_dir(dest_dir)
+
+        errors = []
+        pool = httpclient.HTTPConnectionPool(
+            maxsize=CONF.url_download_max_workers,
+            timeout=CONF.url_download_timeout)
+        try:
+            for batch_urls in self._get_download_batches(urls):
+                results = concurrency.map_concurrently(
+                    lambda url: self._download(pool, url, dest_dir),
+                    batch_urls, CONF.url_download_max_workers)
+
+                # Archives are extracted one at a time in the URLs order, as
+                # their content can overlap
+                for (url, (archive_filename, ex)) in zip(batch_urls,
+                                                         results):
+                    if ex:
+                        LOG.warning('An error occurred during the download '
+                                    'of \'%(url)s\': \'%(ex)s\'' %
+                                    locals())
+                        errors.append(ex)
+                    elif archive_filename:
+                        try:
+                            self._extract_archive(archive_filename, dest_dir)
+                        except Exception, ex:
+                            LOG.warning('An error occurred during the '
+                                        'extraction of \'%(url)s\': '
+                                        '\'%(ex)s\'' % locals())
+                            errors.append(ex)
+        finally:
+            pool.close()
+
+        if errors:
+            raise errors[0]
+
+    def _get_file_name(self, url):
+        (url, sha256) = download.split_checksum(url)
+        return os.path.basename(urlparse.urlsplit(url).path)
+
+    def _get_download_batches(self, urls):
+        '''
+        Splits urls in batches to be downloaded one after the other, so that
+        URLs saved with the same file name are never downloaded at the same
+        time and are processed in order.
+        '''
+        batches = []
+        file_name_counts = {}
+        for url in urls:
+            # File names are case insensitive on Windows
+            file_name = self._get_file_name(url).lower()
+            index = file_name_counts.get(file_name, 0)
+            if file_name:
+                file_name_counts[file_name] = index + 1
+            if index == len(batches):
+                batches.append([])
+            batches[index].append(url)
+        return batches
+
+    def _is_archive(self, file_name, content_type):
+        if content_type in DECOMP_TYPES:
+            return True
+        for extension in ARCHIVE_EXTENSIONS:
+            if file_name.lower().endswith(extension):
+                return True
+        return False
+
+    def _extract_archive(self, archive_filename, dest_dir):
+        LOG.debug("Uncompressing '%(archive_filename)s' to "
+                  "'%(dest_dir)s'." % locals())
+        try:
+            util.extract_archive(archive_filename, dest_dir)
+        finally:
+            os.remove(archive_filename)
+
+    def _replace_file(self, source_path, local_filename, copy=False):
+        if os.path.exists(local_filename):
+            os.remove(local_filename)
+        if copy:
+            shutil.copyfile(source_path, local_filename)
+        else:
+            os.rename(source_path, local_filename)
+        os.chmod(local_filename, 0600)
+
+    def _copy_from_cache(self, cache, url, cached_path, local_filename):
+        LOG.debug("Using cached artifact for '%s'." % url)
+        self._replace_file(cached_path, local_filename, copy=True)
+        entry = cache.get_entry(url)
+        if entry:
+            return entry['content_type']
+
+    def _fetch(self, pool, cache, url, sha256, local_filename):
+        '''
+        Saves the content of url to local_filename, from the artifact cache
+        if available and not modified. Returns the content type.
+        '''
+        request_headers = {}
+        if cache:
+            if sha256:
+                # Content addressed by its checksum, no request needed
+                cached_path = cache.get_path(checksum=sha256)
+                if cached_path:
+                    return self._copy_from_cache(cache, url, cached_path,
+                                                 local_filename)
+            else:
+                request_headers = cache.get_conditional_headers(url)
+
+        # Unique name, as other workers can download to the same directory
+        (fd, part_filename) = tempfile.mkstemp(
+            dir=os.path.dirname(local_filename), suffix='.part')
+        os.close(fd)
+        LOG.debug("Downloading '%(url)s' to '%(local_filename)s'." %
+                  locals())
+        try:
+            try:
+                headers = download.download_file(
+                    pool, url, part_filename, sha256,
+                    retries=CONF.url_download_retries,
+                    timeout=CONF.url_download_timeout,
+                    headers=request_headers,
+                    max_total_delay=CONF.url_download_max_retry_delay)
+            except download.NotModified:
+                cached_path = cache.get_path(url)
+                if cached_path:
+                    return self._copy_from_cache(cache, url, cached_path,
+                                                 local_filename)
+                # Evicted in the meantime
+                return self._fetch(pool, None, url, sha256, local_filename)
+
+            if cache:
+                cache.add_file(url, part_filename,
+                               content_type=headers.get('content-type'),
+                               etag=headers.get('etag'),
+                               last_modified=headers.get('last-modified'))
+            self._replace_file(part_filename, local_filename)
+        finally:
+            if os.path.exists(part_filename):
+                os.remove(part_filename)
+        return headers.get('content-type')
+
+    def _download(self, pool, url, dest_dir):
+        '''
+        Saves the content of url in dest_dir. Returns the path of the file
+        if it is an archive to be extracted, None otherwise.
+        '''
+        file_name = self._get_file_name(url)
+        (url, sha256) = download.split_checksum(url)
+        if not file_name:
+            LOG.warning('No file name in URL \'%s\', skipping' % url)
+            return
+
+        local_filename = os.path.join(dest_dir, file_name)
+        content_type = self._fetch(pool, artifactcache.get_artifact_cache(),
+                                   url, sha256, local_filename)
+        if self._is_archive(file_name, content_type):
+            return local_filename
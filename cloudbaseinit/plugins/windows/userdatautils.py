@@ -15,13 +15,56 @@
 import os
 import re
 import tempfile
+import threading
 import uuid
 
+from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import processrunner
+
+opts = [
+    cfg.FloatOpt('user_data_script_timeout', default=0,
+                 help='Max. time a user_data script can run before being '
+                 'killed along with its child processes, expressed in '
+                 'seconds. 0 means no limit'),
+    cfg.FloatOpt('user_data_scripts_total_timeout', default=0,
+                 help='Max. time available to all the user_data scripts, '
+                 'expressed in seconds since the first one started. '
+                 'Scripts still running are killed and the following ones '
+                 'are skipped. 0 means no limit'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
 
 LOG = logging.getLogger(__name__)
 
+_scripts_deadline = None
+_scripts_deadline_lock = threading.Lock()
+
+
+def _get_scripts_deadline():
+    global _scripts_deadline
+    with _scripts_deadline_lock:
+        if not _scripts_deadline:
+            _scripts_deadline = processrunner.Deadline(
+                CONF.user_data_scripts_total_timeout or None)
+        return _scripts_deadline
+
+
+def execute_script(osutils, args, shell):
+    result = osutils.run_process(args, shell,
+                                 timeout=CONF.user_data_script_timeout or None,
+                                 deadline=_get_scripts_deadline())
+    if result.timed_out:
+        LOG.warning('User_data script did not complete in time')
+
+    LOG.info('User_data script ended with return code: %(exit_code)s, '
+             'duration: %(duration).2f seconds, stdout: %(stdout_bytes)d '
+             'bytes, stderr: %(stderr_bytes)d bytes' % vars(result))
+    return result.exit_code
+
 
 def execute_user_data_script(user_data):
     osutils = osutils_factory.OSUtilsFactory().get_os_utils()
@@ -67,13 +110,7 @@ def execute_user_data_script(user_data):
     try:
         with open(target_path, 'wb') as f:
             f.write(user_data)
-        (out, err, ret_val) = osutils.execute_process(args, shell)
-
-        LOG.info('User_data script ended with return code: %d' % ret_val)
-        LOG.debug('User_data stdout:\n%s' % out)
-        LOG.debug('User_data stderr:\n%s' % err)
-
-        return ret_val
+        return execute_script(osutils, args, shell)
     except Exception, ex:
         LOG.warning('An error occurred during user_data execution: \'%s\''
                     % ex)
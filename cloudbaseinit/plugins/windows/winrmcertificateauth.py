@@ -69,6 +69,18 @@ class ConfigWinRMCertificateAuthPlugin(base.BasePlugin):
 
         return (user_name, password)
 
+    def get_provided_shared_data(self):
+        # The password is unset after use
+        return [constants.SHARED_DATA_PASSWORD]
+
+    def get_required_shared_data(self):
+        return [constants.SHARED_DATA_USERNAME]
+
+    def get_exclusive_resources(self):
+        # The WinRM configuration is read and written back, executed after
+        # ConfigWinRMListenerPlugin which enables the WinRM service
+        return [constants.EXCLUSIVE_RESOURCE_WINRM]
+
     def execute(self, service, shared_data):
         user_name, password = self._get_credentials(shared_data)
 
@@ -18,6 +18,7 @@ from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins import base
+from cloudbaseinit.plugins import constants
 from cloudbaseinit.plugins.windows import x509
 from cloudbaseinit.plugins.windows import winrmconfig
 
@@ -39,6 +40,9 @@ class ConfigWinRMListenerPlugin(base.BasePlugin):
     _cert_subject = "CN=Cloudbase-Init WinRM"
     _winrm_service_name = "WinRM"
 
+    def get_exclusive_resources(self):
+        return [constants.EXCLUSIVE_RESOURCE_WINRM]
+
     def _check_winrm_service(self, osutils):
         if not osutils.check_service_exists(self._winrm_service_name):
             LOG.warn("Cannot configure the WinRM listener as the service "
@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+'''
+RSA public key encryption micro-benchmark.
+
+Compares loading the SSH public key for each secret, as done before the
+key cache, with encrypting all the secrets under the cached key. Run with:
+
+    python -m cloudbaseinit.tests.benchmark.crypt_benchmark [--secrets N]
+'''
+
+import argparse
+import json
+import time
+
+SSH_PUB_KEY = (
+    'ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQCaeUNyFLWS2HyUsC6lmgoLJAjowVE7'
+    'tPJAVAbm72gqQnRLeQ8fpbKLFyRsVJ8Gxmc77ug4jIk1WYCZZv+xCAczNz4g3+QwlEjW'
+    'LFah2a8aaIUQ7TWCM0AaqKqsIc5wowVnMO4XMs9WTIm1cLl+BimhMEIoNorHegLp5T5m'
+    'ZKIQjuPGSzv14t7ApyIMMtz66WFzXo0/U/iU9d1ZLzzWihwpH1MOG528cAe4sDerRLr9'
+    'bi8A/nGAQyl9MmXMFeAVeKdgB+Vv/CXOBF/M7iauU0yb/K/DqG/Crr8NLRnO5X3qGuHm'
+    'SOpOoGYNFOatRu9fK0W4nKBoH1WiWGfzMc8Aqk0l benchmark')
+SSH_PUB_KEY_FINGERPRINT = 'c3:7f:27:fc:07:aa:dc:ec:ae:bb:bb:bf:e3:7c:20:60'
+
+
+def _time(func, iterations):
+    start_time = time.time()
+    for i in range(iterations):
+        func()
+    return (time.time() - start_time) / iterations
+
+
+def run_benchmark(cm, secrets=4, iterations=100, ssh_pub_key=SSH_PUB_KEY):
+    '''
+    Returns the average time in seconds needed to encrypt the given number
+    of secrets with the CryptManager cm, with and without the key cache.
+    '''
+    clear_texts = ['Passw0rd%d' % i for i in range(secrets)]
+
+    def _uncached():
+        for clear_text in clear_texts:
+            with cm.load_ssh_rsa_public_key(ssh_pub_key) as rsa:
+                rsa.public_encrypt(clear_text)
+
+    def _cached():
+        cm.encrypt_many(ssh_pub_key, clear_texts)
+
+    cm.clear_key_cache()
+    uncached_time = _time(_uncached, iterations)
+    cached_time = _time(_cached, iterations)
+    cm.clear_key_cache()
+
+    return {'secrets': secrets,
+            'iterations': iterations,
+            'uncached_time': uncached_time,
+            'cached_time': cached_time,
+            'speedup': uncached_time / cached_time if cached_time else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crypt benchmark')
+    parser.add_argument('--secrets', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    # Requires an OpenSSL library compatible with the crypt module
+    from cloudbaseinit.utils import crypt
+
+    result = run_benchmark(crypt.CryptManager(), args.secrets,
+                           args.iterations)
+    print json.dumps(result, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import BaseHTTPServer
+import json
+import random
+import SocketServer
+import threading
+import time
+
+META_DATA = {
+    'uuid': '4f3a5c2e-6c38-4bd8-9c6d-32a3b1d0a2c1',
+    'hostname': 'benchmark-host',
+    'public_keys': {'key1': 'ssh-rsa AAAAB3NzaC1yc2E benchmark'},
+    'network_config': {'content_path': '/content/0000'},
+}
+
+NETWORK_CONFIG = ('auto eth0\n'
+                  'iface eth0 inet static\n'
+                  '    address 10.0.0.2\n'
+                  '    netmask 255.255.255.0\n'
+                  '    broadcast 10.0.0.255\n'
+                  '    gateway 10.0.0.1\n'
+                  '    dns-nameservers 8.8.8.8 8.8.4.4\n')
+
+USER_DATA = 'rem cmd\necho benchmark\n'
+
+
+def get_openstack_files(meta_data=META_DATA, user_data=USER_DATA,
+                        network_config=NETWORK_CONFIG):
+    return {'openstack/latest/meta_data.json': json.dumps(meta_data),
+            'openstack/latest/user_data': user_data,
+            'openstack/content/0000': network_config}
+
+
+def get_ec2_files(meta_data=META_DATA, user_data=USER_DATA,
+                  version='2009-04-04'):
+    meta_data_path = version + '/meta-data/'
+    keys = sorted(meta_data['public_keys'].items())
+    files = {
+        meta_data_path: 'hostname\ninstance-id\npublic-keys/',
+        meta_data_path + 'hostname': meta_data['hostname'],
+        meta_data_path + 'instance-id': meta_data['uuid'],
+        meta_data_path + 'public-keys/': '\n'.join(
+            '%d=%s' % (i, name) for (i, (name, key)) in enumerate(keys)),
+        version + '/user-data': user_data,
+    }
+    for (i, (name, key)) in enumerate(keys):
+        files[meta_data_path + 'public-keys/%d/openssh-key' % i] = key
+    return files
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send status, headers and body at once, avoiding Nagle delays
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=''):
+        self.server.fake.record(self.command, self.path, status)
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        fake.delay()
+        path = self.path.lstrip('/')
+        if fake.inject_error():
+            self._send(500)
+        elif path in fake.files:
+            self._send(200, fake.files[path])
+        else:
+            self._send(404)
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.getheader('Content-Length') or 0)
+        body = self.rfile.read(length)
+        fake.delay()
+        path = self.path.lstrip('/')
+        if fake.inject_error():
+            self._send(500)
+        elif path in fake.posted_data:
+            # The password can be set only once
+            self._send(409)
+        else:
+            fake.posted_data[path] = body
+            self._send(200)
+
+
+class FakeMetadataServer(object):
+    '''
+    Local HTTP server serving OpenStack and EC2 style metadata, with an
+    optional latency, jitter and error rate applied to each request.
+    '''
+
+    def __init__(self, files, latency=0, jitter=0, error_rate=0,
+                 seed=None):
+        self.files = files
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.posted_data = {}
+        self.requests = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d/' % self._server.server_address[1]
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0),
+                                            _RequestHandler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def delay(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(-self.jitter,
+                                                        self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def inject_error(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def record(self, method, path, status):
+        with self._lock:
+            self.requests.append((method, path, status))
+
+    def reset_requests(self):
+        with self._lock:
+            self.requests = []
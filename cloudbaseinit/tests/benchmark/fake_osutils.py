@@ -0,0 +1,176 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import functools
+import threading
+import time
+
+from cloudbaseinit.osutils import base
+from cloudbaseinit.utils import processrunner
+from cloudbaseinit.utils import timeline
+
+
+def _recorded(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start_time = time.time()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.record(func.__name__, args, time.time() - start_time)
+    return wrapper
+
+
+class RecordingOSUtils(base.BaseOSUtils):
+    '''
+    OS utils stand-in recording each call with its duration. The config
+    values are kept in memory, so they survive across simulated reboots
+    when the same instance is reused.
+    '''
+
+    def __init__(self, boot_completion_delay=0, script_return_codes=None,
+                 host_name_reboot=False, network_reboot=False):
+        self.calls = []
+        self.config = {}
+        self.users = {}
+        self.boot_completion_delay = boot_completion_delay
+        self.script_return_codes = list(script_return_codes or [])
+        self.host_name_reboot = host_name_reboot
+        self.network_reboot = network_reboot
+        self.user_home = None
+        self.rebooted = False
+        self.terminated = False
+        self._lock = threading.Lock()
+
+    def record(self, name, args, duration):
+        with self._lock:
+            self.calls.append((name, args, duration))
+
+    def get_calls(self, name=None):
+        with self._lock:
+            return [c for c in self.calls if not name or c[0] == name]
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = []
+            self.rebooted = False
+            self.terminated = False
+
+    @_recorded
+    def wait_for_boot_completion(self):
+        time.sleep(self.boot_completion_delay)
+
+    @_recorded
+    def reboot(self):
+        self.rebooted = True
+
+    @_recorded
+    def terminate(self):
+        self.terminated = True
+
+    @_recorded
+    def get_system_uuid(self):
+        return '4F3A5C2E-6C38-4BD8-9C6D-32A3B1D0A2C1'
+
+    @_recorded
+    def check_os_version(self, major, minor, build=0):
+        return True
+
+    @_recorded
+    def get_config_value(self, name, section=None):
+        with self._lock:
+            return self.config.get(section, {}).get(name)
+
+    @_recorded
+    def get_config_values(self, section=None):
+        with self._lock:
+            return dict(self.config.get(section, {}))
+
+    @_recorded
+    def set_config_value(self, name, value, section=None):
+        with self._lock:
+            self.config.setdefault(section, {})[name] = value
+
+    @_recorded
+    def set_config_values(self, values, section=None):
+        with self._lock:
+            self.config.setdefault(section, {}).update(values)
+
+    @_recorded
+    def user_exists(self, username):
+        return username in self.users
+
+    @_recorded
+    def create_user(self, username, password, password_expires=False):
+        self.users[username] = password
+
+    @_recorded
+    def set_user_password(self, username, password, password_expires=False):
+        self.users[username] = password
+
+    @_recorded
+    def add_user_to_local_group(self, username, groupname):
+        pass
+
+    @_recorded
+    def create_user_logon_session(self, username, password, domain='.',
+                                  load_profile=True):
+        return object()
+
+    @_recorded
+    def close_user_logon_session(self, token):
+        pass
+
+    @_recorded
+    def get_user_home(self, username):
+        return self.user_home
+
+    @_recorded
+    def set_host_name(self, new_host_name):
+        return self.host_name_reboot
+
+    @_recorded
+    def get_network_adapters(self):
+        return ['Ethernet']
+
+    @_recorded
+    def set_static_network_config(self, adapter_name, address, netmask,
+                                  broadcast, gateway, dnsnameservers):
+        return self.network_reboot
+
+    @_recorded
+    def get_cdrom_drives(self):
+        return []
+
+    def _get_script_return_code(self):
+        with self._lock:
+            ret_val = 0
+            if self.script_return_codes:
+                ret_val = self.script_return_codes.pop(0)
+        timeline.get_boot_timeline().record_subprocess(0)
+        return ret_val
+
+    @_recorded
+    def execute_process(self, args, shell=True):
+        return ('', '', self._get_script_return_code())
+
+    @_recorded
+    def run_process(self, args, shell=False, timeout=None, deadline=None,
+                    name=None):
+        ret_val = self._get_script_return_code()
+        return processrunner.ProcessResult(
+            args, ret_val, 0, processrunner.RingBuffer(0),
+            processrunner.RingBuffer(0), False)
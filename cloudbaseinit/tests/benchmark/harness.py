@@ -0,0 +1,306 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+'''
+End to end boot benchmark.
+
+Runs InitManager.configure_host against a local fake metadata server or a
+generated config drive image, with a recording fake osutils, and reports
+the boot latency, a per phase breakdown and the metadata request count
+for each scenario. Run with:
+
+    python -m cloudbaseinit.tests.benchmark.harness [--scenario NAME]
+'''
+
+import argparse
+import json
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from cloudbaseinit import init
+# Imported for the options they register
+from cloudbaseinit.metadata.services import base  # noqa
+from cloudbaseinit.metadata.services import ec2service  # noqa
+from cloudbaseinit.metadata.services import httpservice  # noqa
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.tests.benchmark import fake_metadata_server
+from cloudbaseinit.tests.benchmark import fake_osutils
+from cloudbaseinit.tests.metadata.services.configdrive import fake_iso
+from cloudbaseinit.utils import timeline
+
+CONF = cfg.CONF
+
+DEFAULT_PLUGINS = [
+    'cloudbaseinit.plugins.windows.sethostname.SetHostNamePlugin',
+    'cloudbaseinit.plugins.windows.createuser.CreateUserPlugin',
+    'cloudbaseinit.plugins.windows.networkconfig.NetworkConfigPlugin',
+    'cloudbaseinit.plugins.windows.sshpublickeys.SetUserSSHPublicKeysPlugin',
+    'cloudbaseinit.plugins.windows.userdata.UserDataPlugin',
+]
+
+HTTP_SERVICE = 'cloudbaseinit.metadata.services.httpservice.HttpService'
+EC2_SERVICE = 'cloudbaseinit.metadata.services.ec2service.EC2Service'
+
+# Windows only modules imported by the config drive service
+_WINDOWS_MODULES = ['ctypes', 'ctypes.wintypes', 'wmi']
+
+
+class BootResult(object):
+    def __init__(self, name):
+        self.name = name
+        self.total_time = None
+        self.phases = {}
+        self.plugins = {}
+        self.metadata_probes = {}
+        self.requests = 0
+        self.request_errors = 0
+        self.osutils_calls = 0
+        self.rebooted = False
+
+    def to_dict(self):
+        return {'name': self.name,
+                'total_time': self.total_time,
+                'phases': self.phases,
+                'plugins': self.plugins,
+                'metadata_probes': self.metadata_probes,
+                'requests': self.requests,
+                'request_errors': self.request_errors,
+                'osutils_calls': self.osutils_calls,
+                'rebooted': self.rebooted}
+
+
+class BootHarness(object):
+    '''
+    Executes simulated boots. The osutils instance, and therefore the
+    plugins execution status, is kept across boots.
+    '''
+
+    def __init__(self, tmp_dir, server=None, metadata_services=None,
+                 plugins=None, osutils=None, conf_overrides=None):
+        self._tmp_dir = tmp_dir
+        self.server = server
+        self.osutils = osutils or fake_osutils.RecordingOSUtils()
+        self.osutils.user_home = os.path.join(tmp_dir, 'home')
+
+        self._overrides = {
+            'metadata_services': metadata_services or [HTTP_SERVICE],
+            'plugins': plugins or DEFAULT_PLUGINS,
+            'metadata_cache_path': None,
+            'retry_count_interval': 0,
+            'boot_timeline_path': os.path.join(tmp_dir, 'timeline.json'),
+        }
+        if server:
+            self._overrides['metadata_base_url'] = server.base_url
+            self._overrides['ec2_metadata_base_url'] = (server.base_url +
+                                                        '2009-04-04/')
+        self._overrides.update(conf_overrides or {})
+
+    def _set_overrides(self):
+        for (name, value) in self._overrides.items():
+            CONF.set_override(name, value)
+
+    def _clear_overrides(self):
+        for name in self._overrides:
+            CONF.clear_override(name)
+
+    def boot(self, name):
+        result = BootResult(name)
+        self.osutils.reset_calls()
+        if self.server:
+            self.server.reset_requests()
+
+        self._set_overrides()
+        try:
+            boot_timeline = timeline.BootTimeline(CONF.boot_timeline_path)
+            with mock.patch('cloudbaseinit.osutils.factory.OSUtilsFactory.'
+                            'get_os_utils', return_value=self.osutils):
+                with mock.patch('cloudbaseinit.utils.timeline._boot_timeline',
+                                boot_timeline):
+                    start_time = time.time()
+                    init.InitManager().configure_host()
+                    result.total_time = time.time() - start_time
+        finally:
+            self._clear_overrides()
+
+        self._set_result_details(result, boot_timeline)
+        return result
+
+    def _set_result_details(self, result, boot_timeline):
+        probes = boot_timeline.get_spans(timeline.SPAN_METADATA_PROBE)
+        plugins = boot_timeline.get_spans(timeline.SPAN_PLUGIN)
+
+        result.phases['wait_for_boot_completion'] = sum(
+            c[2] for c in self.osutils.get_calls('wait_for_boot_completion'))
+        result.phases['metadata_discovery'] = sum(s.wall_time
+                                                  for s in probes)
+        if plugins:
+            result.phases['plugins'] = (
+                max(s.start_time + s.wall_time for s in plugins) -
+                min(s.start_time for s in plugins))
+        else:
+            result.phases['plugins'] = 0
+        result.phases['other'] = max(result.total_time -
+                                     sum(result.phases.values()), 0)
+
+        result.plugins = dict((s.name, {'status': s.status,
+                                        'wall_time': s.wall_time,
+                                        'metadata_fetches':
+                                        s.metadata_fetches,
+                                        'subprocesses': s.subprocesses})
+                              for s in plugins)
+        result.metadata_probes = dict((s.name, {'status': s.status,
+                                                'wall_time': s.wall_time})
+                                      for s in probes)
+        if self.server:
+            result.requests = len(self.server.requests)
+            result.request_errors = len([r for r in self.server.requests
+                                         if r[2] >= 500])
+        result.osutils_calls = len(self.osutils.get_calls())
+        result.rebooted = self.osutils.rebooted
+
+
+def _run_with_server(tmp_dir, files, boot_names, osutils=None,
+                     metadata_services=None, **server_kwargs):
+    server = fake_metadata_server.FakeMetadataServer(files, **server_kwargs)
+    server.start()
+    try:
+        harness = BootHarness(tmp_dir, server,
+                              metadata_services=metadata_services,
+                              osutils=osutils)
+        return [harness.boot(name) for name in boot_names]
+    finally:
+        server.stop()
+
+
+def cold_boot(tmp_dir):
+    return _run_with_server(tmp_dir,
+                            fake_metadata_server.get_openstack_files(),
+                            ['cold_boot'])
+
+
+def reboot_after_execute_on_next_boot(tmp_dir):
+    # The user data script requests to be executed again on next boot
+    osutils = fake_osutils.RecordingOSUtils(script_return_codes=[1002, 0])
+    return _run_with_server(tmp_dir,
+                            fake_metadata_server.get_openstack_files(),
+                            ['first_boot', 'execute_on_next_boot'],
+                            osutils=osutils)
+
+
+def slow_metadata(tmp_dir, latency=0.05, jitter=0.02, error_rate=0.1):
+    return _run_with_server(tmp_dir,
+                            fake_metadata_server.get_openstack_files(),
+                            ['slow_metadata'], latency=latency,
+                            jitter=jitter, error_rate=error_rate, seed=0)
+
+
+def ec2_fallback(tmp_dir):
+    return _run_with_server(tmp_dir, fake_metadata_server.get_ec2_files(),
+                            ['ec2_fallback'],
+                            metadata_services=[HTTP_SERVICE, EC2_SERVICE])
+
+
+def config_drive(tmp_dir):
+    from cloudbaseinit.metadata.services.configdrive.posix.disk \
+        import physical_disk
+
+    image = fake_iso.build_iso(fake_metadata_server.get_openstack_files())
+    image_path = os.path.join(tmp_dir, 'config-2.iso')
+    with open(image_path, 'wb') as f:
+        f.write(image)
+
+    def _get_reader():
+        from cloudbaseinit.metadata.services.configdrive import iso9660
+        from cloudbaseinit.metadata.services.configdrive import manager
+
+        disk = physical_disk.PhysicalDisk(image_path)
+        disk.open()
+        return iso9660.ISO9660Reader(
+            manager._PhysicalDiskFile(disk, len(image)))
+
+    modules = dict((name, mock.MagicMock()) for name in _WINDOWS_MODULES)
+    with mock.patch.dict(sys.modules, modules):
+        from cloudbaseinit.metadata.services.configdrive import configdrive
+        from cloudbaseinit.metadata.services.configdrive import manager
+        with mock.patch.object(manager.ConfigDriveManager,
+                               'get_raw_hdd_config_drive_reader',
+                               side_effect=_get_reader):
+            harness = BootHarness(
+                tmp_dir, metadata_services=[
+                    configdrive.__name__ + '.ConfigDriveService'],
+                conf_overrides={'config_drive_cdrom': False})
+            return [harness.boot('config_drive')]
+
+
+SCENARIOS = [
+    ('cold_boot', cold_boot),
+    ('reboot_after_execute_on_next_boot', reboot_after_execute_on_next_boot),
+    ('slow_metadata', slow_metadata),
+    ('ec2_fallback', ec2_fallback),
+    ('config_drive', config_drive),
+]
+
+
+def run_scenarios(names=None, repeat=1):
+    results = []
+    for (name, scenario) in SCENARIOS:
+        if names and name not in names:
+            continue
+        for i in range(repeat):
+            tmp_dir = tempfile.mkdtemp()
+            try:
+                results += scenario(tmp_dir)
+            finally:
+                shutil.rmtree(tmp_dir, True)
+    return results
+
+
+def format_report(results):
+    lines = ['%-22s %9s %9s %9s %9s %9s %5s' %
+             ('boot', 'total', 'wait', 'metadata', 'plugins', 'other',
+              'reqs')]
+    for result in results:
+        lines.append('%-22s %9.3f %9.3f %9.3f %9.3f %9.3f %5d' %
+                     (result.name[:22], result.total_time,
+                      result.phases['wait_for_boot_completion'],
+                      result.phases['metadata_discovery'],
+                      result.phases['plugins'], result.phases['other'],
+                      result.requests))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Boot benchmark')
+    parser.add_argument('--scenario', action='append',
+                        choices=[name for (name, s) in SCENARIOS])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results = run_scenarios(args.scenario, args.repeat)
+    if args.json:
+        print json.dumps([r.to_dict() for r in results], indent=2)
+    else:
+        print format_report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import unittest
+
+from cloudbaseinit.tests.benchmark import crypt_benchmark
+from cloudbaseinit.utils import sshkey
+
+
+class CryptBenchmarkTest(unittest.TestCase):
+
+    def test_ssh_pub_key(self):
+        key = sshkey.parse_ssh_rsa_public_key(crypt_benchmark.SSH_PUB_KEY)
+        self.assertEqual(key.fingerprint,
+                         crypt_benchmark.SSH_PUB_KEY_FINGERPRINT)
+
+    def test_run_benchmark(self):
+        mock_cm = mock.MagicMock()
+        result = crypt_benchmark.run_benchmark(mock_cm, secrets=3,
+                                               iterations=2)
+
+        self.assertEqual(mock_cm.load_ssh_rsa_public_key.call_count, 6)
+        self.assertEqual(mock_cm.encrypt_many.call_count, 2)
+        mock_cm.encrypt_many.assert_called_with(
+            crypt_benchmark.SSH_PUB_KEY,
+            ['Passw0rd0', 'Passw0rd1', 'Passw0rd2'])
+        self.assertEqual(mock_cm.clear_key_cache.call_count, 2)
+        self.assertEqual(result['secrets'], 3)
+        self.assertTrue(result['uncached_time'] >= 0)
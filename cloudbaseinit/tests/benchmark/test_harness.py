@@ -0,0 +1,84 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import shutil
+import tempfile
+import unittest
+
+from cloudbaseinit.tests.benchmark import harness
+
+
+class BootHarnessTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _check_cold_boot(self, result):
+        self.assertEqual(len(result.plugins), len(harness.DEFAULT_PLUGINS))
+        for plugin in result.plugins.values():
+            self.assertEqual(plugin['status'], 'done')
+        self.assertFalse(result.rebooted)
+        self.assertTrue(result.total_time >= sum(
+            result.phases[p] for p in ['wait_for_boot_completion',
+                                       'metadata_discovery', 'plugins']))
+
+    def test_cold_boot(self):
+        [result] = harness.cold_boot(self._tmp_dir)
+        self._check_cold_boot(result)
+        # meta_data.json, user_data and the network config content
+        self.assertEqual(result.requests, 3)
+        self.assertEqual(result.plugins['UserDataPlugin']['subprocesses'], 1)
+
+    def test_reboot_after_execute_on_next_boot(self):
+        [first_boot, second_boot] = (
+            harness.reboot_after_execute_on_next_boot(self._tmp_dir))
+
+        self.assertEqual(first_boot.plugins['UserDataPlugin']['status'],
+                         'execute_on_next_boot')
+        statuses = dict((name, plugin['status']) for (name, plugin) in
+                        second_boot.plugins.items())
+        self.assertEqual(statuses.pop('UserDataPlugin'), 'done')
+        self.assertEqual(set(statuses.values()), set(['skipped']))
+        # The network config content is prefetched even if not used
+        self.assertEqual(second_boot.requests, 3)
+
+    def test_slow_metadata(self):
+        [result] = harness.slow_metadata(self._tmp_dir, latency=0.01,
+                                         jitter=0.005, error_rate=0.3)
+        self._check_cold_boot(result)
+        self.assertEqual(result.requests - result.request_errors, 3)
+        self.assertTrue(result.phases['metadata_discovery'] >= 0.005)
+
+    def test_ec2_fallback(self):
+        [result] = harness.ec2_fallback(self._tmp_dir)
+        self._check_cold_boot(result)
+        statuses = dict((name.rsplit('.', 1)[-1], probe['status'])
+                        for (name, probe) in result.metadata_probes.items())
+        self.assertEqual(statuses, {'HttpService': 'not_available',
+                                    'EC2Service': 'loaded'})
+
+    def test_config_drive(self):
+        [result] = harness.config_drive(self._tmp_dir)
+        self._check_cold_boot(result)
+        self.assertEqual(result.requests, 0)
+
+    def test_format_report(self):
+        results = harness.run_scenarios(['cold_boot'], repeat=2)
+        report = harness.format_report(results).splitlines()
+        self.assertEqual(len(report), 3)
+        self.assertTrue(report[1].startswith('cold_boot'))
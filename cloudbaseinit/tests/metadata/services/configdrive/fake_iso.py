@@ -0,0 +1,181 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import struct
+
+BLOCK_SIZE = 2048
+
+
+def _both_endian_32(value):
+    return struct.pack('<I', value) + struct.pack('>I', value)
+
+
+def _both_endian_16(value):
+    return struct.pack('<H', value) + struct.pack('>H', value)
+
+
+def _dir_record(name, extent, size, is_dir, system_use=''):
+    pad = '\x00' if len(name) % 2 == 0 else ''
+    length = 33 + len(name) + len(pad) + len(system_use)
+    if length % 2:
+        system_use += '\x00'
+        length += 1
+    return (chr(length) + '\x00' + _both_endian_32(extent) +
+            _both_endian_32(size) + '\x00' * 7 + chr(2 if is_dir else 0) +
+            '\x00\x00' + _both_endian_16(1) + chr(len(name)) + name + pad +
+            system_use)
+
+
+def _build_tree(files):
+    tree = {}
+    for path in files:
+        parts = path.strip('/').split('/')
+        node = tree
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        # File nodes are identified by their path
+        node[parts[-1]] = path
+    return tree
+
+
+class _Directory(object):
+    def __init__(self, node):
+        self.node = node
+        self.extent = None
+        self.size = None
+        self.children = {}
+
+
+def build_iso(files, label='config-2', joliet=True, rock_ridge=False):
+    '''
+    Returns an ISO 9660 image containing the given files, passed as a
+    dict of paths and contents.
+    '''
+    tree = _build_tree(files)
+
+    def _primary_name(name, is_dir):
+        name = name.upper()
+        return name if is_dir else name + ';1'
+
+    def _rock_ridge_su(name):
+        if rock_ridge:
+            return 'NM' + chr(5 + len(name)) + '\x01\x00' + name
+        return ''
+
+    encoders = [(_primary_name, _rock_ridge_su)]
+    if joliet:
+        encoders.append((lambda n, d: n.encode('utf-16-be'),
+                         lambda n: ''))
+
+    # Directories records are generated twice: size first, extents later
+    def _dir_records(directory, encoder, parent):
+        (encode_name, encode_su) = encoder
+        records = [_dir_record('\x00', directory.extent or 0,
+                               directory.size or 0, True),
+                   _dir_record('\x01', parent.extent or 0,
+                               parent.size or 0, True)]
+        for name in sorted(directory.node):
+            value = directory.node[name]
+            if isinstance(value, dict):
+                child = directory.children[name]
+                records.append(_dir_record(encode_name(name, True),
+                                           child.extent or 0,
+                                           child.size or 0, True,
+                                           encode_su(name)))
+            else:
+                (extent, size) = file_extents.get(value, (0, 0))
+                records.append(_dir_record(encode_name(name, False),
+                                           extent, size, False,
+                                           encode_su(name)))
+
+        data = ''
+        for record in records:
+            # Records cannot span across blocks
+            if len(data) // BLOCK_SIZE != (len(data) + len(record) -
+                                           1) // BLOCK_SIZE:
+                data += '\x00' * (BLOCK_SIZE - len(data) % BLOCK_SIZE)
+            data += record
+        return data
+
+    def _new_dir_tree(node):
+        directory = _Directory(node)
+        for (name, value) in node.items():
+            if isinstance(value, dict):
+                directory.children[name] = _new_dir_tree(value)
+        return directory
+
+    def _walk(directory, parent):
+        yield (directory, parent)
+        for name in sorted(directory.children):
+            for item in _walk(directory.children[name], directory):
+                yield item
+
+    def _blocks(size):
+        return max((size + BLOCK_SIZE - 1) // BLOCK_SIZE, 1)
+
+    file_extents = {}
+    roots = [_new_dir_tree(tree) for encoder in encoders]
+
+    # Volume descriptors and terminator
+    next_extent = 16 + len(encoders) + 1
+    for (root, encoder) in zip(roots, encoders):
+        for (directory, parent) in _walk(root, root):
+            directory.size = _blocks(len(_dir_records(directory, encoder,
+                                                      parent))) * BLOCK_SIZE
+            directory.extent = next_extent
+            next_extent += directory.size // BLOCK_SIZE
+
+    file_data = []
+    for path in sorted(files):
+        content = files[path]
+        file_extents[path] = (next_extent, len(content))
+        file_data.append((next_extent, content))
+        next_extent += _blocks(len(content))
+
+    image = bytearray(next_extent * BLOCK_SIZE)
+    for (i, (root, encoder)) in enumerate(zip(roots, encoders)):
+        for (directory, parent) in _walk(root, root):
+            data = _dir_records(directory, encoder, parent)
+            offset = directory.extent * BLOCK_SIZE
+            image[offset:offset + len(data)] = data
+
+        vd = bytearray(BLOCK_SIZE)
+        vd[0] = 1 if i == 0 else 2
+        vd[1:7] = 'CD001\x01'
+        vd_label = label if i == 0 else label.encode('utf-16-be')
+        vd[40:72] = vd_label.ljust(32)[:32]
+        vd[80:88] = _both_endian_32(next_extent)
+        if i > 0:
+            vd[88:91] = '%/E'
+        vd[120:124] = _both_endian_16(1)
+        vd[124:128] = _both_endian_16(1)
+        vd[128:132] = _both_endian_16(BLOCK_SIZE)
+        vd[156:190] = _dir_record('\x00', root.extent, root.size, True)
+        vd[881] = 1
+        offset = (16 + i) * BLOCK_SIZE
+        image[offset:offset + BLOCK_SIZE] = vd
+
+    terminator = bytearray(BLOCK_SIZE)
+    terminator[0] = 255
+    terminator[1:7] = 'CD001\x01'
+    offset = (16 + len(encoders)) * BLOCK_SIZE
+    image[offset:offset + BLOCK_SIZE] = terminator
+
+    for (extent, content) in file_data:
+        offset = extent * BLOCK_SIZE
+        image[offset:offset + len(content)] = content
+
+    return str(image)
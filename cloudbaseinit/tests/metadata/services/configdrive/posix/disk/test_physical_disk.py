@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cloudbaseinit.metadata.services.configdrive import iso9660
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.tests.metadata.services.configdrive import fake_iso
+
+if os.name != 'nt':
+    from cloudbaseinit.metadata.services.configdrive.posix.disk \
+        import physical_disk
+
+LOG = logging.getLogger(__name__)
+
+
+@unittest.skipIf(os.name == 'nt', 'POSIX only')
+class PhysicalDiskTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._data = ''.join(chr(i % 251) for i in range(100000))
+        self._path = self._write_file('disk.img', self._data)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _write_file(self, name, data):
+        path = os.path.join(self._tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _get_disk(self, path=None, **kwargs):
+        disk = physical_disk.PhysicalDisk(path or self._path, **kwargs)
+        disk.open()
+        self.addCleanup(disk.close)
+        return disk
+
+    def _test_read_at(self, use_mmap):
+        disk = self._get_disk(buffer_size=8192, use_mmap=use_mmap)
+        self.assertEqual(disk.get_sector_size(), 512)
+        self.assertEqual(disk.get_size(), len(self._data))
+        for (offset, size) in [(0, 10), (1000, 20000), (99990, 100),
+                               (200000, 10)]:
+            self.assertEqual(disk.read_at(offset, size),
+                             self._data[offset:offset + size])
+
+    def test_read_at(self):
+        self._test_read_at(use_mmap=False)
+
+    def test_read_at_mmap(self):
+        self._test_read_at(use_mmap=True)
+
+    def _test_copy_to(self, use_mmap):
+        disk = self._get_disk(buffer_size=8192, use_mmap=use_mmap)
+        path = os.path.join(self._tmp_dir, 'copy.img')
+        with open(path, 'wb') as f:
+            copied = disk.copy_to(f, 50000, offset=10)
+
+        self.assertEqual(copied, 50000)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self._data[10:50010])
+        # 50176 aligned bytes in 8 KB chunks
+        self.assertEqual(disk.read_count, 7)
+
+    def test_copy_to(self):
+        self._test_copy_to(use_mmap=False)
+
+    def test_copy_to_mmap(self):
+        self._test_copy_to(use_mmap=True)
+
+    def test_mmap_empty_file(self):
+        disk = self._get_disk(self._write_file('empty.img', ''),
+                              use_mmap=True)
+        self.assertEqual(disk.read_at(0, 100), '')
+
+    def test_read_iso(self):
+        image = fake_iso.build_iso({'openstack/latest/meta_data.json': '{}'})
+        disk = self._get_disk(self._write_file('config.iso', image))
+
+        class _DiskFile(object):
+            offset = 0
+
+            def seek(self, offset):
+                self.offset = offset
+
+            def read(self, size):
+                return disk.read_at(self.offset, size)
+
+        reader = iso9660.ISO9660Reader(_DiskFile())
+        self.assertEqual(reader.read_file('openstack/latest/meta_data.json'),
+                         '{}')
+
+    def _test_copy_large_file(self, use_mmap):
+        size = 64 * 1024 * 1024
+        path = os.path.join(self._tmp_dir, 'large.img')
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+        disk = self._get_disk(path, use_mmap=use_mmap)
+        start = time.time()
+        with open(os.devnull, 'wb') as f:
+            self.assertEqual(disk.copy_to(f, size), size)
+        LOG.debug('Copied %(size)s bytes in %(reads)s reads, %(time).3fs, '
+                  'mmap: %(use_mmap)s' % {'size': size,
+                                          'reads': disk.read_count,
+                                          'time': time.time() - start,
+                                          'use_mmap': use_mmap})
+        self.assertEqual(disk.read_count, 64)
+
+    def test_copy_large_file(self):
+        self._test_copy_large_file(use_mmap=False)
+
+    def test_copy_large_file_mmap(self):
+        self._test_copy_large_file(use_mmap=True)
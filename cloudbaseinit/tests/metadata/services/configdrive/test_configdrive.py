@@ -29,11 +29,13 @@ _ctypes_mock = mock.MagicMock()
 _ctypes_util_mock = mock.MagicMock()
 _win32com_client_mock = mock.MagicMock()
 _pywintypes_mock = mock.MagicMock()
+_wmi_mock = mock.MagicMock()
 _mock_dict = {'win32com': _win32com_mock,
               'ctypes': _ctypes_mock,
               'ctypes.util': _ctypes_util_mock,
               'win32com.client': _win32com_client_mock,
-              'pywintypes': _pywintypes_mock}
+              'pywintypes': _pywintypes_mock,
+              'wmi': _wmi_mock}
 
 
 class ConfigDriveServiceTest(unittest.TestCase):
@@ -45,6 +47,7 @@ class ConfigDriveServiceTest(unittest.TestCase):
 
     def tearDown(self):
         reload(sys)
+        CONF.clear_override('config_drive_read_in_place')
 
     @mock.patch('cloudbaseinit.metadata.services.configdrive.manager.'
                 'ConfigDriveManager.get_config_drive_files')
@@ -52,6 +55,7 @@ class ConfigDriveServiceTest(unittest.TestCase):
     @mock.patch('os.path.join')
     def test_load(self, mock_join, mock_gettempdir,
                   mock_get_config_drive_files):
+        CONF.set_override('config_drive_read_in_place', False)
         uuid.uuid4 = mock.MagicMock()
         fake_path = os.path.join('fake', 'path')
         fake_path_found = os.path.join(fake_path, 'found')
@@ -76,9 +80,76 @@ class ConfigDriveServiceTest(unittest.TestCase):
             mock_join.assert_called_with(
                 self._config_drive._metadata_path, fake_path)
 
+    @mock.patch('cloudbaseinit.metadata.services.configdrive.manager.'
+                'ConfigDriveManager.get_config_drive_cdrom_mount_point')
+    @mock.patch('cloudbaseinit.metadata.services.configdrive.manager.'
+                'ConfigDriveManager.get_raw_hdd_config_drive_reader')
+    def _test_load_in_place(self, mock_get_reader, mock_get_mount_point,
+                            reader, mount_point):
+        mock_get_reader.return_value = reader
+        mock_get_mount_point.return_value = mount_point
+
+        response = self._config_drive.load()
+
+        mock_get_reader.assert_called_once_with()
+        self.assertEqual(self._config_drive._iso_reader, reader)
+        self.assertFalse(self._config_drive._delete_metadata_path)
+        if reader:
+            self.assertFalse(mock_get_mount_point.called)
+            self.assertEqual(self._config_drive._metadata_path, None)
+        else:
+            mock_get_mount_point.assert_called_once_with()
+            self.assertEqual(self._config_drive._metadata_path, mount_point)
+        self.assertEqual(response, bool(reader or mount_point))
+
+    def test_load_in_place_raw_hdd(self):
+        self._test_load_in_place(reader=mock.MagicMock(), mount_point=None)
+
+    def test_load_in_place_cdrom(self):
+        self._test_load_in_place(reader=None, mount_point='D:\\')
+
+    def test_load_in_place_not_found(self):
+        self._test_load_in_place(reader=None, mount_point=None)
+
+    def test_get_data_iso_reader(self):
+        fake_path = os.path.join('fake', 'path')
+        mock_reader = mock.MagicMock()
+        self._config_drive._iso_reader = mock_reader
+
+        response = self._config_drive._get_data(fake_path)
+
+        mock_reader.read_file.assert_called_once_with(fake_path)
+        self.assertEqual(response, mock_reader.read_file.return_value)
+
+    def test_get_data_iso_reader_not_existing(self):
+        base = importlib.import_module('cloudbaseinit.metadata.services.base')
+        mock_reader = mock.MagicMock()
+        mock_reader.read_file.side_effect = IOError
+        self._config_drive._iso_reader = mock_reader
+
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._config_drive._get_data, 'fake')
+
     @mock.patch('shutil.rmtree')
-    def test_cleanup(self, mock_rmtree):
+    def _test_cleanup(self, mock_rmtree, delete_metadata_path):
         fake_path = os.path.join('fake', 'path')
+        mock_reader = mock.MagicMock()
         self._config_drive._metadata_path = fake_path
+        self._config_drive._delete_metadata_path = delete_metadata_path
+        self._config_drive._iso_reader = mock_reader
+
         self._config_drive.cleanup()
+
+        mock_reader.close.assert_called_once_with()
+        if delete_metadata_path:
+            mock_rmtree.assert_called_once_with(fake_path, True)
+        else:
+            self.assertFalse(mock_rmtree.called)
         self.assertEqual(self._config_drive._metadata_path, None)
+        self.assertEqual(self._config_drive._iso_reader, None)
+
+    def test_cleanup(self):
+        self._test_cleanup(delete_metadata_path=True)
+
+    def test_cleanup_in_place(self):
+        self._test_cleanup(delete_metadata_path=False)
@@ -0,0 +1,110 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import StringIO
+import tempfile
+import unittest
+
+from cloudbaseinit.metadata.services.configdrive import iso9660
+from cloudbaseinit.tests.metadata.services.configdrive import fake_iso
+
+
+class ISO9660ReaderTest(unittest.TestCase):
+    _FILES = {
+        'openstack/latest/meta_data.json': '{"uuid": "fake"}',
+        'openstack/latest/user_data': 'x' * 5000,
+        'openstack/content/0000': '',
+        'ec2/latest/meta-data.json': '{}',
+    }
+
+    def _get_reader(self, **kwargs):
+        image = fake_iso.build_iso(self._FILES, **kwargs)
+        return iso9660.ISO9660Reader(StringIO.StringIO(image))
+
+    def _test_read_file(self, **kwargs):
+        reader = self._get_reader(**kwargs)
+        self.assertEqual(reader.volume_label, 'config-2')
+        for (path, content) in self._FILES.items():
+            self.assertEqual(reader.read_file(path), content)
+
+    def test_read_file_joliet(self):
+        self._test_read_file(joliet=True)
+
+    def test_read_file_rock_ridge(self):
+        self._test_read_file(joliet=False, rock_ridge=True)
+
+    def test_read_file_primary(self):
+        # Names are upper cased in the primary volume descriptor only
+        self._test_read_file(joliet=False)
+
+    def test_read_file_from_file(self):
+        image = fake_iso.build_iso(self._FILES)
+        (fd, path) = tempfile.mkstemp()
+        try:
+            os.write(fd, image)
+            os.close(fd)
+            reader = iso9660.ISO9660Reader(open(path, 'rb'))
+            try:
+                response = reader.read_file('/openstack/latest/user_data')
+            finally:
+                reader.close()
+            self.assertEqual(response, 'x' * 5000)
+        finally:
+            os.remove(path)
+
+    def test_read_file_not_existing(self):
+        reader = self._get_reader()
+        for path in ['openstack/2012-08-10/meta_data.json',
+                     'openstack/latest/meta_data.json/other']:
+            try:
+                reader.read_file(path)
+                self.fail('IOError not raised')
+            except IOError as ex:
+                self.assertEqual(ex.errno, errno.ENOENT)
+
+    def test_read_file_directory(self):
+        reader = self._get_reader()
+        self.assertRaises(IOError, reader.read_file, 'openstack/latest')
+
+    def test_list_dir(self):
+        reader = self._get_reader()
+        self.assertEqual(reader.list_dir('/'), ['ec2', 'openstack'])
+        self.assertEqual(reader.list_dir('openstack'), ['content', 'latest'])
+        self.assertEqual(reader.list_dir('openstack/latest'),
+                         ['meta_data.json', 'user_data'])
+
+    def test_list_dir_many_entries(self):
+        # Directory records span across multiple sectors
+        self._FILES = dict(('dir/file_%03d' % i, str(i)) for i in range(200))
+        reader = self._get_reader()
+        self.assertEqual(len(reader.list_dir('dir')), 200)
+        self.assertEqual(reader.read_file('dir/file_199'), '199')
+
+    def test_exists(self):
+        reader = self._get_reader()
+        self.assertTrue(reader.exists('openstack/latest/meta_data.json'))
+        self.assertFalse(reader.exists('openstack/latest/fake'))
+
+    def test_invalid_image(self):
+        self.assertRaises(iso9660.ISO9660Error, iso9660.ISO9660Reader,
+                          StringIO.StringIO('\x00' * 40960))
+
+    def test_truncated_image(self):
+        image = fake_iso.build_iso(self._FILES)
+        self.assertRaises(iso9660.ISO9660Error, iso9660.ISO9660Reader,
+                          StringIO.StringIO(image[:16 * 2048 + 100]))
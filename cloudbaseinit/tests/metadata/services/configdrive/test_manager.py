@@ -0,0 +1,147 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import importlib
+import mock
+import os
+import sys
+import tempfile
+import unittest
+
+from cloudbaseinit.metadata.services.configdrive import base_disk
+from cloudbaseinit.tests.metadata.services.configdrive import fake_iso
+from cloudbaseinit.tests.utils import fake_wmi
+from cloudbaseinit.utils import wmiquery
+
+_ctypes_mock = mock.MagicMock()
+_wmi_mock = mock.MagicMock()
+_mock_dict = {'ctypes': _ctypes_mock,
+              'ctypes.wintypes': _ctypes_mock.wintypes,
+              'wmi': _wmi_mock}
+
+
+class FakePhysicalDisk(base_disk.BasePhysicalDisk):
+    def __init__(self, data, sector_size, buffer_size=4096):
+        super(FakePhysicalDisk, self).__init__(buffer_size)
+        self._data = data
+        self._offset = 0
+        self.geometry = mock.MagicMock()
+        self.geometry.BytesPerSector = sector_size
+        self.reads = []
+        self.closed = False
+
+    def get_geometry(self):
+        return self.geometry
+
+    def get_sector_size(self):
+        return self.geometry.BytesPerSector
+
+    def seek(self, offset):
+        assert offset % self.geometry.BytesPerSector == 0
+        self._offset = offset
+
+    def _read_into_buffer(self, bytes_to_read):
+        assert bytes_to_read % self.geometry.BytesPerSector == 0
+        self.reads.append((self._offset, bytes_to_read))
+        buf = self._data[self._offset:self._offset + bytes_to_read]
+        self._offset += len(buf)
+        return buf
+
+    def close(self):
+        self.closed = True
+
+
+class PhysicalDiskFileTest(unittest.TestCase):
+    @mock.patch.dict(sys.modules, _mock_dict)
+    def setUp(self):
+        self._manager = importlib.import_module(
+            'cloudbaseinit.metadata.services.configdrive.manager')
+        self._iso9660 = importlib.import_module(
+            'cloudbaseinit.metadata.services.configdrive.iso9660')
+
+    def tearDown(self):
+        reload(sys)
+
+    def _test_read(self, sector_size):
+        data = ''.join(chr(i % 256) for i in range(8192))
+        disk = FakePhysicalDisk(data + 'x' * 4096, sector_size)
+        disk_file = self._manager._PhysicalDiskFile(disk, len(data))
+
+        disk_file.seek(1000)
+        self.assertEqual(disk_file.read(100), data[1000:1100])
+        self.assertEqual(disk_file.tell(), 1100)
+        self.assertEqual(disk_file.read(10000), data[1100:])
+        self.assertEqual(disk_file.read(10), '')
+
+        disk_file.close()
+        self.assertTrue(disk.closed)
+
+    def test_read_512_sectors(self):
+        self._test_read(sector_size=512)
+
+    def test_read_4096_sectors(self):
+        self._test_read(sector_size=4096)
+
+    def test_read_iso(self):
+        image = fake_iso.build_iso({'openstack/latest/meta_data.json': '{}'})
+        disk = FakePhysicalDisk(image + '\x00' * 65536, 512)
+        disk_file = self._manager._PhysicalDiskFile(disk, len(image))
+
+        reader = self._iso9660.ISO9660Reader(disk_file)
+        response = reader.read_file('openstack/latest/meta_data.json')
+
+        self.assertEqual(response, '{}')
+        # Volume descriptors, 3 directory levels and the file extent
+        self.assertTrue(len(disk.reads) <= 8)
+
+
+class ConfigDriveManagerTest(unittest.TestCase):
+    @mock.patch.dict(sys.modules, _mock_dict)
+    def setUp(self):
+        manager = importlib.import_module(
+            'cloudbaseinit.metadata.services.configdrive.manager')
+        self._config_manager = manager.ConfigDriveManager()
+
+    def tearDown(self):
+        reload(sys)
+
+    def test_write_iso_file(self):
+        data = ''.join(chr(i % 256) for i in range(10000))
+        disk = FakePhysicalDisk(data + 'x' * 4096, 512, buffer_size=4096)
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self._config_manager._write_iso_file(disk, path, len(data))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            os.remove(path)
+        self.assertEqual(disk.reads, [(0, 4096), (4096, 4096), (8192, 2048)])
+
+    @mock.patch('cloudbaseinit.utils.wmiquery.get_wmi_connection')
+    def test_get_physical_disks_path(self, mock_get_wmi_connection):
+        wmi = fake_wmi.FakeWMI({'Win32_DiskDrive': [
+            {'DeviceID': '\\\\.\\PHYSICALDRIVE0', 'Size': 1024},
+            {'DeviceID': '\\\\.\\PHYSICALDRIVE1', 'Size': 2048}]})
+        mock_get_wmi_connection.return_value = wmiquery.WMIConnection(
+            connect=lambda moniker: wmi)
+
+        response = self._config_manager._get_physical_disks_path()
+
+        self.assertEqual(response, ['\\\\.\\PHYSICALDRIVE0',
+                                    '\\\\.\\PHYSICALDRIVE1'])
+        self.assertEqual(wmi.queries,
+                         ['SELECT DeviceID FROM Win32_DiskDrive'])
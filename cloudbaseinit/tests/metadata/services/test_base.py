@@ -0,0 +1,183 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import mock
+import unittest
+
+from cloudbaseinit.metadata.services import base
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import httpclient
+
+CONF = cfg.CONF
+
+
+class FakeService(base.BaseMetadataService):
+    def __init__(self, enable_retry):
+        super(FakeService, self).__init__()
+        self._enable_retry = enable_retry
+
+    def _get_data(self, path):
+        pass
+
+
+class BaseMetadataServiceTest(unittest.TestCase):
+    @mock.patch('cloudbaseinit.utils.retry.RetryPolicy._wait')
+    def _test_exec_with_retry(self, mock_sleep, errors, expected_attempts,
+                              enable_retry=True, stop_retrying=False):
+        action = mock.MagicMock()
+        action.side_effect = errors + ['fake data']
+        mock_sleep.return_value = False
+        service = FakeService(enable_retry)
+        if stop_retrying:
+            service.stop_retrying()
+
+        if expected_attempts > len(errors):
+            self.assertEqual(service._exec_with_retry(action), 'fake data')
+        else:
+            self.assertRaises(Exception, service._exec_with_retry, action)
+        self.assertEqual(action.call_count, expected_attempts)
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        for delay in delays:
+            self.assertTrue(CONF.retry_count_interval / 2.0 <= delay <=
+                            CONF.retry_max_interval)
+        return delays
+
+    def test_exec_with_retry(self):
+        self._test_exec_with_retry(errors=[IOError()] * 2,
+                                   expected_attempts=3)
+
+    def test_exec_with_retry_max_attempts(self):
+        self._test_exec_with_retry(errors=[IOError()] * 10,
+                                   expected_attempts=CONF.retry_count + 1)
+
+    def test_exec_with_retry_total_delay(self):
+        # The random delays add up to at most the fixed intervals total
+        for i in range(50):
+            delays = self._test_exec_with_retry(
+                errors=[IOError()] * 10,
+                expected_attempts=CONF.retry_count + 1)
+            self.assertEqual(len(delays), CONF.retry_count)
+            self.assertTrue(sum(delays) <=
+                            CONF.retry_count * CONF.retry_count_interval +
+                            1e-9)
+
+    def test_exec_with_retry_stopped(self):
+        self._test_exec_with_retry(errors=[IOError()] * 2,
+                                   expected_attempts=1, stop_retrying=True)
+
+    @mock.patch('cloudbaseinit.utils.retry.RetryPolicy._wait')
+    def test_exec_with_retry_stopped_while_waiting(self, mock_wait):
+        action = mock.MagicMock()
+        action.side_effect = [IOError(), 'fake data']
+        mock_wait.return_value = False
+        service = FakeService(True)
+        service.stop_retrying()
+        service.resume_retrying()
+        self.assertEqual(service._exec_with_retry(action), 'fake data')
+
+        # Waiting is interrupted by stop_retrying
+        mock_wait.side_effect = lambda delay: service.stop_retrying() or True
+        action.side_effect = [IOError(), 'fake data']
+        self.assertRaises(IOError, service._exec_with_retry, action)
+        self.assertEqual(action.call_count, 3)
+
+    def test_exec_with_retry_disabled(self):
+        self._test_exec_with_retry(errors=[IOError()], expected_attempts=1,
+                                   enable_retry=False)
+
+    def test_exec_with_retry_not_existing(self):
+        self._test_exec_with_retry(
+            errors=[base.NotExistingMetadataException()],
+            expected_attempts=1)
+
+    def test_exec_with_retry_client_error(self):
+        self._test_exec_with_retry(
+            errors=[httpclient.HTTPError('http://fake', 403, 'Forbidden')],
+            expected_attempts=1)
+
+    def test_get_meta_data(self):
+        service = FakeService(enable_retry=False)
+        service._get_data = mock.MagicMock()
+        service._get_data.return_value = (
+            '{"meta": {"admin_username": "fake"}, "keys": ["fake key"]}')
+
+        meta_data = service.get_meta_data('openstack')
+
+        self.assertEqual(meta_data, {'meta': {'admin_username': 'fake'},
+                                     'keys': ('fake key',)})
+        self.assertIs(service.get_meta_data('openstack'), meta_data)
+        service._get_data.assert_called_once_with(
+            'openstack/latest/meta_data.json')
+
+        service.get_meta_data('openstack', '2013-04-04')
+        self.assertEqual(service._get_data.call_count, 2)
+
+    def test_get_meta_data_read_only(self):
+        service = FakeService(enable_retry=False)
+        service._get_data = mock.MagicMock()
+        service._get_data.return_value = '{"meta": {"fake": "value"}}'
+
+        meta_data = service.get_meta_data('openstack')
+
+        self.assertRaises(TypeError, meta_data.__setitem__, 'fake', 'value')
+        self.assertRaises(TypeError, meta_data['meta'].pop, 'fake')
+        self.assertRaises(TypeError, meta_data['meta'].update, {})
+        meta_copy = copy.deepcopy(meta_data)
+        meta_copy['meta']['fake'] = 'other'
+        self.assertEqual(meta_data['meta']['fake'], 'value')
+
+    def test_get_meta_data_copy(self):
+        service = FakeService(enable_retry=False)
+        service._get_data = mock.MagicMock()
+        service._get_data.return_value = '{"meta": {"fake": "value"}}'
+
+        meta_data = service.get_meta_data('openstack')
+        meta_copy = copy.copy(meta_data)
+
+        self.assertEqual(type(meta_copy), dict)
+        self.assertEqual(meta_copy, meta_data)
+        self.assertIs(meta_copy['meta'], meta_data['meta'])
+        meta_copy['other'] = 'value'
+        self.assertNotIn('other', meta_data)
+
+    def test_get_meta_data_deepcopy(self):
+        service = FakeService(enable_retry=False)
+        service._get_data = mock.MagicMock()
+        service._get_data.return_value = (
+            '{"keys": [{"data": "fake key", "names": ["a"]}]}')
+
+        meta_data = service.get_meta_data('openstack')
+        meta_copy = copy.deepcopy(meta_data)
+
+        self.assertEqual(meta_copy,
+                         {'keys': [{'data': 'fake key', 'names': ['a']}]})
+        self.assertEqual(type(meta_copy['keys'][0]), dict)
+        meta_copy['keys'].append('other key')
+        meta_copy['keys'][0]['names'].append('b')
+        self.assertEqual(meta_data['keys'],
+                         ({'data': 'fake key', 'names': ('a',)},))
+
+    def test_get_meta_data_reset_on_load(self):
+        service = FakeService(enable_retry=False)
+        service._get_data = mock.MagicMock()
+        service._get_data.return_value = '{}'
+
+        service.get_meta_data('openstack')
+        service.load()
+        service.get_meta_data('openstack')
+
+        self.assertEqual(service._get_data.call_count, 2)
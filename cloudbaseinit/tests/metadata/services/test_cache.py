@@ -0,0 +1,219 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cloudbaseinit.metadata.services import base
+from cloudbaseinit.metadata.services import cache
+from cloudbaseinit.openstack.common import cfg
+
+CONF = cfg.CONF
+
+
+class PersistentMetadataCacheTest(unittest.TestCase):
+    _SERVICE_NAME = 'FakeService'
+    _PATH = 'openstack/latest/meta_data.json'
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._cache_path = os.path.join(self._tmp_dir, 'cache', 'md.json')
+        self._osutils = mock.MagicMock()
+        self._osutils.get_system_uuid.return_value = 'FAKE-UUID'
+        patcher = mock.patch('cloudbaseinit.osutils.factory.OSUtilsFactory.'
+                             'get_os_utils', return_value=self._osutils)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self._cache = cache.PersistentMetadataCache(self._cache_path, 60)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _update_stored_cache(self, update):
+        with open(self._cache_path, 'rb') as f:
+            stored = json.load(f)
+        update(stored)
+        with open(self._cache_path, 'wb') as f:
+            json.dump(stored, f)
+
+    def _get_stored_entry(self, stored):
+        return stored['entries'][self._SERVICE_NAME][self._PATH]
+
+    def test_get_not_existing(self):
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertIsNone(response)
+
+    def test_set_get_str(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, '{"uuid": "\xff"}')
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertEqual(response, '{"uuid": "\xff"}')
+        self.assertIsInstance(response, str)
+
+    def test_set_get_json(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, {'instance-id': 'i'})
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertEqual(response, {'instance-id': 'i'})
+
+    def test_get_other_service(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+        response = self._cache.get('OtherService', self._PATH)
+        self.assertIsNone(response)
+
+    def test_get_expired(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+        with mock.patch('time.time', return_value=time.time() + 61):
+            response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertIsNone(response)
+
+    def test_get_checksum_mismatch(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+
+        def _update(stored):
+            self._get_stored_entry(stored)['value'] = 'b3RoZXIgZGF0YQ=='
+        self._update_stored_cache(_update)
+
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertIsNone(response)
+
+    def test_get_version_mismatch(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+
+        def _update(stored):
+            stored['version'] = cache.CACHE_FORMAT_VERSION + 1
+        self._update_stored_cache(_update)
+
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertIsNone(response)
+
+    def test_get_corrupted(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+        with open(self._cache_path, 'wb') as f:
+            f.write('{"version":')
+
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertIsNone(response)
+
+    def test_get_instance_id_changed(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+        self._osutils.get_system_uuid.return_value = 'OTHER-UUID'
+        new_cache = cache.PersistentMetadataCache(self._cache_path, 60)
+
+        response = new_cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertIsNone(response)
+
+    def test_get_instance_id_not_validated(self):
+        no_validation_cache = cache.PersistentMetadataCache(
+            self._cache_path, 60, validate_instance_id=False)
+        no_validation_cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+        self._osutils.get_system_uuid.return_value = 'OTHER-UUID'
+
+        response = no_validation_cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertEqual(response, 'fake data')
+        self.assertFalse(self._osutils.get_system_uuid.called)
+
+
+    def test_set_owner_only(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH, 'fake data')
+        self._osutils.set_owner_only_permissions.assert_called_once_with(
+            self._cache_path + '.tmp')
+        if os.name != 'nt':
+            self.assertEqual(os.stat(self._cache_path).st_mode & 0777, 0600)
+            self.assertEqual(
+                os.stat(os.path.dirname(self._cache_path)).st_mode & 0777,
+                0700)
+
+    def test_set_secret_path(self):
+        self._cache.set(self._SERVICE_NAME, 'latest/meta-data/admin_pass',
+                        'fake password')
+        self.assertFalse(os.path.exists(self._cache_path))
+
+    def test_set_str_without_secrets(self):
+        self._cache.set(self._SERVICE_NAME, self._PATH,
+                        '{"admin_pass": "fake", "meta": {"admin_pass": '
+                        '"fake", "admin_username": "fake user"}}')
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertEqual(json.loads(response),
+                         {'meta': {'admin_username': 'fake user'}})
+        with open(self._cache_path, 'rb') as f:
+            self.assertNotIn('admin_pass', f.read())
+
+    def test_set_json_without_secrets(self):
+        data = {'meta': {'admin_pass': 'fake'}, 'keys': [{'admin_pass': 1}]}
+        self._cache.set(self._SERVICE_NAME, self._PATH, data)
+        response = self._cache.get(self._SERVICE_NAME, self._PATH)
+        self.assertEqual(response, {'meta': {}, 'keys': [{}]})
+        # The data is returned unchanged to the caller
+        self.assertEqual(data['meta'], {'admin_pass': 'fake'})
+
+
+class FakeService(base.BaseMetadataService):
+    def __init__(self):
+        super(FakeService, self).__init__()
+        self._enable_persistent_cache = True
+        self.get_data_calls = 0
+
+    def _get_data(self, path):
+        self.get_data_calls += 1
+        return 'fake data'
+
+
+class BaseMetadataServicePersistentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        CONF.set_override('metadata_cache_path',
+                          os.path.join(self._tmp_dir, 'md.json'))
+        CONF.set_override('metadata_cache_validate_instance_id', False)
+
+    def tearDown(self):
+        CONF.clear_override('metadata_cache_path')
+        CONF.clear_override('metadata_cache_validate_instance_id')
+        shutil.rmtree(self._tmp_dir)
+
+    def test_get_user_data_persisted(self):
+        service = FakeService()
+        service.load()
+        self.assertEqual(service.get_user_data('openstack'), 'fake data')
+        self.assertEqual(service.get_data_calls, 1)
+
+        # New boot
+        service = FakeService()
+        service.load()
+        self.assertEqual(service.get_user_data('openstack'), 'fake data')
+        self.assertEqual(service.get_data_calls, 0)
+
+    def test_get_user_data_persistent_cache_disabled(self):
+        service = FakeService()
+        service._enable_persistent_cache = False
+        service.get_user_data('openstack')
+
+        service = FakeService()
+        service._enable_persistent_cache = False
+        service.get_user_data('openstack')
+        self.assertEqual(service.get_data_calls, 1)
+        self.assertFalse(os.path.exists(CONF.metadata_cache_path))
+
+    @mock.patch('cloudbaseinit.metadata.services.cache.'
+                'PersistentMetadataCache.get')
+    def test_get_user_data_persistent_cache_error(self, mock_get):
+        mock_get.side_effect = Exception
+        service = FakeService()
+        self.assertEqual(service.get_user_data('openstack'), 'fake data')
+        self.assertEqual(service.get_data_calls, 1)
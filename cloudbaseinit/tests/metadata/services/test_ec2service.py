@@ -20,6 +20,7 @@ import unittest
 
 from cloudbaseinit.metadata.services import ec2service
 from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import httpclient
 
 CONF = cfg.CONF
 
@@ -47,27 +48,28 @@ class Ec2ServiceTest(unittest.TestCase):
         self._test_load(side_effect='fake data')
 
     @mock.patch('posixpath.join')
-    @mock.patch('urllib2.Request')
-    @mock.patch('urllib2.urlopen')
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_response')
     @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
                 '._load_public_keys')
     @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
                 '._check_EC2')
     @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
-                '._get_EC2_value')
-    def _test_get_data(self, mock_get_EC2_value, mock_check_EC2,
-                       mock_load_public_keys,  mock_urlopen,
-                       mock_Request, mock_join, check_ec2, data_type):
+                '._get_EC2_values')
+    def _test_get_data(self, mock_get_EC2_values, mock_check_EC2,
+                       mock_load_public_keys, mock_get_response,
+                       mock_join, check_ec2, data_type):
         mock_path = mock.MagicMock()
-        mock_req = mock.MagicMock()
         mock_response = mock.MagicMock()
         fake_path = os.path.join('fake', 'path')
         mock_join.return_value = fake_path
         mock_check_EC2.return_value = check_ec2
-        mock_Request.return_value = mock_req
-        mock_urlopen.return_value = mock_response
-        mock_response.read.return_value = 'fake data'
-        mock_path.endswith.return_value = data_type
+        mock_get_response.return_value = mock_response
+        mock_response.data = 'fake data'
+        mock_path.endswith.side_effect = lambda s: s == data_type
+        values = [('fake %s' % key, None) for key in ec2service.ec2nodes]
+        values[0] = (None, Exception())
+        mock_get_EC2_values.return_value = values
 
         if check_ec2 is None:
             self.assertRaises(Exception, self._ec2service._get_data,
@@ -75,18 +77,17 @@ class Ec2ServiceTest(unittest.TestCase):
 
         elif data_type is 'meta_data.json':
             response = self._ec2service._get_data(mock_path)
-            print response
-            for key in ec2service.ec2nodes:
-                mock_get_EC2_value.assert_called_with(key)
-                mock_load_public_keys.assert_called_with()
+            mock_get_EC2_values.assert_called_once_with(ec2service.ec2nodes)
+            mock_load_public_keys.assert_called_once_with(response)
+            self.assertNotIn(ec2service.ec2nodes[0], response)
+            for key in ec2service.ec2nodes[1:]:
+                self.assertEqual(response[key], 'fake %s' % key)
 
         elif data_type is 'user_data':
             response = self._ec2service._get_data(mock_path)
             mock_join.assert_called_with(CONF.ec2_metadata_base_url,
                                          'user-data')
-            mock_Request.assert_called_once_with(fake_path)
-            mock_urlopen.assert_called_once_with(mock_req)
-            mock_response.read.assert_called_once_with()
+            mock_get_response.assert_called_once_with(fake_path)
             self.assertEqual(response, 'fake data')
 
     def test_get_data_metadata_json(self):
@@ -114,25 +115,56 @@ class Ec2ServiceTest(unittest.TestCase):
     def test_check_EC2(self):
         self._test_check_EC2(side_effect='fake value')
 
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_EC2_value')
+    def test_check_EC2_once(self, mock_get_EC2_value):
+        self.assertTrue(self._ec2service._check_EC2())
+        self.assertTrue(self._ec2service._check_EC2())
+        mock_get_EC2_value.assert_called_once_with('')
+
+    @mock.patch('cloudbaseinit.utils.httpclient.HTTPConnectionPool.request')
+    def _test_get_response(self, mock_request, status):
+        mock_response = mock.MagicMock()
+        mock_response.status = status
+        mock_request.return_value = mock_response
+        if status >= 400:
+            self.assertRaises(httpclient.HTTPError,
+                              self._ec2service._get_response, 'fake url')
+        else:
+            response = self._ec2service._get_response('fake url')
+            self.assertEqual(response, mock_response)
+        mock_request.assert_called_once_with('GET', 'fake url')
+
+    def test_get_response(self):
+        self._test_get_response(status=200)
+
+    def test_get_response_not_found(self):
+        self._test_get_response(status=404)
+
     @mock.patch('posixpath.join')
-    @mock.patch('urllib2.Request')
-    @mock.patch('urllib2.urlopen')
-    def test_get_EC2_value(self, mock_urlopen, mock_Request, mock_join):
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_response')
+    def test_get_EC2_value(self, mock_get_response, mock_join):
         mock_key = mock.MagicMock()
         mock_response = mock.MagicMock()
         fake_path = os.path.join('fake', 'path')
         mock_join.return_value = fake_path
-        mock_Request.return_value = 'fake req'
-        mock_urlopen.return_value = mock_response
-        mock_response.read.return_value = 'fake data'
+        mock_get_response.return_value = mock_response
+        mock_response.data = 'fake data'
         response = self._ec2service._get_EC2_value(mock_key)
         mock_join.assert_called_with(CONF.ec2_metadata_base_url,
                                      'meta-data', mock_key)
-        mock_Request.assert_called_once_with(fake_path)
-        mock_urlopen.assert_called_once_with('fake req')
-        mock_response.read.assert_called_once_with()
+        mock_get_response.assert_called_once_with(fake_path)
         self.assertEqual(response, 'fake data')
 
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_EC2_value')
+    def test_get_EC2_values(self, mock_get_EC2_value):
+        mock_get_EC2_value.side_effect = lambda key: 'value %s' % key
+        response = self._ec2service._get_EC2_values(['a', 'b', 'c'])
+        self.assertEqual(response, [('value a', None), ('value b', None),
+                                    ('value c', None)])
+
     @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
                 '._get_EC2_value')
     def test_load_public_keys(self, mock_get_EC2_value):
@@ -142,3 +174,24 @@ class Ec2ServiceTest(unittest.TestCase):
         self._ec2service._load_public_keys(data)
         mock_get_EC2_value.assert_called_with('public-keys/')
         self.assertEqual(data['public_keys'], {})
+
+    @mock.patch('cloudbaseinit.metadata.services.ec2service.EC2Service'
+                '._get_EC2_value')
+    def test_load_public_keys_list(self, mock_get_EC2_value):
+        def _get_EC2_value(key):
+            if key == 'public-keys/':
+                return '0=key0\n1=key1\n'
+            elif key == 'public-keys/1/openssh-key':
+                raise Exception()
+            return 'ssh-rsa %s' % key
+
+        data = {}
+        mock_get_EC2_value.side_effect = _get_EC2_value
+        self._ec2service._load_public_keys(data)
+        self.assertEqual(data['public_keys'],
+                         {'0': 'ssh-rsa public-keys/0/openssh-key'})
+
+    @mock.patch('cloudbaseinit.utils.httpclient.HTTPConnectionPool.close')
+    def test_cleanup(self, mock_close):
+        self._ec2service.cleanup()
+        mock_close.assert_called_once_with()
@@ -16,12 +16,14 @@
 
 import mock
 import os
+import socket
+import threading
 import unittest
-import urllib2
 
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.metadata.services import httpservice
 from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import httpclient
 
 CONF = cfg.CONF
 
@@ -31,6 +33,12 @@ class HttpServiceTest(unittest.TestCase):
         CONF.set_override('retry_count_interval', 0)
         self._httpservice = httpservice.HttpService()
 
+    def tearDown(self):
+        CONF.clear_override('retry_count_interval')
+        CONF.clear_override('metadata_fallback_urls')
+        CONF.clear_override('metadata_hedge_delay')
+
+    @mock.patch('sys.platform', 'win32')
     @mock.patch('cloudbaseinit.osutils.factory.OSUtilsFactory.get_os_utils')
     @mock.patch('urlparse.urlparse')
     def _test_check_metadata_ip_route(self, mock_urlparse, mock_get_os_utils,
@@ -60,6 +68,12 @@ class HttpServiceTest(unittest.TestCase):
     def test_test_check_metadata_ip_route_fail(self):
         self._test_check_metadata_ip_route(side_effect=Exception)
 
+    @mock.patch('sys.platform', 'linux2')
+    @mock.patch('cloudbaseinit.osutils.factory.OSUtilsFactory.get_os_utils')
+    def test_check_metadata_ip_route_not_windows(self, mock_get_os_utils):
+        self._httpservice._check_metadata_ip_route()
+        self.assertFalse(mock_get_os_utils.called)
+
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
                 '._check_metadata_ip_route')
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
@@ -81,76 +95,197 @@ class HttpServiceTest(unittest.TestCase):
     def test_load_exception(self):
         self._test_load(side_effect=Exception)
 
-    @mock.patch('urllib2.urlopen')
-    def _test_get_response(self, mock_urlopen, side_effect):
-        mock_req = mock.MagicMock
-        if side_effect and side_effect.code is 404:
-            mock_urlopen.side_effect = [side_effect]
+    @mock.patch('cloudbaseinit.utils.httpclient.HTTPConnectionPool.request')
+    def _test_get_response(self, mock_request, status, data=None):
+        mock_response = mock.MagicMock()
+        mock_response.status = status
+        mock_request.return_value = mock_response
+        if status == 404:
             self.assertRaises(base.NotExistingMetadataException,
                               self._httpservice._get_response,
-                              mock_req)
-        elif side_effect and side_effect.code:
-            mock_urlopen.side_effect = [side_effect]
-            self.assertRaises(Exception, self._httpservice._get_response,
-                              mock_req)
+                              'GET', 'fake url')
+        elif status >= 400:
+            self.assertRaises(httpclient.HTTPError,
+                              self._httpservice._get_response,
+                              'GET', 'fake url')
+        else:
+            response = self._httpservice._get_response('POST', 'fake url',
+                                                       data)
+            self.assertEqual(response, mock_response)
+
+        if data:
+            mock_request.assert_called_once_with(
+                'POST', 'fake url', data,
+                {'Content-Type': 'application/x-www-form-urlencoded'})
         else:
-            mock_urlopen.return_value = 'fake url'
-            response = self._httpservice._get_response(mock_req)
-            self.assertEqual(response, 'fake url')
+            mock_request.assert_called_once_with('GET', 'fake url', None, {})
 
     def test_get_response_fail_HTTPError(self):
-        error = urllib2.HTTPError("http://169.254.169.254/", 404,
-                                  'test error 404', {},  None)
-        self._test_get_response(side_effect=error)
+        self._test_get_response(status=404)
 
     def test_get_response_fail_other_exception(self):
-        error = urllib2.HTTPError("http://169.254.169.254/", 409,
-                                  'test error 409', {}, None)
-        self._test_get_response(side_effect=error)
+        self._test_get_response(status=409)
 
     def test_get_response(self):
-        self._test_get_response(side_effect=None)
+        self._test_get_response(status=200, data='fake data')
 
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
                 '._get_response')
     @mock.patch('posixpath.join')
-    @mock.patch('urllib2.Request')
-    def test_get_data(self, mock_Request, mock_posix_join,
-                      mock_get_response):
+    def test_get_data(self, mock_posix_join, mock_get_response):
         fake_path = os.path.join('fake', 'path')
         mock_data = mock.MagicMock()
         mock_norm_path = mock.MagicMock()
-        mock_req = mock.MagicMock()
         mock_get_response.return_value = mock_data
         mock_posix_join.return_value = mock_norm_path
-        mock_Request.return_value = mock_req
 
         response = self._httpservice._get_data(fake_path)
 
         mock_posix_join.assert_called_with(CONF.metadata_base_url, fake_path)
-        mock_Request.assert_called_once_with(mock_norm_path)
-        mock_get_response.assert_called_once_with(mock_req)
-        self.assertEqual(response, mock_data.read())
+        mock_get_response.assert_called_once_with('GET', mock_norm_path)
+        self.assertEqual(response, mock_data.data)
+
+    def _set_base_urls(self, hedge_delay=10):
+        CONF.set_override('metadata_fallback_urls',
+                          ['http://fake2/', 'http://fake3/'])
+        CONF.set_override('metadata_hedge_delay', hedge_delay)
+
+    def test_get_base_urls(self):
+        CONF.set_override('metadata_fallback_urls',
+                          ['http://fake2/', CONF.metadata_base_url])
+        self.assertEqual(self._httpservice._get_base_urls(),
+                         [CONF.metadata_base_url, 'http://fake2/'])
+
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_response')
+    def test_get_data_hedged(self, mock_get_response):
+        self._set_base_urls(hedge_delay=0.01)
+        blocked = threading.Event()
+        requested = []
+
+        def _get_response(method, url):
+            requested.append(url)
+            if url.startswith(CONF.metadata_base_url):
+                # The preferred URL does not answer in time
+                blocked.wait(5)
+            response = mock.MagicMock()
+            response.data = url
+            return response
+
+        mock_get_response.side_effect = _get_response
+        try:
+            response = self._httpservice._get_data('fake/path')
+            self.assertEqual(response, 'http://fake2/fake/path')
+            self.assertEqual(self._httpservice._base_url, 'http://fake2/')
+
+            response = self._httpservice._get_data('fake/other')
+        finally:
+            blocked.set()
+        self.assertEqual(response, 'http://fake2/fake/other')
+        self.assertEqual(requested.count(CONF.metadata_base_url +
+                                         'fake/other'), 0)
+
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_response')
+    def test_get_data_hedged_error(self, mock_get_response):
+        # Failed requests move to the next URL without waiting
+        self._set_base_urls()
+        response = mock.MagicMock()
+        mock_get_response.side_effect = [socket.error(), response]
+
+        self.assertEqual(self._httpservice._get_data('fake/path'),
+                         response.data)
+        self.assertEqual(self._httpservice._base_url, 'http://fake2/')
+        self.assertEqual(mock_get_response.call_args_list,
+                         [mock.call('GET', CONF.metadata_base_url +
+                                    'fake/path'),
+                          mock.call('GET', 'http://fake2/fake/path')])
+
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_response')
+    def test_get_data_hedged_not_existing(self, mock_get_response):
+        self._set_base_urls()
+        mock_get_response.side_effect = [
+            base.NotExistingMetadataException()]
+
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._httpservice._get_data, 'fake/path')
+        self.assertEqual(self._httpservice._base_url,
+                         CONF.metadata_base_url)
+
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_response')
+    def test_get_data_hedged_all_failed(self, mock_get_response):
+        self._set_base_urls()
+        mock_get_response.side_effect = socket.error()
+
+        self.assertRaises(socket.error, self._httpservice._get_data,
+                          'fake/path')
+        self.assertEqual(mock_get_response.call_count, 3)
+        self.assertIsNone(self._httpservice._base_url)
+
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_response')
+    def test_post_data_not_hedged(self, mock_get_response):
+        self._set_base_urls()
+        self._httpservice._base_url = 'http://fake3/'
+
+        self._httpservice._post_data('fake/path', 'fake data')
+
+        mock_get_response.assert_called_once_with(
+            'POST', 'http://fake3/fake/path', 'fake data')
+
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_response')
+    def test_post_password_conflict_after_failure(self, mock_get_response):
+        error = httpclient.HTTPError('fake url', 409, 'Conflict')
+        mock_get_response.side_effect = [socket.error(), error]
+
+        response = self._httpservice.post_password('fake')
+
+        self.assertTrue(response)
+        self.assertEqual(mock_get_response.call_count, 2)
 
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
                 '._get_response')
     @mock.patch('posixpath.join')
-    @mock.patch('urllib2.Request')
-    def test_post_data(self, mock_Request, mock_posix_join,
-                       mock_get_response):
+    def test_post_data(self, mock_posix_join, mock_get_response):
         fake_path = os.path.join('fake', 'path')
         fake_data = 'fake data'
-        mock_data = mock.MagicMock()
         mock_norm_path = mock.MagicMock()
-        mock_req = mock.MagicMock()
-        mock_get_response.return_value = mock_data
         mock_posix_join.return_value = mock_norm_path
-        mock_Request.return_value = mock_req
 
         response = self._httpservice._post_data(fake_path, fake_data)
 
         mock_posix_join.assert_called_with(CONF.metadata_base_url,
                                            fake_path)
-        mock_Request.assert_called_once_with(mock_norm_path, data=fake_data)
-        mock_get_response.assert_called_once_with(mock_req)
+        mock_get_response.assert_called_once_with('POST', mock_norm_path,
+                                                  fake_data)
         self.assertEqual(response, True)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.BaseMetadataService'
+                '.post_password')
+    def _test_post_password(self, mock_post_password, ret_val):
+        mock_post_password.side_effect = [ret_val]
+        if isinstance(ret_val, httpclient.HTTPError) and ret_val.code != 409:
+            self.assertRaises(httpclient.HTTPError,
+                              self._httpservice.post_password, 'fake')
+        else:
+            response = self._httpservice.post_password('fake')
+            self.assertEqual(response, ret_val is True)
+
+    def test_post_password(self):
+        self._test_post_password(ret_val=True)
+
+    def test_post_password_already_set(self):
+        error = httpclient.HTTPError('fake url', 409, 'Conflict')
+        self._test_post_password(ret_val=error)
+
+    def test_post_password_error(self):
+        error = httpclient.HTTPError('fake url', 500, 'Error')
+        self._test_post_password(ret_val=error)
+
+    @mock.patch('cloudbaseinit.utils.httpclient.HTTPConnectionPool.close')
+    def test_cleanup(self, mock_close):
+        self._httpservice.cleanup()
+        mock_close.assert_called_once_with()
@@ -15,9 +15,13 @@
 #    under the License.
 
 import mock
+import threading
 import unittest
 
 from cloudbaseinit.metadata import factory
+from cloudbaseinit.openstack.common import cfg
+
+CONF = cfg.CONF
 
 
 class MetadataServiceFactoryTests(unittest.TestCase):
@@ -39,3 +43,97 @@ class MetadataServiceFactoryTests(unittest.TestCase):
 
     def test_get_metadata_service_exception(self):
         self._test_get_metadata_service(ret_value=Exception)
+
+
+class MetadataServiceFactoryParallelTests(unittest.TestCase):
+    def setUp(self):
+        CONF.set_override('metadata_services_parallel_discovery', True)
+        CONF.set_override('metadata_services', ['fake1', 'fake2', 'fake3'])
+        self._factory = factory.MetadataServiceFactory()
+
+    def tearDown(self):
+        CONF.clear_override('metadata_services_parallel_discovery')
+        CONF.clear_override('metadata_services')
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def _test_get_metadata_service(self, mock_load_class, services):
+        mock_load_class.side_effect = [lambda s=s: s for s in services]
+        return self._factory.get_metadata_service()
+
+    def _wait_for_cleanup(self, service):
+        # Discarded services are cleaned up by the probe threads
+        event = threading.Event()
+        for i in range(50):
+            if service.cleanup.called:
+                break
+            event.wait(0.1)
+        service.cleanup.assert_called_once_with()
+
+    def test_get_metadata_service_preceding_failed(self):
+        loaded = threading.Event()
+        slow_service = mock.MagicMock()
+        # Fails only after the last service loaded
+        slow_service.load.side_effect = lambda: not loaded.wait(5)
+        failing_service = mock.MagicMock()
+        failing_service.load.side_effect = Exception
+        fast_service = mock.MagicMock()
+        fast_service.load.side_effect = lambda: loaded.set() or True
+
+        response = self._test_get_metadata_service(
+            services=[slow_service, failing_service, fast_service])
+        self.assertEqual(response, fast_service)
+        self._wait_for_cleanup(failing_service)
+        self._wait_for_cleanup(slow_service)
+        self.assertFalse(fast_service.cleanup.called)
+
+    def test_get_metadata_service_preceding_stop_retrying(self):
+        stopped = threading.Event()
+        retrying_service = mock.MagicMock()
+        # Keeps retrying until told to stop
+        retrying_service.load.side_effect = lambda: not stopped.wait(5)
+        retrying_service.stop_retrying.side_effect = stopped.set
+        fast_service = mock.MagicMock()
+        fast_service.load.return_value = True
+        unavailable_service = mock.MagicMock()
+        unavailable_service.load.return_value = False
+
+        response = self._test_get_metadata_service(
+            services=[retrying_service, fast_service, unavailable_service])
+        self.assertEqual(response, fast_service)
+        self.assertTrue(retrying_service.stop_retrying.called)
+        self.assertFalse(fast_service.stop_retrying.called)
+        fast_service.resume_retrying.assert_called_once_with()
+        self._wait_for_cleanup(retrying_service)
+
+    def test_get_metadata_service_priority(self):
+        services = [mock.MagicMock() for i in range(3)]
+        loaded = threading.Event()
+
+        def _slow_load():
+            loaded.wait(5)
+            return True
+
+        def _fast_load():
+            loaded.set()
+            return True
+
+        # The last service loads first, but a preceding one loads too
+        services[0].load.side_effect = lambda: False
+        services[1].load.side_effect = _slow_load
+        services[2].load.side_effect = _fast_load
+
+        response = self._test_get_metadata_service(services=services)
+        self.assertTrue(loaded.is_set())
+        self.assertEqual(response, services[1])
+        self._wait_for_cleanup(services[0])
+        self._wait_for_cleanup(services[2])
+
+    def test_get_metadata_service_none_available(self):
+        services = [mock.MagicMock() for i in range(3)]
+        for service in services:
+            service.load.return_value = False
+
+        self.assertRaises(Exception, self._test_get_metadata_service,
+                          services=services)
+        for service in services:
+            self._wait_for_cleanup(service)
@@ -0,0 +1,82 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import unittest
+
+from cloudbaseinit.metadata import prefetch
+from cloudbaseinit.metadata.services import base
+from cloudbaseinit.utils import timeline
+
+
+class MetadataPrefetchTest(unittest.TestCase):
+    @mock.patch('cloudbaseinit.utils.timeline.get_boot_timeline')
+    def _test_prefetch_metadata(self, mock_get_boot_timeline, meta_data,
+                                user_data_error=None,
+                                expected_content=None):
+        boot_timeline = timeline.BootTimeline()
+        mock_get_boot_timeline.return_value = boot_timeline
+        service = mock.MagicMock()
+        service.get_meta_data.side_effect = [meta_data]
+        service.get_user_data.side_effect = user_data_error
+
+        prefetch.prefetch_metadata(service)
+
+        service.get_meta_data.assert_called_once_with('openstack')
+        service.get_user_data.assert_called_once_with('openstack')
+        if expected_content:
+            service.get_content.assert_called_once_with('openstack',
+                                                        expected_content)
+        else:
+            self.assertFalse(service.get_content.called)
+        [span] = boot_timeline.get_spans(timeline.SPAN_METADATA_PREFETCH)
+        self.assertEqual(span.status, 'done')
+
+    def test_prefetch_metadata(self):
+        meta_data = {'network_config': {
+            'content_path': '/content/0000'}}
+        self._test_prefetch_metadata(meta_data=meta_data,
+                                     expected_content='0000')
+
+    def test_prefetch_metadata_no_network_config(self):
+        self._test_prefetch_metadata(meta_data={})
+
+    def test_prefetch_metadata_errors(self):
+        self._test_prefetch_metadata(
+            meta_data=base.NotExistingMetadataException(),
+            user_data_error=base.NotExistingMetadataException())
+
+    @mock.patch('cloudbaseinit.metadata.prefetch.prefetch_metadata')
+    def test_get_service(self, mock_prefetch_metadata):
+        factory = mock.MagicMock()
+        prefetcher = prefetch.MetadataPrefetcher(factory)
+
+        prefetcher.start()
+        response = prefetcher.get_service()
+
+        self.assertEqual(response, factory.get_metadata_service.return_value)
+        mock_prefetch_metadata.assert_called_once_with(response)
+
+    @mock.patch('cloudbaseinit.metadata.prefetch.prefetch_metadata')
+    def test_get_service_not_available(self, mock_prefetch_metadata):
+        factory = mock.MagicMock()
+        factory.get_metadata_service.side_effect = Exception('fake error')
+        prefetcher = prefetch.MetadataPrefetcher(factory)
+
+        prefetcher.start()
+
+        self.assertRaises(Exception, prefetcher.get_service)
+        self.assertFalse(mock_prefetch_metadata.called)
@@ -0,0 +1,56 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+from cloudbaseinit.osutils import userprovisioning
+
+
+class FakeUserBackend(userprovisioning.BaseUserBackend):
+    '''
+    Keeps users, groups and profiles in memory, counting the calls.
+    '''
+
+    def __init__(self, users=None, groups=None):
+        # Users are stored as username: (password, password_expires)
+        self.users = dict(users or {})
+        self.groups = dict((g, set()) for g in groups or [])
+        self.profiles = set()
+        self.calls = collections.Counter()
+
+    def get_user(self, username):
+        self.calls['get_user'] += 1
+        if username in self.users:
+            return userprovisioning.UserInfo(username,
+                                             self.users[username][1])
+
+    def add_user(self, username, password, password_expires):
+        self.calls['add_user'] += 1
+        self.users[username] = (password, password_expires)
+
+    def update_user(self, user, password, password_expires):
+        self.calls['update_user'] += 1
+        self.users[user.username] = (password, password_expires)
+
+    def add_user_to_local_group(self, username, groupname):
+        self.calls['add_user_to_local_group'] += 1
+        if groupname not in self.groups:
+            raise Exception('Group not found')
+        self.groups[groupname].add(username)
+
+    def create_user_profile(self, username, password):
+        self.calls['create_user_profile'] += 1
+        self.profiles.add(username)
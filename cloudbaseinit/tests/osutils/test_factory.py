@@ -24,6 +24,10 @@ from cloudbaseinit.osutils import factory
 class OSUtilsFactory(unittest.TestCase):
     def setUp(self):
         self._factory = factory.OSUtilsFactory()
+        self._os_name = os.name
+
+    def tearDown(self):
+        os.name = self._os_name
 
     @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
     def _test_get_os_utils(self, mock_load_class, fake_name):
@@ -34,7 +38,7 @@ class OSUtilsFactory(unittest.TestCase):
                 'cloudbaseinit.osutils.windows.WindowsUtils')
         elif fake_name == 'posix':
             mock_load_class.assert_called_with(
-                'cloudbaseinit.osutils.posix.PosixUtils')
+                'cloudbaseinit.osutils.posix.PosixUtil')
 
     def test_get_os_utils_windows(self):
         self._test_get_os_utils(fake_name='nt')
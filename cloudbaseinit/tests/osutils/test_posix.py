@@ -0,0 +1,245 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.osutils import posix
+
+CONF = cfg.CONF
+
+
+class PosixUtilTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._config_path = os.path.join(self._tmp_dir, 'lib', 'config.json')
+        CONF.set_override('config_file_path', self._config_path)
+        self._posixutil = posix.PosixUtil()
+        for name in ['sys', 'proc', 'etc', 'dev']:
+            path = os.path.join(self._tmp_dir, name)
+            os.mkdir(path)
+            setattr(self._posixutil, '_%s_path' % name, path)
+
+    def tearDown(self):
+        CONF.clear_override('config_file_path')
+        shutil.rmtree(self._tmp_dir)
+
+    def test_get_config_value_no_file(self):
+        self.assertIsNone(self._posixutil.get_config_value('fake', 'Plugins'))
+        self.assertEqual(self._posixutil.get_config_values('Plugins'), {})
+
+    def test_set_config_value(self):
+        self._posixutil.set_config_value('fake', 1, 'Plugins')
+        self._posixutil.set_config_value('fake', 'value')
+
+        self.assertEqual(self._posixutil.get_config_value('fake', 'Plugins'),
+                         1)
+        self.assertEqual(self._posixutil.get_config_value('fake'), 'value')
+
+    def test_set_config_values(self):
+        self._posixutil.set_config_value('plugin1', 2, 'Plugins')
+        self._posixutil.set_config_values({'plugin1': 1, 'plugin2': 1},
+                                          'Plugins')
+
+        self.assertEqual(self._posixutil.get_config_values('Plugins'),
+                         {'plugin1': 1, 'plugin2': 1})
+        self.assertEqual(os.listdir(os.path.dirname(self._config_path)),
+                         ['config.json'])
+
+    def _write_file(self, path, data=''):
+        path = os.path.join(self._tmp_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _add_interface(self, name, index, if_type=1, physical=True):
+        self._write_file('sys/class/net/%s/ifindex' % name, '%d\n' % index)
+        self._write_file('sys/class/net/%s/type' % name, '%d\n' % if_type)
+        if physical:
+            os.mkdir(os.path.join(self._tmp_dir, 'sys/class/net', name,
+                                  'device'))
+
+    def _write_routes(self):
+        self._add_interface('eth0', 2)
+        self._write_file(
+            'proc/net/route',
+            'Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask'
+            '\t\tMTU\tWindow\tIRTT\n'
+            'eth0\t00000000\t0102000A\t0003\t0\t0\t100\t00000000\t0\t0\t0\n'
+            'eth0\t0000000A\t00000000\t0001\t0\t0\t0\t00FFFFFF\t0\t0\t0\n'
+            'eth0\t0000FEA9\t00000000\t0000\t0\t0\t0\t0000FFFF\t0\t0\t0\n')
+
+    def test_get_default_gateway(self):
+        self._write_routes()
+        self.assertEqual(self._posixutil.get_default_gateway(),
+                         (2, '10.0.2.1'))
+
+    def test_get_default_gateway_no_route(self):
+        self._write_file('proc/net/route', 'Iface\tDestination\n')
+        self.assertEqual(self._posixutil.get_default_gateway(),
+                         (None, None))
+
+    def test_check_static_route_exists(self):
+        self._write_routes()
+        self.assertTrue(self._posixutil.check_static_route_exists(
+            '10.0.0.0'))
+        # Routes which are not up are ignored
+        self.assertFalse(self._posixutil.check_static_route_exists(
+            '169.254.0.0'))
+
+    @mock.patch('cloudbaseinit.osutils.posix.PosixUtil._execute')
+    def _test_add_static_route(self, mock_execute, err=None):
+        self._write_routes()
+        self._posixutil.check_static_route_exists('169.254.169.254')
+        if err:
+            mock_execute.side_effect = [Exception(err)]
+
+        self._posixutil.add_static_route('169.254.169.254',
+                                         '255.255.255.255', '10.0.2.1', 2,
+                                         10)
+
+        mock_execute.assert_called_once_with(
+            ['ip', 'route', 'add', '169.254.169.254/32', 'via', '10.0.2.1',
+             'metric', '10', 'dev', 'eth0'])
+        self.assertEqual(
+            self._posixutil._routing_table_cache.refresh_count, 1)
+        self._posixutil.check_static_route_exists('169.254.169.254')
+        self.assertEqual(
+            self._posixutil._routing_table_cache.refresh_count, 2)
+
+    def test_add_static_route(self):
+        self._test_add_static_route()
+
+    def test_add_static_route_exists(self):
+        self._test_add_static_route(err='RTNETLINK answers: File exists')
+
+    def test_add_static_route_failed(self):
+        self.assertRaises(Exception, self._test_add_static_route,
+                          err='RTNETLINK answers: Network is unreachable')
+
+    def test_get_network_adapters(self):
+        self._add_interface('lo', 1, if_type=772, physical=False)
+        self._add_interface('eth0', 2)
+        self._add_interface('veth0', 3, physical=False)
+        self.assertEqual(self._posixutil.get_network_adapters(), ['eth0'])
+
+    @mock.patch('cloudbaseinit.osutils.posix.PosixUtil._execute')
+    def test_set_static_network_config(self, mock_execute):
+        self._add_interface('eth0', 2)
+        response = self._posixutil.set_static_network_config(
+            'eth0', '10.0.2.15', '255.255.255.0', '10.0.2.255', '10.0.2.1',
+            ['8.8.8.8', '8.8.4.4'])
+
+        self.assertFalse(response)
+        self.assertEqual(mock_execute.call_args_list, [
+            mock.call(['ip', 'addr', 'flush', 'dev', 'eth0']),
+            mock.call(['ip', 'addr', 'add', '10.0.2.15/24', 'broadcast',
+                       '10.0.2.255', 'dev', 'eth0']),
+            mock.call(['ip', 'link', 'set', 'eth0', 'up']),
+            mock.call(['ip', 'route', 'replace', 'default', 'via',
+                       '10.0.2.1', 'dev', 'eth0'])])
+        with open(os.path.join(self._tmp_dir, 'etc', 'resolv.conf')) as f:
+            self.assertEqual(f.read(),
+                             'nameserver 8.8.8.8\nnameserver 8.8.4.4\n')
+
+    def test_set_static_network_config_no_adapter(self):
+        self.assertRaises(Exception,
+                          self._posixutil.set_static_network_config,
+                          'eth0', '10.0.2.15', '255.255.255.0',
+                          '10.0.2.255', '10.0.2.1', [])
+
+    @mock.patch('cloudbaseinit.osutils.posix.PosixUtil._execute')
+    def _test_create_user(self, mock_execute, password_expires):
+        self._posixutil.create_user('fake_user', 'fake:pwd',
+                                    password_expires)
+        expected = [mock.call(['useradd', '-m', 'fake_user']),
+                    mock.call(['chpasswd'], 'fake_user:fake:pwd\n')]
+        if not password_expires:
+            expected.append(mock.call(['chage', '-M', '-1', 'fake_user']))
+        self.assertEqual(mock_execute.call_args_list, expected)
+
+    def test_create_user(self):
+        self._test_create_user(password_expires=False)
+
+    def test_create_user_password_expires(self):
+        self._test_create_user(password_expires=True)
+
+    @mock.patch('subprocess.Popen')
+    def test_execute_failed(self, mock_popen):
+        mock_popen.return_value.communicate.return_value = ('', 'fake err')
+        mock_popen.return_value.returncode = 1
+        self.assertRaises(Exception, self._posixutil._execute, ['fake'])
+
+    @mock.patch('pwd.getpwnam')
+    def test_get_user_home(self, mock_getpwnam):
+        mock_getpwnam.return_value.pw_dir = '/home/fake'
+        self.assertEqual(self._posixutil.get_user_home('fake'), '/home/fake')
+        mock_getpwnam.side_effect = [KeyError]
+        self.assertIsNone(self._posixutil.get_user_home('fake'))
+
+    @mock.patch('cloudbaseinit.osutils.posix.PosixUtil._execute')
+    def test_set_host_name(self, mock_execute):
+        self._write_file('etc/hostname', 'old\n')
+        self.assertFalse(self._posixutil.set_host_name('fake-host'))
+        mock_execute.assert_called_once_with(['hostname', 'fake-host'])
+        with open(os.path.join(self._tmp_dir, 'etc', 'hostname')) as f:
+            self.assertEqual(f.read(), 'fake-host\n')
+
+    def test_get_cdrom_drives(self):
+        self._write_file('sys/block/sda/device/type', '0\n')
+        self._write_file('sys/block/sr0/device/type', '5\n')
+        self._write_file('sys/block/loop0/size', '0\n')
+        self.assertEqual(self._posixutil.get_cdrom_drives(),
+                         [os.path.join(self._tmp_dir, 'dev', 'sr0')])
+
+    def test_get_volume_label(self):
+        self._write_file('dev/sr0')
+        labels_path = os.path.join(self._tmp_dir, 'dev', 'disk', 'by-label')
+        os.makedirs(labels_path)
+        os.symlink('../../sr0', os.path.join(labels_path,
+                                             'config\\x20drive'))
+        self.assertEqual(self._posixutil.get_volume_label(
+            os.path.join(self._tmp_dir, 'dev', 'sr0')), 'config drive')
+        self.assertIsNone(self._posixutil.get_volume_label(
+            os.path.join(self._tmp_dir, 'dev', 'sda')))
+
+    def test_get_system_uuid(self):
+        self._write_file('sys/class/dmi/id/product_uuid', 'FAKE-UUID\n')
+        self.assertEqual(self._posixutil.get_system_uuid(), 'FAKE-UUID')
+
+    def test_set_owner_only_permissions(self):
+        path = os.path.join(self._tmp_dir, 'fake')
+        open(path, 'wb').close()
+        os.chmod(path, 0644)
+        self._posixutil.set_owner_only_permissions(path)
+        self.assertEqual(os.stat(path).st_mode & 0777, 0600)
+
+    def test_check_os_version(self):
+        self.assertFalse(self._posixutil.check_os_version(6, 0))
+        self.assertFalse(self._posixutil.check_os_version(2, 6, 32))
+
+    @mock.patch('cloudbaseinit.osutils.posix.PosixUtil._execute')
+    def test_firewall_create_rule(self, mock_execute):
+        self._posixutil.firewall_create_rule('fake', 5985,
+                                             self._posixutil.PROTOCOL_TCP)
+        mock_execute.assert_called_once_with(
+            ['iptables', '-I', 'INPUT', '-p', 'tcp', '--dport', '5985', '-m',
+             'comment', '--comment', 'fake', '-j', 'ACCEPT'])
@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import unittest
+
+from cloudbaseinit.osutils import userprovisioning
+from cloudbaseinit.tests.osutils import fake_userbackend
+
+
+class ProvisionUserTest(unittest.TestCase):
+
+    def setUp(self):
+        self._backend = fake_userbackend.FakeUserBackend(
+            users={'existing': ('old', True)},
+            groups=['Administrators', 'Users'])
+
+    def _provision(self, username, **kwargs):
+        spec = userprovisioning.UserSpec(username, 'Passw0rd', **kwargs)
+        return userprovisioning.provision_user(self._backend, spec)
+
+    def test_provision_new_user(self):
+        result = self._provision('new', groups=['Administrators', 'Users'],
+                                 create_profile=True)
+
+        self.assertTrue(result.exists)
+        self.assertTrue(result.created)
+        self.assertEqual(result.failed_groups, [])
+        self.assertEqual(self._backend.users['new'], ('Passw0rd', False))
+        self.assertEqual(self._backend.groups['Users'], set(['new']))
+        self.assertEqual(self._backend.profiles, set(['new']))
+        self.assertEqual(self._backend.calls,
+                         {'get_user': 1, 'add_user': 1,
+                          'create_user_profile': 1,
+                          'add_user_to_local_group': 2})
+
+    def test_provision_existing_user(self):
+        result = self._provision('existing', groups=['Administrators'],
+                                 create_profile=True)
+
+        self.assertTrue(result.exists)
+        self.assertFalse(result.created)
+        self.assertEqual(self._backend.users['existing'],
+                         ('Passw0rd', False))
+        # Profiles are created only along with the user
+        self.assertEqual(self._backend.profiles, set())
+        self.assertEqual(self._backend.calls,
+                         {'get_user': 1, 'update_user': 1,
+                          'add_user_to_local_group': 1})
+
+    def test_provision_user_group_not_found(self):
+        result = self._provision('new', groups=['Fake', 'Users'])
+
+        self.assertTrue(result.created)
+        self.assertEqual(result.failed_groups, ['Fake'])
+        self.assertEqual(self._backend.groups['Users'], set(['new']))
+
+    def test_provision_user_no_create(self):
+        result = self._provision('new', groups=['Users'], create=False)
+
+        self.assertFalse(result.exists)
+        self.assertFalse(result.created)
+        self.assertNotIn('new', self._backend.users)
+        self.assertEqual(self._backend.calls, {'get_user': 1})
+
+
+class OSUtilsUserBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self._osutils = mock.MagicMock()
+        self._backend = userprovisioning.OSUtilsUserBackend(self._osutils)
+
+    def _test_get_user(self, user_exists):
+        self._osutils.user_exists.return_value = user_exists
+        user = self._backend.get_user('fake')
+        if user_exists:
+            self.assertEqual(user.username, 'fake')
+        else:
+            self.assertIsNone(user)
+
+    def test_get_user(self):
+        self._test_get_user(user_exists=True)
+
+    def test_get_user_not_found(self):
+        self._test_get_user(user_exists=False)
+
+    def test_update_user(self):
+        user = userprovisioning.UserInfo('fake')
+        self._backend.update_user(user, 'Passw0rd', True)
+        self._osutils.set_user_password.assert_called_once_with(
+            'fake', 'Passw0rd', True)
+
+    def test_create_user_profile(self):
+        self._backend.create_user_profile('fake', 'Passw0rd')
+        self._osutils.create_user_logon_session.assert_called_once_with(
+            'fake', 'Passw0rd', load_profile=True)
+        self._osutils.close_user_logon_session.assert_called_once_with(
+            self._osutils.create_user_logon_session.return_value)
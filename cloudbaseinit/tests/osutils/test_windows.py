@@ -22,6 +22,7 @@ import unittest
 
 if sys.platform == 'win32':
     import _winreg
+    import ntsecuritycon
     import win32process
     import win32security
     import wmi
@@ -30,6 +31,8 @@ if sys.platform == 'win32':
     from ctypes import wintypes
     from cloudbaseinit.osutils import windows as windows_utils
 from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import routing
+from cloudbaseinit.utils import wmiquery
 
 CONF = cfg.CONF
 
@@ -49,6 +52,13 @@ class WindowsUtilsTest(unittest.TestCase):
     def setUp(self):
         self._winutils = windows_utils.WindowsUtils()
         self._conn = mock.MagicMock()
+        self._wmi_connection = wmiquery.WMIConnection(
+            connect=lambda moniker: self._conn, cache_ttl=0)
+        patcher = mock.patch('cloudbaseinit.utils.wmiquery.'
+                             'get_wmi_connection',
+                             return_value=self._wmi_connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_enable_shutdown_privilege(self):
         fake_process = mock.MagicMock()
@@ -73,6 +83,32 @@ class WindowsUtilsTest(unittest.TestCase):
             win32security.TOKEN_ADJUST_PRIVILEGES |
             win32security.TOKEN_QUERY)
 
+    @mock.patch('win32security.SetNamedSecurityInfo')
+    @mock.patch('win32security.ACL')
+    @mock.patch('win32security.GetTokenInformation')
+    @mock.patch('win32security.OpenProcessToken')
+    @mock.patch('win32process.GetCurrentProcess')
+    def test_set_owner_only_permissions(self, mock_get_current_process,
+                                        mock_open_process_token,
+                                        mock_get_token_information,
+                                        mock_acl,
+                                        mock_set_named_security_info):
+        mock_get_token_information.return_value = (mock.sentinel.sid, 0)
+        self._winutils.set_owner_only_permissions('fake')
+
+        mock_open_process_token.assert_called_once_with(
+            mock_get_current_process(), win32security.TOKEN_QUERY)
+        mock_get_token_information.assert_called_once_with(
+            mock_open_process_token(), win32security.TokenUser)
+        mock_acl().AddAccessAllowedAce.assert_called_once_with(
+            win32security.ACL_REVISION, ntsecuritycon.FILE_ALL_ACCESS,
+            mock.sentinel.sid)
+        mock_set_named_security_info.assert_called_once_with(
+            'fake', win32security.SE_FILE_OBJECT,
+            win32security.DACL_SECURITY_INFORMATION |
+            win32security.PROTECTED_DACL_SECURITY_INFORMATION,
+            None, None, mock_acl(), None)
+
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
                 '._enable_shutdown_privilege')
     def _test_reboot(self, mock_enable_shutdown_privilege, ret_value):
@@ -95,20 +131,17 @@ class WindowsUtilsTest(unittest.TestCase):
     def test_reboot_failed(self):
         self._test_reboot(ret_value=None)
 
-    @mock.patch('wmi.WMI')
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
                 '._sanitize_wmi_input')
-    def _test_get_user_wmi_object(self, mock_sanitize_wmi_input, mock_WMI,
+    def _test_get_user_wmi_object(self, mock_sanitize_wmi_input,
                                   returnvalue):
-        mock_WMI.return_value = self._conn
         mock_sanitize_wmi_input.return_value = self._USERNAME
         self._conn.query.return_value = returnvalue
         response = self._winutils._get_user_wmi_object(self._USERNAME)
         self._conn.query.assert_called_with("SELECT * FROM Win32_Account "
-                                            "where name = \'%s\'" %
+                                            "WHERE Name = \'%s\'" %
                                             self._USERNAME)
         mock_sanitize_wmi_input.assert_called_with(self._USERNAME)
-        mock_WMI.assert_called_with(moniker='//./root/cimv2')
         if returnvalue:
             self.assertTrue(response is not None)
         else:
@@ -122,12 +155,30 @@ class WindowsUtilsTest(unittest.TestCase):
         empty_caption = ''
         self._test_get_user_wmi_object(returnvalue=empty_caption)
 
+    def _test_get_user_record(self, returnvalue):
+        self._conn.query.return_value = returnvalue
+        response = self._winutils._get_user_record(self._USERNAME)
+        self._conn.query.assert_called_with("SELECT Name, SID FROM "
+                                            "Win32_Account WHERE "
+                                            "Name = \'%s\'" %
+                                            self._USERNAME)
+        if returnvalue:
+            self.assertEqual(response.SID, returnvalue[0].SID)
+        else:
+            self.assertTrue(response is None)
+
+    def test_get_user_record(self):
+        self._test_get_user_record(returnvalue=[mock.MagicMock()])
+
+    def test_no_user_record(self):
+        self._test_get_user_record(returnvalue=[])
+
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '._get_user_wmi_object')
-    def _test_user_exists(self, mock_get_user_wmi_object, returnvalue):
-        mock_get_user_wmi_object.return_value = returnvalue
+                '._get_user_record')
+    def _test_user_exists(self, mock_get_user_record, returnvalue):
+        mock_get_user_record.return_value = returnvalue
         response = self._winutils.user_exists(returnvalue)
-        mock_get_user_wmi_object.assert_called_with(returnvalue)
+        mock_get_user_record.assert_called_with(returnvalue)
         if returnvalue:
             self.assertTrue(response)
         else:
@@ -259,6 +310,69 @@ class WindowsUtilsTest(unittest.TestCase):
     def test_get_user_sid_and_domain_no_return_value(self):
         self._test_get_user_sid_and_domain(ret_val=None)
 
+    @mock.patch('cloudbaseinit.osutils.windows.netapi32')
+    def _test_net_user_backend_get_user(self, mock_netapi32, ret_val):
+        backend = self._winutils._get_user_backend()
+        mock_netapi32.NetUserGetInfo.return_value = ret_val
+
+        if ret_val == backend.NERR_UserNotFound:
+            self.assertIsNone(backend.get_user(self._USERNAME))
+        else:
+            self.assertRaises(Exception, backend.get_user, self._USERNAME)
+        self.assertFalse(mock_netapi32.NetApiBufferFree.called)
+
+    def test_net_user_backend_get_user_not_found(self):
+        self._test_net_user_backend_get_user(
+            ret_val=windows_utils.NetUserBackend.NERR_UserNotFound)
+
+    def test_net_user_backend_get_user_error(self):
+        self._test_net_user_backend_get_user(
+            ret_val=self._winutils.ERROR_ACCESS_DENIED)
+
+    @mock.patch('cloudbaseinit.osutils.windows.netapi32')
+    def _test_net_user_backend_add_user(self, mock_netapi32, ret_val):
+        backend = self._winutils._get_user_backend()
+        mock_netapi32.NetUserAdd.return_value = ret_val
+
+        if ret_val:
+            self.assertRaises(Exception, backend.add_user, self._USERNAME,
+                              self._PASSWORD, False)
+        else:
+            backend.add_user(self._USERNAME, self._PASSWORD, False)
+        self.assertEqual(mock_netapi32.NetUserAdd.call_count, 1)
+        ui = mock_netapi32.NetUserAdd.call_args[0][2]._obj
+        self.assertEqual(ui.usri1_name, self._USERNAME)
+        self.assertTrue(ui.usri1_flags & backend.UF_DONT_EXPIRE_PASSWD)
+
+    def test_net_user_backend_add_user(self):
+        self._test_net_user_backend_add_user(ret_val=0)
+
+    def test_net_user_backend_add_user_failed(self):
+        self._test_net_user_backend_add_user(
+            ret_val=self._winutils.ERROR_ACCESS_DENIED)
+
+    @mock.patch('cloudbaseinit.osutils.windows.netapi32')
+    def _test_net_user_backend_update_user(self, mock_netapi32,
+                                           password_expires):
+        backend = self._winutils._get_user_backend()
+        mock_netapi32.NetUserSetInfo.return_value = 0
+        user = windows_utils.userprovisioning.UserInfo(
+            self._USERNAME, True, backend.UF_NORMAL_ACCOUNT)
+
+        backend.update_user(user, self._PASSWORD, password_expires)
+
+        levels = [c[0][2] for c in mock_netapi32.NetUserSetInfo.call_args_list]
+        if password_expires:
+            self.assertEqual(levels, [1003])
+        else:
+            self.assertEqual(levels, [1003, 1008])
+
+    def test_net_user_backend_update_user(self):
+        self._test_net_user_backend_update_user(password_expires=True)
+
+    def test_net_user_backend_update_user_expiration(self):
+        self._test_net_user_backend_update_user(password_expires=False)
+
     def _test_add_user_to_local_group(self, ret_value):
         windows_utils.Win32_LOCALGROUP_MEMBERS_INFO_3 = mock.MagicMock()
         lmi = windows_utils.Win32_LOCALGROUP_MEMBERS_INFO_3()
@@ -303,18 +417,18 @@ class WindowsUtilsTest(unittest.TestCase):
             ret_value=self._winutils.ERROR_INVALID_MEMBER)
 
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '._get_user_wmi_object')
-    def _test_get_user_sid(self, mock_get_user_wmi_object, fail):
+                '._get_user_record')
+    def _test_get_user_sid(self, mock_get_user_record, fail):
         r = mock.Mock()
         if not fail:
-            mock_get_user_wmi_object.return_value = None
+            mock_get_user_record.return_value = None
             response = self._winutils.get_user_sid(self._USERNAME)
             self.assertTrue(response is None)
         else:
-            mock_get_user_wmi_object.return_value = r
+            mock_get_user_record.return_value = r
             response = self._winutils.get_user_sid(self._USERNAME)
             self.assertTrue(response is not None)
-        mock_get_user_wmi_object.assert_called_with(self._USERNAME)
+        mock_get_user_record.assert_called_with(self._USERNAME)
 
     def test_get_user_sid(self):
         self._test_get_user_sid(fail=False)
@@ -444,23 +558,28 @@ class WindowsUtilsTest(unittest.TestCase):
     def test_get_user_home_fail(self):
         self._test_get_user_home(user_sid=None)
 
-    @mock.patch('wmi.WMI')
-    def test_get_network_adapters(self, mock_WMI):
-        mock_WMI.return_value = self._conn
+    def test_get_network_adapters(self):
         mock_response = mock.MagicMock()
         self._conn.query.return_value = [mock_response]
         response = self._winutils.get_network_adapters()
         self._conn.query.assert_called_with(
-            'SELECT * FROM Win32_NetworkAdapter WHERE AdapterTypeId = 0 AND '
-            'PhysicalAdapter = True AND MACAddress IS NOT NULL')
+            'SELECT Name FROM Win32_NetworkAdapter WHERE AdapterTypeId = 0 '
+            'AND PhysicalAdapter = True AND MACAddress IS NOT NULL')
         self.assertEqual(response, [mock_response.Name])
 
+    def test_get_system_uuid(self):
+        mock_response = mock.MagicMock()
+        self._conn.query.return_value = [mock_response]
+        response = self._winutils.get_system_uuid()
+        self._conn.query.assert_called_with(
+            'SELECT UUID FROM Win32_ComputerSystemProduct')
+        self.assertEqual(response, mock_response.UUID)
+
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
                 '._sanitize_wmi_input')
     def _test_set_static_network_config(self, mock_sanitize_wmi_input,
                                         adapter, ret_val1=None,
                                         ret_val2=None, ret_val3=None):
-        wmi.WMI = mock.MagicMock(return_value=self._conn)
         address = '10.10.10.10'
         adapter_name = 'adapter_name'
         broadcast = '0.0.0.0'
@@ -660,6 +779,50 @@ class WindowsUtilsTest(unittest.TestCase):
     def test_get_config_value_type_error(self):
         self._test_get_config_value(value=None)
 
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_set_config_values(self, mock_get_config_key_name):
+        mock_get_config_key_name.return_value = 'fake key'
+        _winreg.CreateKey = mock.MagicMock()
+        _winreg.REG_DWORD = mock.Mock()
+        _winreg.REG_SZ = mock.Mock()
+        _winreg.SetValueEx = mock.MagicMock()
+
+        self._winutils.set_config_values({'name1': 1, 'name2': '2'},
+                                         self._SECTION)
+
+        mock_get_config_key_name.assert_called_once_with(self._SECTION)
+        _winreg.CreateKey.assert_called_once_with(_winreg.HKEY_LOCAL_MACHINE,
+                                                  'fake key')
+        key = _winreg.CreateKey().__enter__()
+        self.assertEqual(sorted(_winreg.SetValueEx.call_args_list),
+                         sorted([mock.call(key, 'name1', 0,
+                                           _winreg.REG_DWORD, 1),
+                                 mock.call(key, 'name2', 0,
+                                           _winreg.REG_SZ, '2')]))
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_get_config_values(self, mock_get_config_key_name):
+        mock_get_config_key_name.return_value = 'fake key'
+        _winreg.OpenKey = mock.MagicMock()
+        _winreg.EnumValue = mock.MagicMock(
+            side_effect=[('name1', 1, 4), ('name2', '2', 1), WindowsError])
+
+        response = self._winutils.get_config_values(self._SECTION)
+
+        _winreg.OpenKey.assert_called_once_with(_winreg.HKEY_LOCAL_MACHINE,
+                                                'fake key')
+        self.assertEqual(_winreg.EnumValue.call_count, 3)
+        self.assertEqual(response, {'name1': 1, 'name2': '2'})
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_get_config_values_no_key(self, mock_get_config_key_name):
+        _winreg.OpenKey = mock.MagicMock(side_effect=WindowsError)
+        response = self._winutils.get_config_values(self._SECTION)
+        self.assertEqual(response, {})
+
     def _test_wait_for_boot_completion(self, ret_val):
         key = mock.MagicMock()
         time.sleep = mock.MagicMock()
@@ -679,35 +842,44 @@ class WindowsUtilsTest(unittest.TestCase):
         ret_val = [[7]]
         self._test_wait_for_boot_completion(ret_val)
 
-    @mock.patch('wmi.WMI')
-    def test_get_service(self, mock_WMI):
-        mock_WMI.return_value = self._conn
-        self._conn.Win32_Service.return_value = ['fake name']
+    def test_get_service(self):
+        self._conn.query.return_value = ['fake service']
         response = self._winutils._get_service('fake name')
-        mock_WMI.assert_called_with(moniker='//./root/cimv2')
-        self._conn.Win32_Service.assert_called_with(Name='fake name')
-        self.assertEqual(response, 'fake name')
+        self._conn.query.assert_called_with(
+            'SELECT * FROM Win32_Service WHERE Name = \'fake name\'')
+        self.assertEqual(response, 'fake service')
+
+    def test_get_service_record(self):
+        mock_service = mock.MagicMock()
+        self._conn.query.return_value = [mock_service]
+        response = self._winutils._get_service_record('fake name',
+                                                      ['State'], False)
+        self._conn.query.assert_called_with(
+            'SELECT State FROM Win32_Service WHERE Name = \'fake name\'')
+        self.assertEqual(response.State, mock_service.State)
 
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '._get_service')
-    def test_check_service_exists(self, mock_get_service):
-        mock_get_service.return_value = 'not None'
+                '._get_service_record')
+    def test_check_service_exists(self, mock_get_service_record):
+        mock_get_service_record.return_value = 'not None'
         response = self._winutils.check_service_exists('fake name')
         self.assertEqual(response, True)
 
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '._get_service')
-    def test_get_service_status(self, mock_get_service):
+                '._get_service_record')
+    def test_get_service_status(self, mock_get_service_record):
         mock_service = mock.MagicMock()
-        mock_get_service.return_value = mock_service
+        mock_get_service_record.return_value = mock_service
         response = self._winutils.get_service_status('fake name')
+        mock_get_service_record.assert_called_once_with(
+            'fake name', ['State'], cache=False)
         self.assertEqual(response, mock_service.State)
 
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '._get_service')
-    def test_get_service_start_mode(self, mock_get_service):
+                '._get_service_record')
+    def test_get_service_start_mode(self, mock_get_service_record):
         mock_service = mock.MagicMock()
-        mock_get_service.return_value = mock_service
+        mock_get_service_record.return_value = mock_service
         response = self._winutils.get_service_start_mode('fake name')
         self.assertEqual(response, mock_service.StartMode)
 
@@ -821,28 +993,99 @@ class WindowsUtilsTest(unittest.TestCase):
         self._test_check_static_route_exists(routing_table=routing_table)
 
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '.execute_process')
-    def _test_add_static_route(self, mock_execute_process, err):
+                '._get_ipv4_routing_table')
+    def test_routing_table_cached(self, mock_get_ipv4_routing_table):
+        mock_get_ipv4_routing_table.return_value = [
+            ('0.0.0.0', '0.0.0.0', self._GATEWAY, 2, 10)]
+
+        self.assertFalse(
+            self._winutils.check_static_route_exists(self._DESTINATION))
+        self.assertEqual(self._winutils.get_default_gateway(),
+                         (2, self._GATEWAY))
+        mock_get_ipv4_routing_table.assert_called_once_with()
+
+        self._winutils._invalidate_routing_table()
+        self._winutils.get_default_gateway()
+        self.assertEqual(mock_get_ipv4_routing_table.call_count, 2)
+
+    @mock.patch('ctypes.windll.iphlpapi.GetIpInterfaceEntry')
+    @mock.patch('ctypes.windll.iphlpapi.InitializeIpInterfaceEntry')
+    def _test_get_ipv4_interface_metric(self,
+                                        mock_InitializeIpInterfaceEntry,
+                                        mock_GetIpInterfaceEntry, err):
+        def _get_ip_interface_entry(p_row):
+            row = p_row._obj
+            self.assertEqual(row.Family, self._winutils.AF_INET)
+            self.assertEqual(row.InterfaceIndex, 1)
+            row.Metric = 10
+            return err
+        mock_GetIpInterfaceEntry.side_effect = _get_ip_interface_entry
+
+        if err:
+            self.assertRaises(Exception,
+                              self._winutils._get_ipv4_interface_metric, 1)
+        else:
+            self.assertEqual(
+                self._winutils._get_ipv4_interface_metric(1), 10)
+        self.assertEqual(mock_InitializeIpInterfaceEntry.call_count, 1)
+
+    def test_get_ipv4_interface_metric(self):
+        self._test_get_ipv4_interface_metric(err=0)
+
+    def test_get_ipv4_interface_metric_fail(self):
+        self._test_get_ipv4_interface_metric(err=1168)
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_ipv4_interface_metric')
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._invalidate_routing_table')
+    @mock.patch('ctypes.windll.iphlpapi.CreateIpForwardEntry')
+    def _test_add_static_route(self, mock_CreateIpForwardEntry,
+                               mock_invalidate_routing_table,
+                               mock_get_ipv4_interface_metric, err,
+                               interface_metric=10):
         next_hop = '10.10.10.10'
         interface_index = 1
         metric = 9
-        args = ['ROUTE', 'ADD', self._DESTINATION, 'MASK', self._NETMASK,
-                next_hop]
-        mock_execute_process.return_value = (None, err, None)
-        if err:
+        mock_CreateIpForwardEntry.return_value = err
+        if interface_metric is None:
+            mock_get_ipv4_interface_metric.side_effect = Exception()
+        else:
+            mock_get_ipv4_interface_metric.return_value = interface_metric
+        if err and err != self._winutils.ERROR_OBJECT_ALREADY_EXISTS:
             self.assertRaises(Exception, self._winutils.add_static_route,
                               self._DESTINATION, self._NETMASK, next_hop,
                               interface_index, metric)
         else:
             self._winutils.add_static_route(self._DESTINATION, self._NETMASK,
                                             next_hop, interface_index, metric)
-            mock_execute_process.assert_called_with(args)
+
+        row = mock_CreateIpForwardEntry.call_args[0][0]._obj
+        self.assertEqual(row.dwForwardDest,
+                         routing.ipv4_to_dword(self._DESTINATION))
+        self.assertEqual(row.dwForwardMask,
+                         routing.ipv4_to_dword(self._NETMASK))
+        self.assertEqual(row.dwForwardNextHop,
+                         routing.ipv4_to_dword(next_hop))
+        self.assertEqual(row.dwForwardIfIndex, interface_index)
+        self.assertEqual(row.dwForwardMetric1,
+                         metric + (interface_metric or 0))
+        mock_get_ipv4_interface_metric.assert_called_once_with(
+            interface_index)
+        mock_invalidate_routing_table.assert_called_once_with()
 
     def test_add_static_route(self):
-        self._test_add_static_route(err=404)
+        self._test_add_static_route(err=0)
+
+    def test_add_static_route_already_exists(self):
+        self._test_add_static_route(
+            err=self._winutils.ERROR_OBJECT_ALREADY_EXISTS)
 
     def test_add_static_route_fail(self):
-        self._test_add_static_route(err=None)
+        self._test_add_static_route(err=87)
+
+    def test_add_static_route_no_interface_metric(self):
+        self._test_add_static_route(err=0, interface_metric=None)
 
     @mock.patch('ctypes.sizeof')
     @mock.patch('ctypes.byref')
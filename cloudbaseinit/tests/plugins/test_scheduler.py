@@ -0,0 +1,228 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import importlib
+import mock
+import sys
+import threading
+import time
+import unittest
+
+from cloudbaseinit.plugins import base
+from cloudbaseinit.plugins import constants
+from cloudbaseinit.plugins import scheduler
+
+
+class FakePlugin(base.BasePlugin):
+    def __init__(self, name, provides=[], requires=[], reboot=False,
+                 resources=[]):
+        self._name = name
+        self._provides = provides
+        self._requires = requires
+        self._reboot = reboot
+        self._resources = resources
+
+    def get_name(self):
+        return self._name
+
+    def get_provided_shared_data(self):
+        return self._provides
+
+    def get_required_shared_data(self):
+        return self._requires
+
+    def get_exclusive_resources(self):
+        return self._resources
+
+    def may_require_reboot(self):
+        return self._reboot
+
+
+class PluginSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self._plugins = [
+            FakePlugin('hostname', reboot=True),
+            FakePlugin('createuser', provides=['user', 'password']),
+            FakePlugin('extendvolumes'),
+            FakePlugin('sshpublickeys', requires=['user']),
+            FakePlugin('setuserpassword', provides=['password'],
+                       requires=['user']),
+            FakePlugin('winrmlistener'),
+            FakePlugin('userdata', reboot=True),
+            FakePlugin('certauth', provides=['password'],
+                       requires=['user']),
+        ]
+
+    def test_get_plugin_dependencies(self):
+        response = scheduler.get_plugin_dependencies(self._plugins)
+        self.assertEqual(response, [set(), set([0]), set([0]),
+                                    set([0, 1]), set([0, 1]), set([0]),
+                                    set(range(6)), set([0, 1, 4, 6])])
+
+    def test_get_plugin_dependencies_exclusive_resources(self):
+        plugins = [FakePlugin('plugin0', resources=['fake_resource']),
+                   FakePlugin('plugin1'),
+                   FakePlugin('plugin2', resources=['fake_resource']),
+                   FakePlugin('plugin3', resources=['other_resource'])]
+        response = scheduler.get_plugin_dependencies(plugins)
+        self.assertEqual(response, [set(), set(), set([0]), set()])
+
+    def _run(self, max_workers, reboot_plugins=[], stop_on_reboot=True):
+        executed = []
+        lock = threading.Lock()
+        names = [p.get_name() for p in self._plugins]
+        deps = scheduler.get_plugin_dependencies(self._plugins)
+
+        def _exec_plugin(plugin):
+            with lock:
+                index = names.index(plugin.get_name())
+                for i in deps[index]:
+                    self.assertIn(names[i], executed)
+                executed.append(plugin.get_name())
+            return plugin.get_name() in reboot_plugins
+
+        plugins_scheduler = scheduler.PluginScheduler(self._plugins,
+                                                      max_workers)
+        reboot_required = plugins_scheduler.run(
+            _exec_plugin, stop_on_reboot=stop_on_reboot)
+        return (executed, reboot_required)
+
+    def test_run_sequential(self):
+        (executed, reboot_required) = self._run(max_workers=1)
+        self.assertEqual(executed, [p.get_name() for p in self._plugins])
+        self.assertFalse(reboot_required)
+
+    def test_run_parallel(self):
+        (executed, reboot_required) = self._run(max_workers=4)
+        self.assertEqual(sorted(executed),
+                         sorted(p.get_name() for p in self._plugins))
+        self.assertFalse(reboot_required)
+
+    def _test_run_reboot(self, max_workers):
+        (executed, reboot_required) = self._run(
+            max_workers=max_workers, reboot_plugins=['hostname'])
+        self.assertEqual(executed, ['hostname'])
+        self.assertTrue(reboot_required)
+
+        (executed, reboot_required) = self._run(
+            max_workers=max_workers, reboot_plugins=['userdata'])
+        self.assertEqual(sorted(executed[:-1]),
+                         sorted(p.get_name() for p in self._plugins[:6]))
+        self.assertEqual(executed[-1], 'userdata')
+        self.assertTrue(reboot_required)
+
+    def test_run_reboot_sequential(self):
+        self._test_run_reboot(max_workers=1)
+
+    def test_run_reboot_parallel(self):
+        self._test_run_reboot(max_workers=4)
+
+    def test_run_reboot_not_stopped(self):
+        (executed, reboot_required) = self._run(
+            max_workers=4, reboot_plugins=['hostname'], stop_on_reboot=False)
+        self.assertEqual(len(executed), len(self._plugins))
+        self.assertTrue(reboot_required)
+
+    def test_run_concurrency(self):
+        self._plugins = [FakePlugin('plugin%d' % i) for i in range(6)]
+        started = threading.Event()
+        state = {'running': 0, 'max_running': 0}
+        lock = threading.Lock()
+
+        def _exec_plugin(plugin):
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'],
+                                           state['running'])
+                if state['max_running'] == 3:
+                    started.set()
+            started.wait(5)
+            with lock:
+                state['running'] -= 1
+
+        plugins_scheduler = scheduler.PluginScheduler(self._plugins, 3)
+        self.assertFalse(plugins_scheduler.run(_exec_plugin))
+        self.assertEqual(state['max_running'], 3)
+
+    def test_run_plugin_exception(self):
+        executed = []
+
+        def _exec_plugin(plugin):
+            executed.append(plugin.get_name())
+            raise Exception('fake error')
+
+        plugins_scheduler = scheduler.PluginScheduler(self._plugins, 4)
+        self.assertFalse(plugins_scheduler.run(_exec_plugin))
+        self.assertEqual(len(executed), len(self._plugins))
+
+
+class WinRMPluginSchedulerTests(unittest.TestCase):
+    @mock.patch.dict(sys.modules, {'ctypes': mock.MagicMock(),
+                                   'win32com': mock.MagicMock(),
+                                   'pywintypes': mock.MagicMock()})
+    def setUp(self):
+        self._windows_pkg = importlib.import_module(
+            'cloudbaseinit.plugins.windows')
+        self._windows_pkg_dict = dict(self._windows_pkg.__dict__)
+        winrmlistener = importlib.import_module(
+            'cloudbaseinit.plugins.windows.winrmlistener')
+        winrmcert = importlib.import_module(
+            'cloudbaseinit.plugins.windows.winrmcertificateauth')
+        self._plugins = [
+            FakePlugin('createuser',
+                       provides=[constants.SHARED_DATA_USERNAME,
+                                 constants.SHARED_DATA_PASSWORD]),
+            winrmlistener.ConfigWinRMListenerPlugin(),
+            FakePlugin('extendvolumes'),
+            winrmcert.ConfigWinRMCertificateAuthPlugin(),
+            FakePlugin('localscripts'),
+        ]
+
+    def tearDown(self):
+        # Avoid leaving the modules imported with the mocked dependencies
+        # as attributes of the package
+        self._windows_pkg.__dict__.clear()
+        self._windows_pkg.__dict__.update(self._windows_pkg_dict)
+
+    def test_run_winrm_plugins_not_concurrent(self):
+        winrm_names = [self._plugins[1].get_name(),
+                       self._plugins[3].get_name()]
+        running = []
+        executed = []
+        overlaps = []
+        lock = threading.Lock()
+
+        def _exec_plugin(plugin):
+            name = plugin.get_name()
+            with lock:
+                if name in winrm_names and running:
+                    overlaps.append((name, list(running)))
+                if name in winrm_names:
+                    running.append(name)
+            # Give the other worker threads the chance to start a plugin
+            time.sleep(0.05)
+            with lock:
+                if name in winrm_names:
+                    running.remove(name)
+                executed.append(name)
+
+        plugins_scheduler = scheduler.PluginScheduler(self._plugins, 4)
+        self.assertFalse(plugins_scheduler.run(_exec_plugin))
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(len(executed), len(self._plugins))
+        self.assertLess(executed.index(winrm_names[0]),
+                        executed.index(winrm_names[1]))
@@ -0,0 +1,100 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import unittest
+
+from cloudbaseinit.plugins import status
+
+
+class FakeOSUtils(object):
+    def __init__(self, values=None, enumerate_values=True):
+        self.values = dict(values or {})
+        self.calls = []
+        self._enumerate_values = enumerate_values
+
+    def get_config_value(self, name, section=None):
+        self.calls.append('get_config_value')
+        return self.values.get(name)
+
+    def get_config_values(self, section=None):
+        self.calls.append('get_config_values')
+        if not self._enumerate_values:
+            raise NotImplementedError()
+        return dict(self.values)
+
+    def set_config_values(self, values, section=None):
+        self.calls.append('set_config_values')
+        self.values.update(values)
+
+
+class PluginStatusStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._osutils = FakeOSUtils({'plugin1': 1, 'plugin2': 2})
+
+    def _get_store(self, batch_size=0):
+        return status.PluginStatusStore(self._osutils, 'Plugins',
+                                        batch_size)
+
+    def test_get(self):
+        store = self._get_store()
+        self.assertEqual(store.get('plugin1'), 1)
+        self.assertEqual(store.get('plugin2'), 2)
+        self.assertIsNone(store.get('plugin3'))
+        self.assertEqual(self._osutils.calls, ['get_config_values'])
+
+    def test_get_not_enumerable(self):
+        self._osutils = FakeOSUtils({'plugin1': 1}, enumerate_values=False)
+        store = self._get_store()
+        self.assertEqual(store.get('plugin1'), 1)
+        self.assertEqual(store.get('plugin1'), 1)
+        self.assertIsNone(store.get('plugin2'))
+        self.assertEqual(self._osutils.calls, ['get_config_values',
+                                               'get_config_value',
+                                               'get_config_value'])
+
+    def test_set_and_flush(self):
+        store = self._get_store()
+        for i in range(5):
+            store.set('plugin%d' % i, 1)
+        self.assertEqual(store.get('plugin2'), 1)
+        self.assertEqual(self._osutils.values['plugin2'], 2)
+        self.assertNotIn('set_config_values', self._osutils.calls)
+
+        store.flush()
+        store.flush()
+
+        self.assertEqual(self._osutils.calls.count('set_config_values'), 1)
+        self.assertEqual(self._osutils.values,
+                         dict(('plugin%d' % i, 1) for i in range(5)))
+        self.assertEqual(store.get('plugin4'), 1)
+
+    def test_set_batch_size(self):
+        store = self._get_store(batch_size=2)
+        for i in range(5):
+            store.set('plugin%d' % i, 1)
+        self.assertEqual(self._osutils.calls.count('set_config_values'), 2)
+        store.flush()
+        self.assertEqual(self._osutils.calls.count('set_config_values'), 3)
+
+    def test_flush_error(self):
+        self._osutils.set_config_values = mock.MagicMock(
+            side_effect=Exception('fake error'))
+        store = self._get_store()
+        store.set('plugin1', 2)
+        self.assertRaises(Exception, store.flush)
+        # Pending updates are kept for a later flush
+        self.assertEqual(store.get('plugin1'), 2)
@@ -19,6 +19,7 @@ import unittest
 
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.plugins import base
+from cloudbaseinit.plugins import constants
 from cloudbaseinit.plugins.windows import createuser
 
 CONF = cfg.CONF
@@ -43,31 +44,28 @@ class CreateUserPluginTests(unittest.TestCase):
                       user_exists=True):
         CONF.set_override('groups', ['Admins'])
         shared_data = {}
-        mock_token = mock.MagicMock()
         mock_osutils = mock.MagicMock()
         mock_service = mock.MagicMock()
         mock_get_password.return_value = 'password'
         mock_get_os_utils.return_value = mock_osutils
-        mock_osutils.user_exists.return_value = user_exists
-        mock_osutils.create_user_logon_session.return_value = mock_token
+        mock_osutils.provision_user.return_value.created = not user_exists
 
         response = self._create_user.execute(mock_service, shared_data)
 
         mock_get_os_utils.assert_called_once_with()
         mock_get_password.assert_called_once_with(mock_osutils)
-        mock_osutils.user_exists.assert_called_once_with(CONF.username)
+        user_spec = mock_osutils.provision_user.call_args[0][0]
+        self.assertEqual(user_spec.username, CONF.username)
+        self.assertEqual(user_spec.password, 'password')
+        self.assertEqual(user_spec.groups, ['Admins'])
+        self.assertTrue(user_spec.create_profile)
+        self.assertEqual(shared_data[constants.SHARED_DATA_USERNAME],
+                         CONF.username)
         if user_exists:
-            mock_osutils.set_user_password.assert_called_once_with(
-                CONF.username, 'password')
+            self.assertNotIn(constants.SHARED_DATA_PASSWORD, shared_data)
         else:
-            mock_osutils.create_user.assert_called_once_with(CONF.username,
-                                                             'password')
-            mock_osutils.create_user_logon_session.assert_called_once_with(
-                CONF.username, 'password', True)
-            mock_osutils.close_user_logon_session.assert_called_once_with(
-                mock_token)
-        mock_osutils.add_user_to_local_group.assert_called_once_with(
-            CONF.username, CONF.groups[0])
+            self.assertEqual(shared_data[constants.SHARED_DATA_PASSWORD],
+                             'password')
         self.assertEqual(response, (base.PLUGIN_EXECUTION_DONE, False))
 
     def test_execute_user_exists(self):
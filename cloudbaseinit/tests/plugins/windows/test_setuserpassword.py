@@ -33,22 +33,18 @@ class SetUserPasswordPluginTests(unittest.TestCase):
             '2013-04-04')
 
     @mock.patch('base64.b64encode')
-    @mock.patch('cloudbaseinit.utils.crypt.CryptManager'
-                '.load_ssh_rsa_public_key')
-    def test_encrypt_password(self, mock_load_ssh_key, mock_b64encode):
-        mock_rsa = mock.MagicMock()
+    @mock.patch('cloudbaseinit.utils.crypt.CryptManager.public_encrypt')
+    def test_encrypt_password(self, mock_public_encrypt, mock_b64encode):
         fake_ssh_pub_key = 'fake key'
         fake_password = 'fake password'
-        mock_load_ssh_key.return_value = mock_rsa
-        mock_rsa.__enter__().public_encrypt.return_value = 'public encrypted'
+        mock_public_encrypt.return_value = 'public encrypted'
         mock_b64encode.return_value = 'encrypted password'
 
         response = self._setpassword_plugin._encrypt_password(
             fake_ssh_pub_key, fake_password)
-        print mock_rsa.mock_calls
 
-        mock_load_ssh_key.assert_called_with(fake_ssh_pub_key)
-        mock_rsa.__enter__().public_encrypt.assert_called_with('fake password')
+        mock_public_encrypt.assert_called_with(fake_ssh_pub_key,
+                                               'fake password')
         mock_b64encode.assert_called_with('public encrypted')
         self.assertEqual(response, 'encrypted password')
 
@@ -120,19 +116,31 @@ class SetUserPasswordPluginTests(unittest.TestCase):
 
     @mock.patch('cloudbaseinit.plugins.windows.setuserpassword.'
                 'SetUserPasswordPlugin._get_password')
-    def test_set_password(self, mock_get_password):
+    def _test_set_password(self, mock_get_password, user_exists):
         mock_service = mock.MagicMock()
         mock_osutils = mock.MagicMock()
         mock_get_password.return_value = 'fake password'
+        mock_osutils.provision_user.return_value.exists = user_exists
 
         response = self._setpassword_plugin._set_password(mock_service,
                                                           mock_osutils,
                                                           'fake user')
 
         mock_get_password.assert_called_once_with(mock_service, mock_osutils)
-        mock_osutils.set_user_password.assert_called_once_with('fake user',
-                                                               'fake password')
-        self.assertEqual(response, 'fake password')
+        user_spec = mock_osutils.provision_user.call_args[0][0]
+        self.assertEqual(user_spec.username, 'fake user')
+        self.assertEqual(user_spec.password, 'fake password')
+        self.assertFalse(user_spec.create)
+        if user_exists:
+            self.assertEqual(response, 'fake password')
+        else:
+            self.assertIsNone(response)
+
+    def test_set_password(self):
+        self._test_set_password(user_exists=True)
+
+    def test_set_password_no_user(self):
+        self._test_set_password(user_exists=False)
 
     @mock.patch('cloudbaseinit.plugins.windows.setuserpassword.'
                 'SetUserPasswordPlugin._set_password')
@@ -147,7 +155,6 @@ class SetUserPasswordPluginTests(unittest.TestCase):
         fake_shared_data.get.return_value = 'fake username'
         mock_service.is_password_set.return_value = False
         mock_get_os_utils.return_value = mock_osutils
-        mock_osutils.user_exists.return_value = True
         mock_set_password.return_value = 'fake password'
 
         response = self._setpassword_plugin.execute(mock_service,
@@ -158,7 +165,6 @@ class SetUserPasswordPluginTests(unittest.TestCase):
         mock_service.is_password_set.assert_called_once_with(
             self._setpassword_plugin._post_password_md_ver)
         mock_get_os_utils.assert_called_once_with()
-        mock_osutils.user_exists.assert_called_once_with('fake username')
         mock_set_password.assert_called_once_with(mock_service, mock_osutils,
                                                   'fake username')
         mock_set_metadata_password.assert_called_once_with('fake password',
@@ -14,7 +14,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import gzip
 import mock
+import StringIO
+import threading
 import unittest
 
 from cloudbaseinit.metadata.services import base as metadata_services_base
@@ -59,12 +62,13 @@ class UserDataPluginTest(unittest.TestCase):
     def test_execute_not_user_data(self):
         self._test_execute(ret_val=None)
 
-    @mock.patch('email.message_from_string')
-    def test_parse_mime(self, mock_message_from_string):
-        fake_user_data = 'fake data'
-        response = self._userdata._parse_mime(user_data=fake_user_data)
-        mock_message_from_string.assert_called_once_with(fake_user_data)
-        self.assertEqual(response, mock_message_from_string().walk())
+    @mock.patch('cloudbaseinit.utils.mimestream.iter_parts')
+    def test_parse_mime(self, mock_iter_parts):
+        mock_stream = mock.MagicMock()
+        response = self._userdata._parse_mime(user_data_stream=mock_stream)
+        mock_iter_parts.assert_called_once_with(
+            mock_stream, CONF.user_data_spool_threshold, decompress=True)
+        self.assertEqual(response, mock_iter_parts())
 
     @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.factory.'
                 'UserDataPluginsFactory.load_plugins')
@@ -87,9 +91,12 @@ class UserDataPluginTest(unittest.TestCase):
         response = self._userdata._process_user_data(user_data=user_data)
         if user_data.startswith('Content-Type: multipart'):
             mock_load_plugins.assert_called_once_with()
-            mock_parse_mime.assert_called_once_with(user_data)
+            self.assertEqual(mock_parse_mime.call_count, 1)
+            self.assertEqual(mock_parse_mime.call_args[0][0].read(),
+                             user_data)
             mock_process_part.assert_called_once_with(mock_part,
                                                       mock_load_plugins(), {})
+            mock_part.close.assert_called_once_with()
             self.assertEqual(response, (base.PLUGIN_EXECUTION_DONE, reboot))
         else:
             mock_process_non_multi_part.assert_called_once_with(user_data)
@@ -107,6 +114,18 @@ class UserDataPluginTest(unittest.TestCase):
         self._test_process_user_data(user_data='Content-Type: non-multipart',
                                      reboot=False)
 
+    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
+                '._process_non_multi_part')
+    def test_process_user_data_gzip(self, mock_process_non_multi_part):
+        user_data = '#ps1\nfake script'
+        f = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=f, mode='wb') as g:
+            g.write(user_data)
+
+        response = self._userdata._process_user_data(f.getvalue())
+        mock_process_non_multi_part.assert_called_once_with(user_data)
+        self.assertEqual(response, mock_process_non_multi_part())
+
     @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
                 '._add_part_handlers')
     @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
@@ -229,3 +248,125 @@ class UserDataPluginTest(unittest.TestCase):
         mock_get_plugin_return_value.assert_called_once_with(
             mock_execute_user_data_script())
         self.assertEqual(response, mock_get_plugin_return_value())
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdatautils'
+                '.execute_user_data_script')
+    def test_process_part_compressed(self, mock_execute_user_data_script):
+        mock_part = mock.MagicMock()
+        mock_part.get_content_type.return_value = 'application/x-gzip'
+        mock_execute_user_data_script.return_value = 1001
+
+        response = self._userdata._process_part(
+            part=mock_part, user_data_plugins={}, user_handlers={})
+        mock_execute_user_data_script.assert_called_once_with(
+            mock_part.get_payload())
+        self.assertEqual(response, (base.PLUGIN_EXECUTION_DONE, True))
+
+    def _get_mock_part(self, group=None, content_type='text/x-shellscript'):
+        mock_part = mock.MagicMock()
+        mock_part.get_content_type.return_value = content_type
+        mock_part.get.side_effect = lambda name: {
+            self._userdata._parallel_group_header: group}.get(name)
+        return mock_part
+
+    def test_group_parts(self):
+        parts = [self._get_mock_part(),
+                 self._get_mock_part(group='a'),
+                 self._get_mock_part(group='a'),
+                 self._get_mock_part(group='b'),
+                 self._get_mock_part(
+                     group='b',
+                     content_type=self._userdata._part_handler_content_type),
+                 self._get_mock_part(group='b'),
+                 self._get_mock_part(group='b'),
+                 self._get_mock_part()]
+
+        groups = list(self._userdata._group_parts(parts, {}))
+        self.assertEqual(groups, [parts[0:1], parts[1:3], parts[3:4],
+                                  parts[4:5], parts[5:7], parts[7:8]])
+
+    def test_group_parts_user_handlers(self):
+        # Parts processed by user part handlers are executed sequentially
+        parts = [self._get_mock_part(group='a', content_type='fake/type'),
+                 self._get_mock_part(group='a', content_type='fake/type'),
+                 self._get_mock_part(group='a'),
+                 self._get_mock_part(group='a')]
+
+        groups = list(self._userdata._group_parts(
+            parts, {'fake/type': mock.sentinel.handler_func}))
+        self.assertEqual(groups, [parts[0:1], parts[1:2], parts[2:4]])
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.factory.'
+                'UserDataPluginsFactory.load_plugins')
+    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
+                '._parse_mime')
+    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
+                '._process_parts')
+    def test_process_user_data_reboot_close_parts(self, mock_process_parts,
+                                                  mock_parse_mime,
+                                                  mock_load_plugins):
+        # The last part is parsed ahead to find the end of the group
+        parts = [self._get_mock_part(group='a'),
+                 self._get_mock_part(group='a'),
+                 self._get_mock_part()]
+        mock_parse_mime.return_value = iter(parts)
+        mock_process_parts.return_value = (base.PLUGIN_EXECUTION_DONE, True)
+
+        response = self._userdata._process_user_data(
+            'Content-Type: multipart')
+
+        self.assertEqual(response, (base.PLUGIN_EXECUTION_DONE, True))
+        mock_process_parts.assert_called_once_with(
+            parts[0:2], mock_load_plugins(), {})
+        for part in parts:
+            part.close.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
+                '._process_part')
+    def _test_process_parts(self, mock_process_part, results,
+                            expected_result):
+        parts = [self._get_mock_part(group='a') for result in results]
+        part_results = dict(zip(parts, results))
+        mock_process_part.side_effect = lambda part, plugins, handlers: (
+            part_results[part])
+
+        response = self._userdata._process_parts(parts, {}, {})
+        self.assertEqual(mock_process_part.call_count, len(parts))
+        self.assertEqual(response, expected_result)
+
+    def test_process_parts(self):
+        self._test_process_parts(
+            results=[(base.PLUGIN_EXECUTE_ON_NEXT_BOOT, False),
+                     (base.PLUGIN_EXECUTION_DONE, False)],
+            expected_result=(base.PLUGIN_EXECUTION_DONE, False))
+
+    def test_process_parts_reboot(self):
+        # The first part requiring a reboot determines the result
+        self._test_process_parts(
+            results=[(base.PLUGIN_EXECUTION_DONE, False),
+                     (base.PLUGIN_EXECUTE_ON_NEXT_BOOT, True),
+                     (base.PLUGIN_EXECUTION_DONE, True),
+                     (base.PLUGIN_EXECUTION_DONE, False)],
+            expected_result=(base.PLUGIN_EXECUTE_ON_NEXT_BOOT, True))
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
+                '._process_part')
+    def test_process_parts_concurrent(self, mock_process_part):
+        parts = [self._get_mock_part(group='a') for i in range(3)]
+        condition = threading.Condition()
+        running = []
+
+        def _process_part(part, plugins, handlers):
+            # Waits until all the parts of the group are running
+            with condition:
+                running.append(part)
+                condition.notify_all()
+                while len(running) < len(parts):
+                    condition.wait(5)
+                    if len(running) < len(parts):
+                        return (base.PLUGIN_EXECUTION_DONE, True)
+            return (base.PLUGIN_EXECUTION_DONE, False)
+
+        mock_process_part.side_effect = _process_part
+        response = self._userdata._process_parts(parts, {}, {})
+        self.assertEqual(response, (base.PLUGIN_EXECUTION_DONE, False))
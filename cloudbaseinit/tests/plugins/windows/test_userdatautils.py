@@ -20,6 +20,7 @@ import unittest
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.plugins.windows import userdatautils
 from cloudbaseinit.tests.metadata import fake_json_response
+from cloudbaseinit.utils import processrunner
 
 CONF = cfg.CONF
 
@@ -98,7 +99,8 @@ class UserDataUtilsTest(unittest.TestCase):
         mock_gettempdir.assert_called_once_with()
         self.assertEqual(mock_re_search.call_count, number_of_calls)
         if args:
-            mock_osutils.execute_process.assert_called_with(args, shell)
+            mock_osutils.run_process.assert_called_with(
+                args, shell, timeout=None, deadline=mock.ANY)
         if not directory_exists:
             self.assertEqual(response, 0)
         else:
@@ -133,3 +135,38 @@ class UserDataUtilsTest(unittest.TestCase):
         fake_user_data = '#ps1_sysnative\s'
         self._test_execute_user_data_script(fake_user_data=fake_user_data,
                                             directory_exists=False)
+
+    def _test_execute_script(self, script_timeout, timed_out):
+        mock_osutils = mock.MagicMock()
+        mock_osutils.run_process.return_value = processrunner.ProcessResult(
+            ['fake.cmd'], 1, 0.5, processrunner.RingBuffer(0),
+            processrunner.RingBuffer(0), timed_out)
+        CONF.set_override('user_data_script_timeout', script_timeout)
+        try:
+            response = userdatautils.execute_script(mock_osutils,
+                                                    ['fake.cmd'], True)
+        finally:
+            CONF.clear_override('user_data_script_timeout')
+
+        mock_osutils.run_process.assert_called_once_with(
+            ['fake.cmd'], True, timeout=script_timeout or None,
+            deadline=userdatautils._get_scripts_deadline())
+        self.assertEqual(response, 1)
+
+    def test_execute_script(self):
+        self._test_execute_script(script_timeout=0, timed_out=False)
+
+    def test_execute_script_timeout(self):
+        self._test_execute_script(script_timeout=10, timed_out=True)
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdatautils.'
+                '_scripts_deadline', None)
+    def test_get_scripts_deadline(self):
+        CONF.set_override('user_data_scripts_total_timeout', 60)
+        try:
+            deadline = userdatautils._get_scripts_deadline()
+        finally:
+            CONF.clear_override('user_data_scripts_total_timeout')
+        # The same deadline is shared by all the scripts
+        self.assertIs(userdatautils._get_scripts_deadline(), deadline)
+        self.assertTrue(0 < deadline.get_remaining() <= 60)
@@ -30,40 +30,50 @@ class ShellScriptPluginTests(unittest.TestCase):
         self._shellscript = shellscript.ShellScriptPlugin()
 
     @mock.patch('cloudbaseinit.osutils.factory.OSUtilsFactory.get_os_utils')
-    @mock.patch('tempfile.gettempdir')
-    def _test_process(self, mock_gettempdir, mock_get_os_utils, filename,
-                      exception=False):
+    @mock.patch('tempfile.mkdtemp')
+    @mock.patch('shutil.rmtree')
+    def _test_process(self, mock_rmtree, mock_mkdtemp, mock_get_os_utils,
+                      filename, exception=False):
         fake_dir_path = os.path.join("fake", "dir")
         mock_osutils = mock.MagicMock()
         mock_part = mock.MagicMock()
         mock_part.get_filename.return_value = filename
-        mock_gettempdir.return_value = fake_dir_path
+        mock_mkdtemp.return_value = fake_dir_path
 
         mock_get_os_utils.return_value = mock_osutils
 
         if exception:
-            mock_osutils.execute_process.side_effect = [Exception]
+            mock_osutils.run_process.side_effect = [Exception]
 
         with mock.patch("cloudbaseinit.plugins.windows.userdataplugins."
                         "shellscript.open", mock.mock_open(), create=True):
             response = self._shellscript.process(mock_part)
 
         mock_part.get_filename.assert_called_once_with()
-        mock_gettempdir.assert_called_once_with()
+        if filename.endswith(".other"):
+            self.assertFalse(mock_mkdtemp.called)
+        else:
+            mock_mkdtemp.assert_called_once_with()
+            mock_rmtree.assert_called_once_with(fake_dir_path,
+                                                ignore_errors=True)
+
         if filename.endswith(".cmd"):
-            mock_osutils.execute_process.assert_called_with(
-                [os.path.join(fake_dir_path, filename)], True)
+            mock_osutils.run_process.assert_called_with(
+                [os.path.join(fake_dir_path, filename)], True,
+                timeout=None, deadline=mock.ANY)
         elif filename.endswith(".sh"):
-            mock_osutils.execute_process.assert_called_with(
-                ['bash.exe', os.path.join(fake_dir_path, filename)], False)
+            mock_osutils.run_process.assert_called_with(
+                ['bash.exe', os.path.join(fake_dir_path, filename)], False,
+                timeout=None, deadline=mock.ANY)
         elif filename.endswith(".py"):
-            mock_osutils.execute_process.assert_called_with(
-                ['python.exe', os.path.join(fake_dir_path, filename)], False)
+            mock_osutils.run_process.assert_called_with(
+                ['python.exe', os.path.join(fake_dir_path, filename)], False,
+                timeout=None, deadline=mock.ANY)
         elif filename.endswith(".ps1"):
-            mock_osutils.execute_process.assert_called_with(
+            mock_osutils.run_process.assert_called_with(
                 ['powershell.exe', '-ExecutionPolicy', 'RemoteSigned',
                  '-NonInteractive', os.path.join(fake_dir_path, filename)],
-                False)
+                False, timeout=None, deadline=mock.ANY)
             self.assertFalse(response)
 
     def test_process_cmd(self):
@@ -83,3 +93,24 @@ class ShellScriptPluginTests(unittest.TestCase):
 
     def test_process_exception(self):
         self._test_process(filename='fake.cmd', exception=True)
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdatautils.execute_script')
+    @mock.patch('cloudbaseinit.osutils.factory.OSUtilsFactory.get_os_utils')
+    def test_process_unique_paths(self, mock_get_os_utils,
+                                  mock_execute_script):
+        target_paths = []
+
+        def _execute_script(osutils, args, shell):
+            target_paths.append(args[-1])
+            self.assertTrue(os.path.exists(args[-1]))
+            return 0
+        mock_execute_script.side_effect = _execute_script
+
+        for i in range(2):
+            mock_part = mock.MagicMock()
+            mock_part.get_filename.return_value = 'fake.cmd'
+            self._shellscript.process(mock_part)
+
+        self.assertNotEqual(target_paths[0], target_paths[1])
+        for target_path in target_paths:
+            self.assertFalse(os.path.exists(os.path.dirname(target_path)))
@@ -13,11 +13,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import mock
+import os
+import shutil
+import tempfile
 import unittest
+import zipfile
 
 from cloudbaseinit.openstack.common import cfg
 from cloudbaseinit.plugins.windows.userdataplugins import urldownload
+from cloudbaseinit.utils import artifactcache
+from cloudbaseinit.utils import download
 
 CONF = cfg.CONF
 
@@ -26,35 +33,276 @@ class UrlDownloadHandlerTests(unittest.TestCase):
 
     def setUp(self):
         self._urldownload = urldownload.URLDownloadPlugin()
+        self._tmp_dir = tempfile.mkdtemp()
 
-    @mock.patch('cloudbaseinit.plugins.windows.userdatautils'
-                '.execute_user_data_script')
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
 
-    def _test_process(self, mock_execute_user_data_script, filename):
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.urldownload'
+                '.URLDownloadPlugin._do_include')
+    def test_process(self, mock_do_include):
         mock_part = mock.MagicMock()
-        mock_part.get_filename.return_value = filename
         response = self._urldownload.process(mock_part)
-        mock_part.get_filename.assert_called_with()
-        if filename:
-            mock_execute_user_data_script.assert_called_with(
-                mock_part.get_payload())
-            self.assertEqual(response, mock_execute_user_data_script())
+        mock_do_include.assert_called_once_with(mock_part.get_payload())
+        self.assertTrue(response is None)
+
+    def test_get_urls(self):
+        response = self._urldownload._get_urls(
+            '# comment\n\nhttp://fake/a\n  http://fake/b#sha256=ab  \n')
+        self.assertEqual(response,
+                         ['http://fake/a', 'http://fake/b#sha256=ab'])
+
+    @mock.patch('tempfile.gettempdir')
+    @mock.patch('cloudbaseinit.utils.httpclient.HTTPConnectionPool')
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.urldownload'
+                '.URLDownloadPlugin._download')
+    def _test_do_include(self, mock_download, mock_pool, mock_gettempdir,
+                         errors):
+        urls = ['http://fake/%d' % i for i in range(3)]
+        mock_gettempdir.return_value = self._tmp_dir
+        mock_download.side_effect = errors
+        dest_dir = os.path.join(self._tmp_dir, urldownload.DOWNLOAD_DIR)
+
+        if [error for error in errors if error]:
+            self.assertRaises(IOError, self._urldownload._do_include,
+                              '\n'.join(urls))
         else:
-            self.assertTrue(response is None)
+            self._urldownload._do_include('\n'.join(urls))
 
+        self.assertTrue(os.path.isdir(dest_dir))
+        self.assertEqual(sorted(c[0][1] for c in
+                                mock_download.call_args_list), urls)
+        for c in mock_download.call_args_list:
+            self.assertEqual(c[0], (mock_pool(), c[0][1], dest_dir))
+        mock_pool().close.assert_called_once_with()
 
-        response = self._urldownload.process(mock_part)
-        mock_part.get_filename.assert_called_with()
-        if filename:
-            mock_execute_user_data_script.assert_called_with(
-                mock_part.get_payload())
-            self.assertEqual(response, mock_execute_user_data_script())
+    def test_do_include(self):
+        self._test_do_include(errors=[None, None, None])
+
+    def test_do_include_error(self):
+        self._test_do_include(errors=[None, IOError(), None])
+
+    def test_get_download_batches(self):
+        urls = ['http://a/setup.zip', 'http://b/Setup.zip#sha256=ab',
+                'http://a/other', 'http://c/setup.zip', 'http://a/',
+                'http://b/']
+        response = self._urldownload._get_download_batches(urls)
+        self.assertEqual(response, [['http://a/setup.zip', 'http://a/other',
+                                     'http://a/', 'http://b/'],
+                                    ['http://b/Setup.zip#sha256=ab'],
+                                    ['http://c/setup.zip']])
+
+    @mock.patch('tempfile.gettempdir')
+    @mock.patch('cloudbaseinit.utils.httpclient.HTTPConnectionPool')
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.urldownload'
+                '.URLDownloadPlugin._extract_archive')
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.urldownload'
+                '.URLDownloadPlugin._download')
+    def test_do_include_same_file_name(self, mock_download,
+                                       mock_extract_archive, mock_pool,
+                                       mock_gettempdir):
+        urls = ['http://a/setup.zip', 'http://b/setup.zip',
+                'http://a/other.zip']
+        mock_gettempdir.return_value = self._tmp_dir
+        dest_dir = os.path.join(self._tmp_dir, urldownload.DOWNLOAD_DIR)
+        calls = []
+
+        def _download(pool, url, dest_dir):
+            calls.append(('download', url))
+            return url
+        mock_download.side_effect = _download
+        mock_extract_archive.side_effect = (
+            lambda archive_filename, dest_dir:
+            calls.append(('extract', archive_filename)))
+
+        self._urldownload._do_include('\n'.join(urls))
+
+        # The second setup.zip is downloaded once the first is extracted
+        self.assertEqual(sorted(calls[:2]),
+                         [('download', 'http://a/other.zip'),
+                          ('download', 'http://a/setup.zip')])
+        self.assertEqual(calls[2:],
+                         [('extract', 'http://a/setup.zip'),
+                          ('extract', 'http://a/other.zip'),
+                          ('download', 'http://b/setup.zip'),
+                          ('extract', 'http://b/setup.zip')])
+        for c in mock_extract_archive.call_args_list:
+            self.assertEqual(c[0][1], dest_dir)
+
+    @mock.patch('tempfile.gettempdir')
+    @mock.patch('cloudbaseinit.utils.httpclient.HTTPConnectionPool')
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.urldownload'
+                '.URLDownloadPlugin._extract_archive')
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.urldownload'
+                '.URLDownloadPlugin._download')
+    def test_do_include_extract_error(self, mock_download,
+                                      mock_extract_archive, mock_pool,
+                                      mock_gettempdir):
+        urls = ['http://a/a.zip', 'http://a/b.zip']
+        mock_gettempdir.return_value = self._tmp_dir
+        mock_download.side_effect = lambda pool, url, dest_dir: url
+        mock_extract_archive.side_effect = [ValueError(), None]
+
+        self.assertRaises(ValueError, self._urldownload._do_include,
+                          '\n'.join(urls))
+        self.assertEqual([c[0][0] for c in
+                          mock_extract_archive.call_args_list], urls)
+
+    @mock.patch('cloudbaseinit.utils.file.extract_archive')
+    def _test_extract_archive(self, mock_extract_archive, error):
+        archive_filename = os.path.join(self._tmp_dir, 'file.zip')
+        open(archive_filename, 'wb').close()
+        mock_extract_archive.side_effect = error
+        if error:
+            self.assertRaises(ValueError, self._urldownload._extract_archive,
+                              archive_filename, self._tmp_dir)
+        else:
+            self._urldownload._extract_archive(archive_filename,
+                                               self._tmp_dir)
+        mock_extract_archive.assert_called_once_with(archive_filename,
+                                                     self._tmp_dir)
+        self.assertFalse(os.path.exists(archive_filename))
+
+    def test_extract_archive(self):
+        self._test_extract_archive(error=None)
+
+    def test_extract_archive_error(self):
+        self._test_extract_archive(error=ValueError())
+
+    def _fake_download(self, pool, url, path, sha256, **kwargs):
+        self.assertEqual(sha256, 'ab')
+        if url.endswith('.zip'):
+            with zipfile.ZipFile(path, 'w') as zf:
+                zf.writestr('extracted', 'fake')
+            return {}
+        with open(path, 'wb') as f:
+            f.write('fake')
+        return {'content-type': 'text/plain'}
+
+    @mock.patch('cloudbaseinit.utils.download.download_file')
+    def _test_download(self, mock_download_file, file_name, archive):
+        mock_download_file.side_effect = self._fake_download
+        response = self._urldownload._download(
+            mock.sentinel.pool, 'http://fake/path/%s#sha256=ab' % file_name,
+            self._tmp_dir)
+        local_filename = os.path.join(self._tmp_dir, file_name)
+        self.assertEqual(os.listdir(self._tmp_dir), [file_name])
+        if archive:
+            # Archives are extracted by the caller
+            self.assertEqual(response, local_filename)
+            self.assertTrue(zipfile.is_zipfile(local_filename))
         else:
             self.assertTrue(response is None)
+            with open(local_filename, 'rb') as f:
+                self.assertEqual(f.read(), 'fake')
+
+    def test_download(self):
+        self._test_download(file_name='file.txt', archive=False)
+
+    def test_download_archive(self):
+        self._test_download(file_name='file.zip', archive=True)
+
+    @mock.patch('cloudbaseinit.utils.download.download_file')
+    def test_fetch_part_file(self, mock_download_file):
+        cache = artifactcache.ArtifactCache(
+            os.path.join(self._tmp_dir, 'cache'), 1024)
+        local_filename = os.path.join(self._tmp_dir, 'file')
+        part_filenames = []
+
+        def _download_file(pool, url, path, *args, **kwargs):
+            part_filenames.append(path)
+            return self._fake_download_text(pool, url, path, None)
+        mock_download_file.side_effect = _download_file
+
+        for i in range(2):
+            self._urldownload._fetch(mock.sentinel.pool, cache,
+                                     'http://fake/%d/file' % i, None,
+                                     local_filename)
+
+        # Each download gets its own part file next to the target file
+        self.assertNotEqual(part_filenames[0], part_filenames[1])
+        for part_filename in part_filenames:
+            self.assertEqual(os.path.dirname(part_filename), self._tmp_dir)
+            self.assertTrue(part_filename.endswith('.part'))
+            self.assertFalse(os.path.exists(part_filename))
+
+    @mock.patch('cloudbaseinit.utils.download.download_file')
+    def test_download_error(self, mock_download_file):
+        def _download_file(pool, url, path, *args, **kwargs):
+            open(path, 'wb').close()
+            raise IOError()
+
+        mock_download_file.side_effect = _download_file
+        self.assertRaises(IOError, self._urldownload._download,
+                          mock.sentinel.pool, 'http://fake/file',
+                          self._tmp_dir)
+        self.assertEqual(os.listdir(self._tmp_dir), [])
+
+    @mock.patch('cloudbaseinit.utils.download.download_file')
+    def test_download_no_file_name(self, mock_download_file):
+        self._urldownload._download(mock.sentinel.pool, 'http://fake/',
+                                    self._tmp_dir)
+        self.assertFalse(mock_download_file.called)
+
+    def _fake_download_text(self, pool, url, path, sha256, **kwargs):
+        with open(path, 'wb') as f:
+            f.write('fake')
+        return {'content-type': 'text/plain', 'etag': '"1"'}
+
+    @mock.patch('cloudbaseinit.utils.download.download_file')
+    def _test_fetch_cached(self, mock_download_file, sha256, not_modified,
+                           expected_downloads):
+        cache = artifactcache.ArtifactCache(
+            os.path.join(self._tmp_dir, 'cache'), 1024)
+        local_filename = os.path.join(self._tmp_dir, 'file')
+        mock_download_file.side_effect = self._fake_download_text
+
+        response = self._urldownload._fetch(mock.sentinel.pool, cache,
+                                            'http://fake/file', sha256,
+                                            local_filename)
+        self.assertEqual(response, 'text/plain')
+        self.assertEqual(mock_download_file.call_args[1]['headers'], {})
+
+        os.remove(local_filename)
+        if not_modified:
+            mock_download_file.side_effect = download.NotModified(
+                'http://fake/file', {})
+        response = self._urldownload._fetch(mock.sentinel.pool, cache,
+                                            'http://fake/file', sha256,
+                                            local_filename)
+        self.assertEqual(response, 'text/plain')
+        with open(local_filename, 'rb') as f:
+            self.assertEqual(f.read(), 'fake')
+        self.assertEqual(mock_download_file.call_count, expected_downloads)
+        if expected_downloads > 1:
+            self.assertEqual(mock_download_file.call_args[1]['headers'],
+                             {'If-None-Match': '"1"'})
+
+    def test_fetch_cached_not_modified(self):
+        self._test_fetch_cached(sha256=None, not_modified=True,
+                                expected_downloads=2)
+
+    def test_fetch_cached_modified(self):
+        self._test_fetch_cached(sha256=None, not_modified=False,
+                                expected_downloads=2)
 
+    def test_fetch_cached_checksum(self):
+        self._test_fetch_cached(sha256=hashlib.sha256('fake').hexdigest(),
+                                not_modified=False, expected_downloads=1)
 
-    def test_process(self):
-        self._test_process(filename='cfn-userdata')
+    @mock.patch('cloudbaseinit.utils.download.download_file')
+    def test_fetch_cached_other_checksum(self, mock_download_file):
+        cache = artifactcache.ArtifactCache(
+            os.path.join(self._tmp_dir, 'cache'), 1024)
+        local_filename = os.path.join(self._tmp_dir, 'file')
+        mock_download_file.side_effect = self._fake_download_text
+        self._urldownload._fetch(mock.sentinel.pool, cache,
+                                 'http://fake/file', None, local_filename)
 
-    def test_process_content_not_supported(self):
-        self._test_process(filename=None)
+        # The content cached for the url cannot be revalidated
+        self._urldownload._fetch(mock.sentinel.pool, cache,
+                                 'http://fake/file',
+                                 hashlib.sha256('other').hexdigest(),
+                                 local_filename)
+        self.assertEqual(mock_download_file.call_count, 2)
+        self.assertEqual(mock_download_file.call_args[1]['headers'], {})
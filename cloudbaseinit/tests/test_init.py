@@ -15,12 +15,14 @@
 #    under the License.
 
 import mock
+import threading
 import unittest
 import sys
 
 from cloudbaseinit import init
 from cloudbaseinit.plugins import base
 from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import timeline
 
 CONF = cfg.CONF
 _win32com_mock = mock.MagicMock()
@@ -47,27 +49,56 @@ class InitManagerTest(unittest.TestCase):
         reload(init)
 
     def test_get_plugin_status(self):
-        self.osutils.get_config_value.return_value = 1
+        self.osutils.get_config_values.return_value = {'fake plugin': 1}
         response = self._init._get_plugin_status(self.osutils, 'fake plugin')
-        self.osutils.get_config_value.assert_called_once_with(
-            'fake plugin', self._init._PLUGINS_CONFIG_SECTION)
+        response2 = self._init._get_plugin_status(self.osutils, 'other')
+        self.osutils.get_config_values.assert_called_once_with(
+            self._init._PLUGINS_CONFIG_SECTION)
         self.assertTrue(response == 1)
+        self.assertIsNone(response2)
 
     def test_set_plugin_status(self):
+        self._init._set_plugin_status(self.osutils, 'fake plugin', 'status')
+        self.osutils.set_config_values.assert_called_once_with(
+            {'fake plugin': 'status'}, self._init._PLUGINS_CONFIG_SECTION)
+
+    def test_set_plugin_status_batch(self):
+        CONF.set_override('plugins_status_batch_size', 0)
+        try:
+            self._init._set_plugin_status(self.osutils, 'fake plugin',
+                                          'status')
+            self.assertFalse(self.osutils.set_config_values.called)
 
+            self._init._flush_plugin_status(self.osutils)
+            self.osutils.set_config_values.assert_called_once_with(
+                {'fake plugin': 'status'},
+                self._init._PLUGINS_CONFIG_SECTION)
+        finally:
+            CONF.clear_override('plugins_status_batch_size')
+
+    def test_flush_plugin_status_error(self):
+        self.osutils.set_config_values.side_effect = Exception('fake error')
         self._init._set_plugin_status(self.osutils, 'fake plugin', 'status')
-        self.osutils.set_config_value.assert_called_once_with(
-            'fake plugin', 'status', self._init._PLUGINS_CONFIG_SECTION)
+        self._init._flush_plugin_status(self.osutils)
+        self.assertEqual(self.osutils.set_config_values.call_count, 2)
 
+    @mock.patch('cloudbaseinit.init.InitManager._flush_plugin_status')
     @mock.patch('cloudbaseinit.init.InitManager._get_plugin_status')
     @mock.patch('cloudbaseinit.init.InitManager._set_plugin_status')
     def _test_exec_plugin(self, status, mock_set_plugin_status,
-                          mock_get_plugin_status):
+                          mock_get_plugin_status, mock_flush_plugin_status,
+                          reboot=False):
         fake_name = 'fake name'
         self.plugin.get_name.return_value = fake_name
-        self.plugin.execute.return_value = (status, True)
+        self.plugin.may_require_reboot.return_value = reboot
         mock_get_plugin_status.return_value = status
 
+        def _execute(service, shared_data):
+            # Pending statuses must be written before a reboot can occur
+            self.assertEqual(mock_flush_plugin_status.called, reboot)
+            return (status, True)
+        self.plugin.execute.side_effect = _execute
+
         response = self._init._exec_plugin(osutils=self.osutils,
                                            service='fake service',
                                            plugin=self.plugin,
@@ -81,6 +112,8 @@ class InitManagerTest(unittest.TestCase):
             mock_set_plugin_status.assert_called_once_with(self.osutils,
                                                            fake_name, status)
             self.assertTrue(response)
+        else:
+            self.assertFalse(mock_flush_plugin_status.called)
 
     def test_test_exec_plugin_execution_done(self):
         self._test_exec_plugin(base.PLUGIN_EXECUTION_DONE)
@@ -88,6 +121,62 @@ class InitManagerTest(unittest.TestCase):
     def test_test_exec_plugin(self):
         self._test_exec_plugin(base.PLUGIN_EXECUTE_ON_NEXT_BOOT)
 
+    def test_test_exec_plugin_may_require_reboot(self):
+        self._test_exec_plugin(base.PLUGIN_EXECUTE_ON_NEXT_BOOT, reboot=True)
+
+    @mock.patch('cloudbaseinit.utils.timeline.get_boot_timeline')
+    @mock.patch('cloudbaseinit.init.InitManager._get_plugin_status')
+    def _test_exec_plugin_timeline(self, mock_get_plugin_status,
+                                   mock_get_boot_timeline, status,
+                                   expected_status, exception=None):
+        boot_timeline = timeline.BootTimeline()
+        mock_get_boot_timeline.return_value = boot_timeline
+        mock_get_plugin_status.return_value = None
+        self.plugin.get_name.return_value = 'fake name'
+        self.plugin.execute.return_value = (status, False)
+        self.plugin.execute.side_effect = exception
+
+        self._init._exec_plugin(self.osutils, 'fake service', self.plugin,
+                                {})
+
+        [span] = boot_timeline.get_spans(timeline.SPAN_PLUGIN)
+        self.assertEqual(span.name, 'fake name')
+        self.assertEqual(span.status, expected_status)
+
+    def test_exec_plugin_timeline(self):
+        self._test_exec_plugin_timeline(
+            status=base.PLUGIN_EXECUTE_ON_NEXT_BOOT,
+            expected_status='execute_on_next_boot')
+
+    def test_exec_plugin_timeline_exception(self):
+        self._test_exec_plugin_timeline(
+            status=None, expected_status='error',
+            exception=Exception('fake error'))
+
+    @mock.patch('cloudbaseinit.utils.timeline.get_boot_timeline')
+    def _test_end_boot_timeline(self, mock_get_boot_timeline, summary):
+        mock_get_boot_timeline.return_value.end.return_value = {
+            'total_time': 1}
+        CONF.set_override('boot_timeline_summary', summary)
+        try:
+            self._init._end_boot_timeline(self.osutils)
+        finally:
+            CONF.clear_override('boot_timeline_summary')
+
+        mock_get_boot_timeline.return_value.end.assert_called_once_with()
+        if summary:
+            self.osutils.set_config_value.assert_called_once_with(
+                self._init._BOOT_TIMELINE_CONFIG_NAME, '{"total_time": 1}',
+                self._init._PLUGINS_CONFIG_SECTION)
+        else:
+            self.assertFalse(self.osutils.set_config_value.called)
+
+    def test_end_boot_timeline(self):
+        self._test_end_boot_timeline(summary=False)
+
+    def test_end_boot_timeline_summary(self):
+        self._test_end_boot_timeline(summary=True)
+
     def _test_check_plugin_os_requirements(self, requirements):
         sys.platform = 'win32'
         fake_name = 'fake name'
@@ -110,6 +199,7 @@ class InitManagerTest(unittest.TestCase):
     def test_check_plugin_os_requirements_other_requirenments(self):
         self._test_check_plugin_os_requirements(('linux', (5, 2)))
 
+    @mock.patch('cloudbaseinit.init.InitManager._flush_plugin_status')
     @mock.patch('cloudbaseinit.init.InitManager'
                 '._check_plugin_os_requirements')
     @mock.patch('cloudbaseinit.init.InitManager._exec_plugin')
@@ -120,7 +210,8 @@ class InitManagerTest(unittest.TestCase):
     def test_configure_host(self, mock_get_metadata_service,
                             mock_get_os_utils, mock_load_plugins,
                             mock_exec_plugin,
-                            mock_check_os_requirements):
+                            mock_check_os_requirements,
+                            mock_flush_plugin_status):
         fake_service = mock.MagicMock()
         fake_plugin = mock.MagicMock()
         mock_load_plugins.return_value = [fake_plugin]
@@ -137,5 +228,48 @@ class InitManagerTest(unittest.TestCase):
                                                            fake_plugin)
         mock_exec_plugin.assert_called_once_with(self.osutils, fake_service,
                                                  fake_plugin, {})
+        mock_flush_plugin_status.assert_called_once_with(self.osutils)
         fake_service.cleanup.assert_called_once_with()
         self.osutils.reboot.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.init.InitManager._flush_plugin_status')
+    @mock.patch('cloudbaseinit.plugins.factory.PluginFactory.load_plugins')
+    @mock.patch('cloudbaseinit.osutils.factory.OSUtilsFactory.get_os_utils')
+    @mock.patch('cloudbaseinit.metadata.prefetch.prefetch_metadata')
+    @mock.patch('cloudbaseinit.metadata.factory.MetadataServiceFactory.'
+                'get_metadata_service')
+    def _test_configure_host_prefetch(self, mock_get_metadata_service,
+                                      mock_prefetch_metadata,
+                                      mock_get_os_utils, mock_load_plugins,
+                                      mock_flush_plugin_status, prefetch):
+        fake_service = mock.MagicMock()
+        mock_load_plugins.return_value = []
+        mock_get_os_utils.return_value = self.osutils
+        loaded = threading.Event()
+        mock_get_metadata_service.side_effect = (
+            lambda: loaded.set() or fake_service)
+        # Set when the service was loaded while waiting for the boot
+        # completion
+        loaded_while_waiting = []
+        self.osutils.wait_for_boot_completion.side_effect = (
+            lambda: loaded_while_waiting.append(
+                loaded.wait(5 if prefetch else 0)))
+
+        CONF.set_override('metadata_prefetch', prefetch)
+        try:
+            self._init.configure_host()
+        finally:
+            CONF.clear_override('metadata_prefetch')
+
+        self.assertEqual(loaded_while_waiting, [prefetch])
+        if prefetch:
+            mock_prefetch_metadata.assert_called_once_with(fake_service)
+        else:
+            self.assertFalse(mock_prefetch_metadata.called)
+        fake_service.cleanup.assert_called_once_with()
+
+    def test_configure_host_prefetch(self):
+        self._test_configure_host_prefetch(prefetch=True)
+
+    def test_configure_host_no_prefetch(self):
+        self._test_configure_host_prefetch(prefetch=False)
@@ -0,0 +1,77 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import re
+
+_QUERY_RE = re.compile(r'^SELECT (?P<fields>.+?) FROM (?P<class_name>\w+)'
+                       r'(?: WHERE (?P<where>.+))?$')
+_CONDITION_RE = re.compile(r'^(?P<field>\w+) (?:(?P<is_not_null>IS NOT NULL)'
+                           r'|= (?P<value>.+))$')
+
+
+class FakeWMIObject(object):
+    def __init__(self, class_name, properties):
+        self.class_name = class_name
+        self.__dict__.update(properties)
+
+
+def _parse_value(value):
+    if value.startswith('\'') and value.endswith('\''):
+        return value[1:-1].replace('\'\'', '\'')
+    elif value in ['True', 'False']:
+        return value == 'True'
+    else:
+        return int(value)
+
+
+def _matches(properties, where):
+    if not where:
+        return True
+    for condition in where.split(' AND '):
+        m = _CONDITION_RE.match(condition)
+        value = properties.get(m.group('field'))
+        if m.group('is_not_null'):
+            if value is None:
+                return False
+        elif value != _parse_value(m.group('value')):
+            return False
+    return True
+
+
+class FakeWMI(object):
+    '''
+    In memory WMI namespace supporting simple WQL queries, i.e. conditions
+    on single properties joined by AND. Executed queries are recorded.
+    '''
+
+    def __init__(self, classes):
+        self._classes = classes
+        self.queries = []
+
+    def query(self, query):
+        self.queries.append(query)
+        m = _QUERY_RE.match(query)
+        fields = [f.strip() for f in m.group('fields').split(',')]
+
+        result = []
+        for properties in self._classes.get(m.group('class_name'), []):
+            if _matches(properties, m.group('where')):
+                if fields != ['*']:
+                    # Projected objects contain only the selected fields
+                    properties = dict((f, properties[f]) for f in fields)
+                result.append(FakeWMIObject(m.group('class_name'),
+                                            properties))
+        return result
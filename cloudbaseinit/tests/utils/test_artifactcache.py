@@ -0,0 +1,167 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import artifactcache
+
+CONF = cfg.CONF
+
+
+class ArtifactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._cache_dir = os.path.join(self._tmp_dir, 'cache')
+        self._cache = artifactcache.ArtifactCache(self._cache_dir, 100)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _get_objects(self):
+        return sorted(os.listdir(os.path.join(self._cache_dir, 'objects')))
+
+    def test_add_data(self):
+        path = self._cache.add_data('http://fake/a', 'fake data',
+                                    content_type='text/plain', etag='"1"',
+                                    last_modified='fake date')
+        checksum = hashlib.sha256('fake data').hexdigest()
+        self.assertEqual(os.path.basename(path), checksum)
+        self.assertEqual(self._cache.read('http://fake/a'), 'fake data')
+        entry = self._cache.get_entry('http://fake/a')
+        self.assertEqual((entry['sha256'], entry['size'],
+                          entry['content_type']),
+                         (checksum, 9, 'text/plain'))
+        self.assertEqual(self._cache.get_conditional_headers('http://fake/a'),
+                         {'If-None-Match': '"1"',
+                          'If-Modified-Since': 'fake date'})
+
+    def test_add_file(self):
+        path = os.path.join(self._tmp_dir, 'file')
+        with open(path, 'wb') as f:
+            f.write('fake data')
+        self._cache.add_file('http://fake/a', path)
+        self.assertEqual(self._cache.read('http://fake/a'), 'fake data')
+        self.assertTrue(os.path.exists(path))
+
+    def test_not_cached(self):
+        self.assertIsNone(self._cache.get_entry('http://fake/a'))
+        self.assertIsNone(self._cache.get_path('http://fake/a'))
+        self.assertIsNone(self._cache.read('http://fake/a'))
+        self.assertEqual(self._cache.get_conditional_headers('http://fake/a'),
+                         {})
+
+    def test_get_path_checksum(self):
+        path = self._cache.add_data('http://fake/a', 'fake data')
+        checksum = hashlib.sha256('fake data').hexdigest()
+        self.assertEqual(self._cache.get_path(checksum=checksum.upper()),
+                         path)
+        self.assertIsNone(self._cache.get_path(checksum='0' * 64))
+
+    def test_get_path_corrupted(self):
+        path = self._cache.add_data('http://fake/a', 'fake data')
+        checksum = hashlib.sha256('fake data').hexdigest()
+        with open(path, 'wb') as f:
+            f.write('corrupted data')
+
+        cache = artifactcache.ArtifactCache(self._cache_dir, 100)
+        self.assertIsNone(cache.get_path(checksum=checksum))
+        self.assertIsNone(cache.get_entry('http://fake/a'))
+        self.assertFalse(os.path.exists(path))
+
+        path = cache.add_data('http://fake/a', 'fake data')
+        self.assertEqual(cache.get_path(checksum=checksum), path)
+
+    def test_add_data_replaces_corrupted(self):
+        path = self._cache.add_data('http://fake/a', 'fake data')
+        with open(path, 'wb') as f:
+            f.write('corrupted data')
+
+        cache = artifactcache.ArtifactCache(self._cache_dir, 100)
+        cache.add_data('http://fake/b', 'fake data')
+        self.assertEqual(cache.read('http://fake/b'), 'fake data')
+        self.assertIsNone(cache.get_entry('http://fake/a'))
+
+    @mock.patch('time.time')
+    def test_get_path_index_saved(self, mock_time):
+        mock_time.return_value = 1000
+        self._cache.add_data('http://fake/a', 'fake data')
+
+        with mock.patch.object(self._cache, '_save_index') as mock_save:
+            # Access times are not persisted at every read
+            mock_time.return_value += 1
+            self._cache.get_path('http://fake/a')
+            self.assertFalse(mock_save.called)
+            self.assertEqual(self._cache.get_entry('http://fake/a')[
+                'last_access'], 1001)
+
+            mock_time.return_value += (
+                artifactcache._ACCESS_TIME_SAVE_INTERVAL)
+            self._cache.get_path('http://fake/a')
+            mock_save.assert_called_once_with()
+
+    def test_content_addressed(self):
+        self._cache.add_data('http://fake/a', 'fake data')
+        self._cache.add_data('http://fake/b', 'fake data')
+        self.assertEqual(len(self._get_objects()), 1)
+        self.assertEqual(self._cache.read('http://fake/b'), 'fake data')
+
+    def test_persisted(self):
+        self._cache.add_data('http://fake/a', 'fake data', etag='"1"')
+        cache = artifactcache.ArtifactCache(self._cache_dir, 100)
+        self.assertEqual(cache.read('http://fake/a'), 'fake data')
+        self.assertEqual(cache.get_entry('http://fake/a')['etag'], '"1"')
+
+    def test_unreadable_index(self):
+        self._cache.add_data('http://fake/a', 'fake data')
+        with open(os.path.join(self._cache_dir, 'index.json'), 'wb') as f:
+            f.write('fake')
+        cache = artifactcache.ArtifactCache(self._cache_dir, 100)
+        self.assertIsNone(cache.read('http://fake/a'))
+
+    def test_evict_lru(self):
+        self._cache.add_data('http://fake/a', 'a' * 40)
+        self._cache.add_data('http://fake/b', 'b' * 40)
+        # Mark a as recently used
+        self._cache.get_path('http://fake/a')
+        self._cache.add_data('http://fake/c', 'c' * 40)
+
+        self.assertIsNone(self._cache.get_entry('http://fake/b'))
+        self.assertEqual(self._cache.read('http://fake/a'), 'a' * 40)
+        self.assertEqual(self._cache.read('http://fake/c'), 'c' * 40)
+        self.assertEqual(len(self._get_objects()), 2)
+
+    def test_evict_too_large(self):
+        # The artifact just added is never evicted
+        self._cache.add_data('http://fake/a', 'a' * 40)
+        path = self._cache.add_data('http://fake/b', 'b' * 200)
+        self.assertTrue(os.path.exists(path))
+        self.assertIsNone(self._cache.get_entry('http://fake/a'))
+
+    def test_get_artifact_cache(self):
+        self.assertIsNone(artifactcache.get_artifact_cache())
+        CONF.set_override('artifact_cache_path', self._cache_dir)
+        try:
+            cache = artifactcache.get_artifact_cache()
+            self.assertIsInstance(cache, artifactcache.ArtifactCache)
+            self.assertIs(artifactcache.get_artifact_cache(), cache)
+        finally:
+            CONF.clear_override('artifact_cache_path')
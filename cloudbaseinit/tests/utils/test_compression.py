@@ -0,0 +1,97 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import bz2
+import gzip
+import StringIO
+import unittest
+
+from cloudbaseinit.utils import compression
+
+
+def _gzip(data):
+    f = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=f, mode='wb') as g:
+        g.write(data)
+    return f.getvalue()
+
+
+class CompressionTest(unittest.TestCase):
+    def setUp(self):
+        self._data = ''.join('line %d\n' % i for i in range(50000))
+
+    def test_get_compression(self):
+        self.assertEqual(compression.get_compression(_gzip('')),
+                         compression.GZIP)
+        self.assertEqual(compression.get_compression(bz2.compress('')),
+                         compression.BZIP2)
+        self.assertEqual(compression.get_compression(
+            base64.encodestring(_gzip(''))), compression.BASE64)
+        self.assertEqual(compression.get_compression(
+            base64.encodestring(bz2.compress(''))), compression.BASE64)
+
+    def test_get_compression_none(self):
+        for data in ['', 'BZh', '#ps1\nfake', 'Content-Type: multipart',
+                     base64.encodestring('#ps1\nfake')]:
+            self.assertIsNone(compression.get_compression(data))
+
+    def _test_get_decompressed_stream(self, data):
+        stream = compression.get_decompressed_stream(StringIO.StringIO(data))
+        self.assertEqual(stream.peek(10), self._data[:10])
+        self.assertEqual(stream.read(), self._data)
+
+    def test_get_decompressed_stream_gzip(self):
+        self._test_get_decompressed_stream(_gzip(self._data))
+
+    def test_get_decompressed_stream_gzip_members(self):
+        self._test_get_decompressed_stream(
+            _gzip(self._data[:1000]) + _gzip(self._data[1000:]))
+
+    def test_get_decompressed_stream_bzip2(self):
+        self._test_get_decompressed_stream(bz2.compress(self._data))
+
+    def test_get_decompressed_stream_base64(self):
+        self._test_get_decompressed_stream(
+            base64.encodestring(_gzip(self._data)))
+
+    def test_get_decompressed_stream_base64_bzip2(self):
+        self._test_get_decompressed_stream(
+            base64.encodestring(bz2.compress(self._data)))
+
+    def test_get_decompressed_stream_not_compressed(self):
+        self._test_get_decompressed_stream(self._data)
+
+    def test_readline(self):
+        stream = compression.get_decompressed_stream(
+            StringIO.StringIO(_gzip(self._data)))
+        lines = list(iter(stream.readline, ''))
+        self.assertEqual(lines, self._data.splitlines(True))
+
+    def test_readline_size(self):
+        stream = compression.get_decompressed_stream(
+            StringIO.StringIO(_gzip('x' * 100 + '\nfake')))
+        self.assertEqual(stream.readline(60), 'x' * 60)
+        self.assertEqual(stream.readline(60), 'x' * 40 + '\n')
+        self.assertEqual(stream.readline(60), 'fake')
+        self.assertEqual(stream.readline(60), '')
+
+    def test_read_chunks(self):
+        stream = compression.get_decompressed_stream(
+            StringIO.StringIO(bz2.compress(self._data)))
+        chunks = list(iter(lambda: stream.read(1000), ''))
+        self.assertEqual(len(chunks[0]), 1000)
+        self.assertEqual(''.join(chunks), self._data)
@@ -0,0 +1,63 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+import unittest
+
+from cloudbaseinit.utils import concurrency
+
+
+class MapConcurrentlyTest(unittest.TestCase):
+    def _test_map_concurrently(self, max_workers):
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0}
+
+        def _func(item):
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['running'],
+                                           state['max_running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+            if item == 3:
+                raise ValueError(item)
+            return item * 2
+
+        response = concurrency.map_concurrently(_func, range(10),
+                                                max_workers)
+
+        self.assertEqual(len(response), 10)
+        for item, (result, ex) in enumerate(response):
+            if item == 3:
+                self.assertIsNone(result)
+                self.assertIsInstance(ex, ValueError)
+            else:
+                self.assertEqual(result, item * 2)
+                self.assertIsNone(ex)
+        self.assertTrue(state['max_running'] <= max(max_workers, 1))
+        return state['max_running']
+
+    def test_map_concurrently(self):
+        self.assertTrue(self._test_map_concurrently(max_workers=4) > 1)
+
+    def test_map_concurrently_single_worker(self):
+        self._test_map_concurrently(max_workers=1)
+
+    def test_map_concurrently_no_items(self):
+        response = concurrency.map_concurrently(lambda i: i, [], 4)
+        self.assertEqual(response, [])
@@ -0,0 +1,223 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import BaseHTTPServer
+import hashlib
+import mock
+import os
+import shutil
+import SocketServer
+import tempfile
+import threading
+import unittest
+
+from cloudbaseinit.utils import download
+from cloudbaseinit.utils import httpclient
+
+_CONTENT = ''.join(chr(i % 256) for i in range(300000))
+
+
+class FakeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send_redirect(self, status, location):
+        self.send_response(status)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.ranges.append(self.headers.getheader('Range'))
+        if self.path == '/redirect':
+            self._send_redirect(302, '/file')
+            return
+        if self.path == '/redirect-loop':
+            self._send_redirect(301, '/redirect-loop')
+            return
+        if self.path == '/moved' and len(self.server.ranges) > 1:
+            # Moved to another host after a partial download
+            self._send_redirect(307, 'http://localhost:%d/file' %
+                                self.server.server_port)
+            return
+        if self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.getheader('If-None-Match') == '"fake"':
+            self.send_response(304)
+            self.send_header('ETag', '"fake"')
+            self.end_headers()
+            return
+        if self.path == '/error' and len(self.server.ranges) == 1:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.getheader('Range')
+        if range_header and self.server.support_ranges:
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                             (start, len(_CONTENT) - 1, len(_CONTENT)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(_CONTENT) - start))
+        self.end_headers()
+
+        if self.path in ('/drop', '/moved') and self.server.drops:
+            # Send only part of the content and close the connection
+            self.server.drops -= 1
+            self.wfile.write(_CONTENT[start:start + 100000])
+            self.close_connection = 1
+        else:
+            self.wfile.write(_CONTENT[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeHandler)
+        self.ranges = []
+        self.drops = 2
+        self.support_ranges = True
+
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self._server = FakeServer()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._base_url = 'http://127.0.0.1:%d' % self._server.server_port
+        self._pool = httpclient.HTTPConnectionPool(timeout=5)
+        self._tmp_dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tmp_dir, 'file')
+
+    def tearDown(self):
+        self._pool.close()
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._tmp_dir)
+
+    def _download(self, path, **kwargs):
+        return download.download_file(self._pool, self._base_url + path,
+                                      self._path, sec_between=0, **kwargs)
+
+    def _get_content(self):
+        with open(self._path, 'rb') as f:
+            return f.read()
+
+    def test_split_checksum(self):
+        self.assertEqual(download.split_checksum('http://fake/a#sha256=AB'),
+                         ('http://fake/a', 'ab'))
+        self.assertEqual(download.split_checksum('http://fake/a'),
+                         ('http://fake/a', None))
+        self.assertEqual(download.split_checksum('http://fake/a#other'),
+                         ('http://fake/a', None))
+
+    def test_download_file(self):
+        headers = self._download('/file')
+        self.assertEqual(self._get_content(), _CONTENT)
+        self.assertEqual(headers['content-length'], str(len(_CONTENT)))
+        self.assertEqual(self._server.ranges, [None])
+
+    def test_download_file_resumed(self):
+        self._download('/drop')
+        self.assertEqual(self._get_content(), _CONTENT)
+        self.assertEqual(self._server.ranges,
+                         [None, 'bytes=100000-', 'bytes=200000-'])
+
+    def test_download_file_ranges_not_supported(self):
+        self._server.support_ranges = False
+        self._download('/drop')
+        self.assertEqual(self._get_content(), _CONTENT)
+
+    def test_download_file_too_many_errors(self):
+        self.assertRaises(download.DownloadError, self._download, '/drop',
+                          retries=1)
+
+    @mock.patch('time.sleep')
+    def test_download_file_max_total_delay(self, mock_sleep):
+        download.download_file(self._pool, self._base_url + '/drop',
+                               self._path, sec_between=1, max_total_delay=2)
+        self.assertEqual(self._get_content(), _CONTENT)
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(sum(delays) <= 2 + 1e-9)
+        for delay in delays:
+            self.assertTrue(delay >= 1 - 1e-9)
+
+    def test_download_file_transient_status(self):
+        self._download('/error')
+        self.assertEqual(self._get_content(), _CONTENT)
+
+    def test_download_file_redirect(self):
+        self._download('/redirect')
+        self.assertEqual(self._get_content(), _CONTENT)
+        self.assertEqual(self._server.ranges, [None, None])
+
+    def test_download_file_too_many_redirects(self):
+        self.assertRaises(httpclient.HTTPError, self._download,
+                          '/redirect-loop')
+        self.assertEqual(len(self._server.ranges),
+                         download.MAX_REDIRECTS + 1)
+
+    def test_download_file_redirect_other_host(self):
+        self._download('/moved')
+        self.assertEqual(self._get_content(), _CONTENT)
+        # The range received from the first host is not resumed
+        self.assertEqual(self._server.ranges, [None, 'bytes=100000-', None])
+
+    def test_download_file_not_found(self):
+        self.assertRaises(httpclient.HTTPError, self._download, '/missing')
+        self.assertEqual(len(self._server.ranges), 1)
+
+    def test_download_file_checksum(self):
+        self._download('/file',
+                       expected_sha256=hashlib.sha256(_CONTENT).hexdigest())
+        self.assertEqual(self._get_content(), _CONTENT)
+
+    def test_download_file_checksum_mismatch(self):
+        self.assertRaises(download.ChecksumMismatchError, self._download,
+                          '/file', expected_sha256='0' * 64)
+        self.assertFalse(os.path.exists(self._path))
+
+    def test_download_local_file(self):
+        source_path = os.path.join(self._tmp_dir, 'source')
+        with open(source_path, 'wb') as f:
+            f.write(_CONTENT)
+        download.download_file(None, 'file://' + source_path, self._path)
+        self.assertEqual(self._get_content(), _CONTENT)
+
+    def test_download_file_not_modified(self):
+        try:
+            self._download('/file', headers={'If-None-Match': '"fake"'})
+            self.fail('NotModified not raised')
+        except download.NotModified as ex:
+            self.assertEqual(ex.headers['etag'], '"fake"')
+        self.assertFalse(os.path.exists(self._path))
+
+    def test_download_file_modified(self):
+        self._download('/file', headers={'If-None-Match': '"other"'})
+        self.assertEqual(self._get_content(), _CONTENT)
@@ -0,0 +1,181 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import mock
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import artifactcache
+from cloudbaseinit.utils import download
+from cloudbaseinit.utils import file as util
+
+CONF = cfg.CONF
+
+
+class ReadFileOrUrlCachedTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        CONF.set_override('artifact_cache_path', self._tmp_dir)
+
+    def tearDown(self):
+        CONF.clear_override('artifact_cache_path')
+        shutil.rmtree(self._tmp_dir)
+
+    def _get_response(self, code, contents='', headers={}):
+        response = mock.MagicMock()
+        response.code = code
+        response.contents = contents
+        response.headers = headers
+        response.ok.return_value = code == 200
+        return response
+
+    @mock.patch('cloudbaseinit.utils.url_helper.readurl')
+    def test_read_file_or_url_cached(self, mock_readurl):
+        mock_readurl.side_effect = [
+            self._get_response(200, 'fake data', {'etag': '"1"',
+                                                  'content-type': 'fake'}),
+            self._get_response(304)]
+
+        response = util.read_file_or_url('http://fake/a', headers={'a': 'b'})
+        self.assertEqual(response.contents, 'fake data')
+        self.assertEqual(mock_readurl.call_args[1]['headers'], {'a': 'b'})
+
+        response = util.read_file_or_url('http://fake/a', headers={'a': 'b'})
+        self.assertEqual(response.contents, 'fake data')
+        self.assertEqual(response.headers, {'content-type': 'fake'})
+        self.assertEqual(mock_readurl.call_args[1]['headers'],
+                         {'a': 'b', 'If-None-Match': '"1"'})
+
+    @mock.patch('cloudbaseinit.utils.url_helper.readurl')
+    def test_read_file_or_url_checksum(self, mock_readurl):
+        mock_readurl.return_value = self._get_response(200, 'fake data')
+        url = 'http://fake/a#sha256=%s' % hashlib.sha256(
+            'fake data').hexdigest()
+        for i in range(2):
+            response = util.read_file_or_url(url)
+            self.assertEqual(response.contents, 'fake data')
+        # Content addressed by the checksum, no further requests
+        self.assertEqual(mock_readurl.call_count, 1)
+        self.assertEqual(mock_readurl.call_args[0][0], 'http://fake/a')
+
+    @mock.patch('cloudbaseinit.utils.url_helper.readurl')
+    def test_read_file_or_url_checksum_mismatch(self, mock_readurl):
+        mock_readurl.return_value = self._get_response(200, 'fake data')
+        url = 'http://fake/a#sha256=%s' % ('0' * 64)
+        self.assertRaises(download.ChecksumMismatchError,
+                          util.read_file_or_url, url)
+        self.assertIsNone(
+            artifactcache.get_artifact_cache().get_entry('http://fake/a'))
+
+    @mock.patch('cloudbaseinit.utils.url_helper.readurl')
+    def test_read_file_or_url_checksum_corrupted(self, mock_readurl):
+        checksum = hashlib.sha256('fake data').hexdigest()
+        mock_readurl.return_value = self._get_response(
+            200, 'fake data', {'etag': '"1"'})
+        url = 'http://fake/a#sha256=%s' % checksum
+        util.read_file_or_url(url)
+        path = artifactcache.get_artifact_cache().get_path(checksum=checksum)
+        with open(path, 'wb') as f:
+            f.write('corrupted data')
+
+        # A new cache instance verifies the cached content again
+        with mock.patch('cloudbaseinit.utils.artifactcache._artifact_cache',
+                        None):
+            response = util.read_file_or_url(url)
+        self.assertEqual(response.contents, 'fake data')
+        self.assertEqual(mock_readurl.call_count, 2)
+        # No conditional request for content with another checksum
+        self.assertEqual(mock_readurl.call_args[1]['headers'], {})
+
+    @mock.patch('cloudbaseinit.utils.url_helper.readurl')
+    def test_read_file_or_url_post(self, mock_readurl):
+        util.read_file_or_url('http://fake/a', data='fake')
+        self.assertEqual(mock_readurl.call_args[1]['data'], 'fake')
+
+
+class ExtractArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._dest_dir = os.path.join(self._tmp_dir, 'dest')
+        os.mkdir(self._dest_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _create_zip(self, names):
+        path = os.path.join(self._tmp_dir, 'fake.zip')
+        zf = zipfile.ZipFile(path, 'w')
+        try:
+            for name in names:
+                zf.writestr(name, 'fake data')
+        finally:
+            zf.close()
+        return path
+
+    def _create_tar(self, members):
+        path = os.path.join(self._tmp_dir, 'fake.tar')
+        tf = tarfile.open(path, 'w')
+        try:
+            for member in members:
+                tf.addfile(member)
+        finally:
+            tf.close()
+        return path
+
+    def test_extract_zip(self):
+        path = self._create_zip(['a/b.txt'])
+        util.extract_archive(path, self._dest_dir)
+        self.assertTrue(os.path.isfile(
+            os.path.join(self._dest_dir, 'a', 'b.txt')))
+
+    def test_extract_zip_outside_dest_dir(self):
+        path = self._create_zip(['a.txt', 'a/../../b.txt'])
+        self.assertRaises(ValueError, util.extract_archive, path,
+                          self._dest_dir)
+        self.assertEqual(os.listdir(self._dest_dir), [])
+        self.assertFalse(os.path.exists(os.path.join(self._tmp_dir, 'b.txt')))
+
+    def test_extract_tar_outside_dest_dir(self):
+        path = self._create_tar([tarfile.TarInfo('../a.txt')])
+        self.assertRaises(ValueError, util.extract_archive, path,
+                          self._dest_dir)
+        self.assertEqual(os.listdir(self._dest_dir), [])
+
+    def _test_extract_tar_link(self, link_type, link_name, raises):
+        member = tarfile.TarInfo('a/link')
+        member.type = link_type
+        member.linkname = link_name
+        path = self._create_tar([member])
+        if raises:
+            self.assertRaises(ValueError, util.extract_archive, path,
+                              self._dest_dir)
+        else:
+            util.extract_archive(path, self._dest_dir)
+
+    def test_extract_tar_symlink_outside_dest_dir(self):
+        self._test_extract_tar_link(tarfile.SYMTYPE, '../../etc', True)
+
+    def test_extract_tar_symlink_inside_dest_dir(self):
+        self._test_extract_tar_link(tarfile.SYMTYPE, '../b', False)
+
+    def test_extract_tar_hardlink_outside_dest_dir(self):
+        self._test_extract_tar_link(tarfile.LNKTYPE, '../b', True)
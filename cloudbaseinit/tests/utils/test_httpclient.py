@@ -0,0 +1,118 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import BaseHTTPServer
+import SocketServer
+import threading
+import unittest
+
+from cloudbaseinit.utils import httpclient
+
+
+class FakeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def _send(self, code, body, close=False):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        if close:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/missing':
+            self._send(404, 'not found')
+        elif self.path == '/close':
+            self._send(200, 'bye', close=True)
+        elif self.path == '/drop':
+            # Close the connection without notifying the client
+            self._send(200, 'bye')
+            self.close_connection = 1
+        else:
+            self._send(200, 'data:%s' % self.path)
+
+    def do_POST(self):
+        length = int(self.headers.getheader('Content-Length'))
+        self._send(200, 'posted:%s' % self.rfile.read(length))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeHandler)
+        self.connections = 0
+
+
+class HTTPConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self._server = FakeServer()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._base_url = 'http://127.0.0.1:%d' % self._server.server_port
+        self._pool = httpclient.HTTPConnectionPool(timeout=5)
+
+    def tearDown(self):
+        self._pool.close()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def test_request_keep_alive(self):
+        for i in range(5):
+            response = self._pool.request('GET', self._base_url + '/md/%d' % i)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.data, 'data:/md/%d' % i)
+
+        response = self._pool.request('POST', self._base_url + '/pwd',
+                                      'secret')
+        self.assertEqual(response.data, 'posted:secret')
+        self.assertEqual(self._pool.connections_opened, 1)
+        self.assertEqual(self._pool.requests_served, 6)
+        self.assertEqual(self._server.connections, 1)
+
+    def test_request_error_status(self):
+        response = self._pool.request('GET', self._base_url + '/missing')
+        self.assertEqual(response.status, 404)
+        self.assertEqual(response.data, 'not found')
+
+        self._pool.request('GET', self._base_url + '/')
+        self.assertEqual(self._pool.connections_opened, 1)
+
+    def test_request_connection_close(self):
+        self._pool.request('GET', self._base_url + '/close')
+        self._pool.request('GET', self._base_url + '/')
+        self.assertEqual(self._pool.connections_opened, 2)
+        self.assertEqual(self._pool.requests_served, 2)
+
+    def test_request_stale_connection(self):
+        self._pool.request('GET', self._base_url + '/drop')
+        response = self._pool.request('GET', self._base_url + '/')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self._pool.connections_opened, 2)
+
+    def test_request_unsupported_scheme(self):
+        self.assertRaises(ValueError, self._pool.request, 'GET',
+                          'ftp://127.0.0.1/')
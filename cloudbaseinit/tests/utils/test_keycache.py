@@ -0,0 +1,83 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cloudbaseinit.utils import keycache
+
+
+class KeyCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._freed = []
+        self._cache = keycache.KeyCache(lambda data: 'handle-' + data,
+                                        self._freed.append, max_size=2)
+
+    def test_get(self):
+        for i in range(3):
+            with self._cache.get('fp1', 'key1') as handle:
+                self.assertEqual(handle, 'handle-key1')
+        self.assertEqual(self._cache.loads, 1)
+        self.assertEqual(self._cache.hits, 2)
+        self.assertEqual(self._freed, [])
+
+    def test_get_evicts_least_recently_used(self):
+        for (fingerprint, data) in [('fp1', 'key1'), ('fp2', 'key2'),
+                                    ('fp1', 'key1'), ('fp3', 'key3')]:
+            with self._cache.get(fingerprint, data):
+                pass
+        self.assertEqual(self._freed, ['handle-key2'])
+        self.assertEqual(len(self._cache), 2)
+
+    def test_evicted_while_in_use(self):
+        with self._cache.get('fp1', 'key1') as handle:
+            self._cache.clear()
+            # Still in use, freed once released
+            self.assertEqual(self._freed, [])
+            self.assertEqual(handle, 'handle-key1')
+        self.assertEqual(self._freed, ['handle-key1'])
+        self.assertEqual(len(self._cache), 0)
+
+    def test_clear(self):
+        with self._cache.get('fp1', 'key1'):
+            pass
+        with self._cache.get('fp2', 'key2'):
+            pass
+        self._cache.clear()
+        self.assertEqual(sorted(self._freed), ['handle-key1', 'handle-key2'])
+
+        with self._cache.get('fp1', 'key1'):
+            pass
+        self.assertEqual(self._cache.loads, 3)
+
+    def test_get_load_failed(self):
+        def _load(data):
+            raise Exception('fake error')
+
+        cache = keycache.KeyCache(_load, self._freed.append)
+        try:
+            with cache.get('fp1', 'key1'):
+                self.fail('Exception not raised')
+        except Exception, ex:
+            self.assertEqual(str(ex), 'fake error')
+        self.assertEqual(len(cache), 0)
+
+    def test_no_cache(self):
+        cache = keycache.KeyCache(lambda data: data, self._freed.append,
+                                  max_size=0)
+        with cache.get('fp1', 'key1'):
+            self.assertEqual(self._freed, [])
+        self.assertEqual(self._freed, ['key1'])
@@ -0,0 +1,188 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import email
+import gzip
+import StringIO
+import unittest
+
+from cloudbaseinit.utils import mimestream
+
+_USER_DATA = '''Content-Type: multipart/mixed; boundary="===outer=="
+MIME-Version: 1.0
+
+preamble
+--===outer==
+Content-Type: text/x-shellscript; charset="us-ascii"
+Content-Disposition: attachment; filename="script.cmd"
+
+echo 1
+echo 2
+
+--===outer==
+Content-Type: multipart/alternative; boundary="inner"
+
+--inner
+Content-Type: text/x-cfninitdata
+Content-Transfer-Encoding: base64
+Content-Disposition: attachment; filename="cfn-userdata"
+
+%(base64)s
+--inner
+Content-Type: text/plain
+Content-Transfer-Encoding: quoted-printable
+
+long =
+line=3D1
+--inner--
+--===outer==
+Content-Type: text/part-handler
+Content-Disposition: attachment; filename="handler.py"
+
+def list_types():
+--===outer==--
+epilogue
+'''
+
+
+class MIMEStreamTest(unittest.TestCase):
+    def setUp(self):
+        self._binary = ''.join(chr(i) for i in range(256)) * 100
+        encoded = base64.encodestring(self._binary)
+        self._user_data = _USER_DATA % {'base64': encoded.rstrip('\n')}
+
+    def _get_parts(self, user_data, spool_threshold=1024 * 1024,
+                   decompress=False):
+        return list(mimestream.iter_parts(StringIO.StringIO(user_data),
+                                          spool_threshold, decompress))
+
+    def _test_iter_parts(self, user_data):
+        parts = self._get_parts(user_data, spool_threshold=1024)
+        expected = list(email.message_from_string(user_data).walk())
+
+        self.assertEqual([p.get_content_type() for p in parts],
+                         [p.get_content_type() for p in expected])
+        self.assertEqual([p.get_filename() for p in parts],
+                         [p.get_filename() for p in expected])
+        self.assertEqual([p.get_payload() for p in parts if
+                          not p.is_multipart()],
+                         [p.get_payload(decode=True) for p in expected if
+                          not p.is_multipart()])
+        for part in parts:
+            part.close()
+
+    def test_iter_parts(self):
+        self._test_iter_parts(self._user_data)
+
+    def test_iter_parts_crlf(self):
+        self._test_iter_parts(self._user_data.replace('\n', '\r\n'))
+
+    def test_iter_parts_decoded(self):
+        parts = self._get_parts(self._user_data)
+        self.assertEqual(parts[1].get_payload(), 'echo 1\necho 2\n')
+        self.assertEqual(parts[3].get_payload(), self._binary)
+        self.assertEqual(parts[4].get_payload(), 'long line=1')
+        self.assertEqual(parts[5].get_payload(), 'def list_types():')
+
+    def test_iter_parts_spooled(self):
+        parts = self._get_parts(self._user_data, spool_threshold=1024)
+        # Only the payloads larger than the threshold are moved to disk
+        self.assertTrue(parts[3]._payload._rolled)
+        self.assertFalse(parts[1]._payload._rolled)
+
+    def test_iter_parts_lazy(self):
+        f = StringIO.StringIO(self._user_data)
+        parts = mimestream.iter_parts(f)
+        parts.next()
+        part = parts.next()
+        self.assertEqual(part.get_filename(), 'script.cmd')
+        self.assertTrue(f.tell() < len(self._user_data) / 2)
+
+    def test_iter_parts_long_line(self):
+        payload = 'x' * (mimestream._LINE_CHUNK_SIZE * 3 + 10)
+        user_data = ('Content-Type: multipart/mixed; boundary="b"\n\n'
+                     '--b\nContent-Type: text/plain\n\n%s\n--b--\n' % payload)
+        parts = self._get_parts(user_data)
+        self.assertEqual(parts[1].get_payload(), payload)
+
+    def test_iter_parts_missing_end_boundary(self):
+        user_data = ('Content-Type: multipart/mixed; boundary="b"\n\n'
+                     '--b\nContent-Type: text/plain\n\nfake\n')
+        parts = self._get_parts(user_data)
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(parts[1].get_payload(), 'fake\n')
+
+    def test_copy_payload(self):
+        parts = self._get_parts(self._user_data, spool_threshold=1024)
+        f = StringIO.StringIO()
+        parts[3].copy_payload(f)
+        self.assertEqual(f.getvalue(), self._binary)
+
+    def test_close(self):
+        parts = self._get_parts(self._user_data)
+        parts[1].close()
+        self.assertEqual(parts[1].get_payload(), '')
+
+    def _get_compressed_user_data(self, content_type, transfer_encoding,
+                                  payload):
+        return ('Content-Type: multipart/mixed; boundary="b"\n\n'
+                '--b\nContent-Type: %(content_type)s\n'
+                'Content-Transfer-Encoding: %(transfer_encoding)s\n\n'
+                '%(payload)s\n--b--\n' %
+                {'content_type': content_type,
+                 'transfer_encoding': transfer_encoding,
+                 'payload': base64.encodestring(payload)})
+
+    def _compress(self, data):
+        f = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=f, mode='wb') as g:
+            g.write(data)
+        return f.getvalue()
+
+    def test_iter_parts_compressed(self):
+        user_data = self._get_compressed_user_data(
+            'text/x-shellscript', 'base64', self._compress(self._binary))
+        parts = self._get_parts(user_data, decompress=True)
+        self.assertEqual(parts[1].get_content_type(), 'text/x-shellscript')
+        self.assertEqual(parts[1].get_payload(), self._binary)
+
+    def test_iter_parts_compressed_not_decompressed(self):
+        compressed = self._compress(self._binary)
+        user_data = self._get_compressed_user_data(
+            'application/x-gzip', 'base64', compressed)
+        parts = self._get_parts(user_data)
+        self.assertEqual(parts[1].get_payload(), compressed)
+
+    def test_iter_parts_compressed_not_marked(self):
+        # Only base64 or compression transfer encodings are checked
+        compressed = self._compress(self._binary)
+        user_data = ('Content-Type: multipart/mixed; boundary="b"\n\n'
+                     '--b\nContent-Type: application/octet-stream\n\n'
+                     '%s\n--b--\n' % compressed)
+        parts = self._get_parts(user_data, decompress=True)
+        self.assertEqual(parts[1].get_payload(), compressed)
+
+    def test_iter_parts_compressed_mime(self):
+        user_data = self._get_compressed_user_data(
+            'application/x-gzip', 'base64', self._compress(self._user_data))
+        parts = self._get_parts(user_data, decompress=True)
+        self.assertEqual([p.get_content_type() for p in parts],
+                         ['multipart/mixed', 'multipart/mixed',
+                          'text/x-shellscript', 'multipart/alternative',
+                          'text/x-cfninitdata', 'text/plain',
+                          'text/part-handler'])
+        self.assertEqual(parts[4].get_payload(), self._binary)
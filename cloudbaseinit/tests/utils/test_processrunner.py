@@ -0,0 +1,116 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import os
+import time
+import unittest
+
+from cloudbaseinit.utils import processrunner
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def test_write(self):
+        buf = processrunner.RingBuffer(10)
+        for i in range(10):
+            buf.write('line%d\n' % i)
+        self.assertEqual(buf.getvalue(), 'ne8\nline9\n')
+        self.assertEqual(buf.total_size, 60)
+
+    def test_write_large_chunk(self):
+        buf = processrunner.RingBuffer(4)
+        buf.write('abcdefgh')
+        self.assertEqual(buf.getvalue(), 'efgh')
+
+    def test_write_no_tail(self):
+        buf = processrunner.RingBuffer(0)
+        buf.write('abc')
+        buf.write('def')
+        self.assertEqual(buf.getvalue(), '')
+        self.assertEqual(buf.total_size, 6)
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_no_limit(self):
+        deadline = processrunner.Deadline()
+        self.assertIsNone(deadline.get_remaining())
+        self.assertFalse(deadline.is_expired())
+
+    def test_expired(self):
+        deadline = processrunner.Deadline(-1)
+        self.assertEqual(deadline.get_remaining(), 0)
+        self.assertTrue(deadline.is_expired())
+
+
+@unittest.skipIf(os.name == 'nt', 'POSIX only')
+class RunProcessTest(unittest.TestCase):
+
+    def _run(self, script, **kwargs):
+        return processrunner.run_process(['sh', '-c', script], **kwargs)
+
+    def test_run_process(self):
+        result = self._run('echo out; echo err >&2; exit 3')
+        self.assertEqual(result.exit_code, 3)
+        self.assertEqual(result.stdout_tail, 'out\n')
+        self.assertEqual(result.stderr_tail, 'err\n')
+        self.assertEqual(result.stdout_bytes, 4)
+        self.assertEqual(result.stderr_bytes, 4)
+        self.assertFalse(result.timed_out)
+        self.assertTrue(result.duration >= 0)
+
+    @mock.patch('cloudbaseinit.utils.processrunner.LOG')
+    def test_run_process_logs_lines(self, mock_log):
+        self._run('echo line1; echo line2', name='script')
+        mock_log.debug.assert_any_call('script stdout: line1')
+        mock_log.debug.assert_any_call('script stdout: line2')
+
+    def test_run_process_bounded_output(self):
+        result = self._run('i=0; while [ $i -lt 1000 ]; do '
+                           'echo 0123456789; i=$((i+1)); done',
+                           tail_size=22)
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.stdout_bytes, 11000)
+        self.assertEqual(result.stdout_tail, '0123456789\n' * 2)
+
+    def test_run_process_timeout_kills_tree(self):
+        start_time = time.time()
+        # The child sleep keeps the output pipes open unless it is killed
+        # along with the shell
+        result = self._run('sleep 30 & sleep 30', timeout=0.5)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(result.exit_code, -9)
+        self.assertTrue(time.time() - start_time <
+                        processrunner.OUTPUT_DRAIN_TIMEOUT)
+
+    def test_run_process_deadline(self):
+        deadline = processrunner.Deadline(0.5)
+        result = self._run('sleep 30', timeout=30, deadline=deadline)
+        self.assertTrue(result.timed_out)
+
+    @mock.patch('subprocess.Popen')
+    def test_run_process_deadline_expired(self, mock_popen):
+        result = self._run('true', deadline=processrunner.Deadline(-1))
+        self.assertTrue(result.timed_out)
+        self.assertIsNone(result.exit_code)
+        self.assertFalse(mock_popen.called)
+
+    @mock.patch('cloudbaseinit.utils.timeline.BootTimeline.'
+                'record_subprocess')
+    def test_run_process_records_subprocess(self, mock_record_subprocess):
+        self._run('true')
+        self.assertEqual(mock_record_subprocess.call_count, 1)
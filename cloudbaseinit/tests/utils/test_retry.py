@@ -0,0 +1,148 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import threading
+import unittest
+
+from cloudbaseinit.utils import retry
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, code):
+        super(FakeHTTPError, self).__init__('HTTP Error %s' % code)
+        self.code = code
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self._timeline = mock.MagicMock()
+        self._action = mock.MagicMock()
+
+    @mock.patch('time.sleep')
+    @mock.patch('cloudbaseinit.utils.timeline.get_boot_timeline')
+    def _test_execute(self, mock_get_boot_timeline, mock_sleep, errors,
+                      expected_attempts, expected_error=None, **kwargs):
+        mock_get_boot_timeline.return_value = self._timeline
+        self._action.side_effect = errors + ['fake result']
+        policy = retry.RetryPolicy('fake', **kwargs)
+
+        if expected_error:
+            self.assertRaises(expected_error, policy.execute, self._action)
+        else:
+            self.assertEqual(policy.execute(self._action), 'fake result')
+
+        self.assertEqual(self._action.call_count, expected_attempts)
+        self.assertEqual(mock_sleep.call_count, expected_attempts - 1)
+        self.assertEqual(self._timeline.record_retry.call_count,
+                         expected_attempts - 1)
+        return [c[0][0] for c in mock_sleep.call_args_list]
+
+    def test_execute(self):
+        self._test_execute(errors=[], expected_attempts=1)
+
+    def test_execute_retry(self):
+        delays = self._test_execute(errors=[IOError()] * 3,
+                                    expected_attempts=4)
+        self.assertEqual([c[0][:2] for c in
+                          self._timeline.record_retry.call_args_list],
+                         [('fake', 1), ('fake', 2), ('fake', 3)])
+        self.assertEqual([c[0][2] for c in
+                          self._timeline.record_retry.call_args_list],
+                         delays)
+
+    def test_execute_stopped(self):
+        stop_event = threading.Event()
+        stop_event.set()
+        self._test_execute(errors=[IOError()] * 2, expected_attempts=1,
+                           expected_error=IOError, stop_event=stop_event)
+
+    @mock.patch('cloudbaseinit.utils.timeline.get_boot_timeline')
+    def test_execute_stopped_while_waiting(self, mock_get_boot_timeline):
+        stop_event = threading.Event()
+        self._action.side_effect = [IOError(), 'fake result']
+        policy = retry.RetryPolicy('fake', base_delay=60,
+                                   stop_event=stop_event)
+        timer = threading.Timer(0.1, stop_event.set)
+        timer.start()
+        try:
+            self.assertRaises(IOError, policy.execute, self._action)
+        finally:
+            timer.cancel()
+        self.assertEqual(self._action.call_count, 1)
+
+    def test_execute_max_attempts(self):
+        self._test_execute(errors=[IOError()] * 3, expected_attempts=2,
+                           expected_error=IOError, max_attempts=2)
+
+    def test_execute_fatal_error(self):
+        self._test_execute(errors=[FakeHTTPError(404)], expected_attempts=1,
+                           expected_error=FakeHTTPError)
+
+    def test_execute_retryable_http_error(self):
+        self._test_execute(errors=[FakeHTTPError(503), FakeHTTPError(429)],
+                           expected_attempts=3)
+
+    def test_execute_is_retryable(self):
+        self._test_execute(errors=[IOError()], expected_attempts=1,
+                           expected_error=IOError,
+                           is_retryable=lambda ex: False)
+
+    @mock.patch('time.time')
+    def test_execute_deadline(self, mock_time):
+        # Attempts at 0, 9 and 12 seconds, the last delay is shortened
+        mock_time.side_effect = [0, 9, 12]
+        delays = self._test_execute(errors=[IOError()] * 3,
+                                    expected_attempts=2,
+                                    expected_error=IOError, base_delay=5,
+                                    deadline=10)
+        self.assertEqual(delays, [1])
+
+    def test_execute_max_total_delay(self):
+        delays = self._test_execute(errors=[IOError()] * 3,
+                                    expected_attempts=4, max_attempts=4,
+                                    base_delay=1, max_total_delay=5)
+        self.assertTrue(sum(delays) <= 5 + 1e-9)
+        # Each retry keeps at least base_delay
+        for delay in delays:
+            self.assertTrue(delay >= 1)
+
+    def test_execute_max_total_delay_exhausted(self):
+        delays = self._test_execute(errors=[IOError()] * 3,
+                                    expected_attempts=2,
+                                    expected_error=IOError, base_delay=2,
+                                    max_total_delay=2)
+        self.assertEqual(delays, [2])
+
+    def test_get_next_delay(self):
+        policy = retry.RetryPolicy('fake', base_delay=1, max_delay=30)
+        delay = 1
+        for i in range(100):
+            next_delay = policy.get_next_delay(delay)
+            self.assertTrue(1 <= next_delay <= min(30, delay * 3))
+            delay = next_delay
+
+    def test_get_next_delay_jitter(self):
+        # Instances retrying together spread their attempts
+        policy = retry.RetryPolicy('fake', base_delay=1, max_delay=30)
+        delays = set(policy.get_next_delay(4) for i in range(10))
+        self.assertTrue(len(delays) > 1)
+
+    def test_is_transient_error(self):
+        self.assertTrue(retry.is_transient_error(IOError()))
+        self.assertTrue(retry.is_transient_error(FakeHTTPError(500)))
+        self.assertTrue(retry.is_transient_error(FakeHTTPError(408)))
+        self.assertFalse(retry.is_transient_error(FakeHTTPError(403)))
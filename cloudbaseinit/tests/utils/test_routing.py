@@ -0,0 +1,85 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import unittest
+
+from cloudbaseinit.utils import routing
+
+
+class RoutingTest(unittest.TestCase):
+    _ROWS = [
+        ('10.0.0.0', '255.0.0.0', '0.0.0.0', 2, 266),
+        ('0.0.0.0', '0.0.0.0', '10.0.0.1', 2, 10),
+        ('169.254.169.254', '255.255.255.255', '10.0.0.1', 2, 10),
+        ('0.0.0.0', '0.0.0.0', '192.168.0.1', 3, 20),
+    ]
+
+    def setUp(self):
+        self._get_rows = mock.MagicMock(return_value=self._ROWS)
+        self._cache = routing.RoutingTableCache(self._get_rows)
+
+    def test_ipv4_dword(self):
+        for address in ['0.0.0.0', '10.0.0.1', '169.254.169.254',
+                        '255.255.255.255']:
+            value = routing.ipv4_to_dword(address)
+            self.assertEqual(routing.dword_to_ipv4(value), address)
+
+    def test_get_routes(self):
+        table = self._cache.get_table()
+
+        self.assertTrue(table.has_route('169.254.169.254'))
+        self.assertFalse(table.has_route('169.254.169.253'))
+        self.assertEqual([r.next_hop for r in table.get_routes('0.0.0.0')],
+                         ['10.0.0.1', '192.168.0.1'])
+        self.assertEqual(table.get_routes('1.1.1.1'), [])
+        self.assertEqual(len(table.routes), 4)
+
+    def test_get_default_route(self):
+        route = self._cache.get_table().get_default_route()
+
+        self.assertEqual((route.interface_index, route.next_hop, route.metric),
+                         (2, '10.0.0.1', 10))
+
+    def test_get_default_route_none(self):
+        self._get_rows.return_value = self._ROWS[:1]
+
+        self.assertIsNone(self._cache.get_table().get_default_route())
+
+    def test_rows_without_metric(self):
+        self._get_rows.return_value = [('0.0.0.0', '0.0.0.0', '10.0.0.1', 2)]
+
+        route = self._cache.get_table().get_default_route()
+
+        self.assertIsNone(route.metric)
+
+    def test_get_table_cached(self):
+        table = self._cache.get_table()
+        table.has_route('169.254.169.254')
+        self._cache.get_table().get_default_route()
+
+        self.assertIs(self._cache.get_table(), table)
+        self._get_rows.assert_called_once_with()
+
+    def test_invalidate(self):
+        table = self._cache.get_table()
+        self._get_rows.return_value = self._ROWS[1:2]
+
+        self._cache.invalidate()
+
+        self.assertIsNot(self._cache.get_table(), table)
+        self.assertFalse(self._cache.get_table().has_route('10.0.0.0'))
+        self.assertEqual(self._cache.refresh_count, 2)
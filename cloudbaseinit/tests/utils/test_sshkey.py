@@ -0,0 +1,65 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import struct
+import unittest
+
+from cloudbaseinit.utils import sshkey
+
+
+def _build_key(*fields):
+    blob = ''.join(struct.pack('>I', len(f)) + f for f in fields)
+    return 'ssh-rsa %s fake comment' % base64.b64encode(blob)
+
+
+class SSHKeyTest(unittest.TestCase):
+
+    def test_parse_ssh_rsa_public_key(self):
+        key = sshkey.parse_ssh_rsa_public_key(
+            _build_key('ssh-rsa', '\x01\x00\x01', '\x00\xff' * 8))
+        self.assertEqual(key.key_type, 'ssh-rsa')
+        self.assertEqual(key.e, '\x01\x00\x01')
+        self.assertEqual(key.n, '\x00\xff' * 8)
+        self.assertEqual(key.fingerprint, sshkey.get_fingerprint(key.blob))
+
+    def test_parse_ssh_rsa_public_key_no_comment(self):
+        ssh_pub_key = _build_key('ssh-rsa', 'e', 'n').rsplit(' ', 2)[0]
+        key = sshkey.parse_ssh_rsa_public_key(ssh_pub_key)
+        self.assertEqual(key.n, 'n')
+
+    def test_get_fingerprint(self):
+        self.assertEqual(sshkey.get_fingerprint(''),
+                         'd4:1d:8c:d9:8f:00:b2:04:e9:80:09:98:ec:f8:42:7e')
+
+    def _test_parse_invalid_key(self, ssh_pub_key):
+        self.assertRaises(sshkey.InvalidSSHKeyException,
+                          sshkey.parse_ssh_rsa_public_key, ssh_pub_key)
+
+    def test_parse_invalid_prefix(self):
+        self._test_parse_invalid_key('ssh-dss AAAA')
+
+    def test_parse_invalid_base64(self):
+        self._test_parse_invalid_key('ssh-rsa A')
+
+    def test_parse_unsupported_key_type(self):
+        self._test_parse_invalid_key(_build_key('ssh-dss', 'p', 'q', 'g'))
+
+    def test_parse_truncated_key(self):
+        self._test_parse_invalid_key(_build_key('ssh-rsa', 'e', 'n')[:-20])
+
+    def test_parse_extra_fields(self):
+        self._test_parse_invalid_key(_build_key('ssh-rsa', 'e', 'n', 'x'))
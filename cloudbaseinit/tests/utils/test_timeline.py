@@ -0,0 +1,142 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.utils import timeline
+
+CONF = cfg.CONF
+
+
+class BootTimelineTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tmp_dir, 'timeline.json')
+        self._timeline = timeline.BootTimeline(self._path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _read_records(self):
+        with open(self._path, 'rb') as f:
+            return [json.loads(l) for l in f.read().splitlines()]
+
+    def test_record_retry(self):
+        with self._timeline.span(timeline.SPAN_PLUGIN, 'fake plugin'):
+            self._timeline.record_retry('fake request', 1, 0.5,
+                                        IOError('fake error'))
+        self._timeline.record_retry('fake request', 2, 1.0,
+                                    IOError('fake error'))
+
+        [span] = self._timeline.get_spans(timeline.SPAN_PLUGIN)
+        self.assertEqual((span.retries, span.retry_delay), (1, 0.5))
+        self.assertEqual(self._timeline.get_summary()['retries'], 2)
+
+        records = [r for r in self._read_records() if r['event'] == 'retry']
+        self.assertEqual([(r['name'], r['attempt'], r['delay'], r['span'])
+                          for r in records],
+                         [('fake request', 1, 0.5, 'fake plugin'),
+                          ('fake request', 2, 1.0, None)])
+        self.assertEqual(records[0]['error'], 'IOError: fake error')
+
+    def test_span(self):
+        with self._timeline.span(timeline.SPAN_PLUGIN, 'fake plugin') as s:
+            self._timeline.record_metadata_fetch()
+            self._timeline.record_subprocess(0.5)
+            self._timeline.record_subprocess(1.5)
+            s.status = 'done'
+
+        self.assertIsNone(self._timeline.get_current_span())
+        [span] = self._timeline.get_spans(timeline.SPAN_PLUGIN)
+        self.assertEqual(span.metadata_fetches, 1)
+        self.assertEqual(span.subprocesses, 2)
+        self.assertEqual(span.subprocess_time, 2.0)
+        self.assertTrue(span.wall_time >= 0)
+        self.assertTrue(span.cpu_time >= 0)
+
+        [record] = self._read_records()
+        self.assertEqual(record['event'], 'span')
+        self.assertEqual(record['boot_id'], self._timeline.boot_id)
+        self.assertEqual(record['kind'], timeline.SPAN_PLUGIN)
+        self.assertEqual(record['name'], 'fake plugin')
+        self.assertEqual(record['status'], 'done')
+        self.assertEqual(record['metadata_fetches'], 1)
+
+    def test_span_exception(self):
+        def _run():
+            with self._timeline.span(timeline.SPAN_METADATA_PROBE, 'fake'):
+                raise Exception('fake error')
+
+        self.assertRaises(Exception, _run)
+        [span] = self._timeline.get_spans()
+        self.assertEqual(span.status, 'error')
+
+    def test_record_without_span(self):
+        self._timeline.record_metadata_fetch()
+        self._timeline.record_subprocess(1)
+        self.assertEqual(self._timeline.get_spans(), [])
+
+    def test_spans_per_thread(self):
+        def _run(name):
+            with self._timeline.span(timeline.SPAN_PLUGIN, name):
+                self._timeline.record_metadata_fetch()
+
+        with self._timeline.span(timeline.SPAN_PLUGIN, 'main'):
+            thread = threading.Thread(target=_run, args=('thread',))
+            thread.start()
+            thread.join()
+
+        spans = dict((s.name, s) for s in self._timeline.get_spans())
+        self.assertEqual(spans['main'].metadata_fetches, 0)
+        self.assertEqual(spans['thread'].metadata_fetches, 1)
+
+    def test_end(self):
+        with self._timeline.span(timeline.SPAN_METADATA_PROBE, 'service'):
+            pass
+        with self._timeline.span(timeline.SPAN_PLUGIN, 'plugin'):
+            pass
+
+        summary = self._timeline.end()
+
+        self.assertEqual(summary['plugins'].keys(), ['plugin'])
+        records = self._read_records()
+        self.assertEqual([r['event'] for r in records],
+                         ['span', 'span', 'boot'])
+        self.assertEqual(records[-1]['plugins'], summary['plugins'])
+
+    def test_no_path(self):
+        boot_timeline = timeline.BootTimeline()
+        with boot_timeline.span(timeline.SPAN_PLUGIN, 'plugin'):
+            pass
+        boot_timeline.end()
+        self.assertFalse(os.path.exists(self._path))
+
+    @mock.patch('cloudbaseinit.utils.timeline._boot_timeline', None)
+    def test_get_boot_timeline(self):
+        CONF.set_override('boot_timeline_path', self._path)
+        try:
+            boot_timeline = timeline.get_boot_timeline()
+        finally:
+            CONF.clear_override('boot_timeline_path')
+        self.assertEqual(boot_timeline._path, self._path)
+        self.assertIs(timeline.get_boot_timeline(), boot_timeline)
@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import requests
+import unittest
+
+from cloudbaseinit.utils import url_helper
+
+
+class UrlHelperTest(unittest.TestCase):
+    def _get_response(self, status_code, content='fake'):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = content
+        return response
+
+    @mock.patch('time.sleep')
+    @mock.patch('requests.request')
+    def _test_readurl(self, mock_request, mock_sleep, status_codes,
+                      expected_attempts, expected_code=None):
+        mock_request.side_effect = [self._get_response(code) for code in
+                                    status_codes]
+
+        if expected_code:
+            try:
+                url_helper.readurl('http://fake', retries=5, sec_between=2)
+                self.fail('UrlError not raised')
+            except url_helper.UrlError as ex:
+                self.assertEqual(ex.code, expected_code)
+        else:
+            response = url_helper.readurl('http://fake', retries=5,
+                                          sec_between=2)
+            self.assertEqual(response.contents, 'fake')
+
+        self.assertEqual(mock_request.call_count, expected_attempts)
+        for c in mock_sleep.call_args_list:
+            self.assertTrue(2 <= c[0][0] <= url_helper.MAX_SEC_BETWEEN)
+
+    def test_readurl(self):
+        self._test_readurl(status_codes=[200], expected_attempts=1)
+
+    def test_readurl_transient_error(self):
+        self._test_readurl(status_codes=[503, 500, 200], expected_attempts=3)
+
+    def test_readurl_fatal_error(self):
+        self._test_readurl(status_codes=[404], expected_attempts=1,
+                           expected_code=404)
+
+    def test_readurl_too_many_errors(self):
+        self._test_readurl(status_codes=[503] * 6, expected_attempts=6,
+                           expected_code=503)
+
+    @mock.patch('time.sleep')
+    @mock.patch('requests.request')
+    def test_readurl_headers(self, mock_request, mock_sleep):
+        mock_request.return_value = self._get_response(200)
+        url_helper.readurl('http://fake', headers={'If-None-Match': '"1"'})
+        headers = mock_request.call_args[1]['headers']
+        self.assertEqual(headers['If-None-Match'], '"1"')
+        self.assertTrue(headers['User-Agent'].startswith('Cloud-Init/'))
+
+    @mock.patch('time.sleep')
+    @mock.patch('requests.request')
+    def test_wait_for_url(self, mock_request, mock_sleep):
+        mock_request.side_effect = [self._get_response(503),
+                                    self._get_response(200, ''),
+                                    self._get_response(503),
+                                    self._get_response(200)]
+        response = url_helper.wait_for_url(['http://fake/a', 'http://fake/b'],
+                                           max_wait=60)
+        self.assertEqual(response, 'http://fake/b')
+        self.assertEqual(mock_sleep.call_count, 1)
+
+    @mock.patch('time.time')
+    @mock.patch('time.sleep')
+    @mock.patch('requests.request')
+    def test_wait_for_url_timeout(self, mock_request, mock_sleep,
+                                  mock_time):
+        mock_time.side_effect = range(0, 1000, 4)
+        mock_request.return_value = self._get_response(503)
+        response = url_helper.wait_for_url(['http://fake/a'], max_wait=20)
+        self.assertFalse(response)
+        self.assertTrue(0 < mock_sleep.call_count < 5)
+
+    @mock.patch('time.sleep')
+    @mock.patch('requests.request')
+    def test_wait_for_url_no_max_wait(self, mock_request, mock_sleep):
+        mock_request.return_value = self._get_response(503)
+        response = url_helper.wait_for_url(['http://fake/a', 'http://fake/b'])
+        self.assertFalse(response)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertFalse(mock_sleep.called)
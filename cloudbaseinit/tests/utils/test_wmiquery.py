@@ -0,0 +1,126 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import threading
+import unittest
+
+from cloudbaseinit.tests.utils import fake_wmi
+from cloudbaseinit.utils import wmiquery
+
+
+class WMIConnectionTest(unittest.TestCase):
+    _CLASSES = {
+        'Win32_Account': [
+            {'Name': 'Admin', 'SID': 'S-1-5-500', 'Domain': 'fake',
+             'PasswordExpires': False},
+            {'Name': 'O\'Brien', 'SID': 'S-1-5-1001', 'Domain': 'fake',
+             'PasswordExpires': True},
+        ],
+        'Win32_Service': [
+            {'Name': 'WinRM', 'State': 'Running', 'StartMode': 'Auto'},
+        ],
+    }
+
+    def setUp(self):
+        self._wmi = fake_wmi.FakeWMI(self._CLASSES)
+        self._connect = mock.MagicMock(return_value=self._wmi)
+        self._conn = wmiquery.WMIConnection(connect=self._connect,
+                                            cache_ttl=60)
+
+    def test_build_query(self):
+        self.assertEqual(wmiquery.build_query('Win32_Service'),
+                         'SELECT * FROM Win32_Service')
+        self.assertEqual(wmiquery.build_query('Win32_Service',
+                                              ['Name', 'State'],
+                                              'Name = \'WinRM\''),
+                         'SELECT Name, State FROM Win32_Service '
+                         'WHERE Name = \'WinRM\'')
+
+    def test_query(self):
+        response = self._conn.query('Win32_Account',
+                                    where='Name = \'O\'\'Brien\'')
+
+        self.assertEqual([r.SID for r in response], ['S-1-5-1001'])
+        self.assertEqual(response[0].Domain, 'fake')
+        self._connect.assert_called_once_with(wmiquery.DEFAULT_MONIKER)
+
+    def test_query_records(self):
+        response = self._conn.query_records('Win32_Account', ['Name', 'SID'])
+
+        self.assertEqual([(r.Name, r.SID) for r in response],
+                         [('Admin', 'S-1-5-500'), ('O\'Brien', 'S-1-5-1001')])
+        self.assertFalse(hasattr(response[0], 'Domain'))
+        self.assertEqual(self._wmi.queries,
+                         ['SELECT Name, SID FROM Win32_Account'])
+
+    def test_shared_connection(self):
+        for i in range(3):
+            self._conn.query_records('Win32_Service', ['State'])
+
+        self.assertEqual(self._connect.call_count, 1)
+        self.assertEqual(self._conn.connections_opened, 1)
+        self.assertEqual(self._conn.queries_executed, 3)
+
+    def test_connection_per_thread(self):
+        thread = threading.Thread(
+            target=lambda: self._conn.query('Win32_Service'))
+        thread.start()
+        thread.join()
+        self._conn.query('Win32_Service')
+
+        self.assertEqual(self._conn.connections_opened, 2)
+
+    def test_query_records_cached(self):
+        for i in range(3):
+            response = self._conn.query_records(
+                'Win32_Service', ['Name', 'StartMode'], 'Name = \'WinRM\'',
+                cache=True)
+
+        self.assertEqual(response[0].StartMode, 'Auto')
+        self.assertEqual(len(self._wmi.queries), 1)
+
+        # Different projections are different queries
+        self._conn.query_records('Win32_Service', ['State'],
+                                 'Name = \'WinRM\'', cache=True)
+        self.assertEqual(len(self._wmi.queries), 2)
+
+    def test_query_records_cache_expired(self):
+        conn = wmiquery.WMIConnection(connect=self._connect, cache_ttl=0)
+        for i in range(2):
+            conn.query_records('Win32_Service', ['Name'], cache=True)
+
+        self.assertEqual(len(self._wmi.queries), 2)
+
+    def test_invalidate(self):
+        for class_name in ['Win32_Service', 'Win32_Account']:
+            self._conn.query_records(class_name, ['Name'], cache=True)
+
+        self._conn.invalidate('Win32_Account')
+        self._conn.query_records('Win32_Service', ['Name'], cache=True)
+        self._conn.query_records('Win32_Account', ['Name'], cache=True)
+        self.assertEqual(len(self._wmi.queries), 3)
+
+        self._conn.invalidate()
+        self._conn.query_records('Win32_Service', ['Name'], cache=True)
+        self.assertEqual(len(self._wmi.queries), 4)
+
+    @mock.patch('cloudbaseinit.utils.wmiquery._wmi_connection', None)
+    def test_get_wmi_connection(self):
+        conn = wmiquery.get_wmi_connection()
+
+        self.assertIsInstance(conn, wmiquery.WMIConnection)
+        self.assertIs(wmiquery.get_wmi_connection(), conn)
@@ -0,0 +1,289 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.openstack.common import log as logging
+
+opts = [
+    cfg.StrOpt('artifact_cache_path', default=None,
+               help='Local directory where the artifacts downloaded from '
+               'URLs, e.g. by the user data URL download plugin, are '
+               'cached across reboots. Disabled if not set'),
+    cfg.IntOpt('artifact_cache_max_size', default=512 * 1024 * 1024,
+               help='Max. size of the artifact cache in bytes, least '
+               'recently used artifacts are evicted above it'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+_CHUNK_SIZE = 64 * 1024
+# Min. interval between index writes due only to access time updates
+_ACCESS_TIME_SAVE_INTERVAL = 60
+
+
+def _get_file_checksum(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), ''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ArtifactCache(object):
+    '''
+    Content addressed cache of downloaded artifacts.
+
+    Artifacts are stored once per content checksum and indexed by URL,
+    together with the validators (ETag, Last-Modified) needed to revalidate
+    them with conditional requests. The least recently used artifacts are
+    evicted when the total size exceeds max_size. Each artifact is checked
+    against its checksum the first time it is used and discarded if
+    corrupted.
+    '''
+
+    def __init__(self, path, max_size):
+        self._path = path
+        self._objects_dir = os.path.join(path, 'objects')
+        self._index_path = os.path.join(path, 'index.json')
+        self._max_size = max_size
+        self._index = None
+        self._index_save_time = 0
+        self._verified = set()
+        self._lock = threading.RLock()
+
+    def _get_empty_index(self):
+        return {'version': INDEX_FORMAT_VERSION, 'entries': {}}
+
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+
+        self._index = self._get_empty_index()
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, 'rb') as f:
+                    index = json.load(f)
+                if index.get('version') == INDEX_FORMAT_VERSION:
+                    self._index = index
+                else:
+                    LOG.debug('Discarding artifact cache index with '
+                              'unsupported version: %s' %
+                              index.get('version'))
+            except Exception, ex:
+                LOG.debug('Discarding unreadable artifact cache index '
+                          '\'%(path)s\': %(ex)s' %
+                          {'path': self._index_path, 'ex': ex})
+        return self._index
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            json.dump(self._index, f)
+        if os.path.exists(self._index_path):
+            # os.rename does not replace existing files on Windows
+            os.remove(self._index_path)
+        os.rename(tmp_path, self._index_path)
+        self._index_save_time = time.time()
+
+    def _get_object_path(self, checksum):
+        return os.path.join(self._objects_dir, checksum)
+
+    def _get_valid_entry(self, url):
+        entry = self._load_index()['entries'].get(url)
+        if entry and os.path.exists(self._get_object_path(entry['sha256'])):
+            return entry
+
+    def _touch(self, checksum):
+        now = time.time()
+        for entry in self._load_index()['entries'].values():
+            if entry['sha256'] == checksum:
+                entry['last_access'] = now
+        # Access times are otherwise persisted with the next index change
+        if now - self._index_save_time >= _ACCESS_TIME_SAVE_INTERVAL:
+            self._save_index()
+
+    def _verify(self, checksum):
+        if checksum in self._verified:
+            return True
+
+        object_path = self._get_object_path(checksum)
+        if _get_file_checksum(object_path) == checksum:
+            self._verified.add(checksum)
+            return True
+
+        LOG.warning('Discarding corrupted cached artifact: %s' % checksum)
+        entries = self._load_index()['entries']
+        for (url, entry) in entries.items():
+            if entry['sha256'] == checksum:
+                del entries[url]
+        os.remove(object_path)
+        self._save_index()
+        return False
+
+    def get_entry(self, url):
+        '''
+        Returns a dict with the url checksum (sha256), size, content_type,
+        etag and last_modified values, or None if url is not cached.
+        '''
+        with self._lock:
+            entry = self._get_valid_entry(url)
+            if entry:
+                return dict(entry)
+
+    def get_path(self, url=None, checksum=None):
+        '''
+        Returns the path of the cached content of url, or of the content
+        with the given sha256 checksum if provided. The content is marked as
+        recently used. Returns None if not cached or corrupted.
+        '''
+        with self._lock:
+            if not checksum:
+                entry = self._get_valid_entry(url)
+                if not entry:
+                    return None
+                checksum = entry['sha256']
+
+            checksum = checksum.lower()
+            path = self._get_object_path(checksum)
+            if not os.path.exists(path) or not self._verify(checksum):
+                return None
+            self._touch(checksum)
+            return path
+
+    def get_conditional_headers(self, url):
+        headers = {}
+        entry = self.get_entry(url)
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def add_file(self, url, path, content_type=None, etag=None,
+                 last_modified=None):
+        '''
+        Copies the file at path into the cache as the content of url and
+        returns the path of the cached copy.
+        '''
+        checksum = _get_file_checksum(path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            object_path = self._get_object_path(checksum)
+            if os.path.exists(object_path):
+                # A corrupted copy is discarded and replaced
+                self._verify(checksum)
+            if not os.path.exists(object_path):
+                if not os.path.exists(self._objects_dir):
+                    os.makedirs(self._objects_dir)
+                (fd, tmp_path) = tempfile.mkstemp(dir=self._objects_dir)
+                os.close(fd)
+                shutil.copyfile(path, tmp_path)
+                os.rename(tmp_path, object_path)
+                self._verified.add(checksum)
+
+            self._load_index()['entries'][url] = {
+                'sha256': checksum,
+                'size': size,
+                'content_type': content_type,
+                'etag': etag,
+                'last_modified': last_modified,
+                'last_access': time.time()}
+            self._evict(keep_checksum=checksum)
+            self._save_index()
+            return object_path
+
+    def add_data(self, url, data, content_type=None, etag=None,
+                 last_modified=None):
+        if not os.path.exists(self._path):
+            os.makedirs(self._path)
+        (fd, tmp_path) = tempfile.mkstemp(dir=self._path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            return self.add_file(url, tmp_path, content_type, etag,
+                                 last_modified)
+        finally:
+            os.remove(tmp_path)
+
+    def read(self, url):
+        path = self.get_path(url)
+        if path:
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def _evict(self, keep_checksum=None):
+        entries = self._load_index()['entries']
+
+        objects = {}
+        for (url, entry) in entries.items():
+            (size, last_access, urls) = objects.get(entry['sha256'],
+                                                    (0, 0, []))
+            objects[entry['sha256']] = (entry['size'],
+                                        max(last_access,
+                                            entry['last_access']),
+                                        urls + [url])
+
+        total_size = sum(size for (size, last_access, urls) in
+                         objects.values())
+        lru_objects = sorted(objects.items(), key=lambda item: item[1][1])
+        for (checksum, (size, last_access, urls)) in lru_objects:
+            if total_size <= self._max_size:
+                break
+            if checksum == keep_checksum:
+                continue
+
+            LOG.debug('Evicting cached artifact: %s' % checksum)
+            for url in urls:
+                del entries[url]
+            object_path = self._get_object_path(checksum)
+            if os.path.exists(object_path):
+                os.remove(object_path)
+            total_size -= size
+
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+
+def get_artifact_cache():
+    '''
+    Returns the shared ArtifactCache, or None if not enabled.
+    '''
+    global _artifact_cache
+
+    if not CONF.artifact_cache_path:
+        return None
+    with _artifact_cache_lock:
+        if (not _artifact_cache or
+                _artifact_cache._path != CONF.artifact_cache_path):
+            _artifact_cache = ArtifactCache(CONF.artifact_cache_path,
+                                            CONF.artifact_cache_max_size)
+        return _artifact_cache
@@ -0,0 +1,189 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import binascii
+import bz2
+import re
+import zlib
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+GZIP = 'gzip'
+BZIP2 = 'bzip2'
+BASE64 = 'base64'
+
+COMPRESSED_CONTENT_TYPES = ['application/gzip', 'application/x-gzip',
+                            'application/x-bzip', 'application/x-bzip2']
+COMPRESSION_ENCODINGS = ['gzip', 'x-gzip', 'bzip2', 'x-bzip2']
+
+MAGIC_SIZE = 16
+
+_GZIP_MAGIC = '\x1f\x8b'
+_BZIP2_MAGIC_RE = re.compile('^BZh[1-9]')
+_BASE64_PREFIX_RE = re.compile('^[A-Za-z0-9+/]{8}')
+
+_CHUNK_SIZE = 64 * 1024
+_MAX_NESTING = 4
+
+
+def get_compression(data):
+    '''
+    Returns the compression of data by looking at its first MAGIC_SIZE
+    bytes. Base64 is detected only when wrapping gzip or bzip2 content.
+    '''
+    if data.startswith(_GZIP_MAGIC):
+        return GZIP
+    elif _BZIP2_MAGIC_RE.match(data):
+        return BZIP2
+
+    prefix = ''.join(data.split())
+    if _BASE64_PREFIX_RE.match(prefix):
+        decoded = binascii.a2b_base64(prefix[:8])
+        if get_compression(decoded) in [GZIP, BZIP2]:
+            return BASE64
+
+
+class _StreamReader(object):
+    '''
+    Read only file-like object, decoding the content of f in chunks.
+    '''
+
+    def __init__(self, f):
+        self._f = f
+        self._buf = ''
+        self._eof = False
+
+    def _decode(self, data):
+        return data
+
+    def _flush(self):
+        return ''
+
+    def _fill(self, size):
+        chunks = [self._buf]
+        buf_size = len(self._buf)
+        while not self._eof and (size < 0 or buf_size < size):
+            data = self._f.read(_CHUNK_SIZE)
+            if data:
+                data = self._decode(data)
+            else:
+                data = self._flush()
+                self._eof = True
+            chunks.append(data)
+            buf_size += len(data)
+        self._buf = ''.join(chunks)
+
+    def _take(self, size):
+        data = self._buf[:size]
+        self._buf = self._buf[size:]
+        return data
+
+    def peek(self, size):
+        self._fill(size)
+        return self._buf[:size]
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            size = len(self._buf)
+        return self._take(size)
+
+    def readline(self, size=-1):
+        start = 0
+        while True:
+            i = self._buf.find('\n', start)
+            if i >= 0 and (size < 0 or i < size):
+                return self._take(i + 1)
+            if (size >= 0 and len(self._buf) >= size) or self._eof:
+                return self._take(size if size >= 0 else len(self._buf))
+            start = len(self._buf)
+            self._fill(start + 1)
+
+    def close(self):
+        self._f.close()
+
+
+class _GzipReader(_StreamReader):
+    def __init__(self, f):
+        super(_GzipReader, self).__init__(f)
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _decode(self, data):
+        output = self._decompressor.decompress(data)
+        # Concatenated gzip members
+        while self._decompressor.unused_data:
+            data = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            output += self._decompressor.decompress(data)
+        return output
+
+    def _flush(self):
+        return self._decompressor.flush()
+
+
+class _Bzip2Reader(_StreamReader):
+    def __init__(self, f):
+        super(_Bzip2Reader, self).__init__(f)
+        self._decompressor = bz2.BZ2Decompressor()
+
+    def _decode(self, data):
+        output = self._decompressor.decompress(data)
+        # Concatenated bzip2 streams
+        while self._decompressor.unused_data:
+            data = self._decompressor.unused_data
+            self._decompressor = bz2.BZ2Decompressor()
+            output += self._decompressor.decompress(data)
+        return output
+
+
+class _Base64Reader(_StreamReader):
+    def __init__(self, f):
+        super(_Base64Reader, self).__init__(f)
+        self._encoded = ''
+
+    def _decode(self, data):
+        self._encoded += ''.join(data.split())
+        size = len(self._encoded) // 4 * 4
+        output = binascii.a2b_base64(self._encoded[:size])
+        self._encoded = self._encoded[size:]
+        return output
+
+    def _flush(self):
+        if not self._encoded:
+            return ''
+        return binascii.a2b_base64(self._encoded +
+                                   '=' * (-len(self._encoded) % 4))
+
+
+_READERS = {GZIP: _GzipReader, BZIP2: _Bzip2Reader, BASE64: _Base64Reader}
+
+
+def get_decompressed_stream(f):
+    '''
+    Returns a file-like object reading the content of f, decompressed on
+    the fly if compressed with gzip or bzip2, possibly base64 wrapped.
+    The returned object supports peek() for content type detection.
+    '''
+    stream = _StreamReader(f)
+    for i in range(_MAX_NESTING):
+        compression = get_compression(stream.peek(MAGIC_SIZE))
+        if not compression:
+            break
+        LOG.debug('Decompressing %s content' % compression)
+        stream = _READERS[compression](stream)
+    return stream
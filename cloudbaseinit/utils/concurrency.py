@@ -0,0 +1,65 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import Queue
+import threading
+
+
+def map_concurrently(func, items, max_workers):
+    '''
+    Calls func for each item using at most max_workers threads.
+
+    Returns a list of (result, exception) tuples in the same order as items,
+    where exception is None if the call succeeded.
+    '''
+    items = list(items)
+    results = [None] * len(items)
+
+    if max_workers <= 1 or len(items) <= 1:
+        for i, item in enumerate(items):
+            results[i] = _call(func, item)
+        return results
+
+    work_queue = Queue.Queue()
+    for i, item in enumerate(items):
+        work_queue.put((i, item))
+
+    def _worker():
+        while True:
+            try:
+                (i, item) = work_queue.get_nowait()
+            except Queue.Empty:
+                return
+            results[i] = _call(func, item)
+
+    threads = []
+    for i in range(min(max_workers, len(items))):
+        thread = threading.Thread(target=_worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def _call(func, item):
+    try:
+        return (func(item), None)
+    except Exception, ex:
+        return (None, ex)
@@ -14,12 +14,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import base64
+import contextlib
 import ctypes
 import ctypes.util
-import struct
 import sys
 
+from cloudbaseinit.utils import keycache
+from cloudbaseinit.utils import sshkey
+
 if sys.platform == "win32":
     openssl_lib_path = "libeay32.dll"
 else:
@@ -109,8 +111,10 @@ class OpenSSLException(CryptException):
 
 
 class RSAWrapper(object):
-    def __init__(self, rsa_p):
+    def __init__(self, rsa_p, owned=True):
         self._rsa_p = rsa_p
+        # Handles which are not owned, e.g. cached, are not freed
+        self._owned = owned
 
     def __enter__(self):
         return self
@@ -119,9 +123,14 @@ class RSAWrapper(object):
         self.free()
 
     def free(self):
-        openssl.RSA_free(self._rsa_p)
+        if self._rsa_p and self._owned:
+            openssl.RSA_free(self._rsa_p)
+        self._rsa_p = None
 
     def public_encrypt(self, clear_text):
+        if not self._rsa_p:
+            raise CryptException('The RSA key has been freed')
+
         flen = len(clear_text)
         rsa_size = openssl.RSA_size(self._rsa_p)
         enc_text = ctypes.create_string_buffer(rsa_size)
@@ -138,61 +147,63 @@ class RSAWrapper(object):
 
 
 class CryptManager(object):
-    def load_ssh_rsa_public_key(self, ssh_pub_key):
-        ssh_rsa_prefix = "ssh-rsa "
-
-        if not ssh_pub_key.startswith(ssh_rsa_prefix):
-            raise CryptException('Invalid SSH key')
-
-        s = ssh_pub_key[len(ssh_rsa_prefix):]
-        idx = s.find(' ')
-        if idx >= 0:
-            b64_pub_key = s[:idx]
-        else:
-            b64_pub_key = s
-
-        pub_key = base64.b64decode(b64_pub_key)
-
-        offset = 0
-
-        key_type_len = struct.unpack('>I', pub_key[offset:offset + 4])[0]
-        offset += 4
-
-        key_type = pub_key[offset:offset + key_type_len]
-        offset += key_type_len
-
-        if not key_type in ['ssh-rsa', 'rsa', 'rsa1']:
-            raise CryptException('Unsupported SSH key type "%s". '
-                                 'Only RSA keys are currently supported'
-                                 % key_type)
+    # Loaded keys are shared by all the instances
+    _key_cache = keycache.KeyCache(lambda key: CryptManager._new_rsa(key),
+                                   openssl.RSA_free)
 
+    @staticmethod
+    def _new_rsa(key):
         rsa_p = openssl.RSA_new()
         try:
             rsa_p.contents.e = openssl.BN_new()
             rsa_p.contents.n = openssl.BN_new()
 
-            e_len = struct.unpack('>I', pub_key[offset:offset + 4])[0]
-            offset += 4
-
-            e_key_bin = pub_key[offset:offset + e_len]
-            offset += e_len
-
-            if not openssl.BN_bin2bn(e_key_bin, e_len, rsa_p.contents.e):
+            if not openssl.BN_bin2bn(key.e, len(key.e), rsa_p.contents.e):
                 raise OpenSSLException()
 
-            n_len = struct.unpack('>I', pub_key[offset:offset + 4])[0]
-            offset += 4
-
-            n_key_bin = pub_key[offset:offset + n_len]
-            offset += n_len
-
-            if offset != len(pub_key):
-                raise CryptException('Invalid SSH key')
-
-            if not openssl.BN_bin2bn(n_key_bin, n_len, rsa_p.contents.n):
+            if not openssl.BN_bin2bn(key.n, len(key.n), rsa_p.contents.n):
                 raise OpenSSLException()
 
-            return RSAWrapper(rsa_p)
+            return rsa_p
         except:
             openssl.RSA_free(rsa_p)
             raise
+
+    def _parse_ssh_rsa_public_key(self, ssh_pub_key):
+        try:
+            return sshkey.parse_ssh_rsa_public_key(ssh_pub_key)
+        except sshkey.InvalidSSHKeyException, ex:
+            raise CryptException(str(ex))
+
+    def load_ssh_rsa_public_key(self, ssh_pub_key):
+        '''
+        Returns a new RSAWrapper, to be freed by the caller.
+        '''
+        key = self._parse_ssh_rsa_public_key(ssh_pub_key)
+        return RSAWrapper(self._new_rsa(key))
+
+    @contextlib.contextmanager
+    def get_ssh_rsa_public_key(self, ssh_pub_key):
+        '''
+        Yields an RSAWrapper from the key cache, which must not be freed
+        by the caller.
+        '''
+        key = self._parse_ssh_rsa_public_key(ssh_pub_key)
+        with self._key_cache.get(key.fingerprint, key) as rsa_p:
+            rsa = RSAWrapper(rsa_p, owned=False)
+            try:
+                yield rsa
+            finally:
+                # The handle cannot be used once released
+                rsa.free()
+
+    def encrypt_many(self, ssh_pub_key, clear_texts):
+        with self.get_ssh_rsa_public_key(ssh_pub_key) as rsa:
+            return [rsa.public_encrypt(t) for t in clear_texts]
+
+    def public_encrypt(self, ssh_pub_key, clear_text):
+        return self.encrypt_many(ssh_pub_key, [clear_text])[0]
+
+    @classmethod
+    def clear_key_cache(cls):
+        cls._key_cache.clear()
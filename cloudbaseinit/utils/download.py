@@ -0,0 +1,222 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import httplib
+import os
+import re
+import socket
+import urlparse
+
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import httpclient
+from cloudbaseinit.utils import retry
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+_REDIRECT_STATUSES = (301, 302, 303, 307)
+
+_CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-\d+/(\d+|\*)$')
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ChecksumMismatchError(DownloadError):
+    pass
+
+
+class NotModified(Exception):
+    '''
+    Raised when a conditional request is answered with 304 Not Modified.
+    '''
+
+    def __init__(self, url, headers):
+        super(NotModified, self).__init__('Not modified: %s' % url)
+        self.headers = headers
+
+
+def split_checksum(url):
+    '''
+    Returns a tuple with the url without fragment and the sha256 hex digest
+    given in a "#sha256=<digest>" fragment, or None.
+    '''
+    (url, fragment) = urlparse.urldefrag(url)
+    for param in fragment.split('&'):
+        (name, sep, value) = param.partition('=')
+        if name.lower() == 'sha256' and value:
+            return (url, value.lower())
+    return (url, None)
+
+
+def _is_transient_error(ex):
+    if isinstance(ex, httpclient.HTTPError):
+        return ex.code >= 500 or ex.code == 408
+    return isinstance(ex, (socket.error, httplib.HTTPException,
+                           DownloadError))
+
+
+class _Download(object):
+    def __init__(self, f, chunk_size):
+        self._f = f
+        self._chunk_size = chunk_size
+        self.hash = hashlib.sha256()
+        self.size = 0
+        # Host which served the content downloaded so far
+        self.netloc = None
+
+    def restart(self):
+        self._f.seek(0)
+        self._f.truncate()
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.netloc = None
+
+    def write_from(self, response):
+        while True:
+            chunk = response.read(self._chunk_size)
+            if not chunk:
+                break
+            self._f.write(chunk)
+            self.hash.update(chunk)
+            self.size += len(chunk)
+
+
+def _get_range_start(response):
+    match = _CONTENT_RANGE_RE.match(response.headers.get('content-range', ''))
+    if match:
+        return int(match.group(1))
+
+
+def _download_http(pool, url, download, timeout, request_headers):
+    redirects = 0
+    while True:
+        netloc = urlparse.urlparse(url).netloc
+        if download.size and download.netloc != netloc:
+            # A range of the content served by another host is not
+            # necessarily consistent with the data already received
+            LOG.debug('Download of %s redirected to a different host, '
+                      'restarting' % url)
+            download.restart()
+
+        headers = dict(request_headers or {})
+        if download.size:
+            headers['Range'] = 'bytes=%d-' % download.size
+
+        with pool.urlopen('GET', url, headers=headers,
+                          timeout=timeout) as response:
+            if response.status not in _REDIRECT_STATUSES:
+                return _write_http_response(url, response, download)
+
+            location = response.headers.get('location')
+            if not location or redirects >= MAX_REDIRECTS:
+                raise httpclient.HTTPError(url, response.status,
+                                           response.reason,
+                                           response.headers)
+            redirects += 1
+            LOG.debug('Download of %(url)s redirected to %(location)s' %
+                      {'url': url, 'location': location})
+            url = urlparse.urljoin(url, location)
+
+
+def _write_http_response(url, response, download):
+    if response.status == 206:
+        if _get_range_start(response) != download.size:
+            download.restart()
+            raise DownloadError('Unexpected content range for %s: %s' %
+                                (url, response.headers.get('content-range')))
+        expected_size = int(response.headers.get('content-length', -1))
+        if expected_size >= 0:
+            expected_size += download.size
+    elif response.status == 304:
+        raise NotModified(url, response.headers)
+    elif response.status == 200:
+        if download.size:
+            LOG.debug('Range requests not supported by the server, '
+                      'restarting the download of %s' % url)
+            download.restart()
+        expected_size = int(response.headers.get('content-length', -1))
+    else:
+        raise httpclient.HTTPError(url, response.status, response.reason,
+                                   response.headers)
+
+    download.netloc = urlparse.urlparse(url).netloc
+    download.write_from(response)
+
+    if expected_size >= 0 and download.size < expected_size:
+        raise DownloadError('Incomplete download of %(url)s: %(size)d of '
+                            '%(expected)d bytes' %
+                            {'url': url, 'size': download.size,
+                             'expected': expected_size})
+    return response.headers
+
+
+def download_file(pool, url, path, expected_sha256=None, retries=3,
+                  timeout=None, sec_between=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                  headers=None, max_total_delay=None):
+    '''
+    Downloads url to path in chunks of chunk_size bytes, using connections
+    from the given httpclient.HTTPConnectionPool.
+
+    Transient errors are retried up to retries times with a
+    retry.RetryPolicy, waiting at least sec_between seconds and at most
+    max_total_delay seconds in total, resuming from the last received byte
+    with a Range request when supported by the server.
+    HTTP redirects are followed up to MAX_REDIRECTS times, the download is
+    restarted if the content received so far was served by another host.
+    If expected_sha256 is provided, ChecksumMismatchError is raised and the
+    file removed if the digest of the downloaded content does not match.
+
+    Additional request headers can be passed in headers, e.g. for
+    conditional requests, in which case NotModified is raised if the
+    server replies with a 304 status. Returns the headers of the last
+    HTTP response.
+    '''
+    parsed_url = urlparse.urlparse(url)
+    request_headers = headers
+    headers = {}
+
+    with open(path, 'wb') as f:
+        download = _Download(f, chunk_size)
+        if parsed_url.scheme == 'file' or not parsed_url.scheme:
+            with open(parsed_url.path or url, 'rb') as source:
+                download.write_from(source)
+        else:
+            policy = retry.RetryPolicy("Download of '%s'" % url,
+                                       max_attempts=retries + 1,
+                                       base_delay=sec_between,
+                                       max_total_delay=max_total_delay,
+                                       is_retryable=_is_transient_error)
+            try:
+                headers = policy.execute(
+                    lambda: _download_http(pool, url, download, timeout,
+                                           request_headers))
+            except NotModified:
+                f.close()
+                os.remove(path)
+                raise
+
+    if expected_sha256 and download.hash.hexdigest() != expected_sha256:
+        os.remove(path)
+        raise ChecksumMismatchError(
+            'SHA256 mismatch for %(url)s: expected %(expected)s, got '
+            '%(actual)s' % {'url': url, 'expected': expected_sha256,
+                            'actual': download.hash.hexdigest()})
+    return headers
@@ -4,9 +4,13 @@ import os
 import os.path
 import errno
 import hashlib
+import tarfile
+import zipfile
 from zipfile import ZipFile as ZipFile
 
 from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import artifactcache
+from cloudbaseinit.utils import download
 from cloudbaseinit.utils import url_helper
 
 LOG = logging.getLogger(__name__)
@@ -36,6 +40,7 @@ def write_file(filename, content, mode=0644, omode="wb"):
 def ensure_dir(path, mode=None):
     if not os.path.isdir(path):
         # Make the dir and adjust the mode
+        os.makedirs(path)
         chmod(path, mode)
     else:
         # Just adjust the mode
@@ -77,6 +82,16 @@ def read_file_or_url(url, timeout=5, retries=10,
             LOG.warn("Unable to post data to file resource %s", url)
         file_path = url[len("file://"):]
         return FileResponse(file_path, contents=load_file(file_path))
+
+    cache = artifactcache.get_artifact_cache()
+    if cache and not data:
+        return _read_url_cached(cache, url,
+                                timeout=timeout,
+                                retries=retries,
+                                headers=headers,
+                                headers_cb=headers_cb,
+                                sec_between=sec_between,
+                                ssl_details=ssl_details)
     else:
         return url_helper.readurl(url,
                                   timeout=timeout,
@@ -87,6 +102,58 @@ def read_file_or_url(url, timeout=5, retries=10,
                                   sec_between=sec_between,
                                   ssl_details=ssl_details)
 
+
+def _read_url_cached(cache, url, headers=None, headers_cb=None, **kwargs):
+    # An explicit checksum identifies the content without any request
+    (url, checksum) = download.split_checksum(url)
+    if checksum:
+        path = cache.get_path(checksum=checksum)
+        if path:
+            LOG.debug("Using cached content of %s", url)
+            return FileResponse(path, contents=load_file(path))
+        # The content cached for the url, if any, has another checksum
+        conditional_headers = {}
+    else:
+        conditional_headers = cache.get_conditional_headers(url)
+    if headers_cb:
+        def _headers_cb(url):
+            return dict(headers_cb(url), **conditional_headers)
+        request_headers_cb = _headers_cb
+        request_headers = headers
+    else:
+        request_headers_cb = None
+        request_headers = dict(headers or {}, **conditional_headers)
+
+    resp = url_helper.readurl(url, headers=request_headers,
+                              headers_cb=request_headers_cb, **kwargs)
+    if resp.code == 304:
+        entry = cache.get_entry(url)
+        contents = cache.read(url)
+        if entry and contents is not None:
+            LOG.debug("Content of %s not modified, using cache", url)
+            response = StringResponse(contents)
+            response.url = url
+            response.headers = {'content-type': entry['content_type']}
+            return response
+        # Evicted in the meantime
+        resp = url_helper.readurl(url, headers=headers,
+                                  headers_cb=headers_cb, **kwargs)
+
+    if resp.ok():
+        if checksum:
+            actual_checksum = hashlib.sha256(resp.contents).hexdigest()
+            if actual_checksum != checksum:
+                raise download.ChecksumMismatchError(
+                    'SHA256 mismatch for %(url)s: expected %(expected)s, '
+                    'got %(actual)s' % {'url': url, 'expected': checksum,
+                                        'actual': actual_checksum})
+        cache.add_data(url, resp.contents,
+                       content_type=resp.headers.get('content-type'),
+                       etag=resp.headers.get('etag'),
+                       last_modified=resp.headers.get('last-modified'))
+    return resp
+
+
 def load_file(fname, read_cb=None, quiet=False):
     LOG.debug("Reading from %s (quiet=%s)", fname, quiet)
     ofh = StringIO()
@@ -136,6 +203,41 @@ def hash_blob(blob, routine, mlen=None):
     else:
         return digest
 
+def _check_archive_member(dest_dir, name):
+    dest_dir = os.path.realpath(dest_dir or os.curdir)
+    path = os.path.realpath(os.path.join(dest_dir, name))
+    if path != dest_dir and not path.startswith(os.path.join(dest_dir, '')):
+        raise ValueError('Archive member outside of the destination '
+                         'directory: %s' % name)
+
+
 def unzip_archive(source_filename, dest_dir=None):
      with ZipFile(source_filename) as zf:
-        zf.extractall(dest_dir)
\ No newline at end of file
+        for name in zf.namelist():
+            _check_archive_member(dest_dir, name)
+        zf.extractall(dest_dir)
+
+
+def extract_archive(source_filename, dest_dir=None):
+    '''
+    Extracts a zip or tar archive to dest_dir. ValueError is raised if any
+    member, or link target, would be extracted outside of dest_dir.
+    '''
+    if zipfile.is_zipfile(source_filename):
+        unzip_archive(source_filename, dest_dir)
+    elif tarfile.is_tarfile(source_filename):
+        # Compressed tar archives are detected by tarfile
+        tf = tarfile.open(source_filename)
+        try:
+            for member in tf.getmembers():
+                _check_archive_member(dest_dir, member.name)
+                if member.issym():
+                    _check_archive_member(dest_dir, os.path.join(
+                        os.path.dirname(member.name), member.linkname))
+                elif member.islnk():
+                    _check_archive_member(dest_dir, member.linkname)
+            tf.extractall(dest_dir)
+        finally:
+            tf.close()
+    else:
+        raise ValueError('Unsupported archive format: %s' % source_filename)
\ No newline at end of file
@@ -0,0 +1,205 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import httplib
+import socket
+import threading
+import urlparse
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Methods that can be safely sent again on a fresh connection in case a
+# pooled connection has been closed by the server in the meantime
+IDEMPOTENT_METHODS = ['GET', 'HEAD']
+
+
+class HTTPError(Exception):
+    def __init__(self, url, code, reason, headers=None):
+        super(HTTPError, self).__init__('HTTP Error %(code)s: %(reason)s '
+                                        '(%(url)s)' % locals())
+        self.url = url
+        self.code = code
+        self.reason = reason
+        self.headers = headers or {}
+
+
+class HTTPResponse(object):
+    def __init__(self, url, status, reason, headers, data):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+
+
+class HTTPStreamResponse(object):
+    '''
+    HTTP response whose body is read incrementally. The connection goes
+    back to the pool when the response is closed, if fully read.
+    '''
+
+    def __init__(self, url, response, release_cb):
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = dict(response.getheaders())
+        self._response = response
+        self._release_cb = release_cb
+
+    def read(self, size=None):
+        if size is None:
+            return self._response.read()
+        return self._response.read(size)
+
+    def close(self):
+        if self._release_cb:
+            release_cb = self._release_cb
+            self._release_cb = None
+            release_cb()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HTTPConnectionPool(object):
+    '''
+    Thread safe pool of persistent HTTP/1.1 connections.
+
+    Connections are kept open after each request, unless the server asks
+    otherwise, and reused by subsequent requests to the same host.
+    '''
+
+    def __init__(self, maxsize=4, timeout=None):
+        self._maxsize = maxsize
+        self._timeout = timeout
+        self._idle_connections = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.requests_served = 0
+
+    def _get_connection_key(self, url):
+        parsed_url = urlparse.urlparse(url)
+        scheme = parsed_url.scheme.lower()
+        if scheme not in ['http', 'https']:
+            raise ValueError('Unsupported URL scheme: %s' % scheme)
+        return (scheme, parsed_url.netloc.lower())
+
+    def _new_connection(self, key, timeout):
+        (scheme, netloc) = key
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            conn = httplib.HTTPConnection(netloc, timeout=timeout)
+        with self._lock:
+            self.connections_opened += 1
+        LOG.debug('Opening new HTTP connection to: %s' % netloc)
+        return conn
+
+    def _get_connection(self, key, timeout):
+        with self._lock:
+            connections = self._idle_connections.get(key)
+            if connections:
+                conn = connections.pop()
+            else:
+                conn = None
+
+        if not conn:
+            return (self._new_connection(key, timeout), False)
+
+        conn.timeout = timeout
+        if conn.sock:
+            try:
+                conn.sock.settimeout(timeout)
+            except socket.error:
+                conn.close()
+                return (self._new_connection(key, timeout), False)
+        return (conn, True)
+
+    def _release_connection(self, key, conn):
+        with self._lock:
+            connections = self._idle_connections.setdefault(key, [])
+            if len(connections) < self._maxsize:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def _get_path(self, url):
+        parsed_url = urlparse.urlparse(url)
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path += '?' + parsed_url.query
+        return path
+
+    def _release_response(self, key, conn, response):
+        # Connections with unread data cannot be reused
+        if response.isclosed() and not response.will_close:
+            self._release_connection(key, conn)
+        else:
+            conn.close()
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        '''
+        Sends a request and returns a HTTPStreamResponse once the response
+        headers are received. The response must be closed by the caller.
+        '''
+        if timeout is None:
+            timeout = self._timeout
+        key = self._get_connection_key(url)
+        path = self._get_path(url)
+
+        (conn, reused) = self._get_connection(key, timeout)
+        while True:
+            try:
+                conn.request(method, path, body, headers or {})
+                response = conn.getresponse()
+                break
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if reused and method in IDEMPOTENT_METHODS:
+                    # The server closed the idle connection, try again
+                    # on a new one
+                    LOG.debug('Pooled HTTP connection to %s is not usable '
+                              'anymore, retrying' % key[1])
+                    conn = self._new_connection(key, timeout)
+                    reused = False
+                else:
+                    raise
+
+        with self._lock:
+            self.requests_served += 1
+
+        return HTTPStreamResponse(
+            url, response,
+            lambda: self._release_response(key, conn, response))
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        with self.urlopen(method, url, body, headers, timeout) as response:
+            data = response.read()
+        return HTTPResponse(url, response.status, response.reason,
+                            response.headers, data)
+
+    def close(self):
+        with self._lock:
+            idle_connections = self._idle_connections
+            self._idle_connections = {}
+        for connections in idle_connections.values():
+            for conn in connections:
+                conn.close()
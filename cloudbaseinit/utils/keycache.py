@@ -0,0 +1,90 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import contextlib
+import threading
+
+
+class KeyCache(object):
+    '''
+    Keeps up to max_size native key handles, loaded by load(key_data) and
+    keyed by fingerprint, in least recently used order.
+
+    Handles are released with free(handle) as soon as they are evicted or
+    the cache is cleared, but never while they are still in use.
+    '''
+
+    def __init__(self, load, free, max_size=8):
+        self._load = load
+        self._free = free
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        # Handles evicted while in use, freed on their last release
+        self._evicted = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def _acquire(self, fingerprint, key_data):
+        with self._lock:
+            entry = self._entries.pop(fingerprint, None)
+            if entry:
+                self.hits += 1
+                self._entries[fingerprint] = entry
+                entry[1] += 1
+                return entry
+
+        # Keys are loaded without holding the lock
+        entry = [self._load(key_data), 1]
+        with self._lock:
+            self.loads += 1
+            existing = self._entries.pop(fingerprint, None)
+            if existing:
+                # Loaded in the meantime by another thread
+                self._evict(existing)
+            self._entries[fingerprint] = entry
+            while len(self._entries) > self.max_size:
+                self._evict(self._entries.popitem(last=False)[1])
+            return entry
+
+    def _evict(self, entry):
+        if entry[1]:
+            self._evicted[id(entry)] = entry
+        else:
+            self._free(entry[0])
+
+    def _release(self, entry):
+        with self._lock:
+            entry[1] -= 1
+            if not entry[1] and self._evicted.pop(id(entry), None):
+                self._free(entry[0])
+
+    @contextlib.contextmanager
+    def get(self, fingerprint, key_data):
+        entry = self._acquire(fingerprint, key_data)
+        try:
+            yield entry[0]
+        finally:
+            self._release(entry)
+
+    def clear(self):
+        with self._lock:
+            while self._entries:
+                self._evict(self._entries.popitem()[1])
+
+    def __len__(self):
+        return len(self._entries)
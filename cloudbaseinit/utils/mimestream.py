@@ -0,0 +1,307 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import binascii
+import email
+import quopri
+import shutil
+import tempfile
+
+from cloudbaseinit.utils import compression
+
+DEFAULT_SPOOL_THRESHOLD = 1024 * 1024
+
+# Lines longer than this are read in chunks, e.g. base64 without line breaks
+_LINE_CHUNK_SIZE = 64 * 1024
+
+
+class MIMEPart(object):
+    '''
+    A MIME entity with its decoded payload, kept in memory up to a size
+    threshold and spooled to a temporary file above it. Multipart entities
+    have no payload, their parts are returned separately by iter_parts.
+    '''
+
+    def __init__(self, headers, payload=None):
+        self._headers = headers
+        self._payload = payload
+
+    def get(self, name, failobj=None):
+        return self._headers.get(name, failobj)
+
+    def get_content_type(self):
+        return self._headers.get_content_type()
+
+    def get_filename(self):
+        return self._headers.get_filename()
+
+    def is_multipart(self):
+        return self._headers.get_content_maintype() == 'multipart'
+
+    def get_payload(self):
+        if not self._payload:
+            return ''
+        self._payload.seek(0)
+        return self._payload.read()
+
+    def copy_payload(self, f):
+        if self._payload:
+            self._payload.seek(0)
+            shutil.copyfileobj(self._payload, f)
+
+    def close(self):
+        if self._payload:
+            self._payload.close()
+            self._payload = None
+
+
+class _LineReader(object):
+    def __init__(self, f):
+        self._f = f
+        self._at_line_start = True
+        self._pushback = None
+
+    def readline(self):
+        '''
+        Returns a tuple with the next line, or chunk of a long line, and a
+        flag telling if it starts at the beginning of a line.
+        '''
+        if self._pushback:
+            item = self._pushback
+            self._pushback = None
+            return item
+        line = self._f.readline(_LINE_CHUNK_SIZE)
+        item = (line, self._at_line_start)
+        self._at_line_start = line.endswith('\n')
+        return item
+
+    def unreadline(self, item):
+        self._pushback = item
+
+
+class _Base64Writer(object):
+    def __init__(self, f):
+        self._f = f
+        self._buf = ''
+
+    def write(self, data):
+        self._buf += ''.join(data.split())
+        size = len(self._buf) // 4 * 4
+        if size:
+            self._f.write(binascii.a2b_base64(self._buf[:size]))
+            self._buf = self._buf[size:]
+
+    def close(self):
+        if self._buf:
+            try:
+                self._f.write(binascii.a2b_base64(
+                    self._buf + '=' * (-len(self._buf) % 4)))
+            except binascii.Error:
+                pass
+            self._buf = ''
+
+
+class _QuotedPrintableWriter(object):
+    def __init__(self, f):
+        self._f = f
+        self._buf = ''
+
+    def write(self, data):
+        self._buf += data
+        # Soft line breaks are decoded only with complete lines
+        i = self._buf.rfind('\n')
+        if i >= 0:
+            self._f.write(quopri.decodestring(self._buf[:i + 1]))
+            self._buf = self._buf[i + 1:]
+
+    def close(self):
+        if self._buf:
+            self._f.write(quopri.decodestring(self._buf))
+            self._buf = ''
+
+
+class _PlainWriter(object):
+    def __init__(self, f):
+        self.write = f.write
+
+    def close(self):
+        pass
+
+
+def _get_payload_writer(transfer_encoding, f):
+    transfer_encoding = (transfer_encoding or '').strip().lower()
+    if transfer_encoding == 'base64':
+        return _Base64Writer(f)
+    elif transfer_encoding == 'quoted-printable':
+        return _QuotedPrintableWriter(f)
+    return _PlainWriter(f)
+
+
+def _match_boundary(item, boundaries):
+    (line, at_line_start) = item
+    if not at_line_start or not line.startswith('--'):
+        return None
+    line = line.rstrip()
+    for boundary in reversed(boundaries):
+        if line == '--' + boundary:
+            return (boundary, False)
+        elif line == '--' + boundary + '--':
+            return (boundary, True)
+
+
+def _read_headers(reader):
+    lines = []
+    while True:
+        (line, at_line_start) = reader.readline()
+        if not line or (at_line_start and line in ['\n', '\r\n']):
+            break
+        lines.append(line)
+    return email.message_from_string(''.join(lines))
+
+
+def _read_body(reader, boundaries, writer=None):
+    # The line break preceding a boundary belongs to the boundary
+    eol = ''
+    while True:
+        item = reader.readline()
+        if not item[0]:
+            break
+        if _match_boundary(item, boundaries):
+            reader.unreadline(item)
+            eol = ''
+            break
+        if writer:
+            line = item[0]
+            writer.write(eol)
+            if line.endswith('\r\n'):
+                (line, eol) = (line[:-2], '\r\n')
+            elif line.endswith('\n'):
+                (line, eol) = (line[:-1], '\n')
+            else:
+                eol = ''
+            writer.write(line)
+    if writer:
+        writer.write(eol)
+        writer.close()
+
+
+def _get_compression(headers, payload):
+    transfer_encoding = (headers.get('Content-Transfer-Encoding') or
+                         '').strip().lower()
+    if (headers.get_content_type() not in
+            compression.COMPRESSED_CONTENT_TYPES and
+            transfer_encoding not in
+            ['base64'] + compression.COMPRESSION_ENCODINGS):
+        return None
+    payload.seek(0)
+    return compression.get_compression(payload.read(compression.MAGIC_SIZE))
+
+
+def _decompress_payload(payload, spool_threshold):
+    payload.seek(0)
+    stream = compression.get_decompressed_stream(payload)
+    decompressed = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+    try:
+        shutil.copyfileobj(stream, decompressed)
+    except Exception:
+        decompressed.close()
+        raise
+    finally:
+        payload.close()
+    decompressed.seek(0)
+    return decompressed
+
+
+def _iter_leaf_parts(reader, headers, boundaries, spool_threshold,
+                     decompress):
+    payload = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+    try:
+        _read_body(reader, boundaries, _get_payload_writer(
+            headers.get('Content-Transfer-Encoding'), payload))
+        if decompress and _get_compression(headers, payload):
+            payload = _decompress_payload(payload, spool_threshold)
+    except Exception:
+        payload.close()
+        raise
+
+    if (decompress and headers.get_content_type() in
+            compression.COMPRESSED_CONTENT_TYPES):
+        payload.seek(0)
+        is_mime = payload.read(13).lower() == 'content-type:'
+        payload.seek(0)
+        if is_mime:
+            # A compressed MIME message, its parts follow the container
+            try:
+                for part in _iter_entity_parts(_LineReader(payload), [],
+                                               spool_threshold, decompress):
+                    yield part
+            finally:
+                payload.close()
+            return
+
+    yield MIMEPart(headers, payload)
+
+
+def _iter_entity_parts(reader, boundaries, spool_threshold, decompress):
+    headers = _read_headers(reader)
+    boundary = headers.get_param('boundary')
+
+    if headers.get_content_maintype() != 'multipart' or not boundary:
+        for part in _iter_leaf_parts(reader, headers, boundaries,
+                                     spool_threshold, decompress):
+            yield part
+        return
+
+    yield MIMEPart(headers)
+
+    inner_boundaries = boundaries + [boundary]
+    # Preamble
+    _read_body(reader, inner_boundaries)
+    while True:
+        item = reader.readline()
+        match = _match_boundary(item, inner_boundaries)
+        if not match:
+            # End of data, the closing boundary is missing
+            break
+        (matched_boundary, is_end) = match
+        if matched_boundary != boundary:
+            # Closing an outer entity
+            reader.unreadline(item)
+            break
+        if is_end:
+            # Epilogue
+            _read_body(reader, boundaries)
+            break
+        for part in _iter_entity_parts(reader, inner_boundaries,
+                                       spool_threshold, decompress):
+            yield part
+
+
+def iter_parts(f, spool_threshold=DEFAULT_SPOOL_THRESHOLD, decompress=False):
+    '''
+    Parses a MIME message read from the file-like object f, yielding its
+    entities in depth-first order like email.message.Message.walk().
+
+    Each part is decoded while it is read, so that at most one payload
+    up to spool_threshold bytes is held in memory. Parts need to be closed
+    by the caller once processed.
+
+    If decompress is True, gzip and bzip2 payloads are decompressed when the
+    part content type or transfer encoding marks them as compressed.
+    Compressed MIME messages are expanded and their parts returned in place
+    of the compressed part.
+    '''
+    return _iter_entity_parts(_LineReader(f), [], spool_threshold, decompress)
@@ -0,0 +1,215 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import timeline
+
+opts = [
+    cfg.IntOpt('process_output_tail_size', default=65536,
+               help='Max. number of bytes of stdout and stderr kept in '
+               'memory for each process executed, the full output is '
+               'logged as it is produced'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+# Longer lines are logged in multiple chunks
+MAX_LINE_SIZE = 4096
+# Time given to the output readers to reach the end of the pipes once the
+# process exited, e.g. if a detached child process keeps them open
+OUTPUT_DRAIN_TIMEOUT = 5
+# Time given to a killed process tree to terminate
+KILL_TIMEOUT = 10
+
+
+class RingBuffer(object):
+    '''
+    Keeps the last max_size bytes written to it.
+    '''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.total_size = 0
+        self._chunks = collections.deque()
+        self._size = 0
+
+    def write(self, data):
+        self.total_size += len(data)
+        self._chunks.append(data)
+        self._size += len(data)
+        while (len(self._chunks) > 1 and
+               self._size - len(self._chunks[0]) >= self.max_size):
+            self._size -= len(self._chunks.popleft())
+
+    def getvalue(self):
+        data = ''.join(self._chunks)
+        if self.max_size <= 0:
+            return ''
+        return data[-self.max_size:]
+
+
+class Deadline(object):
+    '''
+    Point in time shared by multiple processes, e.g. an overall limit for
+    a sequence of scripts. A None timeout means no limit.
+    '''
+
+    def __init__(self, timeout=None):
+        self.expires_at = None
+        if timeout is not None:
+            self.expires_at = time.time() + timeout
+
+    def get_remaining(self):
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.time(), 0)
+
+    def is_expired(self):
+        return self.get_remaining() == 0
+
+
+class ProcessResult(object):
+    def __init__(self, args, exit_code, duration, stdout, stderr,
+                 timed_out):
+        self.args = args
+        self.exit_code = exit_code
+        self.duration = duration
+        self.stdout_tail = stdout.getvalue()
+        self.stderr_tail = stderr.getvalue()
+        self.stdout_bytes = stdout.total_size
+        self.stderr_bytes = stderr.total_size
+        self.timed_out = timed_out
+
+
+class _OutputReader(threading.Thread):
+    def __init__(self, pipe, name, buf):
+        super(_OutputReader, self).__init__()
+        self.daemon = True
+        self._pipe = pipe
+        self._name = name
+        self._buf = buf
+
+    def run(self):
+        try:
+            for line in iter(lambda: self._pipe.readline(MAX_LINE_SIZE), ''):
+                self._buf.write(line)
+                LOG.debug('%(name)s: %(line)s' %
+                          {'name': self._name, 'line': line.rstrip('\r\n')})
+        except Exception, ex:
+            LOG.debug('Reading %(name)s failed: %(ex)s' %
+                      {'name': self._name, 'ex': ex})
+        finally:
+            self._pipe.close()
+
+
+def _get_timeout(timeout, deadline):
+    remaining = deadline.get_remaining() if deadline else None
+    if timeout is None:
+        return remaining
+    if remaining is None:
+        return timeout
+    return min(timeout, remaining)
+
+
+def _get_popen_kwargs():
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    # The process becomes the leader of a new process group, killed as a
+    # whole along with its children
+    return {'preexec_fn': os.setsid}
+
+
+def kill_process_tree(p):
+    try:
+        if os.name == 'nt':
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(p.pid)])
+        else:
+            os.killpg(p.pid, signal.SIGKILL)
+    except Exception, ex:
+        LOG.warning('Failed to kill the process tree of pid %(pid)d: '
+                    '%(ex)s' % {'pid': p.pid, 'ex': ex})
+        p.kill()
+
+
+def run_process(args, shell=False, timeout=None, deadline=None, name=None,
+                tail_size=None):
+    '''
+    Executes a process without buffering its whole output: stdout and
+    stderr are logged line by line as they are produced, keeping only the
+    last tail_size bytes of each in memory.
+
+    The process and its children are killed if they are still running
+    after timeout seconds or once the deadline expires. A process is not
+    started at all if the deadline already expired.
+    '''
+    if tail_size is None:
+        tail_size = CONF.process_output_tail_size
+    if name is None:
+        name = os.path.basename(args if isinstance(args, basestring)
+                                else args[0])
+    stdout = RingBuffer(tail_size)
+    stderr = RingBuffer(tail_size)
+
+    if deadline and deadline.is_expired():
+        LOG.warning('Deadline expired, not executing: %s' % name)
+        return ProcessResult(args, None, 0, stdout, stderr, True)
+
+    start_time = time.time()
+    p = subprocess.Popen(args, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, shell=shell,
+                         **_get_popen_kwargs())
+    readers = [_OutputReader(p.stdout, '%s stdout' % name, stdout),
+               _OutputReader(p.stderr, '%s stderr' % name, stderr)]
+    for reader in readers:
+        reader.start()
+
+    exited = threading.Event()
+
+    def _wait():
+        p.wait()
+        exited.set()
+
+    waiter = threading.Thread(target=_wait)
+    waiter.daemon = True
+    waiter.start()
+
+    timed_out = False
+    exited.wait(_get_timeout(timeout, deadline))
+    if not exited.is_set():
+        timed_out = True
+        LOG.warning('%(name)s (pid %(pid)d) timed out, killing it' %
+                    {'name': name, 'pid': p.pid})
+        kill_process_tree(p)
+        exited.wait(KILL_TIMEOUT)
+
+    for reader in readers:
+        reader.join(OUTPUT_DRAIN_TIMEOUT)
+
+    duration = time.time() - start_time
+    timeline.get_boot_timeline().record_subprocess(duration)
+    return ProcessResult(args, p.returncode, duration, stdout, stderr,
+                         timed_out)
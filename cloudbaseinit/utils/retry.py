@@ -0,0 +1,131 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import random
+import sys
+import time
+
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import timeline
+
+LOG = logging.getLogger(__name__)
+
+# Client errors which can succeed if the request is sent again
+RETRYABLE_HTTP_CLIENT_ERRORS = [408, 429]
+
+
+def is_transient_error(ex):
+    '''
+    Returns False for errors which are not going to be fixed by retrying,
+    i.e. HTTP client errors, True otherwise.
+    '''
+    code = getattr(ex, 'code', None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return code in RETRYABLE_HTTP_CLIENT_ERRORS
+    return True
+
+
+class RetryPolicy(object):
+    '''
+    Retries an action with exponential backoff and decorrelated jitter:
+    each delay is chosen randomly between base_delay and three times the
+    previous one, capped at max_delay. Randomized delays prevent instances
+    booting at the same time from retrying in lockstep.
+
+    Retrying stops after max_attempts attempts or once the deadline,
+    expressed in seconds since the first attempt, is reached. The sum of the
+    delays is limited to max_total_delay, shortening them so that each of
+    the remaining retries can still wait base_delay, or stopping retrying
+    once exhausted if max_attempts is not set. None means no limit for all
+    of them. Errors for which is_retryable returns False are raised
+    immediately.
+
+    Retrying also stops, interrupting the current delay, as soon as the
+    optional stop_event threading.Event is set.
+    '''
+
+    def __init__(self, name, max_attempts=None, base_delay=1, max_delay=30,
+                 deadline=None, max_total_delay=None,
+                 is_retryable=is_transient_error, stop_event=None):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.max_total_delay = max_total_delay
+        self.is_retryable = is_retryable
+        self.stop_event = stop_event
+
+    def get_next_delay(self, delay):
+        return min(self.max_delay,
+                   random.uniform(self.base_delay, delay * 3))
+
+    def _wait(self, delay):
+        '''
+        Returns True if interrupted by stop_event.
+        '''
+        if self.stop_event is None:
+            time.sleep(delay)
+            return False
+        return self.stop_event.wait(delay)
+
+    def execute(self, action):
+        start_time = time.time()
+        attempt = 0
+        delay = self.base_delay
+        total_delay = 0
+        while True:
+            attempt += 1
+            try:
+                return action()
+            except Exception, ex:
+                # Keep the original traceback, as is_retryable could handle
+                # other exceptions in the meantime
+                exc_info = sys.exc_info()
+                if not self.is_retryable(ex):
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if self.max_attempts and attempt >= self.max_attempts:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if self.stop_event is not None and self.stop_event.is_set():
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+                delay = self.get_next_delay(delay)
+                if self.deadline is not None:
+                    remaining = start_time + self.deadline - time.time()
+                    if remaining <= 0:
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    delay = min(delay, remaining)
+                if self.max_total_delay is not None:
+                    remaining = self.max_total_delay - total_delay
+                    if remaining <= 0 and not self.max_attempts:
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    allowed_delay = remaining
+                    if self.max_attempts:
+                        retries_left = self.max_attempts - attempt
+                        allowed_delay -= (retries_left - 1) * self.base_delay
+                    delay = max(min(delay, allowed_delay),
+                                min(self.base_delay, remaining))
+                total_delay += delay
+
+                LOG.debug('%(name)s attempt %(attempt)d failed, retrying in '
+                          '%(delay).2f seconds: %(ex)s' %
+                          {'name': self.name, 'attempt': attempt,
+                           'delay': delay, 'ex': ex})
+                timeline.get_boot_timeline().record_retry(
+                    self.name, attempt, delay, ex)
+            if self._wait(delay):
+                LOG.debug('%s retries stopped' % self.name)
+                raise exc_info[0], exc_info[1], exc_info[2]
@@ -0,0 +1,94 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+import struct
+import threading
+
+DEFAULT_DESTINATION = '0.0.0.0'
+
+
+def dword_to_ipv4(value):
+    '''
+    Converts an IPv4 address stored in a DWORD in network byte order,
+    as in the IP Helper structures, to its dotted decimal notation.
+    '''
+    return socket.inet_ntoa(struct.pack('=I', value))
+
+
+def ipv4_to_dword(address):
+    return struct.unpack('=I', socket.inet_aton(address))[0]
+
+
+class Route(object):
+    def __init__(self, destination, mask, next_hop, interface_index,
+                 metric=None):
+        self.destination = destination
+        self.mask = mask
+        self.next_hop = next_hop
+        self.interface_index = interface_index
+        self.metric = metric
+
+
+class RoutingTable(object):
+    '''
+    Snapshot of the IPv4 routing table, indexed by destination.
+    '''
+
+    def __init__(self, routes):
+        self.routes = routes
+        self._routes_by_destination = {}
+        for route in routes:
+            self._routes_by_destination.setdefault(route.destination,
+                                                   []).append(route)
+
+    def get_routes(self, destination):
+        return list(self._routes_by_destination.get(destination, []))
+
+    def has_route(self, destination):
+        return destination in self._routes_by_destination
+
+    def get_default_route(self):
+        # The first default route in table order, if any
+        routes = self._routes_by_destination.get(DEFAULT_DESTINATION)
+        if routes:
+            return routes[0]
+
+
+class RoutingTableCache(object):
+    '''
+    Keeps the routing table snapshot read from get_rows, a callable
+    returning (destination, mask, next_hop, interface_index[, metric])
+    tuples, until invalidated after a change.
+    '''
+
+    def __init__(self, get_rows):
+        self._get_rows = get_rows
+        self._table = None
+        self._lock = threading.Lock()
+        self.refresh_count = 0
+
+    def get_table(self):
+        with self._lock:
+            if self._table is None:
+                self._table = RoutingTable([Route(*row)
+                                            for row in self._get_rows()])
+                self.refresh_count += 1
+            return self._table
+
+    def invalidate(self):
+        with self._lock:
+            self._table = None
@@ -0,0 +1,80 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import binascii
+import hashlib
+import struct
+
+RSA_KEY_TYPES = ['ssh-rsa', 'rsa', 'rsa1']
+
+
+class InvalidSSHKeyException(Exception):
+    pass
+
+
+class SSHRSAPublicKey(object):
+    def __init__(self, blob, key_type, e, n):
+        self.blob = blob
+        self.key_type = key_type
+        self.e = e
+        self.n = n
+        self.fingerprint = get_fingerprint(blob)
+
+
+def get_fingerprint(blob):
+    '''
+    Returns the MD5 fingerprint of a public key blob, as displayed by
+    ssh-keygen -l -E md5, e.g. "c3:7f:27:...".
+    '''
+    digest = hashlib.md5(blob).hexdigest()
+    return ':'.join(digest[i:i + 2] for i in range(0, len(digest), 2))
+
+
+def parse_ssh_rsa_public_key(ssh_pub_key):
+    '''
+    Parses an OpenSSH RSA public key, e.g. "ssh-rsa AAAA... comment".
+    '''
+    ssh_rsa_prefix = 'ssh-rsa '
+
+    if not ssh_pub_key.startswith(ssh_rsa_prefix):
+        raise InvalidSSHKeyException('Invalid SSH key')
+
+    b64_pub_key = ssh_pub_key[len(ssh_rsa_prefix):].split(' ', 1)[0]
+    try:
+        blob = base64.b64decode(b64_pub_key)
+    except (TypeError, binascii.Error):
+        raise InvalidSSHKeyException('Invalid SSH key')
+
+    fields = []
+    offset = 0
+    while offset < len(blob):
+        if offset + 4 > len(blob):
+            raise InvalidSSHKeyException('Invalid SSH key')
+        field_len = struct.unpack('>I', blob[offset:offset + 4])[0]
+        offset += 4
+        fields.append(blob[offset:offset + field_len])
+        offset += field_len
+
+    if not fields or fields[0] not in RSA_KEY_TYPES:
+        raise InvalidSSHKeyException('Unsupported SSH key type "%s". '
+                                     'Only RSA keys are currently supported'
+                                     % (fields[0] if fields else ''))
+    if len(fields) != 3 or offset != len(blob):
+        raise InvalidSSHKeyException('Invalid SSH key')
+
+    (key_type, e, n) = fields
+    return SSHRSAPublicKey(blob, key_type, e, n)
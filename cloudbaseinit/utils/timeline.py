@@ -0,0 +1,190 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.openstack.common import log as logging
+
+opts = [
+    cfg.StrOpt('boot_timeline_path', default=None, help='File where a '
+               'timeline of the metadata service probes and plugins '
+               'executed at each boot is appended, as JSON lines'),
+    cfg.BoolOpt('boot_timeline_summary', default=False, help='Write a '
+                'summary of the boot timeline in the plugins configuration '
+                'section'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+SPAN_PLUGIN = 'plugin'
+SPAN_METADATA_PROBE = 'metadata_probe'
+SPAN_METADATA_PREFETCH = 'metadata_prefetch'
+
+
+def _get_cpu_time():
+    (user_time, system_time) = os.times()[:2]
+    return user_time + system_time
+
+
+class Span(object):
+    '''
+    Timing and counters of a plugin execution, metadata service probe or
+    metadata prefetch.
+
+    The CPU time is the process CPU time consumed during the span, which
+    includes the time used by other spans running in parallel.
+    '''
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.status = None
+        self.start_time = time.time()
+        self.wall_time = None
+        self.cpu_time = None
+        self.metadata_fetches = 0
+        self.subprocesses = 0
+        self.subprocess_time = 0.0
+        self.retries = 0
+        self.retry_delay = 0.0
+
+    def to_dict(self):
+        return {'kind': self.kind,
+                'name': self.name,
+                'status': self.status,
+                'start_time': self.start_time,
+                'wall_time': self.wall_time,
+                'cpu_time': self.cpu_time,
+                'metadata_fetches': self.metadata_fetches,
+                'subprocesses': self.subprocesses,
+                'subprocess_time': self.subprocess_time,
+                'retries': self.retries,
+                'retry_delay': self.retry_delay}
+
+
+class BootTimeline(object):
+    '''
+    Collects the spans executed during a boot. Metadata fetches and
+    subprocesses are accounted to the span running in the current thread.
+    Each completed span is appended to the timeline file, if any.
+    '''
+
+    def __init__(self, path=None):
+        self._path = path
+        self._spans = []
+        self._retries = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.boot_id = str(uuid.uuid4())
+        self.start_time = time.time()
+
+    @contextlib.contextmanager
+    def span(self, kind, name):
+        span = Span(kind, name)
+        parent = self.get_current_span()
+        self._local.span = span
+        cpu_start = _get_cpu_time()
+        try:
+            yield span
+        except Exception:
+            if not span.status:
+                span.status = 'error'
+            raise
+        finally:
+            span.wall_time = time.time() - span.start_time
+            span.cpu_time = _get_cpu_time() - cpu_start
+            self._local.span = parent
+            with self._lock:
+                self._spans.append(span)
+            self._write('span', span.to_dict())
+
+    def get_current_span(self):
+        return getattr(self._local, 'span', None)
+
+    def get_spans(self, kind=None):
+        with self._lock:
+            return [s for s in self._spans if not kind or s.kind == kind]
+
+    def record_metadata_fetch(self):
+        span = self.get_current_span()
+        if span:
+            span.metadata_fetches += 1
+
+    def record_subprocess(self, duration):
+        span = self.get_current_span()
+        if span:
+            span.subprocesses += 1
+            span.subprocess_time += duration
+
+    def record_retry(self, name, attempt, delay, error):
+        span = self.get_current_span()
+        if span:
+            span.retries += 1
+            span.retry_delay += delay
+        with self._lock:
+            self._retries += 1
+        self._write('retry', {'name': name,
+                              'attempt': attempt,
+                              'delay': delay,
+                              'error': '%s: %s' % (error.__class__.__name__,
+                                                   error),
+                              'span': span and span.name})
+
+    def get_summary(self):
+        return {'boot_id': self.boot_id,
+                'total_time': time.time() - self.start_time,
+                'retries': self._retries,
+                'plugins': dict((s.name, round(s.wall_time, 3))
+                                for s in self.get_spans(SPAN_PLUGIN))}
+
+    def end(self):
+        summary = self.get_summary()
+        self._write('boot', summary)
+        return summary
+
+    def _write(self, event, data):
+        if not self._path:
+            return
+        record = {'event': event, 'boot_id': self.boot_id,
+                  'time': time.time()}
+        record.update(data)
+        try:
+            with self._lock:
+                with open(self._path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+        except Exception, ex:
+            LOG.debug('Failed to write the boot timeline: %s' % ex)
+
+
+_boot_timeline = None
+_boot_timeline_lock = threading.Lock()
+
+
+def get_boot_timeline():
+    global _boot_timeline
+    with _boot_timeline_lock:
+        if not _boot_timeline:
+            _boot_timeline = BootTimeline(CONF.boot_timeline_path)
+        return _boot_timeline
@@ -31,6 +31,7 @@ from cloudbaseinit.openstack.common import log as logging
 LOG = logging.getLogger(__name__)
 
 import cloudbaseinit.utils.version as version
+from cloudbaseinit.utils import retry
 
 LOG = logging.getLogger(__name__)
 
@@ -93,6 +94,10 @@ class UrlResponse(object):
         return self.contents
 
 
+# Cap of the randomized intervals between attempts
+MAX_SEC_BETWEEN = 30
+
+
 class UrlError(IOError):
     def __init__(self, cause, code=None, headers=None):
         IOError.__init__(self, str(cause))
@@ -147,10 +152,10 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     manual_tries = 1
     if retries:
         manual_tries = max(int(retries) + 1, 1)
-    if not headers:
-        headers = {
-            'User-Agent': 'Cloud-Init/%s' % (version.version_string()),
-        }
+    # Extra headers, e.g. for conditional requests, keep the user agent
+    headers = dict({
+        'User-Agent': 'Cloud-Init/%s' % (version.version_string()),
+    }, **(headers or {}))
     if not headers_cb:
         def _cb(url):
             return headers
@@ -159,52 +164,63 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     if data:
         # Do this after the log (it might be large)
         req_args['data'] = data
-    if sec_between is None:
-        sec_between = -1
-    excps = []
-    # Handle retrying ourselves since the built-in support
-    # doesn't handle sleeping between tries...
-    for i in range(0, manual_tries):
-        try:
-            req_args['headers'] = headers_cb(url)
-            filtered_req_args = {}
-            for (k, v) in req_args.items():
-                if k == 'data':
-                    continue
-                filtered_req_args[k] = v
-
-            LOG.debug("[%s/%s] open '%s' with %s configuration", i,
-                      manual_tries, url, filtered_req_args)
+    if sec_between is None or sec_between < 0:
+        sec_between = 0
+    attempts = []
+
+    def _request():
+        attempts.append(url)
+        req_args['headers'] = headers_cb(url)
+        filtered_req_args = {}
+        for (k, v) in req_args.items():
+            if k == 'data':
+                continue
+            filtered_req_args[k] = v
+
+        LOG.debug("[%s/%s] open '%s' with %s configuration",
+                  len(attempts) - 1, manual_tries, url, filtered_req_args)
 
+        try:
             r = requests.request(**req_args)
             if check_status:
                 r.raise_for_status()  # pylint: disable=E1103
-            LOG.debug("Read from %s (%s, %sb) after %s attempts", url,
-                      r.status_code, len(r.content),  # pylint: disable=E1103
-                      (i + 1))
-            # Doesn't seem like we can make it use a different
-            # subclass for responses, so add our own backward-compat
-            # attrs
-            return UrlResponse(r)
         except exceptions.RequestException as e:
             if (isinstance(e, (exceptions.HTTPError))
                 and hasattr(e, 'response')  # This appeared in v 0.10.8
                 and hasattr(e.response, 'status_code')):
-                excps.append(UrlError(e, code=e.response.status_code,
-                                      headers=e.response.headers))
-            else:
-                excps.append(UrlError(e))
-                if SSL_ENABLED and isinstance(e, exceptions.SSLError):
-                    # ssl exceptions are not going to get fixed by waiting a
-                    # few seconds
-                    break
-            if i + 1 < manual_tries and sec_between > 0:
-                LOG.debug("Please wait %s seconds while we wait to try again",
-                          sec_between)
-                time.sleep(sec_between)
-    if excps:
-        raise excps[-1]
-    return None  # Should throw before this...
+                raise UrlError(e, code=e.response.status_code,
+                               headers=e.response.headers)
+            raise UrlError(e)
+
+        LOG.debug("Read from %s (%s, %sb) after %s attempts", url,
+                  r.status_code, len(r.content),  # pylint: disable=E1103
+                  len(attempts))
+        # Doesn't seem like we can make it use a different
+        # subclass for responses, so add our own backward-compat
+        # attrs
+        return UrlResponse(r)
+
+    def _is_retryable(e):
+        if not isinstance(e, UrlError):
+            return False
+        if SSL_ENABLED and isinstance(e.cause, exceptions.SSLError):
+            # ssl exceptions are not going to get fixed by waiting a
+            # few seconds
+            return False
+        return retry.is_transient_error(e)
+
+    # Handle retrying ourselves since the built-in support
+    # doesn't handle sleeping between tries...
+    policy = retry.RetryPolicy("Request to '%s'" % url,
+                               max_attempts=manual_tries,
+                               base_delay=sec_between,
+                               max_delay=MAX_SEC_BETWEEN,
+                               is_retryable=_is_retryable)
+    return policy.execute(_request)
+
+
+class _UrlsNotAvailable(Exception):
+    pass
 
 
 def wait_for_url(urls, max_wait=None, timeout=None,
@@ -249,17 +265,19 @@ def wait_for_url(urls, max_wait=None, timeout=None,
         return ((max_wait <= 0 or max_wait is None) or
                 (time.time() - start_time > max_wait))
 
-    loop_n = 0
-    while True:
-        sleep_time = int(loop_n / 5) + 1
+    state = {'timeout': timeout, 'loop_n': 0}
+
+    def _try_urls():
         for url in urls:
             now = time.time()
-            if loop_n != 0:
+            timeout = state['timeout']
+            if state['loop_n'] != 0:
                 if timeup(max_wait, start_time):
                     break
                 if timeout and (now + timeout > (start_time + max_wait)):
                     # shorten timeout to not run way over max_time
                     timeout = int((start_time + max_wait) - now)
+                    state['timeout'] = timeout
 
             reason = ""
             e = None
@@ -298,12 +316,18 @@ def wait_for_url(urls, max_wait=None, timeout=None,
                 # does.
                 exception_cb(msg=status_msg, exception=e)
 
-        if timeup(max_wait, start_time):
-            break
-
-        loop_n = loop_n + 1
-        LOG.debug("Please wait %s seconds while we wait to try again",
-                  sleep_time)
-        time.sleep(sleep_time)
-
-    return False
+        state['loop_n'] += 1
+        raise _UrlsNotAvailable()
+
+    # Rounds over the urls are retried with jittered exponential backoff,
+    # so that instances booting together do not poll in lockstep
+    policy = retry.RetryPolicy('Waiting for urls',
+                               base_delay=sleep_time,
+                               max_delay=MAX_SEC_BETWEEN,
+                               deadline=max_wait if max_wait > 0 else 0,
+                               is_retryable=lambda e: isinstance(
+                                   e, _UrlsNotAvailable))
+    try:
+        return policy.execute(_try_urls)
+    except _UrlsNotAvailable:
+        return False
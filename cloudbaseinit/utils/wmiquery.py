@@ -0,0 +1,152 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+
+from cloudbaseinit.openstack.common import cfg
+from cloudbaseinit.openstack.common import log as logging
+
+opts = [
+    cfg.FloatOpt('wmi_cache_ttl', default=60,
+                 help='Time during which the results of cacheable WMI '
+                 'queries, e.g. user accounts and services, are reused, '
+                 'expressed in seconds'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MONIKER = '//./root/cimv2'
+
+
+def _connect(moniker):
+    import wmi
+    return wmi.WMI(moniker=moniker)
+
+
+def build_query(class_name, fields=None, where=None):
+    query = 'SELECT %(fields)s FROM %(class_name)s' % {
+        'fields': ', '.join(fields) if fields else '*',
+        'class_name': class_name}
+    if where:
+        query += ' WHERE %s' % where
+    return query
+
+
+class WMIRecord(object):
+    '''
+    Copy of the projected properties of a WMI object. Unlike WMI objects,
+    records can be cached and used from any thread.
+    '''
+
+    def __init__(self, **properties):
+        self.__dict__.update(properties)
+
+    def __repr__(self):
+        return 'WMIRecord(%s)' % ', '.join(
+            '%s=%r' % item for item in sorted(self.__dict__.items()))
+
+
+class WMIConnection(object):
+    '''
+    Executes WQL queries on a WMI namespace.
+
+    COM objects can only be used in the thread that created them, so the
+    connection is created lazily and shared by all the queries of the same
+    thread. Records returned by query_records can also be cached for
+    cache_ttl seconds.
+    '''
+
+    def __init__(self, moniker=DEFAULT_MONIKER, connect=_connect,
+                 cache_ttl=None):
+        self._moniker = moniker
+        self._connect = connect
+        self._cache_ttl = cache_ttl
+        self._cache = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.queries_executed = 0
+
+    def _get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            LOG.debug('Opening WMI connection to: %s' % self._moniker)
+            conn = self._connect(self._moniker)
+            self._local.conn = conn
+            with self._lock:
+                self.connections_opened += 1
+        return conn
+
+    def _get_cache_ttl(self):
+        if self._cache_ttl is not None:
+            return self._cache_ttl
+        return CONF.wmi_cache_ttl
+
+    def query(self, class_name, fields=None, where=None):
+        '''
+        Returns the WMI objects of class_name matching the where clause.
+        The objects must be used only in the calling thread.
+        '''
+        query = build_query(class_name, fields, where)
+        conn = self._get_connection()
+        with self._lock:
+            self.queries_executed += 1
+        return conn.query(query)
+
+    def query_records(self, class_name, fields, where=None, cache=False):
+        '''
+        Returns WMIRecord objects containing the given fields of the
+        objects of class_name matching the where clause.
+        '''
+        query = build_query(class_name, fields, where)
+        if cache:
+            with self._lock:
+                entry = self._cache.get(query)
+            if entry and time.time() - entry[0] < self._get_cache_ttl():
+                return list(entry[2])
+
+        records = [WMIRecord(**dict((field, getattr(obj, field))
+                                    for field in fields))
+                   for obj in self.query(class_name, fields, where)]
+        if cache:
+            with self._lock:
+                self._cache[query] = (time.time(), class_name, records)
+        return list(records)
+
+    def invalidate(self, class_name=None):
+        '''
+        Removes the cached records of class_name, or all of them.
+        '''
+        with self._lock:
+            for (query, entry) in self._cache.items():
+                if not class_name or entry[1] == class_name:
+                    del self._cache[query]
+
+
+_wmi_connection = None
+_wmi_connection_lock = threading.Lock()
+
+
+def get_wmi_connection():
+    global _wmi_connection
+    with _wmi_connection_lock:
+        if not _wmi_connection:
+            _wmi_connection = WMIConnection()
+        return _wmi_connection